@@ -0,0 +1,580 @@
+"""
+In-memory CouchDB stand-in served over HTTP - enough of the API for the engine's
+backup, restore, sync and verify paths (_all_docs, _changes, _bulk_docs, documents,
+attachments and database info, _revs_diff and _bulk_get, _find with bookmarks, partitioned
+databases and their /_partition/{p}/ endpoints, plus view queries for index warm-up and a
+single-range _shards map) and the monitoring endpoints of a one-node cluster (_membership,
+/_node/{node}/_stats and _system, _active_tasks, _scheduler/jobs and _scheduler/docs), with no cluster
+or Docker needed.
+
+Authentication is accepted but not checked, revisions are not merged (the
+latest write wins) and sequences are plain counters formatted like CouchDB's.
+Optionally, _bulk_docs behaves like a loaded cluster: each request takes
+write_latency seconds per round of write_slots concurrent writes, and beyond
+write_capacity concurrent writes requests are refused with 503.
+Views are never built: queries return no rows, and _active_tasks and _scheduler/jobs list
+whatever is put in active_tasks and scheduler_jobs. Nothing replicates either: each request
+for _scheduler/docs/_replicator/{id} returns the next entry of replication_states (the last
+one repeats; none is a 404, as for a document the scheduler does not know). _stats counts
+the requests served, their status codes and request times (the last 1000) and the documents
+read and written; _system
+reports the memory of the process and the writes in flight as run queue. _find
+scans every document (and warns that no index is used); its selectors support
+field conditions ($eq, $ne, $gt, $gte, $lt, $lte, $in, $exists, $regex, dotted
+field names) combined with $and and $or.
+"""
+
+import base64
+import bisect
+import resource
+import hashlib
+import json
+import math
+import re
+import threading
+import time
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import parse_qs, unquote, urlsplit
+
+
+def format_seq(seq: int) -> str:
+    return f"{seq}-fake"
+
+def parse_seq(seq: Optional[str]) -> int:
+    if seq in (None, '', 'now'):
+        return 0
+    return int(str(seq).split('-', 1)[0])
+
+def attachment_digest(data: bytes) -> str:
+    return 'md5-' + base64.b64encode(hashlib.md5(data).digest()).decode('ascii')
+
+
+class FakeDatabase:
+    """Documents of one database, kept in id order and in update order"""
+
+    def __init__(self, name: str, partitioned: bool = False):
+        self.name = name
+        self.partitioned = partitioned
+        self.docs: Dict[str, Dict] = {}
+        self.ids: List[str] = []           # sorted ids of live documents
+        self.doc_seq: Dict[str, int] = {}  # id -> seq of its latest update
+        self.by_seq: Dict[int, str] = {}   # seq -> id of the latest update of each document, in seq order
+        self.seq = 0
+        self.deleted = 0
+
+    def put(self, doc: Dict):
+        doc_id = doc['_id']
+        if '_rev' not in doc:
+            previous = self.docs.get(doc_id)
+            generation = int(previous['_rev'].split('-', 1)[0]) + 1 if previous else 1
+            body = json.dumps(doc, sort_keys=True).encode('utf-8')
+            doc['_rev'] = f"{generation}-{hashlib.md5(body).hexdigest()}"
+        for att in (doc.get('_attachments') or {}).values():
+            if 'data' in att:
+                raw = base64.b64decode(att['data'])
+                att.setdefault('digest', attachment_digest(raw))
+                att['length'] = len(raw)
+                att.setdefault('revpos', 1)
+
+        was_live = doc_id in self.docs and not self.docs[doc_id].get('_deleted')
+        is_live = not doc.get('_deleted')
+        if is_live and not was_live:
+            bisect.insort(self.ids, doc_id)
+        elif was_live and not is_live:
+            self.ids.pop(bisect.bisect_left(self.ids, doc_id))
+            self.deleted += 1
+
+        if doc_id in self.doc_seq:
+            del self.by_seq[self.doc_seq[doc_id]]
+        self.seq += 1
+        self.docs[doc_id] = doc
+        self.doc_seq[doc_id] = self.seq
+        self.by_seq[self.seq] = doc_id
+
+    def info(self) -> Dict:
+        size = sum(len(json.dumps(self.docs[doc_id])) for doc_id in self.ids)
+        return {
+            'db_name': self.name,
+            'doc_count': len(self.ids),
+            'doc_del_count': self.deleted,
+            'update_seq': format_seq(self.seq),
+            'sizes': {'active': size, 'external': size, 'file': size},
+            'data_size': size,
+            'props': {'partitioned': True} if self.partitioned else {}
+        }
+
+    def id_bounds(self, prefix: Optional[str]) -> Tuple[int, int]:
+        """Slice of self.ids holding the ids that start with prefix (all of them for None)"""
+        if not prefix:
+            return 0, len(self.ids)
+        return bisect.bisect_left(self.ids, prefix), bisect.bisect_left(self.ids, prefix[:-1] + chr(ord(prefix[-1]) + 1))
+
+
+def render_doc(doc: Dict, attachments: bool) -> Dict:
+    """A document as returned by CouchDB: inline attachment data or stubs"""
+    if '_attachments' not in doc or attachments:
+        return doc
+    stubs = {
+        name: {key: value for key, value in att.items() if key != 'data'} | {'stub': True}
+        for name, att in doc['_attachments'].items()
+    }
+    return {**doc, '_attachments': stubs}
+
+def collation_key(value) -> Tuple:
+    """Sort key following CouchDB's collation of JSON types: null, booleans, numbers, strings, arrays, objects"""
+    if value is None:
+        return (0,)
+    if isinstance(value, bool):
+        return (1, value)
+    if isinstance(value, (int, float)):
+        return (2, value)
+    if isinstance(value, str):
+        return (3, value)
+    if isinstance(value, list):
+        return (4, [collation_key(item) for item in value])
+    return (5, sorted((key, collation_key(item)) for key, item in value.items()))
+
+MISSING = object()
+
+def field_value(doc: Dict, field: str):
+    value = doc
+    for part in field.split('.'):
+        if not isinstance(value, dict) or part not in value:
+            return MISSING
+        value = value[part]
+    return value
+
+def match_condition(value, condition) -> bool:
+    if not isinstance(condition, dict) or not any(key.startswith('$') for key in condition):
+        return value is not MISSING and value == condition
+    for op, arg in condition.items():
+        if op == '$exists':
+            matched = (value is not MISSING) == arg
+        elif value is MISSING:
+            matched = False
+        elif op == '$eq':
+            matched = value == arg
+        elif op == '$ne':
+            matched = value != arg
+        elif op == '$in':
+            matched = value in arg
+        elif op == '$regex':
+            matched = isinstance(value, str) and re.search(arg, value) is not None
+        elif op in ('$gt', '$gte', '$lt', '$lte'):
+            a, b = collation_key(value), collation_key(arg)
+            matched = {'$gt': a > b, '$gte': a >= b, '$lt': a < b, '$lte': a <= b}[op]
+        else:
+            raise ValueError(f"unsupported operator {op}")
+        if not matched:
+            return False
+    return True
+
+def match_selector(doc: Dict, selector: Dict) -> bool:
+    """Whether a document matches a Mango selector (the subset described in the module docstring)"""
+    for key, condition in selector.items():
+        if key == '$and':
+            matched = all(match_selector(doc, clause) for clause in condition)
+        elif key == '$or':
+            matched = any(match_selector(doc, clause) for clause in condition)
+        else:
+            matched = match_condition(field_value(doc, key), condition)
+        if not matched:
+            return False
+    return True
+
+
+class FakeCouchDB:
+    """A fake CouchDB server on a background thread.
+
+    Usage:
+        with FakeCouchDB() as server:
+            server.put_doc('mydb', {'_id': 'a', 'value': 1})
+            run_backup_python(server.url, 'mydb', '/tmp/backups')
+    """
+
+    def __init__(self, host: str = '127.0.0.1', port: int = 0, username: str = 'admin', password: str = 'admin',
+                 write_latency: float = 0.0, write_slots: int = 1, write_capacity: int = 0):
+        self.databases: Dict[str, FakeDatabase] = {}
+        self.lock = threading.Lock()
+        self.username = username
+        self.password = password
+        self.requests = 0
+        self.write_latency = write_latency
+        self.write_slots = max(1, write_slots)
+        self.write_capacity = write_capacity
+        self.writes_in_flight = 0
+        self.writes_refused = 0
+        self.doc_reads = 0
+        self.doc_writes = 0
+        self.status_codes: Dict[int, int] = {}
+        self.request_times = deque(maxlen=1000)
+        self.active_tasks: List[Dict] = []
+        self.scheduler_jobs: List[Dict] = []
+        self.replication_states: List[Dict] = []
+        self.httpd = ThreadingHTTPServer((host, port), self._handler_class())
+        self.httpd.daemon_threads = True
+        self.thread: Optional[threading.Thread] = None
+
+    @property
+    def url(self) -> str:
+        host, port = self.httpd.server_address[:2]
+        return f"http://{self.username}:{self.password}@{host}:{port}"
+
+    def start(self) -> 'FakeCouchDB':
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def __enter__(self) -> 'FakeCouchDB':
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def create_db(self, name: str, partitioned: bool = False) -> FakeDatabase:
+        with self.lock:
+            return self.databases.setdefault(name, FakeDatabase(name, partitioned))
+
+    def put_doc(self, db_name: str, doc: Dict):
+        db = self.create_db(db_name)
+        with self.lock:
+            db.put(doc)
+
+    # Request handling - returns (status, body) where body is JSON-serializable or bytes
+
+    def handle(self, method: str, path: str, query: Dict[str, str], body: bytes) -> Tuple[int, object]:
+        self.requests += 1
+        parts = [unquote(part) for part in path.strip('/').split('/') if part]
+
+        if not parts:
+            return 200, {'couchdb': 'Welcome', 'version': '3.4.2-fake'}
+        if parts[0] == '_up':
+            return 200, {'status': 'ok'}
+        if parts[0] == '_all_dbs':
+            with self.lock:
+                return 200, sorted(self.databases)
+        if parts[0] == '_active_tasks':
+            return 200, list(self.active_tasks)
+        if parts[0] == '_scheduler' and parts[1:] == ['jobs']:
+            return 200, {'total_rows': len(self.scheduler_jobs), 'offset': 0, 'jobs': list(self.scheduler_jobs)}
+        if parts[0] == '_scheduler' and len(parts) == 4 and parts[1] == 'docs':
+            with self.lock:
+                if not self.replication_states:
+                    return 404, {'error': 'not_found', 'reason': 'unknown replication document'}
+                state = self.replication_states.pop(0) if len(self.replication_states) > 1 else self.replication_states[0]
+            return 200, {'database': parts[2], 'doc_id': parts[3], 'info': None, **state}
+        if parts[0] == '_membership':
+            return 200, {'all_nodes': ['couchdb@fake'], 'cluster_nodes': ['couchdb@fake']}
+        if parts[0] == '_node' and len(parts) == 3 and parts[1] in ('couchdb@fake', '_local'):
+            if parts[2] == '_stats':
+                return 200, self.node_stats()
+            if parts[2] == '_system':
+                return 200, self.node_system()
+        if parts[0] == '_dbs_info' and method == 'POST':
+            with self.lock:
+                return 200, [
+                    {'key': name, 'info': self.databases[name].info()} if name in self.databases
+                    else {'key': name, 'error': 'not_found'}
+                    for name in json.loads(body).get('keys', [])
+                ]
+
+        db_name, rest = parts[0], parts[1:]
+        if not rest:
+            return self.handle_db(method, db_name, query)
+
+        with self.lock:
+            db = self.databases.get(db_name)
+        if db is None:
+            return 404, {'error': 'not_found', 'reason': 'Database does not exist.'}
+
+        if rest[0] == '_partition' and len(rest) == 3:
+            if not db.partitioned:
+                return 400, {'error': 'bad_request', 'reason': 'database is not partitioned'}
+            if rest[2] == '_all_docs':
+                return self.handle_all_docs(db, query, f"{rest[1]}:")
+            if rest[2] == '_find' and method == 'POST':
+                return self.handle_find(db, json.loads(body), f"{rest[1]}:")
+        if rest[0] == '_all_docs':
+            if method == 'POST':
+                return self.handle_all_docs_keys(db, json.loads(body).get('keys', []), query)
+            return self.handle_all_docs(db, query)
+        if rest[0] == '_changes':
+            return self.handle_changes(db, query)
+        if rest[0] == '_shards':
+            return 200, {'shards': {'00000000-ffffffff': ['couchdb@fake']}}
+        if rest[0] == '_bulk_docs' and method == 'POST':
+            return self.handle_loaded_write(lambda: self.handle_bulk_docs(db, json.loads(body)))
+        if rest[0] == '_revs_diff' and method == 'POST':
+            return self.handle_revs_diff(db, json.loads(body))
+        if rest[0] == '_bulk_get' and method == 'POST':
+            return self.handle_bulk_get(db, json.loads(body), query)
+        if rest[0] == '_find' and method == 'POST':
+            return self.handle_find(db, json.loads(body))
+        if rest[0] == '_design' and len(rest) == 4 and rest[2] == '_view':
+            return self.handle_view(db, f"_design/{rest[1]}", rest[3])
+
+        if rest[0] in ('_design', '_local') and len(rest) > 1:
+            rest = ['/'.join(rest[:2])] + rest[2:]
+        return self.handle_doc(method, db, rest[0], rest[1] if len(rest) > 1 else None, body)
+
+    def node_stats(self) -> Dict:
+        """The _stats metrics the monitor reads (request_time in milliseconds, like CouchDB)"""
+        times = sorted(self.request_times)
+        percentile = [[p, times[min(len(times) - 1, len(times) * p // 100)] if times else 0] for p in (50, 75, 90, 95, 99)]
+        with self.lock:
+            return {
+                'couchdb': {
+                    'request_time': {'value': {'n': len(times), 'percentile': percentile}, 'type': 'histogram'},
+                    'database_reads': {'value': self.doc_reads, 'type': 'counter'},
+                    'database_writes': {'value': self.doc_writes, 'type': 'counter'},
+                    'open_databases': {'value': len(self.databases), 'type': 'counter'}
+                },
+                'httpd': {'requests': {'value': self.requests, 'type': 'counter'}},
+                'httpd_status_codes': {
+                    str(status): {'value': count, 'type': 'counter'} for status, count in self.status_codes.items()
+                }
+            }
+
+    def node_system(self) -> Dict:
+        memory = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+        return {
+            'memory': {'processes': memory, 'binary': 0, 'ets': 0, 'code': 0, 'atom': 0, 'other': 0},
+            'run_queue': self.writes_in_flight,
+            'process_count': threading.active_count()
+        }
+
+    def handle_db(self, method: str, db_name: str, query: Dict[str, str]) -> Tuple[int, object]:
+        with self.lock:
+            db = self.databases.get(db_name)
+            if method == 'PUT':
+                if db is not None:
+                    return 412, {'error': 'file_exists'}
+                self.databases[db_name] = FakeDatabase(db_name, query.get('partitioned') == 'true')
+                return 201, {'ok': True}
+            if db is None:
+                return 404, {'error': 'not_found', 'reason': 'Database does not exist.'}
+            if method == 'DELETE':
+                del self.databases[db_name]
+                return 200, {'ok': True}
+            return 200, db.info()
+
+    def handle_all_docs(self, db: FakeDatabase, query: Dict[str, str],
+                        prefix: Optional[str] = None) -> Tuple[int, object]:
+        limit = int(query.get('limit', 1 << 62))
+        include_docs = query.get('include_docs') == 'true'
+        attachments = query.get('attachments') == 'true'
+        with self.lock:
+            first, end = db.id_bounds(prefix)
+            start = max(first, bisect.bisect_left(db.ids, json.loads(query['startkey']))) if 'startkey' in query else first
+            start += int(query.get('skip', 0))
+            if 'endkey' in query:
+                end_key = json.loads(query['endkey'])
+                if query.get('inclusive_end') == 'false':
+                    end = min(end, bisect.bisect_left(db.ids, end_key))
+                else:
+                    end = min(end, bisect.bisect_right(db.ids, end_key))
+            rows = []
+            for doc_id in db.ids[start:min(end, start + limit)]:
+                doc = db.docs[doc_id]
+                row = {'id': doc_id, 'key': doc_id, 'value': {'rev': doc['_rev']}}
+                if include_docs:
+                    row['doc'] = render_doc(doc, attachments)
+                rows.append(row)
+            if include_docs:
+                self.doc_reads += len(rows)
+            return 200, {'total_rows': len(db.ids), 'offset': start, 'rows': rows}
+
+    def handle_all_docs_keys(self, db: FakeDatabase, keys: List[str], query: Dict[str, str]) -> Tuple[int, object]:
+        include_docs = query.get('include_docs') == 'true'
+        attachments = query.get('attachments') == 'true'
+        with self.lock:
+            rows = []
+            for doc_id in keys:
+                doc = db.docs.get(doc_id)
+                if doc is None:
+                    rows.append({'key': doc_id, 'error': 'not_found'})
+                elif doc.get('_deleted'):
+                    rows.append({'id': doc_id, 'key': doc_id, 'value': {'rev': doc['_rev'], 'deleted': True}})
+                else:
+                    row = {'id': doc_id, 'key': doc_id, 'value': {'rev': doc['_rev']}}
+                    if include_docs:
+                        row['doc'] = render_doc(doc, attachments)
+                    rows.append(row)
+            return 200, {'total_rows': len(db.ids), 'rows': rows}
+
+    def handle_find(self, db: FakeDatabase, payload: Dict, prefix: Optional[str] = None) -> Tuple[int, object]:
+        """_find in id order; the bookmark is the last id returned"""
+        selector = payload.get('selector') or {}
+        limit = int(payload.get('limit', 25))
+        with self.lock:
+            start, end = db.id_bounds(prefix)
+            if payload.get('bookmark'):
+                start = max(start, bisect.bisect_right(db.ids, payload['bookmark']))
+            docs = []
+            for doc_id in db.ids[start:end]:
+                if len(docs) == limit:
+                    break
+                doc = db.docs[doc_id]
+                if not doc_id.startswith('_design/') and match_selector(doc, selector):
+                    docs.append(render_doc(doc, attachments=False))
+        return 200, {
+            'docs': docs,
+            'bookmark': docs[-1]['_id'] if docs else payload.get('bookmark', 'nil'),
+            'warning': 'No matching index found, create an index to optimize query time.'
+        }
+
+    def handle_changes(self, db: FakeDatabase, query: Dict[str, str]) -> Tuple[int, object]:
+        limit = int(query.get('limit', 1 << 62))
+        include_docs = query.get('include_docs') == 'true'
+        attachments = query.get('attachments') == 'true'
+        with self.lock:
+            since = db.seq if query.get('since') == 'now' else parse_seq(query.get('since'))
+            live = [(seq, doc_id) for seq, doc_id in db.by_seq.items() if seq > since]
+            results = []
+            for seq, doc_id in live[:limit]:
+                doc = db.docs[doc_id]
+                change = {'seq': format_seq(seq), 'id': doc_id, 'changes': [{'rev': doc['_rev']}]}
+                if doc.get('_deleted'):
+                    change['deleted'] = True
+                if include_docs:
+                    change['doc'] = render_doc(doc, attachments)
+                results.append(change)
+            last_seq = format_seq(live[min(limit, len(live)) - 1][0]) if results else format_seq(max(since, 0))
+            return 200, {'results': results, 'last_seq': last_seq, 'pending': max(0, len(live) - limit)}
+
+    def handle_loaded_write(self, write) -> Tuple[int, object]:
+        """Run a write under the configured load model (see the module docstring)"""
+        with self.lock:
+            self.writes_in_flight += 1
+            in_flight = self.writes_in_flight
+        try:
+            if self.write_capacity and in_flight > self.write_capacity:
+                self.writes_refused += 1
+                return 503, {'error': 'service_unavailable', 'reason': 'Too many concurrent writes.'}
+            if self.write_latency:
+                time.sleep(self.write_latency * math.ceil(in_flight / self.write_slots))
+            return write()
+        finally:
+            with self.lock:
+                self.writes_in_flight -= 1
+
+    def handle_bulk_docs(self, db: FakeDatabase, payload: Dict) -> Tuple[int, object]:
+        new_edits = payload.get('new_edits', True)
+        results = []
+        with self.lock:
+            for doc in payload.get('docs', []):
+                if new_edits:
+                    current = db.docs.get(doc['_id'])
+                    if current is not None and not current.get('_deleted') and doc.get('_rev') != current['_rev']:
+                        results.append({'id': doc['_id'], 'error': 'conflict', 'reason': 'Document update conflict.'})
+                        continue
+                    doc.pop('_rev', None)
+                doc.pop('_revisions', None)
+                db.put(doc)
+                self.doc_writes += 1
+                if new_edits:
+                    results.append({'ok': True, 'id': doc['_id'], 'rev': doc['_rev']})
+        return 201, results
+
+    def handle_revs_diff(self, db: FakeDatabase, revs: Dict[str, List[str]]) -> Tuple[int, object]:
+        with self.lock:
+            diff = {}
+            for doc_id, doc_revs in revs.items():
+                current = db.docs.get(doc_id)
+                missing = [rev for rev in doc_revs if current is None or current['_rev'] != rev]
+                if missing:
+                    diff[doc_id] = {'missing': missing}
+            return 200, diff
+
+    def handle_bulk_get(self, db: FakeDatabase, payload: Dict, query: Dict[str, str]) -> Tuple[int, object]:
+        attachments = query.get('attachments') == 'true'
+        results = []
+        with self.lock:
+            for request in payload.get('docs', []):
+                doc = db.docs.get(request['id'])
+                if doc is None or request.get('rev', doc['_rev']) != doc['_rev']:
+                    error = {'id': request['id'], 'rev': request.get('rev'), 'error': 'not_found', 'reason': 'missing'}
+                    results.append({'id': request['id'], 'docs': [{'error': error}]})
+                    continue
+                found = render_doc(doc, attachments)
+                if query.get('revs') == 'true':
+                    generation, rev_hash = doc['_rev'].split('-', 1)
+                    found = {**found, '_revisions': {'start': int(generation), 'ids': [rev_hash]}}
+                results.append({'id': request['id'], 'docs': [{'ok': found}]})
+        return 200, {'results': results}
+
+    def handle_view(self, db: FakeDatabase, ddoc_id: str, view_name: str) -> Tuple[int, object]:
+        with self.lock:
+            ddoc = db.docs.get(ddoc_id)
+            if ddoc is None or ddoc.get('_deleted') or view_name not in (ddoc.get('views') or {}):
+                return 404, {'error': 'not_found', 'reason': 'missing_named_view'}
+            return 200, {'total_rows': 0, 'offset': 0, 'rows': []}
+
+    def handle_doc(self, method: str, db: FakeDatabase, doc_id: str, attachment: Optional[str],
+                   body: bytes) -> Tuple[int, object]:
+        with self.lock:
+            doc = db.docs.get(doc_id)
+            exists = doc is not None and not doc.get('_deleted')
+            if method == 'PUT' and attachment is None:
+                new_doc = json.loads(body)
+                new_doc['_id'] = doc_id
+                if exists and new_doc.get('_rev') != doc['_rev']:
+                    return 409, {'error': 'conflict', 'reason': 'Document update conflict.'}
+                new_doc.pop('_rev', None)
+                db.put(new_doc)
+                return 201, {'ok': True, 'id': doc_id, 'rev': new_doc['_rev']}
+            if not exists:
+                return 404, {'error': 'not_found', 'reason': 'missing'}
+            if method == 'DELETE':
+                db.put({'_id': doc_id, '_deleted': True})
+                return 200, {'ok': True, 'id': doc_id, 'rev': db.docs[doc_id]['_rev']}
+            if attachment is not None:
+                att = (doc.get('_attachments') or {}).get(attachment)
+                if att is None:
+                    return 404, {'error': 'not_found', 'reason': 'Document is missing attachment'}
+                return 200, base64.b64decode(att['data'])
+            return 200, render_doc(doc, attachments=False)
+
+    def _handler_class(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def log_message(self, *args):
+                pass
+
+            def _dispatch(self):
+                url = urlsplit(self.path)
+                query = {key: values[0] for key, values in parse_qs(url.query).items()}
+                length = int(self.headers.get('Content-Length') or 0)
+                body = self.rfile.read(length) if length else b''
+                started = time.perf_counter()
+                try:
+                    status, payload = server.handle(self.command, url.path, query, body)
+                except (ValueError, KeyError) as e:
+                    status, payload = 400, {'error': 'bad_request', 'reason': str(e)}
+                server.request_times.append((time.perf_counter() - started) * 1000)
+                with server.lock:
+                    server.status_codes[status] = server.status_codes.get(status, 0) + 1
+
+                if isinstance(payload, bytes):
+                    data, content_type = payload, 'application/octet-stream'
+                else:
+                    data, content_type = json.dumps(payload).encode('utf-8'), 'application/json'
+                self.send_response(status)
+                self.send_header('Content-Type', content_type)
+                self.send_header('Content-Length', str(len(data)))
+                self.end_headers()
+                if self.command != 'HEAD':
+                    self.wfile.write(data)
+
+            do_GET = do_PUT = do_POST = do_HEAD = do_DELETE = _dispatch
+
+        return Handler
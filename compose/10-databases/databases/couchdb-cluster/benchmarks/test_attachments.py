@@ -0,0 +1,79 @@
+"""
+Attachment blob store: attachments kept out of backup files, each content stored once for every
+backup of the backup root, and put back inline on restore.
+
+Run from the couchdb-cluster directory:
+    python -m pytest benchmarks/test_attachments.py
+"""
+
+import base64
+import json
+
+import pytest
+
+from benchmarks.fake_couchdb import FakeCouchDB
+from couchdb_engine import (
+    blob_path, find_backup_file, iter_backup_docs, reattach_attachments, run_backup_python, run_restore_python,
+    store_attachments
+)
+
+LOGO = b'\x89PNG' + bytes(range(256)) * 8
+TERMS = 'Payment due in 30 days.\n'.encode('utf-8') * 40
+
+
+def inline(data: bytes, content_type: str) -> dict:
+    return {'content_type': content_type, 'data': base64.b64encode(data).decode('ascii')}
+
+
+@pytest.fixture
+def invoices():
+    with FakeCouchDB() as server:
+        for n in range(30):
+            attachments = {'logo.png': inline(LOGO, 'image/png')}
+            if n % 2:
+                attachments['terms.txt'] = inline(TERMS, 'text/plain')
+            server.put_doc('invoices', {'_id': f"inv-{n:03d}", 'total': n * 10, '_attachments': attachments})
+        yield server
+
+
+def test_backups_share_one_copy_of_each_attachment(invoices, tmp_path):
+    for name in ('monday', 'tuesday'):
+        success, msg = run_backup_python(invoices.url, 'invoices', str(tmp_path / name), timestamp='20260504-230000',
+                                         dedup_attachments=True)
+        assert success, msg
+
+    blobs = sorted(path for path in (tmp_path / '_blobs').rglob('*') if path.is_file())
+    assert sorted(blob.read_bytes() for blob in blobs) == sorted([LOGO, TERMS])
+
+    backup_file = find_backup_file(tmp_path / 'tuesday', 'invoices')
+    docs = list(iter_backup_docs(backup_file))
+    assert all(att.get('stub') and 'data' not in att for doc in docs for att in doc['_attachments'].values())
+
+    with FakeCouchDB() as archive:
+        success, msg = run_restore_python(archive.url, 'invoices', str(backup_file))
+        assert success, msg
+        restored = archive.databases['invoices'].docs
+        assert len(restored) == 30
+        assert base64.b64decode(restored['inv-007']['_attachments']['terms.txt']['data']) == TERMS
+        assert base64.b64decode(restored['inv-008']['_attachments']['logo.png']['data']) == LOGO
+        assert 'terms.txt' not in restored['inv-008']['_attachments']
+
+
+def test_stored_blobs_are_not_downloaded_again(invoices, tmp_path):
+    base_url = invoices.url
+    doc = json.loads(json.dumps(invoices.databases['invoices'].docs['inv-003']))
+    stubs = {name: {**att, 'stub': True} for name, att in doc['_attachments'].items()}
+    for att in stubs.values():
+        del att['data']
+    doc['_attachments'] = stubs
+
+    assert store_attachments(base_url, 'invoices', doc, tmp_path) == len(LOGO) + len(TERMS)
+    assert store_attachments(base_url, 'invoices', doc, tmp_path) == 0
+    assert blob_path(tmp_path, stubs['logo.png']['digest']).read_bytes() == LOGO
+
+    # A stub whose blob is missing is restored as it is
+    blob_path(tmp_path, stubs['terms.txt']['digest']).unlink()
+    restored = reattach_attachments(doc, tmp_path)
+    assert base64.b64decode(restored['_attachments']['logo.png']['data']) == LOGO
+    assert restored['_attachments']['terms.txt'] == stubs['terms.txt']
+    assert reattach_attachments(doc, None) is doc
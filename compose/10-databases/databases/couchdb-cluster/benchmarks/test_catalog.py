@@ -0,0 +1,127 @@
+"""
+Backup manifests and the catalog: what a backup and its deltas record, catalogs rebuilt
+from bash backups, updates from parallel backup jobs (separate processes) and listings
+that reconcile the catalog with the backup directories.
+
+Run from the couchdb-cluster directory:
+    python -m pytest benchmarks
+"""
+
+import json
+import multiprocessing
+from pathlib import Path
+
+import pytest
+
+from benchmarks.fake_couchdb import FakeCouchDB
+from couchdb_engine import (
+    list_backups, load_catalog, read_backup_manifest, rebuild_catalog, run_backup_incremental, run_backup_python,
+    server_label, update_backup_manifest
+)
+from couchdb_engine.storage import file_sha256, write_json_atomic
+
+
+def write_backup(backup_dir: Path, db_name: str, docs: int) -> Path:
+    """A small backup file as the bash script writes it (no metadata)"""
+    backup_dir.mkdir(parents=True, exist_ok=True)
+    backup_file = backup_dir / f"{db_name}.json"
+    backup_file.write_text(json.dumps({'new_edits': False, 'docs': [{'_id': f"d{n}"} for n in range(docs)]}))
+    return backup_file
+
+def record_backups(backup_root: str, job: int, count: int):
+    """One backup job: record `count` databases, each in its own manifest update"""
+    for n in range(count):
+        backup_dir = Path(backup_root) / f"job{job}"
+        update_backup_manifest(backup_dir, f"db{n}", write_backup(backup_dir, f"db{n}", n + 1))
+
+
+@pytest.fixture
+def ledger():
+    with FakeCouchDB() as server:
+        for n in range(120):
+            server.put_doc('ledger', {'_id': f"entry-{n:04d}", 'amount': n * 3, 'memo': 'm' * (n % 17)})
+        yield server
+
+
+def test_manifest_of_a_backup_and_its_deltas(ledger, tmp_path):
+    backup_dir = tmp_path / 'weekly'
+    assert run_backup_python(ledger.url, 'ledger', str(backup_dir), timestamp='20260301-010000',
+                             compression='gzip')[0]
+    ledger.put_doc('ledger', {'_id': 'entry-9000', 'amount': 1})
+    assert run_backup_incremental(ledger.url, 'ledger', str(tmp_path / 'weekly-1'), timestamp='20260301-020000')[0]
+
+    manifest = read_backup_manifest(backup_dir)
+    entry = manifest['databases']['ledger']
+    assert manifest['source'] == server_label(ledger.url)
+    assert (entry['doc_count'], entry['compression']) == (120, 'gzip')
+    assert entry['sha256'] == file_sha256(backup_dir / entry['file'])
+    # Files are recorded relative to the backup directory, the delta next to its base
+    assert entry['file'] == 'backup_20260301-010000/ledger.json.gz'
+    assert [delta['file'] for delta in entry['deltas']] == ['backup_20260301-010000/ledger.20260301-020000.delta']
+    assert manifest['size_bytes'] == entry['compressed_size'] + entry['deltas'][0]['compressed_size']
+    assert entry['uncompressed_size'] > entry['compressed_size']
+
+    catalog = load_catalog(tmp_path)
+    assert catalog['weekly']['databases'] == ['ledger']
+    assert catalog['weekly']['doc_count'] == 120
+
+
+def test_rebuild_indexes_bash_backups(tmp_path):
+    write_backup(tmp_path / 'ofelia_backup_20260301_020000', 'ledger', 7)
+    write_backup(tmp_path / 'ofelia_backup_20260301_020000', 'audit', 2)
+    write_backup(tmp_path / 'temp_sync_20260301_030000', 'ledger', 4)
+    write_backup(tmp_path / '_blobs', 'not-a-backup', 1)
+    (tmp_path / 'empty').mkdir()
+
+    entries = rebuild_catalog(tmp_path)
+    assert [entry['name'] for entry in entries] == ['ofelia_backup_20260301_020000']
+    assert entries[0]['doc_count'] == 9
+    manifest = read_backup_manifest(tmp_path / 'ofelia_backup_20260301_020000')
+    assert manifest['databases']['audit']['sha256'] == file_sha256(
+        tmp_path / 'ofelia_backup_20260301_020000' / 'audit.json')
+
+    # Manifests are kept unless forced: a removed database stays listed until then
+    (tmp_path / 'ofelia_backup_20260301_020000' / 'audit.json').unlink()
+    assert rebuild_catalog(tmp_path)[0]['databases'] == ['audit', 'ledger']
+    assert rebuild_catalog(tmp_path, force=True)[0]['databases'] == ['ledger']
+
+
+def test_parallel_jobs_keep_every_entry(tmp_path):
+    processes = [
+        multiprocessing.get_context('spawn').Process(target=record_backups, args=(str(tmp_path), job, 15))
+        for job in range(4)
+    ]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join(60)
+        assert process.exitcode == 0
+
+    for job in range(4):
+        assert sorted(read_backup_manifest(tmp_path / f"job{job}")['databases']) == sorted(f"db{n}" for n in range(15))
+    catalog = load_catalog(tmp_path)
+    assert sorted(catalog) == [f"job{job}" for job in range(4)]
+    assert all(entry['file_count'] == 15 for entry in catalog.values())
+
+
+def test_listing_refreshes_entries_of_changed_manifests(tmp_path):
+    update_backup_manifest(tmp_path / 'nightly', 'orders', write_backup(tmp_path / 'nightly', 'orders', 3))
+    assert [b['databases'] for b in list_backups(tmp_path)] == [['orders']]
+
+    # Another process rewrote the manifest but its catalog update was lost
+    update_backup_manifest(tmp_path / 'nightly', 'users', write_backup(tmp_path / 'nightly', 'users', 2))
+    catalog = json.loads((tmp_path / 'catalog.json').read_text())
+    catalog['backups']['nightly'] = {**catalog['backups']['nightly'], 'databases': ['orders'], 'file_count': 1,
+                                     'manifest_mtime': 0}
+    write_json_atomic(tmp_path / 'catalog.json', catalog)
+
+    backups = list_backups(tmp_path)
+    assert [(b['databases'], b['file_count']) for b in backups] == [(['orders', 'users'], 2)]
+    assert load_catalog(tmp_path)['nightly']['databases'] == ['orders', 'users']
+
+    # Directories without a manifest are scanned once and then listed from the catalog
+    write_backup(tmp_path / 'ofelia_backup_20260101_020000', 'orders', 1)
+    assert sorted(b['name'] for b in list_backups(tmp_path)) == ['nightly', 'ofelia_backup_20260101_020000']
+    (tmp_path / 'ofelia_backup_20260101_020000' / 'orders.json').unlink()
+    assert 'ofelia_backup_20260101_020000' in load_catalog(tmp_path)
+    assert sorted(b['name'] for b in list_backups(tmp_path)) == ['nightly']
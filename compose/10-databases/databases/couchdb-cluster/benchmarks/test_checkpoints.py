@@ -0,0 +1,78 @@
+"""
+Resumable backups and restores: run plans of interrupted backup runs and restore checkpoints.
+
+Run from the couchdb-cluster directory:
+    python -m pytest benchmarks
+"""
+
+import json
+
+import pytest
+
+from benchmarks.fake_couchdb import FakeCouchDB
+from couchdb_engine import (
+    build_backup_manifest, find_backup_file, find_backup_files, find_interrupted_backups, restore_checkpoint_file,
+    run_backup_python, run_backups_parallel, run_restore_python, server_label
+)
+from couchdb_engine.config import RUN_PLAN_NAME
+
+
+@pytest.fixture
+def server():
+    with FakeCouchDB() as couch:
+        for db_name in ('orders', 'run'):
+            for n in range(30):
+                couch.put_doc(db_name, {'_id': f"{db_name}-{n:02d}", 'total': n * 10})
+        yield couch
+
+
+def test_run_plan_is_not_a_database(server, tmp_path):
+    """run.json of an interrupted run is not the backup of a database "run" - which may exist too"""
+    run_dir = tmp_path / 'nightly'
+    run = run_backups_parallel(server.url, ['orders', 'run'], str(run_dir), 2, timestamp='20260101-000000')
+    first_db, success, msg = next(run)
+    assert success, msg
+    run.close()  # Interrupted after recording the first database as completed
+    assert (run_dir / RUN_PLAN_NAME).exists()
+    remaining = 'run' if first_db == 'orders' else 'orders'
+    assert [plan['remaining'] for plan in find_interrupted_backups(tmp_path)] == [[remaining]]
+
+    # A run still in progress has no manifest yet: its files are found by scanning
+    (run_dir / 'manifest.json').unlink()
+    backup_dir = run_dir / 'backup_20260101-000000'
+    assert find_backup_files(run_dir) == {'orders': backup_dir / 'orders.json', 'run': backup_dir / 'run.json'}
+    assert find_backup_file(run_dir, 'run') == backup_dir / 'run.json'
+    assert sorted(build_backup_manifest(run_dir)['databases']) == ['orders', 'run']
+
+    (backup_dir / 'run.json').unlink()
+    assert sorted(find_backup_files(run_dir)) == ['orders']
+    assert find_backup_file(run_dir, 'run') is None
+
+
+def test_restores_into_several_targets_keep_their_own_checkpoint(server, tmp_path):
+    """Restoring one backup into another server or name neither resumes nor discards the
+    progress of an interrupted restore elsewhere"""
+    assert run_backup_python(server.url, 'orders', str(tmp_path), timestamp='20260101-000000')[0]
+    backup_file = find_backup_file(tmp_path, 'orders')
+    with FakeCouchDB() as first, FakeCouchDB() as second:
+        interrupted = restore_checkpoint_file(backup_file, first.url, 'orders')
+        interrupted.write_text(json.dumps({
+            'target': server_label(first.url), 'db': 'orders', 'regular_done': 25,
+            'design_done': False, 'deltas_done': 0, 'delta_docs_done': 0
+        }))
+        assert len({interrupted, restore_checkpoint_file(backup_file, second.url, 'orders'),
+                    restore_checkpoint_file(backup_file, first.url, 'orders_copy')}) == 3
+
+        for target_url, db_name in ((second.url, 'orders'), (first.url, 'orders_copy')):
+            success, msg = run_restore_python(target_url, db_name, str(backup_file))
+            assert success, msg
+            assert not restore_checkpoint_file(backup_file, target_url, db_name).exists()
+        assert len(second.databases['orders'].docs) == 30
+        assert len(first.databases['orders_copy'].docs) == 30
+
+        # The first restore still resumes where it stopped
+        assert interrupted.exists()
+        success, msg = run_restore_python(first.url, 'orders', str(backup_file), resume=True)
+        assert success, msg
+        assert sorted(first.databases['orders'].docs) == [f"orders-{n:02d}" for n in range(25, 30)]
+        assert not interrupted.exists()
@@ -0,0 +1,50 @@
+"""
+JSON codec: loads and dumps_doc give exactly the values and text of the standard library,
+whichever codec is active, and the worker pool keeps the order of its input.
+
+Run from the couchdb-cluster directory:
+    python -m pytest benchmarks/test_codec.py
+"""
+
+import json
+
+import pytest
+
+from couchdb_engine import dumps_doc, loads, map_ordered, plain_floats
+
+DOCS = [
+    {'_id': 'plain', 'price': 19.99, 'qty': 3, 'ok': True, 'note': None, 'tags': ['a', 'b']},
+    {'_id': 'unicode', 'name': 'Zoë Łukasz 東京 🚀', 'escaped': 'tab\there "quoted" \\ back'},
+    {'_id': 'exponents', 'tiny': 0.00001, 'huge': 1e16, 'neg': -2.5e-7, 'zero': 0.0, 'nested': [{'x': 1e300}]},
+    {'_id': 'big-int', 'serial': 2 ** 70, 'negative': -(2 ** 65)},
+    {'_id': 'surrogate', 'broken': '\ud800 alone'},
+    {'_id': 'int-keys', 'map': {1: 'one', 2: 'two'}},
+]
+
+
+@pytest.mark.parametrize('doc', DOCS, ids=[doc['_id'] for doc in DOCS])
+def test_same_text_and_values_as_the_standard_library(doc):
+    text = dumps_doc(doc)
+    assert text == json.dumps(doc, separators=(',', ':'), ensure_ascii=False)
+    assert loads(text) == json.loads(text)
+    assert loads(text.encode('utf-8', 'surrogatepass')) == json.loads(text.encode('utf-8', 'surrogatepass'))
+
+
+def test_non_finite_and_out_of_range_numbers():
+    assert loads('{"a": 1e400, "b": -1e400}') == {'a': float('inf'), 'b': float('-inf')}
+    assert dumps_doc({'n': float('nan')}) == '{"n":NaN}'
+    assert loads('[123456789012345678901234567890]') == [123456789012345678901234567890]
+
+
+def test_plain_floats():
+    assert plain_floats({'a': [1.5, {'b': 0.0001}], 'c': 'x' * 1000, 'd': 10 ** 30})
+    assert not plain_floats({'a': [{'b': 1e16}]})
+    assert not plain_floats([0.00009])
+    assert not plain_floats(float('inf'))
+    assert plain_floats(-0.0)
+
+
+def test_pool_keeps_the_order():
+    docs = [{'_id': f"{n:04d}", 'v': n / 3} for n in range(300)]
+    assert list(map_ordered(dumps_doc, docs, ahead=4)) == [dumps_doc(doc) for doc in docs]
+    assert list(map_ordered(dumps_doc, [])) == []
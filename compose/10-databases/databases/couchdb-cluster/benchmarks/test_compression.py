@@ -0,0 +1,79 @@
+"""
+Compressed backup files: segments that decode as one stream, truncation back to a checkpoint
+and appending a file written apart (as resumed and shard-aware backups do), and compressed
+backups restored document for document.
+
+Run from the couchdb-cluster directory:
+    python -m pytest benchmarks/test_compression.py
+"""
+
+import pytest
+
+from benchmarks.fake_couchdb import FakeCouchDB
+from couchdb_engine import (
+    available_compressions, find_backup_file, open_backup_reader, open_backup_writer, run_backup_python,
+    run_restore_python
+)
+
+COMPRESSED = ['gzip', pytest.param('zstd', marks=pytest.mark.skipif(
+    'zstd' not in available_compressions(), reason="zstandard is not installed"))]
+SUFFIXES = {'none': '.json', 'gzip': '.json.gz', 'zstd': '.json.zst'}
+
+
+@pytest.mark.parametrize('compression', COMPRESSED)
+def test_resume_truncates_to_the_checkpoint(tmp_path, compression):
+    path = tmp_path / f"stream{SUFFIXES[compression]}"
+    stream, counter = open_backup_writer(path, compression)
+    stream.write('{"docs": [1, 2')
+    stream.flush()
+    offset = counter.end_segment()
+    stream.write(', lost when the job died')
+    stream.close()
+    assert counter.bytes_written == len('{"docs": [1, 2, lost when the job died')
+
+    stream, counter = open_backup_writer(path, compression, resume_offset=offset)
+    stream.write(', 3]}')
+    stream.close()
+    assert path.stat().st_size > offset
+    with open_backup_reader(path) as reader:
+        assert reader.read() == '{"docs": [1, 2, 3]}'
+
+
+@pytest.mark.parametrize('compression', COMPRESSED)
+def test_appended_part_continues_the_stream(tmp_path, compression):
+    part = tmp_path / f"part{SUFFIXES[compression]}"
+    part_stream, part_counter = open_backup_writer(part, compression)
+    part_stream.write('"é", "ü"' * 200)
+    part_stream.close()
+
+    whole = tmp_path / f"whole{SUFFIXES[compression]}"
+    stream, counter = open_backup_writer(whole, compression)
+    stream.write('[')
+    stream.flush()
+    counter.append_file(part, part_counter.bytes_written)
+    stream.write(']')
+    stream.close()
+    assert counter.bytes_written == 2 + part_counter.bytes_written
+    with open_backup_reader(whole) as reader:
+        assert reader.read() == '[' + '"é", "ü"' * 200 + ']'
+
+
+def test_unknown_compression(tmp_path):
+    with pytest.raises(ValueError, match='Unknown compression'):
+        open_backup_writer(tmp_path / 'stream.json.bz2', 'bzip2')
+
+
+@pytest.mark.parametrize('compression', ['none', *COMPRESSED])
+def test_compressed_backup_restores_every_document(tmp_path, compression):
+    with FakeCouchDB() as origin, FakeCouchDB() as replica:
+        for n in range(700):
+            origin.put_doc('telemetry', {'_id': f"t{n:05d}", 'reading': n / 7, 'tags': ['a', 'b'][:n % 3]})
+        success, msg = run_backup_python(origin.url, 'telemetry', str(tmp_path), timestamp='20260410-120000',
+                                         compression=compression)
+        assert success, msg
+        backup_file = find_backup_file(tmp_path, 'telemetry')
+        assert backup_file.name == f"telemetry{SUFFIXES[compression]}"
+
+        success, msg = run_restore_python(replica.url, 'telemetry', str(backup_file))
+        assert success, msg
+        assert replica.databases['telemetry'].docs == origin.databases['telemetry'].docs
@@ -0,0 +1,209 @@
+"""
+Engine tests against the in-process fake CouchDB (see fake_couchdb.py): offset index lookups
+across segment and shard range boundaries, restores into another database name with deltas,
+resumed restores, the revision merge-join of verify and the adaptive restore limiter.
+
+Run from the couchdb-cluster directory:
+    python -m pytest benchmarks
+"""
+
+import json
+from pathlib import Path
+
+import pytest
+
+import couchdb_engine.backup as backup
+from benchmarks.fake_couchdb import FakeCouchDB
+from couchdb_engine import (
+    AdaptiveLimiter, available_compressions, compare_revs, extract_docs, find_backup_file, iter_backup_docs,
+    open_backup_index, read_backup_meta, read_indexed_docs, restore_checkpoint_file, run_backup_incremental,
+    run_backup_python, run_backup_sharded, run_restore_python, run_restore_selected, server_label
+)
+
+DB = 'orders'
+COMPRESSIONS = ['none', 'gzip', pytest.param('zstd', marks=pytest.mark.skipif(
+    'zstd' not in available_compressions(), reason="zstandard is not installed"))]
+
+
+@pytest.fixture
+def source():
+    with FakeCouchDB() as server:
+        yield server
+
+@pytest.fixture
+def target():
+    with FakeCouchDB() as server:
+        yield server
+
+def fill(server: FakeCouchDB, count: int, start: int = 0):
+    for n in range(start, start + count):
+        server.put_doc(DB, {'_id': f"doc-{n:05d}", 'n': n, 'payload': 'x' * (n % 50)})
+
+def target_docs(server: FakeCouchDB, db_name: str) -> dict:
+    return {doc_id: doc for doc_id, doc in server.databases[db_name].docs.items() if not doc.get('_deleted')}
+
+
+@pytest.mark.parametrize('compression', COMPRESSIONS)
+@pytest.mark.parametrize('writer', ['checkpointed', 'sharded'])
+def test_index_lookup_across_segments(source, tmp_path, monkeypatch, compression, writer):
+    """Documents looked up in the index are read back intact on both sides of every segment
+    boundary: checkpoints of a single-stream backup, ranges of a shard-aware one"""
+    fill(source, 1300)
+    source.put_doc(DB, {'_id': '_design/app', 'views': {}})
+    if writer == 'checkpointed':
+        # A new compressed segment starts at every checkpoint, i.e. every page of 500 documents
+        monkeypatch.setattr(backup, 'BACKUP_CHECKPOINT_PAGES', 1)
+        success, msg = run_backup_python(source.url, DB, str(tmp_path), timestamp='20260101-000000',
+                                         compression=compression)
+    else:
+        success, msg = run_backup_sharded(source.url, DB, str(tmp_path), timestamp='20260101-000000',
+                                          compression=compression, node_urls=[source.url, source.url], min_docs=0)
+    assert success, msg
+    backup_file = find_backup_file(tmp_path, DB)
+    meta = read_backup_meta(backup_file, DB)
+    if writer == 'sharded':
+        assert meta['ranges'] > 1
+
+    index = open_backup_index(backup_file, DB)
+    try:
+        everything = list(index.entries())
+        assert [doc_id for doc_id, _, _ in everything] == sorted(source.databases[DB].ids)
+        # Offsets of the entries are in the uncompressed stream, segment starts too (the last
+        # segment may hold only the end of the document array)
+        starts = [start for start, _ in meta['index']['segments'][1:] if start <= everything[-1][1]]
+        assert starts
+        for boundary in starts:
+            first_after = next(n for n, (_, offset, _) in enumerate(everything) if offset >= boundary)
+            around = everything[max(first_after - 3, 0):first_after + 3]
+            end_id = everything[first_after + 3][0] if first_after + 3 < len(everything) else None
+            entries = list(index.entries(around[0][0], end_id))
+            assert entries == around
+            docs = list(read_indexed_docs(backup_file, DB, entries))
+            assert [doc['_id'] for doc in docs] == [doc_id for doc_id, _, _ in entries]
+            assert all(doc['n'] == int(doc['_id'][4:]) for doc in docs if doc['_id'].startswith('doc-'))
+        assert index.get('doc-00999') is not None
+        assert index.get('doc-99999') is None
+        assert index.get('doc-0099') is None
+    finally:
+        index.close()
+
+    docs = list(read_indexed_docs(backup_file, DB, everything))
+    assert docs == list(iter_backup_docs(backup_file))
+
+
+def test_restore_under_another_name_applies_deltas(source, target, tmp_path):
+    """A backup restored into another database finds its index and deltas by the name it was made from"""
+    fill(source, 50)
+    assert run_backup_python(source.url, DB, str(tmp_path), timestamp='20260101-000000')[0]
+    fill(source, 10, start=50)
+    source.put_doc(DB, {**source.databases[DB].docs['doc-00007'], 'n': -7})
+    source.put_doc(DB, {'_id': 'doc-00008', '_deleted': True})
+    assert run_backup_incremental(source.url, DB, str(tmp_path), timestamp='20260101-000100')[0]
+    backup_file = find_backup_file(tmp_path, DB)
+
+    success, msg = run_restore_python(target.url, 'scratch', str(backup_file))
+    assert success, msg
+    docs = target_docs(target, 'scratch')
+    assert len(docs) == 59
+    assert docs['doc-00007']['n'] == -7
+    assert 'doc-00008' not in docs
+
+    success, msg = run_restore_selected(target.url, 'picked', str(backup_file), [('doc-00005', 'doc-00009')])
+    assert success, msg
+    assert {doc_id: doc['n'] for doc_id, doc in target_docs(target, 'picked').items()} == {
+        'doc-00005': 5, 'doc-00006': 6, 'doc-00007': -7
+    }
+
+    extract_file = tmp_path / 'extract' / 'picked.json'
+    extract_file.parent.mkdir()
+    success, msg = extract_docs(str(backup_file), 'picked', [('doc-00055', None)], str(extract_file))
+    assert success, msg
+    assert [doc['_id'] for doc in json.loads(extract_file.read_text())['docs']] == [
+        f"doc-{n:05d}" for n in range(55, 60)
+    ]
+
+
+def test_restore_resumes_from_checkpoint(source, target, tmp_path):
+    """A resumed restore skips the regular documents and delta files its checkpoint records as done"""
+    fill(source, 100)
+    source.put_doc(DB, {'_id': '_design/app', 'views': {}})
+    assert run_backup_python(source.url, DB, str(tmp_path), timestamp='20260101-000000')[0]
+    source.put_doc(DB, {**source.databases[DB].docs['doc-00001'], 'n': -1})
+    assert run_backup_incremental(source.url, DB, str(tmp_path), timestamp='20260101-000100')[0]
+    source.put_doc(DB, {**source.databases[DB].docs['doc-00002'], 'n': -2})
+    assert run_backup_incremental(source.url, DB, str(tmp_path), timestamp='20260101-000200')[0]
+    backup_file = find_backup_file(tmp_path, DB)
+
+    checkpoint_file = restore_checkpoint_file(backup_file, target.url, DB)
+    checkpoint_file.write_text(json.dumps({
+        'target': server_label(target.url), 'db': DB, 'regular_done': 40,
+        'design_done': False, 'deltas_done': 1, 'delta_docs_done': 0
+    }))
+    success, msg = run_restore_python(target.url, DB, str(backup_file), resume=True)
+    assert success, msg
+    docs = target_docs(target, DB)
+    assert sorted(docs) == sorted(['_design/app', 'doc-00002'] + [f"doc-{n:05d}" for n in range(40, 100)])
+    assert docs['doc-00002']['n'] == -2
+    assert not checkpoint_file.exists()
+
+    # A checkpoint recording a restore into another database is not resumed
+    checkpoint_file = restore_checkpoint_file(backup_file, target.url, 'fresh')
+    checkpoint_file.write_text(json.dumps({
+        'target': server_label(target.url), 'db': 'elsewhere', 'regular_done': 40,
+        'design_done': True, 'deltas_done': 2, 'delta_docs_done': 0
+    }))
+    success, msg = run_restore_python(target.url, 'fresh', str(backup_file), resume=True)
+    assert success, msg
+    assert len(target_docs(target, 'fresh')) == 101
+    assert target_docs(target, 'fresh')['doc-00001']['n'] == -1
+
+
+def test_compare_revs():
+    backup_revs = [('a', '1-x'), ('b', '1-x'), ('d', '2-y'), ('f', '1-x')]
+    live_revs = [('b', '1-x'), ('c', '1-x'), ('d', '3-z'), ('g', '1-x')]
+    compared, differences = compare_revs(backup_revs, live_revs)
+    assert compared == 6
+    assert differences.counts == {'missing': 2, 'extra': 2, 'changed': 1}
+    assert differences.describe(compared, 'documents').startswith('5/6 documents differ')
+
+    compared, differences = compare_revs(backup_revs, backup_revs)
+    assert compared == 4 and differences.describe(compared, 'documents') is None
+    assert compare_revs([], [])[0] == 0
+
+
+def test_adaptive_limiter():
+    limiter = AdaptiveLimiter('test', initial=2, ceiling=20, floor=1, latency_target=1.0, backoff=0.5,
+                              max_bytes_per_sec=0, adaptive=True)
+    # Slow start: +1 per fast answer
+    for _ in range(4):
+        limiter.release(limiter.acquire(), 0.1, 201)
+    assert limiter.current == 6
+
+    # Answers between half the target and the target keep the limit
+    limiter.release(limiter.acquire(), 0.8, 201)
+    assert limiter.current == 6
+
+    # One decrease per round: requests sent before it do not count again
+    in_flight = [limiter.acquire() for _ in range(4)]
+    limiter.release(in_flight[0], 0.1, 503)
+    assert limiter.current == 3
+    for seq in in_flight[1:]:
+        limiter.release(seq, 2.0, None)
+    assert limiter.current == 3
+    limiter.release(limiter.acquire(), 2.0, 201)
+    assert limiter.current == 1
+
+    # Additive increase after the first decrease, never below the floor or above the ceiling
+    for _ in range(3):
+        limiter.release(limiter.acquire(), 0.1, 429)
+    assert limiter.current == 1
+    for _ in range(5):
+        limiter.release(limiter.acquire(), 0.1, 201)
+    assert limiter.current == 3
+    for _ in range(500):
+        limiter.release(limiter.acquire(), 0.1, 201)
+    assert limiter.current == 20
+
+    fixed = AdaptiveLimiter('fixed', initial=4, ceiling=20, floor=1, adaptive=False)
+    fixed.release(fixed.acquire(), 0.1, 503)
+    assert fixed.current == 4
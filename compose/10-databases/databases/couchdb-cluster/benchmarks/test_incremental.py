@@ -0,0 +1,70 @@
+"""
+Incremental backups: choice of the base backup a delta is appended to.
+
+Run from the couchdb-cluster directory:
+    python -m pytest benchmarks
+"""
+
+import os
+import shutil
+
+import pytest
+
+from benchmarks.fake_couchdb import FakeCouchDB
+from couchdb_engine import (
+    find_backup_file, find_delta_files, find_latest_base, run_backup_incremental, run_backup_python, server_label
+)
+
+DB = 'inventory'
+
+
+@pytest.fixture
+def cluster_a():
+    with FakeCouchDB() as server:
+        for n in range(20):
+            server.put_doc(DB, {'_id': f"item-{n:03d}", 'stock': n})
+        yield server
+
+@pytest.fixture
+def cluster_b():
+    with FakeCouchDB() as server:
+        for n in range(5):
+            server.put_doc(DB, {'_id': f"other-{n:03d}", 'stock': 0})
+        yield server
+
+
+def test_base_of_another_server_is_not_used(cluster_a, cluster_b, tmp_path):
+    assert run_backup_python(cluster_a.url, DB, str(tmp_path / 'nightly'), timestamp='20260101-000000')[0]
+    base_a = find_backup_file(tmp_path / 'nightly', DB)
+    assert find_latest_base(tmp_path, DB, server_label(cluster_a.url)) == base_a
+    assert find_latest_base(tmp_path, DB, server_label(cluster_b.url)) is None
+
+    # An incremental backup of the other cluster starts its own base instead of a delta on A's
+    success, msg = run_backup_incremental(cluster_b.url, DB, str(tmp_path / 'target'), timestamp='20260101-010000')
+    assert success, msg
+    base_b = find_backup_file(tmp_path / 'target', DB)
+    assert base_b is not None and base_b != base_a
+    assert find_delta_files(base_a, DB) == []
+    assert find_latest_base(tmp_path, DB, server_label(cluster_b.url)) == base_b
+
+
+def test_temporary_sync_backups_and_bash_backups_are_not_bases(cluster_a, tmp_path):
+    assert run_backup_python(cluster_a.url, DB, str(tmp_path / 'nightly'), timestamp='20260101-000000')[0]
+    base = find_backup_file(tmp_path / 'nightly', DB)
+
+    # A newer leftover of run_sync_backup, and a newer bash backup without metadata
+    leftover = tmp_path / 'temp_sync_20260101_020000_000000' / 'backup_20260101-020000'
+    shutil.copytree(base.parent, leftover)
+    bash_run = tmp_path / 'ofelia_backup_20260101_030000'
+    bash_run.mkdir()
+    (bash_run / f"{DB}.json").write_text('{"new_edits":false,"docs":[]}')
+    (bash_run / f"{DB}.seq").write_text('99-bash')
+    for seq_file in (leftover / f"{DB}.seq", bash_run / f"{DB}.seq"):
+        os.utime(seq_file, (base.stat().st_mtime + 60, base.stat().st_mtime + 60))
+    assert find_latest_base(tmp_path, DB, server_label(cluster_a.url)) == base
+
+    cluster_a.put_doc(DB, {**cluster_a.databases[DB].docs['item-003'], 'stock': 42})
+    success, msg = run_backup_incremental(cluster_a.url, DB, str(tmp_path / 'next'), timestamp='20260102-000000')
+    assert success, msg
+    assert [f.name for f in find_delta_files(base, DB)] == [f"{DB}.20260102-000000.delta"]
+    assert find_delta_files(leftover / f"{DB}.json", DB) == []
@@ -0,0 +1,106 @@
+"""
+Background jobs: CLI subprocesses run against the fake CouchDB, their per-database results,
+live replication progress, the queue with cancellation, and jobs left running by a
+previous manager process.
+
+Run from the couchdb-cluster directory:
+    python -m pytest benchmarks/test_jobs.py
+"""
+
+import json
+import time
+
+import pytest
+
+from benchmarks.fake_couchdb import FakeCouchDB
+from couchdb_engine import JobRunner
+
+RUNNING = {'state': 'running', 'info': {'docs_read': 12, 'docs_written': 12, 'changes_pending': 88}}
+
+
+@pytest.fixture
+def couch():
+    with FakeCouchDB() as server:
+        server.create_db('scratch')
+        yield server
+
+def wait_for(runner: JobRunner, job_id: str, until, timeout: float = 60) -> dict:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        job = runner.get(job_id)
+        if until(job):
+            return job
+        time.sleep(0.02)
+    raise AssertionError(f"job {job_id} still {runner.get(job_id)['status']}")
+
+def finished(job: dict) -> bool:
+    return job['status'] not in ('queued', 'running')
+
+
+def test_results_and_metrics_of_a_job(couch, tmp_path):
+    runner = JobRunner(tmp_path, max_jobs=2)
+    job_id = runner.submit('delete', 'Delete 2 databases', ['delete', '--db', 'scratch', '--db', 'absent'], total=2,
+                           env={'SOURCE_COUCHDB_URL': couch.url})
+    job = wait_for(runner, job_id, finished)
+
+    assert (job['status'], job['succeeded'], job['failed'], job['returncode']) == ('failed', 1, 1, 1)
+    assert [(r['database'], r['success']) for r in job['results']] == [('scratch', True), ('absent', False)]
+    assert 'scratch' not in couch.databases
+    assert job['metrics'] is not None
+    # Credentials passed in env are not persisted with the job
+    assert couch.url not in (tmp_path / f"{job_id}.json").read_text()
+
+
+def test_replication_progress_while_running(couch, tmp_path):
+    couch.replication_states = [RUNNING] * 40 + [
+        {'state': 'completed', 'info': {'docs_read': 100, 'docs_written': 100, 'doc_write_failures': 0}}
+    ]
+    runner = JobRunner(tmp_path)
+    job_id = runner.submit('sync', 'Sync scratch', ['sync', '--db', 'scratch'], total=1, env={
+        'SOURCE_COUCHDB_URL': couch.url, 'TARGET_COUCHDB_URL': couch.url, 'SYNC_POLL_INTERVAL': '0.05'
+    })
+    job = wait_for(runner, job_id, lambda job: job.get('progress') or finished(job))
+    assert job['progress']['scratch']['docs_written'] == 12
+    assert job['progress']['scratch']['changes_pending'] == 88
+
+    job = wait_for(runner, job_id, finished)
+    assert job['status'] == 'succeeded'
+    assert job['progress'] == {}
+    assert job['results'] == [{'database': 'scratch', 'success': True, 'message': "Replicated 'scratch': 100 documents written"}]
+
+
+def test_cancel_running_and_queued_jobs(couch, tmp_path):
+    couch.replication_states = [RUNNING]
+    runner = JobRunner(tmp_path, max_jobs=1)
+    env = {'SOURCE_COUCHDB_URL': couch.url, 'TARGET_COUCHDB_URL': couch.url, 'SYNC_POLL_INTERVAL': '0.05'}
+    running = runner.submit('sync', 'Endless sync', ['sync', '--db', 'scratch'], total=1, env=env)
+    queued = runner.submit('sync', 'Waiting sync', ['sync', '--db', 'scratch'], total=1, env=env)
+    wait_for(runner, running, lambda job: job.get('progress'))
+    assert runner.get(queued)['status'] == 'queued'
+
+    assert runner.cancel(queued)
+    assert runner.get(queued)['status'] == 'cancelled'
+    assert runner.cancel(running)
+    job = wait_for(runner, running, finished)
+    assert job['status'] == 'cancelled'
+    assert not runner.cancel(running)
+    assert runner.remove(running) and runner.get(running) is None
+    assert not (tmp_path / f"{running}.log").exists()
+
+
+def test_jobs_of_a_previous_process_are_interrupted(tmp_path):
+    for job_id, status, created in (('20260101-020000-aaaaaa', 'running', '2026-01-01T02:00:00'),
+                                    ('20260101-010000-bbbbbb', 'succeeded', '2026-01-01T01:00:00')):
+        (tmp_path / f"{job_id}.json").write_text(json.dumps({
+            'id': job_id, 'kind': 'backup', 'title': 'Nightly', 'args': [], 'status': status,
+            'created': created, 'started': None, 'finished': None, 'total': None,
+            'succeeded': 0, 'failed': 0, 'results': [], 'returncode': None, 'pid': None,
+            'cancel_requested': False, 'metrics': None
+        }))
+    (tmp_path / '20260101-020000-aaaaaa.metrics.json').write_text('{}')
+
+    runner = JobRunner(tmp_path)
+    assert [(job['id'], job['status']) for job in runner.list()] == [
+        ('20260101-020000-aaaaaa', 'interrupted'), ('20260101-010000-bbbbbb', 'succeeded')
+    ]
+    assert runner.get('20260101-020000-aaaaaa')['finished'] is not None
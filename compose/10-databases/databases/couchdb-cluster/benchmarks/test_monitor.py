@@ -0,0 +1,86 @@
+"""
+Cluster monitor tests: node figures read from the fake CouchDB's _stats and _system, rates
+between samples, and the parsing of _active_tasks and _scheduler/jobs into task and replication rows.
+
+Run from the couchdb-cluster directory:
+    python -m pytest benchmarks/test_monitor.py
+"""
+
+import pytest
+
+from benchmarks.fake_couchdb import FakeCouchDB
+from couchdb_engine import ClusterMonitor, assess_cluster, node_rows, poll_cluster, replication_rows, task_rows
+
+
+@pytest.fixture(scope='module')
+def node():
+    with FakeCouchDB() as server:
+        for n in range(25):
+            server.put_doc('metrics', {'_id': f"m{n:03d}", 'value': n})
+        yield server
+
+
+def test_rates_between_samples(node):
+    monitor = ClusterMonitor(node.url, interval=0)
+    first = monitor.poll()
+    assert list(first['nodes']) == ['couchdb@fake']
+    assert monitor.latest_rows()[0]['requests_per_s'] is None
+
+    for _ in range(3):
+        assert poll_cluster(node.url, ['couchdb@fake'])['nodes']['couchdb@fake']['requests'] > 0
+    monitor.poll()
+    row = monitor.latest_rows()[0]
+    assert row['requests_per_s'] > 0
+    assert row['memory_mb'] > 0
+    assert row['latency_p95_ms'] is not None
+    assert len(monitor.series()['nodes']) == 2
+
+
+def test_unreachable_node(node):
+    sample = poll_cluster(node.url, ['couchdb@fake', 'couchdb@gone'])
+    assert sample['nodes']['couchdb@gone'] == {'error': 'HTTP 404'}
+    rows = node_rows(None, sample)
+    ready, reasons = assess_cluster(sample, rows)
+    assert not ready
+    assert reasons == ['couchdb@gone unreachable (HTTP 404)']
+
+
+def test_tasks_are_summed_per_database():
+    tasks = [
+        {'type': 'indexer', 'database': 'shards/00000000-7fffffff/invoices.1700000000', 'design_document': '_design/by_day',
+         'node': 'couchdb@n1', 'changes_done': 30, 'total_changes': 100},
+        {'type': 'indexer', 'database': 'shards/80000000-ffffffff/invoices.1700000000', 'design_document': '_design/by_day',
+         'node': 'couchdb@n1', 'changes_done': 70, 'total_changes': 100},
+        {'type': 'database_compaction', 'database': 'shards/00000000-7fffffff/audit.1700000001', 'node': 'couchdb@n2',
+         'changes_done': 5, 'total_changes': 0},
+        {'type': 'replication', 'doc_id': 'nightly', 'changes_pending': 12}
+    ]
+    assert task_rows(tasks) == [
+        {'type': 'database_compaction', 'database': 'audit', 'design_document': None, 'node': 'couchdb@n2',
+         'shards': 1, 'progress': 0},
+        {'type': 'indexer', 'database': 'invoices', 'design_document': '_design/by_day', 'node': 'couchdb@n1',
+         'shards': 2, 'progress': 50}
+    ]
+
+
+def test_replication_lag_and_crashes(node):
+    """changes_pending comes from the job info (CouchDB 3) or, before, from _active_tasks"""
+    node.scheduler_jobs = [
+        {'doc_id': 'nightly', 'node': 'couchdb@fake', 'source': 'http://a/db/', 'target': 'http://b/db/',
+         'info': {'changes_pending': 4, 'docs_written': 96},
+         'history': [{'type': 'started'}, {'type': 'added'}]},
+        {'id': '7a1f+continuous', 'node': 'couchdb@fake', 'info': None,
+         'history': [{'type': 'crashed'}, {'type': 'started'}, {'type': 'crashed'}, {'type': 'added'}]}
+    ]
+    node.active_tasks = [{'type': 'replication', 'replication_id': '7a1f+continuous', 'changes_pending': 310}]
+    try:
+        sample = poll_cluster(node.url)
+    finally:
+        node.scheduler_jobs, node.active_tasks = [], []
+
+    nightly, continuous = sample['replications']
+    assert (nightly['state'], nightly['changes_pending'], nightly['docs_written']) == ('started', 4, 96)
+    assert (continuous['doc_id'], continuous['state'], continuous['crashes']) == ('7a1f+continuous', 'crashed', 2)
+    assert continuous['changes_pending'] == 310
+    assert "replication 7a1f+continuous crashing (2 crashes)" in assess_cluster(sample, [])[1]
+    assert replication_rows([], sample['tasks']) == []
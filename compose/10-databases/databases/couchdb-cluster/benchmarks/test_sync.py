@@ -0,0 +1,88 @@
+"""
+Replication sync tests: the fake CouchDB replays scripted _scheduler/docs states (see
+replication_states in fake_couchdb.py) for the _replicator document the sync creates.
+
+Run from the couchdb-cluster directory:
+    python -m pytest benchmarks/test_sync.py
+"""
+
+import json
+
+import pytest
+import requests
+
+import couchdb_engine.sync as sync
+from benchmarks.fake_couchdb import FakeCouchDB
+from couchdb_engine import run_sync_replication, run_syncs_replication
+from couchdb_engine.cli import main
+
+
+def running(written: int, pending: int) -> dict:
+    return {'state': 'running', 'info': {'docs_read': written, 'docs_written': written, 'changes_pending': pending}}
+
+COMPLETED = {'state': 'completed', 'info': {'docs_read': 80, 'docs_written': 80, 'doc_write_failures': 0}}
+
+
+@pytest.fixture
+def cluster(monkeypatch):
+    monkeypatch.setattr(sync, 'SYNC_POLL_INTERVAL', 0.01)
+    with FakeCouchDB() as server:
+        yield server
+
+def live_replications(server: FakeCouchDB) -> list:
+    replicator = server.databases.get('_replicator')
+    return list(replicator.ids) if replicator else []
+
+
+def test_error_state_ends_the_replication(cluster):
+    """A document the scheduler cannot turn into a job fails the sync at once instead of at the timeout"""
+    cluster.replication_states = [
+        running(5, 20),
+        {'state': 'error', 'info': {'error': 'db_not_found: could not open http://source:5984/ledger/'}}
+    ]
+    seen = []
+    success, msg = run_sync_replication(cluster.url, cluster.url, 'ledger', timeout=30, on_progress=seen.append)
+    assert not success
+    assert 'db_not_found' in msg
+    assert [(p['state'], p['docs_written']) for p in seen] == [('running', 5), ('error', None)]
+    assert live_replications(cluster) == []
+
+
+def test_progress_reaches_the_caller(cluster):
+    cluster.replication_states = [running(10, 70), running(45, 35), COMPLETED]
+    seen = []
+    results = list(run_syncs_replication(cluster.url, cluster.url, ['ledger'], on_progress=seen.append))
+    assert results == [('ledger', True, "Replicated 'ledger': 80 documents written")]
+    assert [(p['database'], p['docs_written'], p['changes_pending']) for p in seen[:2]] == [
+        ('ledger', 10, 70), ('ledger', 45, 35)
+    ]
+    assert seen[-1]['state'] == 'completed'
+
+
+def test_cli_streams_progress_lines(cluster, capsys):
+    cluster.replication_states = [running(30, 50), COMPLETED]
+    assert main(['--jsonl', 'sync', '--source', cluster.url, '--target', cluster.url, '--db', 'ledger']) == 0
+    lines = [json.loads(line) for line in capsys.readouterr().out.splitlines()]
+    assert lines[0] == {'progress': {
+        'database': 'ledger', 'state': 'running', 'docs_read': 30, 'docs_written': 30, 'changes_pending': 50,
+        'error': None
+    }}
+    assert lines[-1] == {'database': 'ledger', 'success': True, 'message': "Replicated 'ledger': 80 documents written"}
+
+
+def test_target_scheme_is_kept(monkeypatch):
+    """An HTTPS cluster is reached over HTTPS, on its own port"""
+    requested = []
+
+    class Unreachable:
+        def __getattr__(self, method):
+            def request(url, **kwargs):
+                requested.append(url)
+                raise requests.ConnectionError("unreachable")
+            return request
+
+    monkeypatch.setattr(sync, 'couch_http', Unreachable())
+    success, msg = run_sync_replication('https://admin:pw@a.example:6984', 'https://admin:pw@b.example:6984',
+                                        'ledger')
+    assert not success and msg.startswith('Network error')
+    assert requested == ['https://b.example:6984/_replicator']
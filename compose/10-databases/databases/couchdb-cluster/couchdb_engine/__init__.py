@@ -0,0 +1,54 @@
+"""
+CouchDB engine - backup, restore, sync and delete operations shared by the
+Streamlit manager (couchdb_manager.py) and the command line (python -m couchdb_engine).
+
+Imports no UI libraries, so it can be used from scripts and scheduled jobs.
+"""
+
+from .logs import configure_logging, get_logger
+from .metrics import (
+    Metrics, metrics, histogram_quantile, summarize_metrics, write_metrics_file, start_metrics_server
+)
+from .throttle import AdaptiveLimiter, overload_reason, limiter_for
+from .codec import available_codecs, active_codec, plain_floats, loads, dumps_doc, codec_processes, get_codec_pool, map_ordered
+from .client import (
+    CouchDBHttp, couch_http, request_endpoint, parse_couchdb_url, server_label, test_connection, get_databases, get_cluster_size,
+    default_backup_concurrency, get_database_info, get_databases_info, delete_database
+)
+from .storage import (
+    available_compressions, open_backup_writer, open_backup_reader, BackupIndexWriter, index_file_for, BackupIndex,
+    open_backup_index, read_indexed_docs, find_backup_file, backup_db_name, find_backup_files,
+    file_sha256, write_json_atomic, checkpoint_file_for, read_checkpoint, blob_path, find_blob_store,
+    store_attachments, reattach_attachments, seq_file_for, meta_file_for, write_backup_meta, read_backup_meta,
+    find_latest_base, find_delta_files
+)
+from .catalog import (
+    read_backup_manifest, describe_backup_file, build_backup_manifest, update_backup_manifest,
+    load_catalog, catalog_lock, rebuild_catalog, list_backups
+)
+from .shards import get_shard_map, cluster_node_urls, split_id_ranges
+from .backup import (
+    iter_all_docs_pages, iter_changes_pages, iter_find_pages, inline_attachments, iter_scope_pages, record_page_written, backup_file_path, record_full_backup, run_backup_python,
+    export_id_range, run_backup_sharded, run_backup_incremental, run_backup_bash, run_backup, read_backup_plan,
+    find_interrupted_backups, resume_backups_parallel, run_backups_parallel
+)
+from .restore import (
+    iter_backup_docs, iter_backup_lines, prepare_restore_lines, restore_checkpoint_file, iter_restore_docs, post_bulk_docs, iter_bulk_batches, restore_docs_batched, clean_attachment_stubs,
+    restore_design_docs, restore_delta_files, prefix_range, id_ranges, in_id_ranges, iter_selected_docs,
+    run_restore_python, run_restore_bash, run_restore, run_restore_selected, extract_docs
+)
+from .scope import make_scope, range_partition, range_selector, scope_selector, describe_scope
+from .indexes import get_design_docs, index_queries, query_index, indexer_progress, warm_indexes
+from .jobs import JobRunner, get_job_runner
+from .monitor import (
+    get_cluster_nodes, node_figures, task_rows, replication_rows, poll_cluster, node_rows, assess_cluster,
+    slowest_node, ClusterMonitor, monitor_for
+)
+from .sync import (
+    replication_state, run_sync_replication, iter_leaf_revs, fetch_missing_revs, run_sync_revs_diff,
+    iter_prefetched, run_sync_stream, run_syncs_parallel, run_syncs_replication, run_sync_backup
+)
+from .verify import (
+    read_delta_revs, iter_backup_revs, iter_live_revs, compare_revs, compare_sampled_revs, verify_backup,
+    verify_backups_parallel
+)
@@ -0,0 +1,997 @@
+"""
+Backups - paged _all_docs and _changes exports with resumable checkpoints, exports of a document
+scope filtered by CouchDB (_all_docs key ranges, partitions, _find), and a bash script fallback
+"""
+
+import contextlib
+import functools
+import json
+import os
+import requests
+import subprocess
+import time
+from datetime import datetime
+from pathlib import Path
+from urllib.parse import quote
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Iterator, List, Dict, Optional, Tuple
+
+from .catalog import update_backup_manifest
+from .client import couch_http, get_database_info, parse_couchdb_url, server_label
+from .codec import dumps_doc, loads
+from .config import (
+    BACKUP_CHECKPOINT_PAGES, BACKUP_COMPRESSION, BACKUP_DEDUP_ATTACHMENTS, BACKUP_DIR, BACKUP_PAGE_SIZE,
+    BACKUP_PAGE_TIMEOUT, BACKUP_SCRIPT, BACKUP_SHARD_RANGES, BACKUP_SHARDED, BACKUP_SHARDED_MIN_DOCS,
+    BACKUP_WORKERS_PER_NODE, BASE_DIR, BLOB_STORE_NAME, COMPRESSION_EXTENSIONS, MANIFEST_NAME, RUN_PLAN_NAME
+)
+from .logs import get_logger
+from .metrics import metrics
+from .scope import describe_scope, range_partition, range_selector
+from .shards import cluster_node_urls, describe_range, split_id_ranges
+from .storage import (
+    BackupIndexWriter, checkpoint_file_for, file_sha256, find_backup_file, find_latest_base, index_file_for,
+    open_backup_writer, read_backup_meta, read_checkpoint, seq_file_for, store_attachments, write_backup_meta,
+    write_json_atomic
+)
+
+log = get_logger(__name__)
+
+def iter_all_docs_pages(base_url: str, db_name: str, page_size: int = BACKUP_PAGE_SIZE,
+                        timeout: int = BACKUP_PAGE_TIMEOUT, attachments: bool = True,
+                        after_key: Optional[str] = None, start_key: Optional[str] = None,
+                        end_key: Optional[str] = None, operation: str = 'backup'):
+    """Yield pages of documents from _all_docs, paginating on the document id.
+
+    Each request asks for page_size + 1 rows: the extra row is not yielded but
+    becomes the startkey of the next request, so no row is fetched twice and
+    only one page is ever held in memory. Without attachments, documents
+    carry attachment stubs (with their digest) instead of inline data.
+    With after_key (a resumed backup), only documents after that id are yielded.
+    start_key and end_key limit the export to the ids from start_key up to,
+    but excluding, end_key (one range of a shard-aware backup).
+    Request and JSON decoding time are recorded as the fetch and parse phases of operation.
+    """
+    all_docs_url = f"{base_url}/{db_name}/_all_docs"
+    page_key = after_key if after_key is not None else start_key
+
+    while True:
+        params = {
+            'include_docs': 'true',
+            'attachments': str(attachments).lower(),
+            'limit': page_size + 1
+        }
+        if page_key is not None:
+            params['startkey'] = json.dumps(page_key)
+        if end_key is not None:
+            params['endkey'] = json.dumps(end_key)
+            params['inclusive_end'] = 'false'
+        if after_key is not None:
+            # startkey is inclusive: fetch one more row in case after_key still exists
+            params['limit'] += 1
+
+        with metrics.phase(operation, 'fetch'):
+            response = couch_http.get(all_docs_url, params=params, timeout=timeout)
+        if response.status_code != 200:
+            raise requests.exceptions.HTTPError(
+                f"Failed to fetch documents: HTTP {response.status_code} - {response.text}",
+                response=response
+            )
+
+        with metrics.phase(operation, 'parse'):
+            data = loads(response.content)
+        if 'rows' not in data:
+            raise ValueError("Invalid response format: missing 'rows' key")
+
+        rows = data['rows']
+        if after_key is not None:
+            rows = rows[1:] if rows and rows[0]['id'] == after_key else rows[:page_size + 1]
+            after_key = None
+        next_row = rows[page_size] if len(rows) > page_size else None
+        yield [row['doc'] for row in rows[:page_size] if 'doc' in row]
+
+        if next_row is None:
+            return
+        page_key = next_row['id']
+
+def iter_changes_pages(base_url: str, db_name: str, since: str, page_size: int = BACKUP_PAGE_SIZE,
+                       timeout: int = BACKUP_PAGE_TIMEOUT,
+                       attachments: bool = True) -> Iterator[Tuple[List[Dict], str]]:
+    """Yield (docs, last_seq) pages from the _changes feed, starting after `since`.
+
+    Deleted documents come through as tombstones ({_id, _rev, _deleted}) so a
+    replay with new_edits=false reproduces deletions as well.
+    """
+    changes_url = f"{base_url}/{db_name}/_changes"
+
+    while True:
+        params = {
+            'since': since,
+            'include_docs': 'true',
+            'attachments': str(attachments).lower(),
+            'limit': page_size
+        }
+        with metrics.phase('incremental', 'fetch'):
+            response = couch_http.get(changes_url, params=params, timeout=timeout)
+        if response.status_code != 200:
+            raise requests.exceptions.HTTPError(
+                f"Failed to fetch changes: HTTP {response.status_code} - {response.text}",
+                response=response
+            )
+
+        with metrics.phase('incremental', 'parse'):
+            data = loads(response.content)
+        if 'results' not in data:
+            raise ValueError("Invalid response format: missing 'results' key")
+
+        results = data['results']
+        since = data.get('last_seq', since)
+        if not results:
+            return
+        yield [change['doc'] for change in results if 'doc' in change], since
+
+        if data.get('pending', 0) == 0:
+            return
+
+def iter_find_pages(base_url: str, db_name: str, selector: Dict, partition: Optional[str] = None,
+                    page_size: int = BACKUP_PAGE_SIZE, timeout: int = BACKUP_PAGE_TIMEOUT,
+                    attachments: bool = True, operation: str = 'backup') -> Iterator[List[Dict]]:
+    """Yield pages of the documents matching a Mango selector, from _find (of one partition
+    with partition), paginating with the bookmark of each answer.
+
+    _find returns attachment stubs: with attachments, the documents of a page
+    that have attachments are read again with their data (see inline_attachments).
+    CouchDB's warning about a selector no index serves is logged once.
+    """
+    find_url = f"{base_url}/{db_name}/_partition/{quote(partition, safe='')}/_find" if partition else f"{base_url}/{db_name}/_find"
+    bookmark = None
+
+    while True:
+        query = {'selector': selector, 'limit': page_size}
+        if bookmark is not None:
+            query['bookmark'] = bookmark
+        with metrics.phase(operation, 'fetch'):
+            response = couch_http.post(find_url, json=query, timeout=timeout)
+        if response.status_code != 200:
+            raise requests.exceptions.HTTPError(
+                f"Failed to find documents: HTTP {response.status_code} - {response.text}",
+                response=response
+            )
+
+        with metrics.phase(operation, 'parse'):
+            data = loads(response.content)
+        if 'docs' not in data:
+            raise ValueError("Invalid response format: missing 'docs' key")
+        if bookmark is None and data.get('warning'):
+            log.warning(f"⚠️ [{operation.upper()}] {db_name}: {data['warning']}")
+
+        docs = data['docs']
+        yield inline_attachments(base_url, db_name, docs, timeout, operation) if attachments else docs
+
+        if len(docs) < page_size or not data.get('bookmark'):
+            return
+        bookmark = data['bookmark']
+
+def inline_attachments(base_url: str, db_name: str, docs: List[Dict], timeout: int = BACKUP_PAGE_TIMEOUT,
+                       operation: str = 'backup') -> List[Dict]:
+    """docs with attachment stubs replaced by the same documents with inline attachments,
+    read with one POST _all_docs (keys) for the page; documents gone meanwhile stay as they are"""
+    stubbed = [doc['_id'] for doc in docs if any(att.get('stub') for att in (doc.get('_attachments') or {}).values())]
+    if not stubbed:
+        return docs
+    with metrics.phase(operation, 'fetch'):
+        response = couch_http.post(
+            f"{base_url}/{db_name}/_all_docs", params={'include_docs': 'true', 'attachments': 'true'},
+            json={'keys': stubbed}, timeout=timeout
+        )
+    if response.status_code != 200:
+        raise requests.exceptions.HTTPError(
+            f"Failed to fetch attachments: HTTP {response.status_code} - {response.text}",
+            response=response
+        )
+    with metrics.phase(operation, 'parse'):
+        rows = loads(response.content).get('rows', [])
+    inlined = {row['id']: row['doc'] for row in rows if row.get('doc')}
+    return [inlined.get(doc['_id'], doc) for doc in docs]
+
+def iter_scope_pages(base_url: str, db_name: str, scope: Dict, page_size: int = BACKUP_PAGE_SIZE,
+                     timeout: int = BACKUP_PAGE_TIMEOUT, attachments: bool = True,
+                     operation: str = 'backup') -> Iterator[List[Dict]]:
+    """Yield pages of the documents of a scope (see make_scope), filtered by CouchDB.
+
+    Each id range of the scope is read on its own, in id order: with
+    _all_docs startkey/endkey, or with _find when the scope has a selector
+    (the selector and the range combined). Partitions of a partitioned database
+    are read from /{db}/_partition/{partition}/..., which only involves the
+    shard holding the partition; elsewhere they are id prefixes ({partition}:).
+    """
+    partitioned = bool(scope['partitions']) and get_database_info(base_url, db_name).get('props', {}).get('partitioned', False)
+    for id_range in scope['ranges'] or [None]:
+        partition = range_partition(scope, *id_range) if partitioned and id_range else None
+        if scope['selector'] is not None:
+            selector = scope['selector']
+            if id_range is not None and partition is None:
+                selector = {'$and': [range_selector(*id_range), selector]}
+            yield from iter_find_pages(base_url, db_name, selector, partition, page_size, timeout, attachments, operation)
+        elif partition is not None:
+            yield from iter_all_docs_pages(
+                base_url, f"{db_name}/_partition/{quote(partition, safe='')}", page_size, timeout, attachments,
+                operation=operation
+            )
+        else:
+            start, end = id_range
+            yield from iter_all_docs_pages(
+                base_url, db_name, page_size, timeout, attachments, start_key=start or None, end_key=end,
+                operation=operation
+            )
+
+def record_page_written(operation: str, started: float, doc_count: int, byte_count: int):
+    """Metrics of one page written to a backup file (the write phase includes copying attachments)"""
+    metrics.add_phase(operation, 'write', time.perf_counter() - started)
+    metrics.inc('docs_total', doc_count, operation=operation)
+    metrics.inc('bytes_total', byte_count, operation=operation)
+
+def backup_file_path(output_dir: str, db_name: str, timestamp: str, compression: str) -> Path:
+    """Location of the backup file of a database in the run directory of timestamp"""
+    return Path(output_dir) / f"backup_{timestamp}" / f"{db_name}.json{COMPRESSION_EXTENSIONS.get(compression, '')}"
+
+def record_full_backup(source_url: str, db_name: str, output_dir: str, backup_file: Path, meta: Dict) -> int:
+    """Record a completed full backup: its metadata (plus size, checksum and source), the
+    update_seq checkpoint used by incremental backups, and its manifest entry; returns the file size"""
+    file_size = backup_file.stat().st_size
+    write_backup_meta(backup_file, db_name, {
+        **meta,
+        'compressed_size': file_size,
+        'sha256': file_sha256(backup_file),
+        'source': server_label(source_url)
+    })
+    if meta['update_seq'] is not None:
+        seq_file_for(backup_file, db_name).write_text(str(meta['update_seq']), encoding='utf-8')
+        log.info(f"📌 [BACKUP] Recorded update_seq checkpoint")
+    update_backup_manifest(Path(output_dir), db_name, backup_file, source=server_label(source_url))
+    return file_size
+
+def run_backup_python(source_url: str, db_name: str, output_dir: str,
+                      timestamp: Optional[str] = None, compression: str = BACKUP_COMPRESSION,
+                      dedup_attachments: bool = BACKUP_DEDUP_ATTACHMENTS,
+                      scope: Optional[Dict] = None) -> Tuple[bool, str]:
+    """Python-based backup using requests instead of curl.
+
+    Documents are fetched page by page and streamed to the backup file as
+    they arrive, so memory use does not grow with the database size.
+    Backups sharing the same timestamp are written to the same run directory.
+    The database update_seq is recorded next to the file so the backup can
+    serve as the base of later incremental backups. With compression, the
+    file is compressed while it is written ({db}.json.gz / {db}.json.zst).
+    With dedup_attachments, attachments are kept out of the file as stubs and
+    stored once in the content-addressed blob store next to output_dir.
+    The backup is recorded in the manifest of output_dir and in the catalog.
+    The offset index of the file ({db}.idx) is written alongside it, for selective restores.
+    
+    Every BACKUP_CHECKPOINT_PAGES pages the partial file is checkpointed (last
+    document id, byte offset); a later run with the same timestamp resumes
+    after the last checkpoint instead of starting over.
+    
+    With a scope (see make_scope), only its documents are read (iter_scope_pages)
+    and the scope is recorded in the metadata. A scoped backup is not
+    checkpointed and records no update_seq: it cannot be the base of incremental backups.
+    """
+    partial_file = None
+    index_partial = None
+    checkpoint_file = None
+    started = time.monotonic()
+    try:
+        log.info(f"🔄 [BACKUP] Starting Python backup for database: {db_name}")
+        
+        # Create output directory with timestamp
+        timestamp = timestamp or datetime.now().strftime('%Y%m%d-%H%M%S')
+        backup_file = backup_file_path(output_dir, db_name, timestamp, compression)
+        backup_file.parent.mkdir(parents=True, exist_ok=True)
+        log.info(f"📁 [BACKUP] Created output directory: {backup_file.parent}")
+        
+        base_url = source_url.rstrip('/')
+        attachments_mode = 'blobs' if dedup_attachments else 'inline'
+        # Write to a partial file first so an interrupted backup never looks complete
+        partial_file = backup_file.with_name(f"{backup_file.name}.partial")
+        index_file = index_file_for(backup_file, db_name)
+        index_partial = index_file.with_name(f"{index_file.name}.partial")
+        checkpoint_file = checkpoint_file_for(backup_file)
+        
+        # Resume from the checkpoint of an interrupted run with the same settings
+        checkpoint = read_checkpoint(checkpoint_file) if scope is None else None
+        if checkpoint and 'ranges' in checkpoint:
+            partial_file = None
+            return run_backup_sharded(source_url, db_name, output_dir, timestamp, compression, dedup_attachments)
+        if checkpoint and not (
+            partial_file.exists() and partial_file.stat().st_size >= checkpoint['offset']
+            and checkpoint['compression'] == compression and checkpoint['attachments'] == attachments_mode
+            and 'index' in checkpoint and index_partial.exists()
+        ):
+            log.warning(f"⚠️ [BACKUP] Discarding a checkpoint that does not match this backup")
+            checkpoint_file.unlink()
+            checkpoint = None
+        
+        if checkpoint:
+            update_seq = checkpoint['update_seq']
+            created = checkpoint['created']
+            log.info(f"⏯️ [BACKUP] Resuming after {checkpoint['doc_count']} documents (last id: {checkpoint['last_id']})")
+        elif scope is not None:
+            created = datetime.now().isoformat(timespec='seconds')
+            update_seq = None
+            checkpoint_file.unlink(missing_ok=True)
+        else:
+            created = datetime.now().isoformat(timespec='seconds')
+            # Capture update_seq before reading: changes made during the export are
+            # picked up again by the next incremental run (replays are idempotent)
+            db_info = get_database_info(base_url, db_name)
+            update_seq = db_info.get('update_seq')
+        
+        if scope is not None:
+            log.info(f"🎯 [BACKUP] Fetching {describe_scope(scope)} from: {base_url}/{db_name} ({BACKUP_PAGE_SIZE} per page)")
+        else:
+            log.info(f"🌐 [BACKUP] Fetching documents from: {base_url}/{db_name}/_all_docs ({BACKUP_PAGE_SIZE} per page)")
+        log.info(f"💾 [BACKUP] Writing to file: {backup_file}")
+        
+        blob_store = Path(output_dir).parent / BLOB_STORE_NAME if dedup_attachments else None
+        if blob_store is not None:
+            log.info(f"📎 [BACKUP] Storing attachments in blob store: {blob_store}")
+        
+        doc_count = checkpoint['doc_count'] if checkpoint else 0
+        design_count = checkpoint['design_count'] if checkpoint else 0
+        last_id = checkpoint['last_id'] if checkpoint else None
+        elapsed = checkpoint['elapsed_s'] if checkpoint else 0.0
+        attachment_bytes = 0
+        
+        index = BackupIndexWriter(index_partial, checkpoint['index'] if checkpoint else None)
+        f, counter = open_backup_writer(partial_file, compression, checkpoint['offset'] if checkpoint else None)
+        with f, index:
+            if checkpoint:
+                counter.bytes_written = checkpoint['uncompressed_size']
+            else:
+                # Write the EXACT format that bash script produces, one page at a time
+                index.write(f, '{"new_edits":false,"docs":[\n')
+            if scope is not None:
+                pages = iter_scope_pages(base_url, db_name, scope, attachments=blob_store is None)
+            else:
+                pages = iter_all_docs_pages(base_url, db_name, attachments=blob_store is None, after_key=last_id)
+            for page_num, docs in enumerate(pages, 1):
+                page_started, page_bytes = time.perf_counter(), index.position
+                for doc in docs:
+                    if blob_store is not None:
+                        attachment_bytes += store_attachments(base_url, db_name, doc, blob_store)
+                    index.write_doc(f, doc)
+                    doc_count += 1
+                    last_id = doc.get('_id', '')
+                    if last_id.startswith('_design/'):
+                        design_count += 1
+                record_page_written('backup', page_started, len(docs), index.position - page_bytes)
+                log.debug("📄 [BACKUP] Page %d: %d documents written", page_num, doc_count)
+                
+                if page_num % BACKUP_CHECKPOINT_PAGES == 0 and doc_count and scope is None:
+                    f.flush()
+                    offset = counter.end_segment()
+                    index.mark_segment(offset)
+                    write_json_atomic(checkpoint_file, {
+                        'last_id': last_id,
+                        'doc_count': doc_count,
+                        'design_count': design_count,
+                        'offset': offset,
+                        'uncompressed_size': counter.bytes_written,
+                        'update_seq': update_seq,
+                        'compression': compression,
+                        'attachments': attachments_mode,
+                        'created': created,
+                        'elapsed_s': elapsed + time.monotonic() - started,
+                        'index': index.checkpoint()
+                    })
+            index.write(f, '\n]}')
+        
+        partial_file.replace(backup_file)
+        index_meta = index.finish(index_file)
+        checkpoint_file.unlink(missing_ok=True)
+        uncompressed_size = counter.bytes_written
+        file_size = record_full_backup(source_url, db_name, output_dir, backup_file, {
+            'compression': compression,
+            'doc_count': doc_count,
+            'uncompressed_size': uncompressed_size,
+            'update_seq': update_seq,
+            'attachments': attachments_mode,
+            'created': created,
+            'duration_s': round(elapsed + time.monotonic() - started, 3),
+            'index': index_meta,
+            **({'scope': scope} if scope is not None else {})
+        })
+        
+        log.info(f"📄 [BACKUP] Found {doc_count} total documents:")
+        log.info(f"   - 🎨 Design documents: {design_count}")
+        log.info(f"   - 📝 Regular documents: {doc_count - design_count}")
+        log.info(f"✅ [BACKUP] Python backup completed successfully:")
+        log.info(f"   - 📁 File: {backup_file}")
+        log.info(f"   - 📊 Documents: {doc_count}")
+        log.info(f"   - 💾 Size: {file_size} bytes ({uncompressed_size} bytes uncompressed, {compression})")
+        if blob_store is not None:
+            log.info(f"   - 📎 New attachment data: {attachment_bytes} bytes")
+        
+        return True, f"Python backup completed: {backup_file} ({doc_count} docs, {file_size} bytes, {uncompressed_size} bytes uncompressed)"
+        
+    except requests.exceptions.RequestException as e:
+        return False, f"HTTP request failed: {str(e)}"
+    except json.JSONDecodeError as e:
+        return False, f"JSON parsing failed: {str(e)}"
+    except Exception as e:
+        return False, f"Python backup error: {str(e)}"
+    finally:
+        # The partial files of a checkpointed backup are kept for resuming
+        if partial_file is not None and not checkpoint_file.exists():
+            partial_file.unlink(missing_ok=True)
+            index_partial.unlink(missing_ok=True)
+
+def export_id_range(base_url: str, db_name: str, part_file: Path, compression: str,
+                    start_key: Optional[str], end_key: Optional[str], blob_store: Optional[Path]) -> Dict:
+    """Export the documents with start_key <= id < end_key to part_file, a slice of the
+    docs array of a backup file (documents separated by ',\\n', no header); returns its counts.
+
+    The offset index of the part is written to {part_file}.idx and its segments
+    (one every BACKUP_CHECKPOINT_PAGES pages) returned with the counts, both
+    relative to the start of the part.
+    """
+    stats = {'doc_count': 0, 'design_count': 0, 'uncompressed_size': 0, 'attachment_bytes': 0}
+    index = BackupIndexWriter(part_file.with_name(f"{part_file.name}.idx"))
+    f, counter = open_backup_writer(part_file, compression)
+    with f, index:
+        pages = iter_all_docs_pages(
+            base_url, db_name, attachments=blob_store is None, start_key=start_key, end_key=end_key
+        )
+        for page_num, docs in enumerate(pages, 1):
+            page_started, page_bytes = time.perf_counter(), index.position
+            for doc in docs:
+                if blob_store is not None:
+                    stats['attachment_bytes'] += store_attachments(base_url, db_name, doc, blob_store)
+                index.write_doc(f, doc)
+                stats['doc_count'] += 1
+                if doc.get('_id', '').startswith('_design/'):
+                    stats['design_count'] += 1
+            record_page_written('backup', page_started, len(docs), index.position - page_bytes)
+            if page_num % BACKUP_CHECKPOINT_PAGES == 0:
+                f.flush()
+                index.mark_segment(counter.end_segment())
+    stats['uncompressed_size'] = counter.bytes_written
+    stats['segments'] = index.state['segments']
+    return stats
+
+def run_backup_sharded(source_url: str, db_name: str, output_dir: str,
+                       timestamp: Optional[str] = None, compression: str = BACKUP_COMPRESSION,
+                       dedup_attachments: bool = BACKUP_DEDUP_ATTACHMENTS, node_urls: Optional[List[str]] = None,
+                       min_docs: int = BACKUP_SHARDED_MIN_DOCS) -> Tuple[bool, str]:
+    """Shard-aware backup: export a large database as id ranges read concurrently from every cluster node.
+
+    The id space is split into BACKUP_SHARD_RANGES ranges (by default
+    BACKUP_WORKERS_PER_NODE per node); each range is exported, and compressed,
+    by its own worker against one of the nodes directly, round-robin, instead of
+    one stream through the load balancer. The range files are then concatenated
+    in id order into a backup file identical in format to run_backup_python's,
+    still sorted by document id.
+    
+    Databases below min_docs (BACKUP_SHARDED_MIN_DOCS), single-node servers and
+    clusters whose nodes cannot be reached directly get a single-stream
+    run_backup_python. node_urls overrides CLUSTER_NODE_URLS.
+    Each completed range is checkpointed; a later run with the same timestamp
+    only exports the missing ones.
+    """
+    part_files: List[Path] = []
+    partial_file = None
+    index_partial = None
+    checkpoint_file = None
+    started = time.monotonic()
+    try:
+        timestamp = timestamp or datetime.now().strftime('%Y%m%d-%H%M%S')
+        backup_file = backup_file_path(output_dir, db_name, timestamp, compression)
+        base_url = source_url.rstrip('/')
+        attachments_mode = 'blobs' if dedup_attachments else 'inline'
+        checkpoint_file = checkpoint_file_for(backup_file)
+        
+        checkpoint = read_checkpoint(checkpoint_file)
+        if checkpoint and 'ranges' not in checkpoint:
+            # Interrupted as a single stream: resume it as such
+            checkpoint_file = None
+            return run_backup_python(source_url, db_name, output_dir, timestamp, compression, dedup_attachments)
+        if checkpoint and (
+            checkpoint['compression'] != compression or checkpoint['attachments'] != attachments_mode
+            or not all('segments' in stats for stats in checkpoint['done'].values())
+        ):
+            log.warning(f"⚠️ [BACKUP] Discarding a checkpoint that does not match this backup")
+            checkpoint_file.unlink()
+            checkpoint = None
+        
+        node_urls = cluster_node_urls(source_url, db_name, node_urls)
+        if checkpoint:
+            ranges = [tuple(key_range) for key_range in checkpoint['ranges']]
+            done = {int(index): stats for index, stats in checkpoint['done'].items()}
+            update_seq = checkpoint['update_seq']
+            created = checkpoint['created']
+            elapsed = checkpoint['elapsed_s']
+            log.info(f"⏯️ [BACKUP] Resuming shard-aware backup of {db_name}: {len(done)}/{len(ranges)} ranges done")
+        else:
+            db_info = get_database_info(base_url, db_name)
+            doc_count = db_info.get('doc_count', 0)
+            if doc_count < min_docs or len(node_urls) < 2:
+                reason = (f"{doc_count} documents" if doc_count < min_docs
+                          else f"{len(node_urls)} cluster node(s) reachable directly")
+                log.info(f"ℹ️ [BACKUP] Single-stream backup of {db_name} ({reason})")
+                checkpoint_file = None
+                return run_backup_python(source_url, db_name, output_dir, timestamp, compression, dedup_attachments)
+            update_seq = db_info.get('update_seq')
+            created = datetime.now().isoformat(timespec='seconds')
+            elapsed = 0.0
+            ranges = split_id_ranges(
+                base_url, db_name, doc_count, BACKUP_SHARD_RANGES or BACKUP_WORKERS_PER_NODE * len(node_urls)
+            )
+            done = {}
+        node_urls = node_urls or [base_url]
+        
+        backup_file.parent.mkdir(parents=True, exist_ok=True)
+        part_files = [backup_file.with_name(f"{backup_file.name}.part{index}") for index in range(len(ranges))]
+        blob_store = Path(output_dir).parent / BLOB_STORE_NAME if dedup_attachments else None
+        log.info(f"🔄 [BACKUP] Starting shard-aware backup of {db_name}: {len(ranges)} id ranges from {len(node_urls)} nodes")
+        
+        def save_checkpoint():
+            write_json_atomic(checkpoint_file, {
+                'ranges': ranges,
+                'done': done,
+                'update_seq': update_seq,
+                'compression': compression,
+                'attachments': attachments_mode,
+                'created': created,
+                'elapsed_s': elapsed + time.monotonic() - started
+            })
+        
+        errors = []
+        pending = [index for index in range(len(ranges)) if index not in done]
+        with ThreadPoolExecutor(max_workers=max(1, len(pending))) as executor:
+            futures = {
+                executor.submit(
+                    export_id_range, node_urls[index % len(node_urls)], db_name, part_files[index], compression,
+                    *ranges[index], blob_store
+                ): index
+                for index in pending
+            }
+            for future in as_completed(futures):
+                index = futures[future]
+                try:
+                    done[index] = future.result()
+                except Exception as e:
+                    errors.append(f"range {describe_range(*ranges[index])}: {e}")
+                    log.error(f"❌ [BACKUP] {db_name} range {index + 1}/{len(ranges)} failed: {e}")
+                    continue
+                save_checkpoint()
+                log.info(f"📄 [BACKUP] {db_name} range {index + 1}/{len(ranges)} {describe_range(*ranges[index])}: "
+                         f"{done[index]['doc_count']} documents ({len(done)}/{len(ranges)} ranges done)")
+        if errors:
+            return False, f"Shard-aware backup failed for {len(errors)} of {len(ranges)} ranges: {'; '.join(errors)}"
+        
+        # Concatenate the ranges in id order; compressed ranges are whole gzip members / zstd frames,
+        # and their indexes are merged with offsets shifted to where each range lands
+        partial_file = backup_file.with_name(f"{backup_file.name}.partial")
+        index_file = index_file_for(backup_file, db_name)
+        index_partial = index_file.with_name(f"{index_file.name}.partial")
+        backup_index = BackupIndexWriter(index_partial)
+        f, counter = open_backup_writer(partial_file, compression)
+        with f, backup_index:
+            backup_index.write(f, '{"new_edits":false,"docs":[\n')
+            first = True
+            for index, part_file in enumerate(part_files):
+                if done[index]['doc_count'] == 0:
+                    continue
+                if not first:
+                    backup_index.write(f, ',\n')
+                f.flush()
+                backup_index.append_part(
+                    part_file.with_name(f"{part_file.name}.idx"), done[index]['segments'], counter.end_segment(),
+                    done[index]['uncompressed_size']
+                )
+                counter.append_file(part_file, done[index]['uncompressed_size'])
+                first = False
+            backup_index.write(f, '\n]}')
+        
+        partial_file.replace(backup_file)
+        index_meta = backup_index.finish(index_file)
+        checkpoint_file.unlink(missing_ok=True)
+        doc_count = sum(stats['doc_count'] for stats in done.values())
+        design_count = sum(stats['design_count'] for stats in done.values())
+        uncompressed_size = counter.bytes_written
+        file_size = record_full_backup(source_url, db_name, output_dir, backup_file, {
+            'compression': compression,
+            'doc_count': doc_count,
+            'uncompressed_size': uncompressed_size,
+            'update_seq': update_seq,
+            'attachments': attachments_mode,
+            'created': created,
+            'duration_s': round(elapsed + time.monotonic() - started, 3),
+            'ranges': len(ranges),
+            'index': index_meta
+        })
+        
+        log.info(f"✅ [BACKUP] Shard-aware backup completed successfully:")
+        log.info(f"   - 📁 File: {backup_file}")
+        log.info(f"   - 📊 Documents: {doc_count} ({design_count} design) in {len(ranges)} ranges")
+        log.info(f"   - 💾 Size: {file_size} bytes ({uncompressed_size} bytes uncompressed, {compression})")
+        if blob_store is not None:
+            log.info(f"   - 📎 New attachment data: {sum(stats['attachment_bytes'] for stats in done.values())} bytes")
+        
+        return True, (f"Shard-aware backup completed: {backup_file} ({doc_count} docs in {len(ranges)} ranges, "
+                      f"{file_size} bytes, {uncompressed_size} bytes uncompressed)")
+        
+    except requests.exceptions.RequestException as e:
+        return False, f"HTTP request failed: {str(e)}"
+    except Exception as e:
+        return False, f"Shard-aware backup error: {str(e)}"
+    finally:
+        if partial_file is not None:
+            partial_file.unlink(missing_ok=True)
+            index_partial.unlink(missing_ok=True)
+        # Ranges recorded in a checkpoint are kept for resuming
+        saved = read_checkpoint(checkpoint_file) if checkpoint_file is not None else None
+        for index, part_file in enumerate(part_files):
+            if saved is None or str(index) not in saved['done']:
+                part_file.unlink(missing_ok=True)
+                part_file.with_name(f"{part_file.name}.idx").unlink(missing_ok=True)
+
+def run_backup_incremental(source_url: str, db_name: str, output_dir: str,
+                           timestamp: Optional[str] = None, compression: str = BACKUP_COMPRESSION,
+                           dedup_attachments: bool = BACKUP_DEDUP_ATTACHMENTS,
+                           sharded: bool = BACKUP_SHARDED) -> Tuple[bool, str]:
+    """Incremental backup: write the changes since the latest base backup as a delta file.
+
+    The base is searched for among the backups of the same server next to
+    output_dir (see find_latest_base). The delta
+    is written next to the base as {db}.{timestamp}.delta, in the same
+    new_edits=false format, the base's update_seq checkpoint is advanced and
+    the delta is added to the metadata and manifest of the base backup.
+    Without a base, a full backup is made into output_dir instead (shard-aware with sharded).
+    Like full backups, the delta is checkpointed every BACKUP_CHECKPOINT_PAGES
+    pages and resumed by a later run with the same timestamp.
+    """
+    partial_file = None
+    checkpoint_file = None
+    try:
+        base_file = find_latest_base(Path(output_dir).parent, db_name, server_label(source_url))
+        if base_file is None:
+            log.info(f"ℹ️ [BACKUP] No base backup with update_seq from {server_label(source_url)} found for "
+                     f"{db_name} - running full backup")
+            full_backup = run_backup_sharded if sharded else run_backup_python
+            return full_backup(source_url, db_name, output_dir, timestamp, compression, dedup_attachments)
+        
+        seq_file = seq_file_for(base_file, db_name)
+        since = seq_file.read_text(encoding='utf-8').strip()
+        log.info(f"🔄 [BACKUP] Starting incremental backup for database: {db_name}")
+        log.info(f"📁 [BACKUP] Base backup: {base_file}")
+        
+        base_url = source_url.rstrip('/')
+        timestamp = timestamp or datetime.now().strftime('%Y%m%d-%H%M%S')
+        delta_file = base_file.parent / f"{db_name}.{timestamp}.delta{COMPRESSION_EXTENSIONS.get(compression, '')}"
+        partial_file = delta_file.with_name(f"{delta_file.name}.partial")
+        checkpoint_file = checkpoint_file_for(delta_file)
+        
+        blob_store = Path(output_dir).parent / BLOB_STORE_NAME if dedup_attachments else None
+        attachments_mode = 'blobs' if dedup_attachments else 'inline'
+        
+        # Resume only if the base has not advanced since the checkpoint was taken
+        checkpoint = read_checkpoint(checkpoint_file)
+        if checkpoint and not (
+            checkpoint['since'] == since and partial_file.exists()
+            and partial_file.stat().st_size >= checkpoint['offset']
+            and checkpoint['compression'] == compression and checkpoint['attachments'] == attachments_mode
+        ):
+            log.warning(f"⚠️ [BACKUP] Discarding a checkpoint that does not match this backup")
+            checkpoint_file.unlink()
+            checkpoint = None
+        if checkpoint:
+            log.info(f"⏯️ [BACKUP] Resuming after {checkpoint['doc_count']} changed documents")
+        
+        doc_count = checkpoint['doc_count'] if checkpoint else 0
+        last_seq = checkpoint['last_seq'] if checkpoint else since
+        
+        f, counter = open_backup_writer(partial_file, compression, checkpoint['offset'] if checkpoint else None)
+        with f:
+            if checkpoint:
+                counter.bytes_written = checkpoint['uncompressed_size']
+            else:
+                f.write('{"new_edits":false,"docs":[\n')
+            changes = iter_changes_pages(base_url, db_name, last_seq, attachments=blob_store is None)
+            for page_num, (docs, last_seq) in enumerate(changes, 1):
+                page_started, page_bytes = time.perf_counter(), counter.bytes_written
+                for doc in docs:
+                    if blob_store is not None:
+                        store_attachments(base_url, db_name, doc, blob_store)
+                    if doc_count > 0:
+                        f.write(',\n')
+                    f.write(dumps_doc(doc))
+                    doc_count += 1
+                record_page_written('incremental', page_started, len(docs), counter.bytes_written - page_bytes)
+                
+                if page_num % BACKUP_CHECKPOINT_PAGES == 0 and doc_count:
+                    f.flush()
+                    write_json_atomic(checkpoint_file, {
+                        'since': since,
+                        'last_seq': last_seq,
+                        'doc_count': doc_count,
+                        'offset': counter.end_segment(),
+                        'uncompressed_size': counter.bytes_written,
+                        'compression': compression,
+                        'attachments': attachments_mode
+                    })
+            f.write('\n]}')
+        checkpoint_file.unlink(missing_ok=True)
+        
+        if doc_count == 0:
+            log.info(f"✅ [BACKUP] No changes since last backup of {db_name}")
+            return True, f"Incremental backup: no changes since {base_file}"
+        
+        partial_file.replace(delta_file)
+        seq_file.write_text(str(last_seq), encoding='utf-8')
+        file_size = delta_file.stat().st_size
+        
+        base_meta = read_backup_meta(base_file, db_name)
+        base_meta.setdefault('deltas', []).append({
+            'file': delta_file.name,
+            'doc_count': doc_count,
+            'compressed_size': file_size,
+            'uncompressed_size': counter.bytes_written,
+            'sha256': file_sha256(delta_file),
+            'last_seq': last_seq,
+            'created': datetime.now().isoformat(timespec='seconds')
+        })
+        write_backup_meta(base_file, db_name, base_meta)
+        # The base belongs to a backup directory directly under the backup root
+        backup_root = Path(output_dir).parent
+        base_dir = backup_root / base_file.relative_to(backup_root).parts[0]
+        update_backup_manifest(base_dir, db_name, base_file)
+        
+        log.info(f"✅ [BACKUP] Incremental backup completed successfully:")
+        log.info(f"   - 📁 File: {delta_file}")
+        log.info(f"   - 📊 Changed documents: {doc_count}")
+        log.info(f"   - 💾 Size: {file_size} bytes ({counter.bytes_written} bytes uncompressed, {compression})")
+        
+        return True, f"Incremental backup completed: {delta_file} ({doc_count} changed docs, {file_size} bytes, {counter.bytes_written} bytes uncompressed)"
+        
+    except requests.exceptions.RequestException as e:
+        return False, f"HTTP request failed: {str(e)}"
+    except json.JSONDecodeError as e:
+        return False, f"JSON parsing failed: {str(e)}"
+    except Exception as e:
+        return False, f"Incremental backup error: {str(e)}"
+    finally:
+        if partial_file is not None and partial_file.exists() and not checkpoint_file.exists():
+            partial_file.unlink()
+
+def run_backup_bash(source_url: str, db_name: str, output_dir: str) -> Tuple[bool, str]:
+    """Run backup for a specific database using bash script"""
+    log.info(f"🔄 [BACKUP-BASH] Starting bash backup for database: {db_name}")
+    
+    parsed = parse_couchdb_url(source_url)
+    log.info(f"🌐 [BACKUP-BASH] Parsed URL - Host: {parsed['host']}, Port: {parsed['port']}")
+    
+    # Create output directory
+    os.makedirs(output_dir, exist_ok=True)
+    log.info(f"📁 [BACKUP-BASH] Created output directory: {output_dir}")
+    
+    # Check if backup script exists
+    if not BACKUP_SCRIPT.exists():
+        log.error(f"❌ [BACKUP-BASH] Backup script not found at {BACKUP_SCRIPT}")
+        return False, f"Backup script not found at {BACKUP_SCRIPT}"
+    
+    log.info(f"✅ [BACKUP-BASH] Found backup script: {BACKUP_SCRIPT}")
+    
+    # Make sure script is executable
+    try:
+        os.chmod(str(BACKUP_SCRIPT), 0o755)
+        log.info(f"✅ [BACKUP-BASH] Made script executable")
+    except Exception as e:
+        log.error(f"❌ [BACKUP-BASH] Could not make script executable: {str(e)}")
+        return False, f"Could not make script executable: {str(e)}"
+    
+    # Escape spaces in paths with backslashes
+    escaped_script = str(BACKUP_SCRIPT).replace(' ', '\\ ')
+    escaped_output_dir = output_dir.replace(' ', '\\ ')
+    
+    # Build command string with escaped spaces
+    cmd_str = (
+        f'bash {escaped_script} '
+        f'-b '
+        f'-H {parsed["host"]} '
+        f'-P {parsed["port"]} '
+        f'-u {parsed["username"]} '
+        f'-p {parsed["password"]} '
+        f'-d {db_name} '
+        f'-o {escaped_output_dir}'
+    )
+    
+    log.info(f"🚀 [BACKUP-BASH] Executing command:")
+    log.info(f"   {cmd_str}")
+    
+    try:
+        # Use shell=True with proper quoting to handle spaces
+        # Provide "N\nN\n" as input to answer "No" to any prompts
+        log.info(f"⏳ [BACKUP-BASH] Running bash script...")
+        result = subprocess.run(
+            cmd_str,
+            shell=True,
+            capture_output=True,
+            text=True,
+            input="N\nN\n",  # Answer "No" to any prompts
+            timeout=300,  # 5 minutes timeout
+            cwd=str(BASE_DIR)  # Set working directory to couchdb folder
+        )
+        
+        log.info(f"📊 [BACKUP-BASH] Script completed with exit code: {result.returncode}")
+        
+        if result.stdout:
+            log.info(f"📝 [BACKUP-BASH] Script output:")
+            for line in result.stdout.split('\n'):
+                if line.strip():
+                    log.info(f"   {line}")
+        
+        if result.stderr:
+            log.warning(f"⚠️ [BACKUP-BASH] Script errors:")
+            for line in result.stderr.split('\n'):
+                if line.strip():
+                    log.info(f"   {line}")
+        
+        # Combine stdout and stderr for full output
+        full_output = f"STDOUT:\n{result.stdout}\n\nSTDERR:\n{result.stderr}"
+        
+        if result.returncode == 0:
+            log.info(f"✅ [BACKUP-BASH] Script executed successfully, checking for backup file...")
+            # Check if backup file was created
+            backup_files = list(Path(output_dir).glob(f"**/{db_name}.json"))
+            if backup_files:
+                file_size = backup_files[0].stat().st_size
+                log.info(f"✅ [BACKUP-BASH] Backup file created: {backup_files[0]} ({file_size} bytes)")
+                return True, f"Backup completed: {backup_files[0]} ({file_size} bytes)"
+            else:
+                log.error(f"❌ [BACKUP-BASH] Backup script ran but no file created")
+                return False, f"Backup script ran but no file created.\n{full_output}"
+        else:
+            log.error(f"❌ [BACKUP-BASH] Script failed with exit code {result.returncode}")
+            return False, f"Backup failed (exit code {result.returncode}):\n{full_output}"
+    except subprocess.TimeoutExpired as e:
+        return False, f"Backup timeout (5 minutes):\n{e.stdout if e.stdout else ''}\n{e.stderr if e.stderr else ''}"
+    except Exception as e:
+        return False, f"Backup error: {str(e)}"
+
+def run_backup(source_url: str, db_name: str, output_dir: str,
+               timestamp: Optional[str] = None, compression: str = BACKUP_COMPRESSION,
+               dedup_attachments: bool = BACKUP_DEDUP_ATTACHMENTS,
+               sharded: bool = BACKUP_SHARDED, scope: Optional[Dict] = None) -> Tuple[bool, str]:
+    """Run backup for a specific database - try Python method first, fallback to bash script"""
+    # Try Python-based backup first (no curl/path issues)
+    timestamp = timestamp or datetime.now().strftime('%Y%m%d-%H%M%S')
+    if scope is not None:
+        # CouchDB already narrows a scoped export: it is not split into shard ranges,
+        # and never redone by the bash script, which would dump the whole database
+        return run_backup_python(source_url, db_name, output_dir, timestamp, compression, dedup_attachments, scope)
+    python_backup = run_backup_sharded if sharded else run_backup_python
+    success, msg = python_backup(source_url, db_name, output_dir, timestamp, compression, dedup_attachments)
+    if success:
+        return success, msg
+    
+    # A checkpointed backup is resumed rather than redone by the bash script
+    if checkpoint_file_for(backup_file_path(output_dir, db_name, timestamp, compression)).exists():
+        return False, f"{msg} (progress saved - resume the backup to continue)"
+        
+    # Fallback to bash script if Python backup fails
+    log.warning("Python backup failed, trying bash script...")
+    success, msg = run_backup_bash(source_url, db_name, output_dir)
+    backup_file = find_backup_file(Path(output_dir), db_name) if success else None
+    if backup_file is not None:
+        update_backup_manifest(Path(output_dir), db_name, backup_file, source=server_label(source_url))
+    return success, msg
+
+def read_backup_plan(output_dir: str) -> Optional[Dict]:
+    """Read the run plan of a backup run that has not completed (None if there is none)"""
+    return read_checkpoint(Path(output_dir) / RUN_PLAN_NAME)
+
+def find_interrupted_backups(backup_root: Path = BACKUP_DIR) -> List[Dict]:
+    """List the backup runs under backup_root that did not complete, newest first.
+
+    Each entry holds the run plan plus its name, path and the databases still to back up.
+    """
+    if not backup_root.exists():
+        return []
+    interrupted = []
+    for run_dir in backup_root.iterdir():
+        plan = read_backup_plan(str(run_dir)) if run_dir.is_dir() else None
+        if plan is not None:
+            remaining = [db for db in plan['databases'] if db not in plan['completed']]
+            interrupted.append({**plan, 'name': run_dir.name, 'path': str(run_dir), 'remaining': remaining})
+    return sorted(interrupted, key=lambda x: x['created'], reverse=True)
+
+def resume_backups_parallel(source_url: str, output_dir: str,
+                            max_workers: int) -> Iterator[Tuple[str, bool, str]]:
+    """Resume an interrupted backup run with the settings of its run plan.
+
+    Only the databases not completed yet are backed up; those interrupted
+    midway continue from their last checkpoint.
+    """
+    plan = read_backup_plan(output_dir)
+    if plan is None:
+        raise ValueError(f"No interrupted backup in {output_dir}")
+    if plan['source'] != server_label(source_url):
+        raise ValueError(f"The backup in {output_dir} was made from {plan['source']}")
+    remaining = [db for db in plan['databases'] if db not in plan['completed']]
+    log.info(f"⏯️ [BACKUP] Resuming backup {Path(output_dir).name}: {len(remaining)} of {len(plan['databases'])} databases left")
+    yield from run_backups_parallel(
+        source_url, remaining, output_dir, max_workers, plan['incremental'], plan['compression'],
+        plan['dedup_attachments'], timestamp=plan['timestamp'], sharded=plan.get('sharded', False),
+        scope=plan.get('scope')
+    )
+
+def run_backups_parallel(source_url: str, db_names: List[str], output_dir: str,
+                         max_workers: int, incremental: bool = False,
+                         compression: str = BACKUP_COMPRESSION,
+                         dedup_attachments: bool = BACKUP_DEDUP_ATTACHMENTS,
+                         timestamp: Optional[str] = None,
+                         sharded: bool = BACKUP_SHARDED,
+                         scope: Optional[Dict] = None) -> Iterator[Tuple[str, bool, str]]:
+    """Back up several databases concurrently with a bounded worker pool.
+
+    All databases of the run share one backup_{timestamp} directory. Yields
+    (db_name, success, message) in completion order, so the caller can drive
+    progress reporting from its own thread. Once all are done, the duration
+    of the run is recorded in its manifest.
+    
+    Until every database is backed up, a run plan (run.json) in output_dir
+    records the run, so find_interrupted_backups and resume_backups_parallel
+    can pick it up after a crash or failure.
+    
+    With sharded, full backups of large databases are exported as concurrent
+    id ranges from every cluster node (see run_backup_sharded). With a scope,
+    only its documents are backed up (incremental backups cover whole databases).
+    """
+    if incremental and scope is not None:
+        raise ValueError("Incremental backups cover whole databases: drop the document scope")
+    timestamp = timestamp or datetime.now().strftime('%Y%m%d-%H%M%S')
+    started = time.monotonic()
+    backup_fn = run_backup_incremental if incremental else functools.partial(run_backup, scope=scope)
+    log.info(f"🚀 [BACKUP] Backing up {len(db_names)} databases with {max_workers} workers")
+    
+    plan_file = Path(output_dir) / RUN_PLAN_NAME
+    plan = read_backup_plan(output_dir)
+    if plan is None or plan['timestamp'] != timestamp:
+        plan = {
+            'source': server_label(source_url),
+            'databases': list(db_names),
+            'completed': [],
+            'timestamp': timestamp,
+            'incremental': incremental,
+            'compression': compression,
+            'dedup_attachments': dedup_attachments,
+            'sharded': sharded,
+            'scope': scope,
+            'created': datetime.now().isoformat(timespec='seconds')
+        }
+    plan_file.parent.mkdir(parents=True, exist_ok=True)
+    write_json_atomic(plan_file, plan)
+        
+    with ThreadPoolExecutor(max_workers=max(1, max_workers)) as executor:
+        futures = {
+            executor.submit(backup_fn, source_url, db, output_dir, timestamp, compression, dedup_attachments, sharded): db
+            for db in db_names
+        }
+        for future in as_completed(futures):
+            db = futures[future]
+            try:
+                success, msg = future.result()
+            except Exception as e:
+                success, msg = False, f"Backup error: {str(e)}"
+            if success:
+                plan['completed'].append(db)
+                write_json_atomic(plan_file, plan)
+            yield db, success, msg
+    
+    if set(plan['databases']) <= set(plan['completed']):
+        plan_file.unlink()
+        # Incremental runs write into their base backups and may leave output_dir empty
+        with contextlib.suppress(OSError):
+            Path(output_dir).rmdir()
+    if (Path(output_dir) / MANIFEST_NAME).exists():
+        update_backup_manifest(Path(output_dir), duration_s=round(time.monotonic() - started, 3))
@@ -0,0 +1,243 @@
+"""
+Backup manifests and catalog - each backup directory describes its files in a
+manifest.json, and catalog.json at the backup root indexes every manifest so
+backups can be listed without walking or stat-ing the backup files
+"""
+
+import fcntl
+import json
+import threading
+from contextlib import contextmanager
+from datetime import datetime
+from pathlib import Path
+from typing import List, Dict, Optional
+
+from .config import BACKUP_DIR, BLOB_STORE_NAME, CATALOG_LOCK_NAME, CATALOG_NAME, JOBS_DIR_NAME, MANIFEST_NAME
+from .restore import iter_backup_docs
+from .storage import file_sha256, find_backup_files, find_delta_files, read_backup_meta, write_json_atomic
+
+MANIFEST_VERSION = 1
+
+# Manifests and the catalog are rewritten whole; serialize the updates of parallel backups, both
+# threads of this process and backup jobs running as other processes (see catalog_lock)
+_manifest_lock = threading.Lock()
+
+@contextmanager
+def catalog_lock(backup_root: Path):
+    """Hold the lock on the catalog and manifests of a backup root: the thread lock of this
+    process plus an exclusive flock on CATALOG_LOCK_NAME, released when the file is closed"""
+    with _manifest_lock:
+        backup_root.mkdir(parents=True, exist_ok=True)
+        with open(backup_root / CATALOG_LOCK_NAME, 'a') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            yield
+
+def is_backup_dir(path: Path) -> bool:
+    """Whether a directory under the backup root is a backup (not the blob store, job state, a temporary
+    sync backup or an empty directory, which list_backups would otherwise rescan on every call)"""
+    return (path.is_dir() and path.name not in (BLOB_STORE_NAME, JOBS_DIR_NAME) and not path.name.startswith('temp_sync_')
+            and next(path.iterdir(), None) is not None)
+
+def read_backup_manifest(backup_dir: Path) -> Optional[Dict]:
+    """Read the manifest of a backup directory (None if it has none)"""
+    try:
+        return json.loads((backup_dir / MANIFEST_NAME).read_text(encoding='utf-8'))
+    except (OSError, ValueError):
+        return None
+
+def describe_backup_file(backup_dir: Path, backup_file: Path, db_name: str, thorough: bool = False) -> Dict:
+    """Manifest entry of one database backup, from its metadata sidecar.
+
+    Backups without complete metadata (older or bash backups) are described
+    from the file itself: sizes only, or with thorough, also a checksum and a
+    document count (which reads the whole file).
+    """
+    meta = read_backup_meta(backup_file, db_name)
+    file_size = backup_file.stat().st_size
+    entry = {
+        'file': backup_file.relative_to(backup_dir).as_posix(),
+        'doc_count': meta.get('doc_count'),
+        'update_seq': meta.get('update_seq'),
+        'compression': meta.get('compression', {'.gz': 'gzip', '.zst': 'zstd'}.get(backup_file.suffix, 'none')),
+        'compressed_size': file_size,
+        'uncompressed_size': meta.get('uncompressed_size', file_size),
+        'sha256': meta.get('sha256'),
+        'attachments': meta.get('attachments', 'inline'),
+        'duration_s': meta.get('duration_s'),
+        'scope': meta.get('scope'),
+        'deltas': [
+            {**delta, 'file': (backup_file.parent / delta['file']).relative_to(backup_dir).as_posix()}
+            for delta in meta.get('deltas', [])
+        ]
+    }
+    if thorough and entry['sha256'] is None:
+        entry['sha256'] = file_sha256(backup_file)
+    if thorough and entry['doc_count'] is None:
+        try:
+            entry['doc_count'] = sum(1 for _ in iter_backup_docs(backup_file, operation='catalog'))
+        except (ValueError, OSError, EOFError):
+            pass
+    if thorough and not entry['deltas']:
+        # Deltas written by the bash job have no metadata
+        entry['deltas'] = [
+            {'file': f.relative_to(backup_dir).as_posix(), 'compressed_size': f.stat().st_size, 'sha256': file_sha256(f)}
+            for f in find_delta_files(backup_file, db_name)
+        ]
+    return entry
+
+def summarize_manifest(manifest: Dict) -> Dict:
+    """Recompute the totals of a manifest from its database entries"""
+    entries = manifest['databases'].values()
+    manifest['file_count'] = len(manifest['databases'])
+    manifest['doc_count'] = sum(entry['doc_count'] or 0 for entry in entries)
+    manifest['size_bytes'] = sum(
+        entry['compressed_size'] + sum(delta.get('compressed_size', 0) for delta in entry['deltas'])
+        for entry in entries
+    )
+    manifest['uncompressed_bytes'] = sum(
+        entry['uncompressed_size'] + sum(delta.get('uncompressed_size', delta.get('compressed_size', 0)) for delta in entry['deltas'])
+        for entry in entries
+    )
+    return manifest
+
+def build_backup_manifest(backup_dir: Path, thorough: bool = False) -> Dict:
+    """Build the manifest of a backup directory by scanning it (used for backups made without one)"""
+    manifest = {
+        'version': MANIFEST_VERSION,
+        'name': backup_dir.name,
+        'created': datetime.fromtimestamp(backup_dir.stat().st_mtime).isoformat(timespec='seconds'),
+        'source': None,
+        'duration_s': None,
+        'databases': {}
+    }
+    for db_name, backup_file in find_backup_files(backup_dir).items():
+        manifest['databases'][db_name] = describe_backup_file(backup_dir, backup_file, db_name, thorough)
+        meta = read_backup_meta(backup_file, db_name)
+        manifest['source'] = manifest['source'] or meta.get('source')
+        if meta.get('created'):
+            manifest['created'] = min(manifest['created'], meta['created'])
+    return summarize_manifest(manifest)
+
+def manifest_mtime(backup_dir: Path) -> Optional[int]:
+    """Modification time (ns) of the manifest of a backup directory, None without one"""
+    try:
+        return (backup_dir / MANIFEST_NAME).stat().st_mtime_ns
+    except OSError:
+        return None
+
+def catalog_entry(backup_dir: Path, manifest: Dict) -> Dict:
+    """Catalog summary of a backup: everything the backup pickers need, without the per-file
+    details, and the manifest time it was made from"""
+    return {
+        'name': backup_dir.name,
+        'path': str(backup_dir),
+        'created': manifest['created'],
+        'source': manifest.get('source'),
+        'databases': sorted(manifest['databases']),
+        'file_count': manifest['file_count'],
+        'doc_count': manifest['doc_count'],
+        'size_bytes': manifest['size_bytes'],
+        'uncompressed_bytes': manifest['uncompressed_bytes'],
+        'manifest_mtime': manifest_mtime(backup_dir)
+    }
+
+def load_catalog(backup_root: Path = BACKUP_DIR) -> Dict[str, Dict]:
+    """Catalog entries keyed by backup name (empty if there is no catalog yet)"""
+    try:
+        return json.loads((backup_root / CATALOG_NAME).read_text(encoding='utf-8'))['backups']
+    except (OSError, ValueError, KeyError):
+        return {}
+
+def save_catalog(backup_root: Path, entries: Dict[str, Dict]):
+    write_json_atomic(backup_root / CATALOG_NAME, {'version': MANIFEST_VERSION, 'backups': entries})
+
+def update_backup_manifest(backup_dir: Path, db_name: Optional[str] = None, backup_file: Optional[Path] = None,
+                           **fields) -> Dict:
+    """Record a database backup and/or run-level fields (source, duration_s) in the
+    manifest of backup_dir, and refresh the catalog entry of the backup"""
+    with catalog_lock(backup_dir.parent):
+        manifest = read_backup_manifest(backup_dir) or {
+            'version': MANIFEST_VERSION,
+            'name': backup_dir.name,
+            'created': datetime.now().isoformat(timespec='seconds'),
+            'source': None,
+            'duration_s': None,
+            'databases': {}
+        }
+        if db_name is not None and backup_file is not None:
+            manifest['databases'][db_name] = describe_backup_file(backup_dir, backup_file, db_name)
+        manifest.update(fields)
+        summarize_manifest(manifest)
+        write_json_atomic(backup_dir / MANIFEST_NAME, manifest)
+
+        if is_backup_dir(backup_dir):
+            entries = load_catalog(backup_dir.parent)
+            entries[backup_dir.name] = catalog_entry(backup_dir, manifest)
+            save_catalog(backup_dir.parent, entries)
+        return manifest
+
+def rebuild_catalog(backup_root: Path = BACKUP_DIR, force: bool = False, thorough: bool = True) -> List[Dict]:
+    """Rebuild the catalog, writing manifests for backups that have none (or for all with force).
+
+    With thorough, manifests built from scratch include checksums and document
+    counts, which reads every backup file once.
+    """
+    entries = {}
+    if backup_root.exists():
+        for backup_dir in sorted(backup_root.iterdir()):
+            if not is_backup_dir(backup_dir):
+                continue
+            manifest = None if force else read_backup_manifest(backup_dir)
+            if manifest is None:
+                manifest = build_backup_manifest(backup_dir, thorough)
+                if not manifest['databases']:
+                    continue
+                with catalog_lock(backup_root):
+                    write_json_atomic(backup_dir / MANIFEST_NAME, manifest)
+            entries[backup_dir.name] = catalog_entry(backup_dir, manifest)
+        with catalog_lock(backup_root):
+            save_catalog(backup_root, entries)
+    return list(entries.values())
+
+def list_backups(backup_root: Path = BACKUP_DIR) -> List[Dict]:
+    """List all available backups from the catalog.
+
+    Reads catalog.json plus one directory listing of the backup root and the
+    manifest times: entries of deleted backups are dropped, and directories
+    the catalog does not know yet (e.g. made by the bash job) or whose
+    manifest changed since their entry was written (e.g. by a backup job
+    whose catalog update was lost) are indexed from their manifest, or by
+    scanning them once.
+    """
+    if not backup_root.exists():
+        return []
+
+    with catalog_lock(backup_root):
+        entries = load_catalog(backup_root)
+        on_disk = {d.name: d for d in backup_root.iterdir() if is_backup_dir(d)}
+        changed = False
+        for name in set(entries) - set(on_disk):
+            del entries[name]
+            changed = True
+        for name, backup_dir in on_disk.items():
+            if name in entries and entries[name].get('manifest_mtime') == manifest_mtime(backup_dir):
+                continue
+            manifest = read_backup_manifest(backup_dir) or build_backup_manifest(backup_dir)
+            if manifest['databases']:
+                entries[name] = catalog_entry(backup_dir, manifest)
+            else:
+                entries.pop(name, None)
+            changed = True
+        if changed:
+            save_catalog(backup_root, entries)
+
+    backups = [
+        {
+            **entry,
+            'size_mb': round(entry['size_bytes'] / (1024 * 1024), 2),
+            'uncompressed_mb': round(entry['uncompressed_bytes'] / (1024 * 1024), 2),
+            'created': datetime.fromisoformat(entry['created'])
+        }
+        for entry in entries.values()
+    ]
+    return sorted(backups, key=lambda x: x['created'], reverse=True)
@@ -0,0 +1,349 @@
+"""
+Command line interface - backup, restore (whole databases or selected documents), extract, sync, verify,
+delete and the backup catalog without the Streamlit UI (also the process that runs the UI's background jobs)
+
+Examples:
+    python -m couchdb_engine backup --url http://admin:pw@localhost:5984 --all
+    python -m couchdb_engine backup --url http://admin:pw@localhost:5984 --resume cli_backup_20250101_020000
+    python -m couchdb_engine backup --url http://admin:pw@localhost:5984 --db shared --partition customer17 --name customer17
+    python -m couchdb_engine restore --url http://admin:pw@localhost:5984 --backup backups/nightly --clean
+    python -m couchdb_engine restore --url http://admin:pw@localhost:5984 --backup backups/nightly --db orders --doc order-42
+    python -m couchdb_engine extract --backup backups/nightly --db orders --partition customer17 --output orders-17.json
+    python -m couchdb_engine sync --source http://... --target http://... --db users --db orders
+    python -m couchdb_engine sync --source http://... --target http://... --all --method diff
+    python -m couchdb_engine sync --source http://... --target http://... --db users --method stream --clean
+    python -m couchdb_engine sync --source http://... --target http://... --db orders --selector '{"type": "invoice"}'
+    python -m couchdb_engine verify --backup backups/nightly --url http://admin:pw@localhost:5984 --sample 100 --json
+    python -m couchdb_engine catalog --rebuild
+    python -m couchdb_engine delete --url http://admin:pw@localhost:5984 --db scratch
+    python -m couchdb_engine --log-level DEBUG --metrics-file restore.prom restore --url http://... --backup backups/nightly --all
+"""
+
+import argparse
+import contextlib
+import functools
+import json
+import os
+import sys
+import threading
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from .backup import resume_backups_parallel, run_backups_parallel
+from .catalog import list_backups, rebuild_catalog
+from .client import default_backup_concurrency, delete_database, get_databases
+from .config import (
+    BACKUP_COMPRESSION, BACKUP_DEDUP_ATTACHMENTS, BACKUP_DIR, BACKUP_SHARDED, LOG_LEVEL,
+    RESTORE_WARM_INDEXES, SYNC_REPLICATION_CONCURRENCY, VERIFY_CONCURRENCY, VERIFY_SAMPLE_SIZE
+)
+from .logs import configure_logging
+from .metrics import write_metrics_file
+from .restore import extract_docs, id_ranges, run_restore, run_restore_selected
+from .scope import make_scope
+from .storage import available_compressions, backup_db_name, find_backup_files
+from .sync import run_sync_backup, run_sync_revs_diff, run_sync_stream, run_syncs_parallel, run_syncs_replication
+from .verify import verify_backup, verify_backups_parallel
+
+
+def select_databases(url: str, names: Optional[List[str]], all_dbs: bool) -> List[str]:
+    """Databases named with --db, or every non-system database of the server with --all"""
+    if all_dbs:
+        return get_databases(url)
+    return names or []
+
+def select_backup_files(backup: str, names: Optional[List[str]]) -> List[Tuple[str, Optional[Path]]]:
+    """(db_name, backup_file) pairs for a backup file or a backup directory, optionally filtered by --db"""
+    backup_path = Path(backup)
+    if backup_path.is_file():
+        return [(names[0] if names else backup_db_name(backup_path, backup_path.stem), backup_path)]
+
+    backup_files = find_backup_files(backup_path) if backup_path.is_dir() else {}
+    if names:
+        return [(db, backup_files.get(db)) for db in names]
+    return sorted(backup_files.items())
+
+def cmd_backup(args) -> Iterable[Tuple[str, bool, str]]:
+    workers = args.workers or default_backup_concurrency(args.url)
+    if args.resume:
+        try:
+            yield from resume_backups_parallel(args.url, str(Path(args.backup_dir) / args.resume), workers)
+        except ValueError as e:
+            yield args.resume, False, str(e)
+        return
+    
+    db_names = select_databases(args.url, args.db, args.all)
+    name = args.name or f"cli_backup_{datetime.now().strftime('%Y%m%d_%H%M%S')}"
+    yield from run_backups_parallel(
+        args.url, db_names, str(Path(args.backup_dir) / name), workers,
+        incremental=args.incremental, compression=args.compression, dedup_attachments=args.dedup_attachments,
+        sharded=args.sharded, scope=selected_scope(args)
+    )
+
+def selected_ranges(args) -> List[Tuple[str, Optional[str]]]:
+    """Document id ranges selected with --doc, --prefix, --partition, --start-key and --end-key"""
+    return id_ranges(args.doc or (), args.prefix or (), args.partition or (), args.start_key, args.end_key)
+
+def selected_scope(args) -> Optional[Dict]:
+    """Document scope selected with the options of selected_ranges and --selector (None: whole databases)"""
+    return make_scope(args.doc or (), args.prefix or (), args.partition or (), args.start_key, args.end_key,
+                      args.selector)
+
+def mango_selector(value: str) -> Dict:
+    """--selector argument: a JSON object, or @FILE to read it from a file"""
+    try:
+        selector = json.loads(Path(value[1:]).read_text(encoding='utf-8') if value.startswith('@') else value)
+    except (OSError, ValueError) as e:
+        raise argparse.ArgumentTypeError(f"invalid selector: {e}")
+    if not isinstance(selector, dict):
+        raise argparse.ArgumentTypeError("a Mango selector is a JSON object")
+    return selector
+
+def cmd_restore(args) -> Iterable[Tuple[str, bool, str]]:
+    ranges = selected_ranges(args)
+    for db_name, backup_file in select_backup_files(args.backup, args.db):
+        if backup_file is None:
+            yield db_name, False, f"No backup file for '{db_name}' in {args.backup}"
+            continue
+        if ranges:
+            success, msg = run_restore_selected(
+                args.url, db_name, str(backup_file), ranges, apply_deltas=not args.no_deltas
+            )
+        else:
+            success, msg = run_restore(
+                args.url, db_name, str(backup_file), args.clean, apply_deltas=not args.no_deltas,
+                resume=args.resume, warm=args.warm_indexes
+            )
+        yield db_name, success, msg
+
+def cmd_extract(args) -> Iterable[Tuple[str, bool, str]]:
+    output = Path(args.output)
+    for db_name, backup_file in select_backup_files(args.backup, args.db):
+        if backup_file is None:
+            yield db_name, False, f"No backup file for '{db_name}' in {args.backup}"
+            continue
+        output_file = output / f"{db_name}.json" if output.is_dir() else output
+        # The backup's index and deltas are named after its source database, whatever --db says
+        success, msg = extract_docs(
+            str(backup_file), backup_db_name(backup_file, db_name), selected_ranges(args), str(output_file),
+            apply_deltas=not args.no_deltas
+        )
+        yield db_name, success, msg
+
+def cmd_sync(args) -> Iterable[Tuple[str, bool, str]]:
+    db_names = select_databases(args.source, args.db, args.all)
+    if args.new_only:
+        existing = set(get_databases(args.target))
+        db_names = [db for db in db_names if db not in existing]
+
+    scope = selected_scope(args)
+    if args.method == 'replication':
+        return run_syncs_replication(args.source, args.target, db_names, args.workers, args.clean, scope,
+                                     on_progress=args.on_progress)
+    if args.method in ('diff', 'stream'):
+        sync_fn = run_sync_revs_diff if args.method == 'diff' else functools.partial(run_sync_stream, scope=scope)
+        return run_syncs_parallel(sync_fn, args.source, args.target, db_names, args.workers, args.clean)
+    return ((db, *run_sync_backup(args.source, args.target, db, args.clean, scope)) for db in db_names)
+
+def cmd_verify(args) -> Iterable[Tuple[str, bool, str]]:
+    if Path(args.backup).is_dir():
+        yield from verify_backups_parallel(Path(args.backup), args.db, args.url, args.sample, args.full, args.workers)
+        return
+    for db_name, backup_file in select_backup_files(args.backup, args.db):
+        if backup_file is None:
+            yield db_name, False, f"No backup file for '{db_name}' in {args.backup}"
+            continue
+        success, msg = verify_backup(str(backup_file), db_name, args.url, sample=args.sample, full=args.full)
+        yield db_name, success, msg
+
+def cmd_delete(args) -> Iterable[Tuple[str, bool, str]]:
+    return ((db, *delete_database(args.url, db)) for db in args.db)
+
+def cmd_catalog(args) -> Iterable[Tuple[str, bool, str]]:
+    backup_root = Path(args.backup_dir)
+    if args.rebuild:
+        rebuild_catalog(backup_root, force=args.force)
+    for backup in list_backups(backup_root):
+        yield backup['name'], True, (
+            f"{backup['created']:%Y-%m-%d %H:%M:%S} - {backup['file_count']} databases, "
+            f"{backup['doc_count']} docs, {backup['size_mb']} MB"
+        )
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(
+        prog="python -m couchdb_engine",
+        description="Back up, restore, sync, verify and delete CouchDB databases"
+    )
+    output = parser.add_mutually_exclusive_group()
+    output.add_argument("--json", action="store_true",
+                        help="Print a JSON summary on stdout (progress logs go to stderr)")
+    output.add_argument("--jsonl", action="store_true",
+                        help="Print one JSON line per database on stdout as it completes, and {\"progress\": ...} "
+                             "lines while replication syncs run (progress logs go to stderr)")
+    parser.add_argument("--log-level", default=LOG_LEVEL, choices=["DEBUG", "INFO", "WARNING", "ERROR"],
+                        type=str.upper, help=f"Engine log level (default: {LOG_LEVEL})")
+    parser.add_argument("--metrics-file", type=Path, metavar="PATH",
+                        help="Write the run's metrics on exit: Prometheus text for *.prom, otherwise JSON with a summary")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    def add_db_selection(sub, with_all=True):
+        sub.add_argument("--db", action="append", metavar="NAME", help="Database to process (repeatable)")
+        if with_all:
+            sub.add_argument("--all", action="store_true", help="Process every non-system database")
+
+    def add_doc_selection(sub, with_selector=False):
+        sub.add_argument("--doc", action="append", metavar="ID", help="Document id to select (repeatable)")
+        sub.add_argument("--prefix", action="append", help="Select the documents whose id starts with PREFIX (repeatable)")
+        sub.add_argument("--partition", action="append", metavar="NAME",
+                         help="Select the documents of a partition, ids NAME:... (repeatable)")
+        sub.add_argument("--start-key", metavar="ID", help="Select the ids from this one on")
+        sub.add_argument("--end-key", metavar="ID", help="Select the ids before this one")
+        if with_selector:
+            sub.add_argument("--selector", type=mango_selector, metavar="JSON",
+                             help="Only the documents matching this Mango selector (or @FILE), "
+                                  "within the ids selected above if any")
+
+    backup = commands.add_parser("backup", help="Back up databases")
+    backup.add_argument("--url", default=os.getenv("SOURCE_COUCHDB_URL"), help="CouchDB URL (default: SOURCE_COUCHDB_URL)")
+    add_db_selection(backup)
+    backup.add_argument("--backup-dir", default=str(BACKUP_DIR), help="Root backup directory")
+    backup.add_argument("--name", help="Backup name (default: cli_backup_<timestamp>)")
+    backup.add_argument("--workers", type=int, default=0, help="Parallel backups (default: 2 per cluster node)")
+    backup.add_argument("--incremental", action="store_true", help="Only back up changes since the latest backup")
+    backup.add_argument("--compression", choices=available_compressions(), default=BACKUP_COMPRESSION)
+    backup.add_argument("--dedup-attachments", action=argparse.BooleanOptionalAction, default=BACKUP_DEDUP_ATTACHMENTS,
+                        help="Store attachments once in the shared blob store")
+    backup.add_argument("--sharded", action=argparse.BooleanOptionalAction, default=BACKUP_SHARDED,
+                        help="Export large databases as id ranges read from every cluster node in parallel")
+    backup.add_argument("--resume", metavar="NAME",
+                        help="Resume the interrupted backup NAME (under --backup-dir) with its original settings")
+    add_doc_selection(backup, with_selector=True)
+    backup.set_defaults(handler=cmd_backup)
+
+    restore = commands.add_parser("restore", help="Restore databases from a backup file or directory")
+    restore.add_argument("--url", default=os.getenv("TARGET_COUCHDB_URL"), help="CouchDB URL (default: TARGET_COUCHDB_URL)")
+    restore.add_argument("--backup", required=True, help="Backup file or directory")
+    add_db_selection(restore, with_all=False)
+    restore.add_argument("--clean", action="store_true", help="Delete each database before restoring it")
+    restore.add_argument("--no-deltas", action="store_true", help="Do not replay incremental deltas")
+    restore.add_argument("--resume", action="store_true",
+                         help="Continue interrupted restores from their checkpoint instead of starting over")
+    restore.add_argument("--warm-indexes", action=argparse.BooleanOptionalAction, default=RESTORE_WARM_INDEXES,
+                         help="Build every view and Mango index before reporting the restore done")
+    add_doc_selection(restore)
+    restore.set_defaults(handler=cmd_restore)
+
+    extract = commands.add_parser("extract", help="Copy selected documents out of a backup into a new backup file")
+    extract.add_argument("--backup", required=True, help="Backup file or directory")
+    add_db_selection(extract, with_all=False)
+    add_doc_selection(extract)
+    extract.add_argument("--output", required=True,
+                         help="Output file, or a directory to write one {db}.json per database into")
+    extract.add_argument("--no-deltas", action="store_true", help="Ignore incremental deltas")
+    extract.set_defaults(handler=cmd_extract)
+
+    sync = commands.add_parser("sync", help="Copy databases from one server to another")
+    sync.add_argument("--source", default=os.getenv("SOURCE_COUCHDB_URL"), help="Source URL (default: SOURCE_COUCHDB_URL)")
+    sync.add_argument("--target", default=os.getenv("TARGET_COUCHDB_URL"), help="Target URL (default: TARGET_COUCHDB_URL)")
+    add_db_selection(sync)
+    sync.add_argument("--new-only", action="store_true", help="Skip databases that already exist on the target")
+    sync.add_argument("--method", choices=["replication", "diff", "stream", "backup"], default="replication",
+                      help="replication: server-to-server _replicator jobs; diff: copy only the revisions missing "
+                           "on the target through this host; stream: full copy through this host's memory, "
+                           "no local disk; backup: backup and restore through this host")
+    sync.add_argument("--workers", type=int, default=SYNC_REPLICATION_CONCURRENCY,
+                      help="Databases synced in parallel (replication, diff and stream)")
+    sync.add_argument("--clean", action="store_true", help="Delete each target database before syncing it")
+    add_doc_selection(sync, with_selector=True)
+    sync.set_defaults(handler=cmd_sync)
+
+    verify = commands.add_parser("verify", help="Check backup files, optionally against a live server")
+    verify.add_argument("--backup", required=True, help="Backup file or directory")
+    add_db_selection(verify, with_all=False)
+    verify.add_argument("--url", help="Also compare document counts with this CouchDB server")
+    verify.add_argument("--sample", type=int, default=VERIFY_SAMPLE_SIZE,
+                        help="With --url, compare the revisions of this many random documents per database")
+    verify.add_argument("--full", action="store_true", help="With --url, compare the revisions of every document")
+    verify.add_argument("--workers", type=int, default=VERIFY_CONCURRENCY, help="Databases verified in parallel")
+    verify.set_defaults(handler=cmd_verify)
+
+    catalog = commands.add_parser("catalog", help="List backups from the backup catalog")
+    catalog.add_argument("--backup-dir", default=str(BACKUP_DIR), help="Root backup directory")
+    catalog.add_argument("--rebuild", action="store_true",
+                         help="Rebuild the catalog, writing manifests (with checksums) for backups that have none")
+    catalog.add_argument("--force", action="store_true", help="With --rebuild, rewrite existing manifests as well")
+    catalog.set_defaults(handler=cmd_catalog)
+
+    delete = commands.add_parser("delete", help="Delete databases (each one named with --db)")
+    delete.add_argument("--url", default=os.getenv("SOURCE_COUCHDB_URL"), help="CouchDB URL (default: SOURCE_COUCHDB_URL)")
+    add_db_selection(delete, with_all=False)
+    delete.set_defaults(handler=cmd_delete)
+
+    return parser
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = build_parser()
+    args = parser.parse_args(argv)
+
+    for url_arg in ("url", "source", "target"):
+        if url_arg in vars(args) and args.command != "verify" and not getattr(args, url_arg):
+            parser.error(f"--{url_arg} is required (or set it in the environment)")
+    if args.command in ("backup", "sync") and not (args.all or args.db or getattr(args, "resume", None)):
+        parser.error("select databases with --db or --all")
+    if args.command == "delete" and not args.db:
+        parser.error("name each database to delete with --db")
+    if args.command == "verify" and (args.full or args.sample) and not args.url:
+        parser.error("--sample and --full compare with a live server: add --url")
+    if args.command == "backup" and selected_scope(args) and (args.incremental or args.resume):
+        parser.error("--incremental and --resume apply to whole databases, not to a document selection")
+    if args.command == "sync" and selected_scope(args) and args.method == "diff":
+        parser.error("--method diff compares whole databases: select documents with replication, stream or backup")
+    if args.command in ("restore", "extract") and selected_ranges(args):
+        if args.command == "restore" and (args.clean or args.resume):
+            parser.error("--clean and --resume apply to whole-database restores, not to a document selection")
+    elif args.command == "extract":
+        parser.error("select documents with --doc, --prefix, --partition, --start-key or --end-key")
+
+    configure_logging(args.log_level)
+    results = []
+    stdout = sys.stdout
+    print_lock = threading.Lock()
+
+    def print_progress(progress: Dict):
+        # Called from the sync worker threads while replications run
+        if args.json or progress['state'] != 'running':
+            return
+        with print_lock:
+            if args.jsonl:
+                print(json.dumps({'progress': progress}), file=stdout, flush=True)
+            else:
+                print(f"🔁 {progress['database']}: {progress['docs_written'] or 0} documents written, "
+                      f"{progress['changes_pending'] or 0} changes pending", flush=True)
+
+    args.on_progress = print_progress
+    # Keep stdout clean for the JSON output: engine progress logs go to stderr
+    with contextlib.redirect_stdout(sys.stderr) if args.json or args.jsonl else contextlib.nullcontext():
+        try:
+            for db_name, success, msg in args.handler(args):
+                results.append({'database': db_name, 'success': success, 'message': msg})
+                with print_lock:
+                    if args.jsonl:
+                        print(json.dumps(results[-1]), file=stdout, flush=True)
+                    elif not args.json:
+                        print(f"{'✅' if success else '❌'} {db_name}: {msg}", flush=True)
+        finally:
+            if args.metrics_file:
+                write_metrics_file(args.metrics_file)
+
+    failed = sum(1 for r in results if not r['success'])
+    if args.json:
+        print(json.dumps({
+            'command': args.command,
+            'succeeded': len(results) - failed,
+            'failed': failed,
+            'results': results
+        }, indent=2))
+    else:
+        print(f"{args.command}: {len(results) - failed}/{len(results)} databases succeeded",
+              file=sys.stderr if args.jsonl else sys.stdout)
+    return 1 if failed else 0
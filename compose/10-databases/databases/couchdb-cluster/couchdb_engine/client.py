@@ -0,0 +1,247 @@
+"""
+CouchDB HTTP client - pooled sessions, server and database information, deletion
+"""
+
+import requests
+import threading
+import time
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from urllib.parse import urlparse
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Dict, Tuple
+
+from .config import (
+    BACKUP_CONCURRENCY, BACKUP_MAX_CONCURRENCY, BACKUP_WORKERS_PER_NODE,
+    COUCHDB_HTTP_BACKOFF, COUCHDB_HTTP_RETRIES, COUCHDB_HTTP_TIMEOUT, COUCHDB_POOL_SIZE,
+    DBS_INFO_BATCH_SIZE, DBS_INFO_CONCURRENCY
+)
+from .logs import get_logger
+from .metrics import metrics
+
+log = get_logger(__name__)
+
+class CouchDBHttp:
+    """Pooled HTTP client: one keep-alive requests.Session per server (scheme://host:port).
+
+    Exposes get/put/post/head/delete like the requests module. Idempotent
+    methods are retried with exponential backoff on 429/5xx; every method is
+    retried on connection errors. POST (e.g. _bulk_docs) is not retried on
+    status codes - callers handle that with knowledge of the payload.
+    """
+
+    RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+    def __init__(self, pool_size: int = COUCHDB_POOL_SIZE, retries: int = COUCHDB_HTTP_RETRIES,
+                 backoff: float = COUCHDB_HTTP_BACKOFF, timeout: int = COUCHDB_HTTP_TIMEOUT):
+        self.pool_size = pool_size
+        self.retries = retries
+        self.backoff = backoff
+        self.timeout = timeout
+        self._sessions: Dict[str, requests.Session] = {}
+        self._lock = threading.Lock()
+
+    def session_for(self, url: str) -> requests.Session:
+        """Get (or create) the pooled session of the server hosting url"""
+        parsed = urlparse(url)
+        key = f"{parsed.scheme}://{parsed.hostname}:{parsed.port}"
+        with self._lock:
+            session = self._sessions.get(key)
+            if session is None:
+                retry = Retry(
+                    total=self.retries,
+                    backoff_factor=self.backoff,
+                    status_forcelist=self.RETRY_STATUSES,
+                    raise_on_status=False,
+                    respect_retry_after_header=True
+                )
+                adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.pool_size, max_retries=retry)
+                session = requests.Session()
+                session.mount('http://', adapter)
+                session.mount('https://', adapter)
+                self._sessions[key] = session
+            return session
+
+    def request(self, method: str, url: str, **kwargs) -> requests.Response:
+        kwargs.setdefault('timeout', self.timeout)
+        started = time.perf_counter()
+        status = 'error'
+        try:
+            response = self.session_for(url).request(method, url, **kwargs)
+            status = str(response.status_code)
+            return response
+        finally:
+            # Time to the response headers (streamed bodies are read by the caller)
+            metrics.observe('http_request_duration_seconds', time.perf_counter() - started,
+                            method=method, endpoint=request_endpoint(url), status=status)
+
+    def get(self, url: str, **kwargs) -> requests.Response:
+        return self.request('GET', url, **kwargs)
+
+    def put(self, url: str, **kwargs) -> requests.Response:
+        return self.request('PUT', url, **kwargs)
+
+    def post(self, url: str, **kwargs) -> requests.Response:
+        return self.request('POST', url, **kwargs)
+
+    def head(self, url: str, **kwargs) -> requests.Response:
+        return self.request('HEAD', url, **kwargs)
+
+    def delete(self, url: str, **kwargs) -> requests.Response:
+        return self.request('DELETE', url, **kwargs)
+
+# Shared by every operation of the manager (UI, backups, restores, syncs)
+couch_http = CouchDBHttp()
+
+def request_endpoint(url: str) -> str:
+    """Endpoint of a request for the latency metrics, without database or document names:
+    _all_docs, _bulk_docs, _changes, ... or document, database, server"""
+    segments = [segment for segment in urlparse(url).path.split('/') if segment]
+    for segment in reversed(segments):
+        if segment.startswith('_') and segment not in ('_design', '_local'):
+            return segment
+    if len(segments) >= 2:
+        return 'document'
+    return 'database' if segments else 'server'
+
+def parse_couchdb_url(url: str) -> Dict[str, str]:
+    """Parse CouchDB URL to extract components"""
+    parsed = urlparse(url)
+    return {
+        'host': parsed.hostname,
+        'port': str(parsed.port) if parsed.port else '5984',
+        'username': parsed.username or '',
+        'password': parsed.password or '',
+        'protocol': parsed.scheme
+    }
+
+def server_label(url: str) -> str:
+    """Server URL without credentials, safe to record in manifests and logs"""
+    parsed = parse_couchdb_url(url)
+    return f"{parsed['protocol']}://{parsed['host']}:{parsed['port']}"
+
+def test_connection(url: str) -> Tuple[bool, str]:
+    """Test CouchDB connection"""
+    try:
+        response = couch_http.get(f"{url.rstrip('/')}/_up", timeout=5)
+        if response.status_code == 200:
+            return True, "✅ Connection successful"
+        else:
+            return False, f"❌ Connection failed: HTTP {response.status_code}"
+    except requests.exceptions.RequestException as e:
+        return False, f"❌ Connection failed: {str(e)}"
+
+def get_databases(url: str) -> List[str]:
+    """Get list of databases from CouchDB"""
+    try:
+        response = couch_http.get(f"{url.rstrip('/')}/_all_dbs", timeout=10)
+        if response.status_code == 200:
+            # Filter out system databases
+            dbs = [db for db in response.json() if not db.startswith('_')]
+            return dbs
+        return []
+    except:
+        return []
+
+def get_cluster_size(url: str) -> int:
+    """Get the number of nodes in the cluster (1 for a single node or on error)"""
+    try:
+        response = couch_http.get(f"{url.rstrip('/')}/_membership", timeout=5)
+        if response.status_code == 200:
+            return max(1, len(response.json().get('cluster_nodes', [])))
+        return 1
+    except:
+        return 1
+
+def default_backup_concurrency(url: str) -> int:
+    """Default number of parallel backups: BACKUP_CONCURRENCY or a few workers per cluster node"""
+    if BACKUP_CONCURRENCY > 0:
+        return min(BACKUP_MAX_CONCURRENCY, BACKUP_CONCURRENCY)
+    return min(BACKUP_MAX_CONCURRENCY, BACKUP_WORKERS_PER_NODE * get_cluster_size(url))
+
+def get_database_info(url: str, db_name: str) -> Dict:
+    """Get database information"""
+    try:
+        response = couch_http.get(f"{url.rstrip('/')}/{db_name}", timeout=5)
+        if response.status_code == 200:
+            return response.json()
+        return {}
+    except:
+        return {}
+
+def get_databases_info(url: str, db_names: List[str]) -> Dict[str, Dict]:
+    """Get information for many databases at once, keyed by database name
+
+    Uses POST /_dbs_info (CouchDB 2.2+) in batches of DBS_INFO_BATCH_SIZE. Servers
+    without it get concurrent GET /{db} requests instead. Missing databases map to {}.
+    """
+    base_url = url.rstrip('/')
+    infos: Dict[str, Dict] = {}
+    pending = list(db_names)
+
+    for start in range(0, len(db_names), DBS_INFO_BATCH_SIZE):
+        batch = db_names[start:start + DBS_INFO_BATCH_SIZE]
+        try:
+            response = couch_http.post(f"{base_url}/_dbs_info", json={'keys': batch}, timeout=30)
+        except requests.exceptions.RequestException:
+            break
+        if response.status_code != 200:
+            # Older servers treat _dbs_info as a database name (400/404) or lack POST (405)
+            break
+        for row in response.json():
+            infos[row.get('key')] = row.get('info') or {}
+        pending = db_names[start + len(batch):]
+
+    if pending:
+        with ThreadPoolExecutor(max_workers=max(1, min(DBS_INFO_CONCURRENCY, len(pending)))) as executor:
+            for db_name, info in zip(pending, executor.map(lambda db: get_database_info(base_url, db), pending)):
+                infos[db_name] = info
+
+    return {db_name: infos.get(db_name, {}) for db_name in db_names}
+
+def delete_database(server_url: str, db_name: str) -> Tuple[bool, str]:
+    """Delete a database from CouchDB server"""
+    try:
+        log.info(f"🗑️ [DELETE] Starting deletion of database: {db_name}")
+        
+        # Parse server URL
+        parsed = parse_couchdb_url(server_url)
+        base_url = f"http://{parsed['host']}:{parsed['port']}"
+        auth = (parsed['username'], parsed['password'])
+        
+        log.info(f"🌐 [DELETE] Target server: {base_url}")
+        
+        # Check if database exists
+        db_url = f"{base_url}/{db_name}"
+        log.info(f"🔍 [DELETE] Checking if database exists: {db_name}")
+        
+        response = couch_http.head(db_url, auth=auth, timeout=10)
+        
+        if response.status_code == 404:
+            log.error(f"❌ [DELETE] Database '{db_name}' does not exist")
+            return False, f"Database '{db_name}' does not exist"
+        elif response.status_code != 200:
+            log.error(f"❌ [DELETE] Error checking database: HTTP {response.status_code}")
+            return False, f"Error checking database: HTTP {response.status_code} - {response.text}"
+        
+        log.info(f"✅ [DELETE] Database exists, proceeding with deletion")
+        
+        # Delete the database
+        log.info(f"🗑️ [DELETE] Sending DELETE request...")
+        delete_response = couch_http.delete(db_url, auth=auth, timeout=30)
+        
+        log.info(f"📊 [DELETE] Delete response: HTTP {delete_response.status_code}")
+        
+        if delete_response.status_code in [200, 202]:
+            log.info(f"✅ [DELETE] Database '{db_name}' deleted successfully (HTTP {delete_response.status_code})")
+            return True, f"Database '{db_name}' deleted successfully"
+        else:
+            log.error(f"❌ [DELETE] Failed to delete database: HTTP {delete_response.status_code}")
+            return False, f"Failed to delete database: HTTP {delete_response.status_code} - {delete_response.text}"
+            
+    except requests.RequestException as e:
+        log.error(f"❌ [DELETE] Network error: {str(e)}")
+        return False, f"Network error: {str(e)}"
+    except Exception as e:
+        log.error(f"❌ [DELETE] Error: {str(e)}")
+        return False, f"Error: {str(e)}"
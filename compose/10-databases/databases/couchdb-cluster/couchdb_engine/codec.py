@@ -0,0 +1,156 @@
+"""
+JSON codec - documents decoded and encoded with orjson when it is installed, producing exactly the
+bytes of the standard library, and a pool of worker processes for the JSON work of large restores
+"""
+
+import json
+import multiprocessing
+import multiprocessing.util
+import os
+import sys
+import threading
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from typing import Callable, Iterable, Iterator, List, Optional, Union
+
+try:
+    import orjson
+except ImportError:  # orjson is optional
+    orjson = None
+
+from .config import CODEC_PROCESSES, JSON_CODEC
+from .logs import get_logger
+
+log = get_logger(__name__)
+
+def available_codecs() -> List[str]:
+    """JSON codecs usable here (orjson only when the package is installed)"""
+    return ['stdlib'] + (['orjson'] if orjson is not None else [])
+
+def active_codec() -> str:
+    """The codec selected by JSON_CODEC: orjson for 'auto' when installed, otherwise stdlib"""
+    if JSON_CODEC == 'orjson' and orjson is None:
+        raise ValueError("JSON_CODEC=orjson requires the 'orjson' package")
+    if JSON_CODEC in ('auto', 'orjson') and orjson is not None:
+        return 'orjson'
+    return 'stdlib'
+
+_fast = active_codec() == 'orjson'
+
+def plain_floats(value) -> bool:
+    """Whether every float in a decoded value is 0 or between 1e-4 and 1e16 in magnitude,
+    the floats repr() writes without an exponent.
+
+    orjson reads and writes those exactly like the standard library; it writes
+    the others differently (1e16 vs 1e+16, 0.00001 vs 1e-05, null vs NaN) and
+    decodes integers beyond 64 bits as such floats. Only containers and floats
+    are looked at, so strings cost nothing however long.
+    """
+    kind = type(value)
+    if kind is float:
+        return 1e-4 <= abs(value) < 1e16 or value == 0
+    if kind is not dict and kind is not list:
+        return True
+    for item in (value.values() if kind is dict else value):
+        kind = type(item)
+        if kind is float:
+            if not (1e-4 <= abs(item) < 1e16 or item == 0):
+                return False
+        elif (kind is dict or kind is list) and not plain_floats(item):
+            return False
+    return True
+
+def loads(data: Union[bytes, str]):
+    """Decode JSON text or UTF-8 bytes into the same values as json.loads.
+
+    Input orjson rejects (lone surrogates, NaN, numbers out of float range) or
+    may have rounded (see plain_floats) is decoded by the standard library instead.
+    """
+    if _fast:
+        try:
+            value = orjson.loads(data)
+        except orjson.JSONDecodeError:
+            pass
+        else:
+            if plain_floats(value):
+                return value
+    return json.loads(data)
+
+def dumps_doc(doc) -> str:
+    """Compact JSON text of a document, identical to json.dumps(doc, separators=(',', ':'), ensure_ascii=False).
+
+    Documents with floats orjson formats differently (see plain_floats) or values
+    it cannot encode (integers beyond 64 bits, lone surrogates, non-string keys)
+    are encoded by the standard library.
+    """
+    if _fast and plain_floats(doc):
+        try:
+            return orjson.dumps(doc).decode('utf-8')
+        except TypeError:
+            pass
+    return json.dumps(doc, separators=(',', ':'), ensure_ascii=False)
+
+def codec_processes() -> int:
+    """Worker processes of the codec pool: CODEC_PROCESSES, or one per CPU core.
+
+    1 (no pool) in daemonic processes such as multiprocessing.Pool workers,
+    which cannot start any, and when __main__ is a script file (the Streamlit
+    app), which every worker would run again; `python -m couchdb_engine` and
+    the background jobs started with it do get the pool.
+    """
+    main = sys.modules.get('__main__')
+    if multiprocessing.current_process().daemon or (
+        getattr(main, '__spec__', None) is None and getattr(main, '__file__', None) is not None
+    ):
+        return 1
+    return CODEC_PROCESSES if CODEC_PROCESSES > 0 else (os.cpu_count() or 1)
+
+def watch_parent():
+    """Codec worker initializer: exit as soon as the process owning the pool ends, even when it
+    is killed (e.g. a cancelled job), instead of waiting for work that will never come"""
+    parent = multiprocessing.parent_process()
+    if parent is not None:
+        def wait():
+            parent.join()
+            os._exit(0)
+        threading.Thread(target=wait, name='codec-parent', daemon=True).start()
+
+_pool: Optional[ProcessPoolExecutor] = None
+_pool_lock = threading.Lock()
+
+def get_codec_pool() -> ProcessPoolExecutor:
+    """The codec worker pool of this process, created on first use and shared by every restore.
+
+    Workers are started from a fork server where available - forking the
+    UI or a job process, with its threads and sockets, would not be safe. The
+    pool is shut down before multiprocessing waits for the children of an exiting
+    process, which would otherwise wait forever on its idle workers.
+    """
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            if 'forkserver' in multiprocessing.get_all_start_methods():
+                context = multiprocessing.get_context('forkserver')
+                context.set_forkserver_preload(['couchdb_engine.codec'])
+            else:
+                context = multiprocessing.get_context('spawn')
+            _pool = ProcessPoolExecutor(max_workers=codec_processes(), mp_context=context, initializer=watch_parent)
+            multiprocessing.util.Finalize(None, _pool.shutdown, exitpriority=20)
+            log.info(f"🧮 [CODEC] Started {codec_processes()} JSON worker processes ({active_codec()})")
+        return _pool
+
+def map_ordered(fn: Callable, items: Iterable, *args, ahead: Optional[int] = None) -> Iterator:
+    """fn(item, *args) for every item, computed in the codec pool and yielded in order.
+
+    At most `ahead` items (default: twice the workers) are submitted ahead of
+    the one being consumed, so memory stays bounded however many items there are.
+    """
+    pool = get_codec_pool()
+    ahead = ahead or 2 * codec_processes()
+    pending = deque()
+    for item in items:
+        pending.append(pool.submit(fn, item, *args))
+        if len(pending) >= ahead:
+            yield pending.popleft().result()
+    while pending:
+        yield pending.popleft().result()
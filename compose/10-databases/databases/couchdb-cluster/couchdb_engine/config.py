@@ -0,0 +1,176 @@
+"""
+Engine configuration - paths and tuning knobs, read from the environment (and .env)
+"""
+
+import os
+import re
+from pathlib import Path
+from dotenv import load_dotenv
+
+# Load environment variables from .env file
+load_dotenv()
+
+# Configuration - Base directory is the application directory
+BASE_DIR = Path(__file__).parent.parent.resolve()
+
+# Configuration
+BACKUP_DIR = Path(os.getenv("BACKUP_DIR", str(BASE_DIR / "backups")))
+BACKUP_SCRIPT = BASE_DIR / "manage" / "backup_restore_couchdb.sh"
+
+# HTTP connection pooling - one keep-alive session per CouchDB server, shared by all
+# operations, with exponential backoff on connection errors, 429 and 5xx
+COUCHDB_POOL_SIZE = int(os.getenv("COUCHDB_POOL_SIZE", "32"))
+COUCHDB_HTTP_RETRIES = int(os.getenv("COUCHDB_HTTP_RETRIES", "3"))
+COUCHDB_HTTP_BACKOFF = float(os.getenv("COUCHDB_HTTP_BACKOFF", "0.5"))
+COUCHDB_HTTP_TIMEOUT = int(os.getenv("COUCHDB_HTTP_TIMEOUT", "30"))
+
+# Backup paging - documents per _all_docs request and per-request timeout (seconds)
+BACKUP_PAGE_SIZE = int(os.getenv("BACKUP_PAGE_SIZE", "500"))
+BACKUP_PAGE_TIMEOUT = int(os.getenv("BACKUP_PAGE_TIMEOUT", "120"))
+
+# Parallel backups - explicit worker count, otherwise derived from the cluster size
+BACKUP_CONCURRENCY = int(os.getenv("BACKUP_CONCURRENCY", "0"))
+BACKUP_WORKERS_PER_NODE = 2
+BACKUP_MAX_CONCURRENCY = 16
+
+# Shard-aware backups - a large database is split into BACKUP_SHARD_RANGES document id ranges
+# (0: BACKUP_WORKERS_PER_NODE per cluster node) exported concurrently, each from a cluster node
+# directly, and merged in id order. Nodes are taken from CLUSTER_NODE_URLS (comma-separated),
+# otherwise from the node names of /{db}/_shards (couchdb@<host> -> <host>:CLUSTER_NODE_PORT,
+# with the credentials of the backup URL); databases below BACKUP_SHARDED_MIN_DOCS use one stream.
+# Range boundaries come from one ids-only _all_docs pass, SHARD_SPLIT_PAGE_SIZE ids per request
+BACKUP_SHARDED = os.getenv("BACKUP_SHARDED", "false").lower() == "true"
+BACKUP_SHARDED_MIN_DOCS = int(os.getenv("BACKUP_SHARDED_MIN_DOCS", "100000"))
+BACKUP_SHARD_RANGES = int(os.getenv("BACKUP_SHARD_RANGES", "0"))
+CLUSTER_NODE_URLS = [url.strip() for url in os.getenv("CLUSTER_NODE_URLS", "").split(",") if url.strip()]
+CLUSTER_NODE_PORT = int(os.getenv("CLUSTER_NODE_PORT", "5984"))
+SHARD_SPLIT_PAGE_SIZE = 10000
+
+# Restore batching - each _bulk_docs request is bounded by document count and
+# payload size, with several batches in flight and retries on transient errors
+RESTORE_BATCH_SIZE = int(os.getenv("RESTORE_BATCH_SIZE", "1000"))
+RESTORE_BATCH_BYTES = int(os.getenv("RESTORE_BATCH_BYTES", str(8 * 1024 * 1024)))
+RESTORE_CONCURRENCY = int(os.getenv("RESTORE_CONCURRENCY", "4"))
+RESTORE_RETRIES = int(os.getenv("RESTORE_RETRIES", "3"))
+RESTORE_BATCH_TIMEOUT = int(os.getenv("RESTORE_BATCH_TIMEOUT", "120"))
+RESTORE_READ_CHUNK = 1024 * 1024
+RESTORE_MAX_READ_CHUNK = 64 * 1024 * 1024
+
+# Adaptive restore concurrency - the _bulk_docs requests in flight to one server (shared by every
+# restore and revision-diff sync writing to it) start at RESTORE_CONCURRENCY and are tuned AIMD-style:
+# +1 per round of batches answered within half of RESTORE_LATENCY_TARGET seconds, multiplied by
+# RESTORE_BACKOFF_FACTOR on 429/5xx, network errors or answers slower than the target, and kept between
+# RESTORE_MIN_CONCURRENCY and the hard ceiling RESTORE_MAX_CONCURRENCY (RESTORE_ADAPTIVE=false: fixed
+# at RESTORE_CONCURRENCY). RESTORE_MAX_BYTES_PER_SEC (0: unlimited) caps the upload rate per server
+RESTORE_ADAPTIVE = os.getenv("RESTORE_ADAPTIVE", "true").lower() == "true"
+RESTORE_MIN_CONCURRENCY = int(os.getenv("RESTORE_MIN_CONCURRENCY", "1"))
+RESTORE_MAX_CONCURRENCY = int(os.getenv("RESTORE_MAX_CONCURRENCY", "16"))
+RESTORE_LATENCY_TARGET = float(os.getenv("RESTORE_LATENCY_TARGET", "10"))
+RESTORE_BACKOFF_FACTOR = float(os.getenv("RESTORE_BACKOFF_FACTOR", "0.5"))
+RESTORE_MAX_BYTES_PER_SEC = int(os.getenv("RESTORE_MAX_BYTES_PER_SEC", "0"))
+
+# Index warm-up - after a restore (optionally by default), every view group and Mango index is
+# queried once so that the first production query does not wait for a cold index build;
+# indexer progress is read from _active_tasks every WARMUP_POLL_INTERVAL seconds
+RESTORE_WARM_INDEXES = os.getenv("RESTORE_WARM_INDEXES", "false").lower() == "true"
+WARMUP_CONCURRENCY = int(os.getenv("WARMUP_CONCURRENCY", "4"))
+WARMUP_TIMEOUT = int(os.getenv("WARMUP_TIMEOUT", "3600"))
+WARMUP_POLL_INTERVAL = float(os.getenv("WARMUP_POLL_INTERVAL", "5"))
+
+# Backup compression - none, gzip or zstd (zstd requires the zstandard package)
+BACKUP_COMPRESSION = os.getenv("BACKUP_COMPRESSION", "none")
+COMPRESSION_EXTENSIONS = {'none': '', 'gzip': '.gz', 'zstd': '.zst'}
+BACKUP_FILE_PATTERN = re.compile(r"^(?P<db>.+)\.json(?P<ext>\.gz|\.zst)?$")
+
+# Backup offset index - every Python backup writes {db}.idx next to the file (document id ->
+# offset and length in the uncompressed stream, sorted by id); selective restores look documents
+# up there and read only them, decompressing from the nearest compressed segment (a new one
+# starts at each checkpoint) INDEX_READ_CHUNK bytes at a time
+INDEX_READ_CHUNK = 64 * 1024
+
+# Content-addressed attachment store shared by all backups under the same root
+BLOB_STORE_NAME = "_blobs"
+BACKUP_DEDUP_ATTACHMENTS = os.getenv("BACKUP_DEDUP_ATTACHMENTS", "false").lower() == "true"
+
+# Checkpoints - interrupted backups and restores resume from the last checkpoint instead of
+# starting over. A backup checkpoints every BACKUP_CHECKPOINT_PAGES pages, a restore every
+# RESTORE_CHECKPOINT_BATCHES acknowledged _bulk_docs batches; run.json records a backup run
+# until all of its databases are done
+BACKUP_CHECKPOINT_PAGES = int(os.getenv("BACKUP_CHECKPOINT_PAGES", "20"))
+RESTORE_CHECKPOINT_BATCHES = int(os.getenv("RESTORE_CHECKPOINT_BATCHES", "10"))
+RUN_PLAN_NAME = "run.json"
+
+# Background jobs - UI operations run as `python -m couchdb_engine` subprocesses, at most
+# JOB_CONCURRENCY at a time; job state and logs are kept in BACKUP_DIR/_jobs (the most
+# recent JOB_HISTORY finished jobs), and the Jobs tab refreshes every JOB_REFRESH_INTERVAL seconds
+JOBS_DIR_NAME = "_jobs"
+JOBS_DIR = BACKUP_DIR / JOBS_DIR_NAME
+JOB_CONCURRENCY = int(os.getenv("JOB_CONCURRENCY", "2"))
+JOB_HISTORY = int(os.getenv("JOB_HISTORY", "50"))
+JOB_REFRESH_INTERVAL = float(os.getenv("JOB_REFRESH_INTERVAL", "2"))
+JOB_CANCEL_GRACE = 10
+JOB_LOG_TAIL = 64 * 1024
+
+# Logging and metrics - engine logs go through the "couchdb_engine" logger at LOG_LEVEL (DEBUG adds
+# per-page and per-batch progress), as plain lines or, with LOG_FORMAT=json, one JSON object per line.
+# Counters, phase timers and request latency histograms are served as Prometheus text on
+# METRICS_PORT (0: off) by the manager; CLI runs and background jobs write them with --metrics-file
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+LOG_FORMAT = os.getenv("LOG_FORMAT", "text")
+METRICS_PORT = int(os.getenv("METRICS_PORT", "0"))
+METRICS_PREFIX = "couchdb_manager"
+METRICS_LATENCY_BUCKETS = [0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60]
+
+# Backup manifests (one per backup directory) and the catalog indexing them all
+MANIFEST_NAME = "manifest.json"
+CATALOG_NAME = "catalog.json"
+CATALOG_LOCK_NAME = "catalog.lock"
+
+# Backup verification - backups checked in parallel; live comparisons page _all_docs for id/rev pairs
+VERIFY_CONCURRENCY = int(os.getenv("VERIFY_CONCURRENCY", "8"))
+VERIFY_SAMPLE_SIZE = int(os.getenv("VERIFY_SAMPLE_SIZE", "0"))
+VERIFY_PAGE_SIZE = int(os.getenv("VERIFY_PAGE_SIZE", "10000"))
+
+# Database stats - fetched via POST /_dbs_info in batches (CouchDB caps keys per request
+# with max_db_number_for_dbs_info_req, default 100), falling back to concurrent GET /{db}
+DBS_INFO_BATCH_SIZE = int(os.getenv("DBS_INFO_BATCH_SIZE", "100"))
+DBS_INFO_CONCURRENCY = int(os.getenv("DBS_INFO_CONCURRENCY", "16"))
+DBS_INFO_CACHE_TTL = int(os.getenv("DBS_INFO_CACHE_TTL", "30"))
+
+# Replication sync - one-shot _replicator jobs run by the target cluster, which pulls
+# from the source directly; the source URL must be reachable from the target cluster
+SYNC_REPLICATION_CONCURRENCY = int(os.getenv("SYNC_REPLICATION_CONCURRENCY", "4"))
+SYNC_POLL_INTERVAL = float(os.getenv("SYNC_POLL_INTERVAL", "2"))
+SYNC_REPLICATION_TIMEOUT = int(os.getenv("SYNC_REPLICATION_TIMEOUT", "3600"))
+
+# Revision-diff sync - the manager scans the source's leaf revisions (_changes, style=all_docs)
+# SYNC_DIFF_PAGE_SIZE at a time, asks the target's _revs_diff which are missing and copies only
+# those (_bulk_get from the source, _bulk_docs with new_edits=false to the target); databases
+# are synced SYNC_REPLICATION_CONCURRENCY at a time
+SYNC_DIFF_PAGE_SIZE = int(os.getenv("SYNC_DIFF_PAGE_SIZE", "1000"))
+
+# Streaming sync - source _all_docs pages (BACKUP_PAGE_SIZE documents) are read on a background
+# thread into a queue of at most SYNC_STREAM_QUEUE_PAGES pages while the target _bulk_docs
+# batches are written, so reading and writing overlap without touching local disk
+SYNC_STREAM_QUEUE_PAGES = int(os.getenv("SYNC_STREAM_QUEUE_PAGES", "4"))
+
+# Cluster monitoring - the Cluster tab polls /_node/{node}/_stats and _system of every cluster node,
+# _active_tasks and _scheduler/jobs concurrently every MONITOR_INTERVAL seconds (one poll shared by
+# every session watching the same server, MONITOR_TIMEOUT seconds per request) and keeps the last
+# MONITOR_HISTORY samples. A node is busy above MONITOR_LATENCY_WARN_MS p95 request time (CouchDB's
+# request_time histogram) or MONITOR_RUN_QUEUE_WARN processes waiting in the Erlang run queue
+MONITOR_INTERVAL = float(os.getenv("MONITOR_INTERVAL", "5"))
+MONITOR_HISTORY = int(os.getenv("MONITOR_HISTORY", "360"))
+MONITOR_TIMEOUT = int(os.getenv("MONITOR_TIMEOUT", "5"))
+MONITOR_LATENCY_WARN_MS = float(os.getenv("MONITOR_LATENCY_WARN_MS", "500"))
+MONITOR_RUN_QUEUE_WARN = int(os.getenv("MONITOR_RUN_QUEUE_WARN", "10"))
+
+# JSON codec - documents are decoded and encoded with orjson when it is installed (JSON_CODEC=auto;
+# orjson requires it, stdlib never uses it), with the exact output of the standard library. Restores
+# of backup files larger than CODEC_POOL_MIN_BYTES on disk decode and re-encode their documents in
+# CODEC_PROCESSES worker processes (0: one per CPU core, 1: in this process), CODEC_CHUNK_BYTES of
+# backup text per task
+JSON_CODEC = os.getenv("JSON_CODEC", "auto")
+CODEC_PROCESSES = int(os.getenv("CODEC_PROCESSES", "0"))
+CODEC_POOL_MIN_BYTES = int(os.getenv("CODEC_POOL_MIN_BYTES", str(64 * 1024 * 1024)))
+CODEC_CHUNK_BYTES = 4 * 1024 * 1024
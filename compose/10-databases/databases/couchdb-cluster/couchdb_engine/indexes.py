@@ -0,0 +1,142 @@
+"""
+View indexes - warming the view and Mango indexes of a database (e.g. right after a restore)
+and indexer progress from _active_tasks
+"""
+
+import json
+import re
+import requests
+import time
+from urllib.parse import quote
+from concurrent.futures import ThreadPoolExecutor, wait
+from typing import List, Dict, Optional, Tuple
+
+from .client import couch_http
+from .config import WARMUP_CONCURRENCY, WARMUP_POLL_INTERVAL, WARMUP_TIMEOUT
+from .logs import get_logger
+
+log = get_logger(__name__)
+
+# Shard files of a clustered database: shards/<range>/<db>.<creation suffix>
+SHARD_NAME_PATTERN = re.compile(r"^shards/[^/]+/(?P<db>.+)\.\d+$")
+
+def get_design_docs(db_url: str, auth: Tuple[str, str]) -> List[Dict]:
+    """All design documents of a database, read with one _all_docs range request"""
+    response = couch_http.get(
+        f"{db_url}/_all_docs",
+        auth=auth,
+        params={'startkey': json.dumps('_design/'), 'endkey': json.dumps('_design0'), 'include_docs': 'true'},
+        timeout=60
+    )
+    if response.status_code != 200:
+        raise requests.exceptions.HTTPError(
+            f"Failed to list design documents: HTTP {response.status_code} - {response.text}", response=response
+        )
+    return [row['doc'] for row in response.json()['rows'] if 'doc' in row]
+
+def index_queries(design_docs: List[Dict]) -> List[Dict]:
+    """One query per index group: {ddoc, path, body} (body None for a GET).
+
+    All views of a design document share one index, so querying the first
+    builds them all. Mango indexes (language "query") are warmed through
+    _find with use_index, matching every document that has the indexed fields.
+    """
+    queries = []
+    for ddoc in design_docs:
+        views = ddoc.get('views') or {}
+        if not views:
+            continue
+        ddoc_id = ddoc['_id']
+        ddoc_name = ddoc_id[len('_design/'):]
+        view_name, view = next(iter(views.items()))
+        if ddoc.get('language') == 'query':
+            fields = [
+                field if isinstance(field, str) else next(iter(field))
+                for field in view.get('options', {}).get('def', {}).get('fields', [])
+            ]
+            queries.append({
+                'ddoc': ddoc_id,
+                'path': '_find',
+                'body': {
+                    'selector': {field: {'$gt': None} for field in fields},
+                    'use_index': [ddoc_name, view_name],
+                    'limit': 1
+                }
+            })
+        else:
+            path = f"_design/{quote(ddoc_name, safe='')}/_view/{quote(view_name, safe='')}"
+            queries.append({'ddoc': ddoc_id, 'path': path, 'body': None})
+    return queries
+
+def query_index(db_url: str, auth: Tuple[str, str], query: Dict, timeout: int = WARMUP_TIMEOUT) -> float:
+    """Run one warm-up query, which returns once the index is up to date; returns the seconds it took"""
+    started = time.monotonic()
+    if query['body'] is None:
+        response = couch_http.get(f"{db_url}/{query['path']}", auth=auth, params={'limit': 0}, timeout=timeout)
+    else:
+        response = couch_http.post(f"{db_url}/{query['path']}", auth=auth, json=query['body'], timeout=timeout)
+    if response.status_code != 200:
+        raise requests.exceptions.HTTPError(
+            f"HTTP {response.status_code} - {response.text}", response=response
+        )
+    return time.monotonic() - started
+
+def indexer_progress(server_url: str, auth: Tuple[str, str], db_name: str) -> Dict[str, int]:
+    """Build progress (percent) of the design documents of a database being indexed, from _active_tasks.
+
+    Indexer tasks run per shard; their changes are summed per design document.
+    Empty when nothing is indexing or _active_tasks is not readable (it needs admin rights).
+    """
+    response = couch_http.get(f"{server_url}/_active_tasks", auth=auth, timeout=10)
+    if response.status_code != 200:
+        return {}
+    totals: Dict[str, List[int]] = {}
+    for task in response.json():
+        if task.get('type') != 'indexer':
+            continue
+        match = SHARD_NAME_PATTERN.match(task.get('database', ''))
+        if (match.group('db') if match else task.get('database')) != db_name:
+            continue
+        done_total = totals.setdefault(task.get('design_document', '?'), [0, 0])
+        done_total[0] += task.get('changes_done', 0)
+        done_total[1] += task.get('total_changes', 0)
+    return {ddoc: int(100 * done / total) if total else 0 for ddoc, (done, total) in totals.items()}
+
+def warm_indexes(db_url: str, auth: Tuple[str, str], design_docs: Optional[List[Dict]] = None,
+                 concurrency: int = WARMUP_CONCURRENCY, timeout: int = WARMUP_TIMEOUT) -> Tuple[int, List[str]]:
+    """Build every view and Mango index of a database by querying each index group once.
+
+    Up to `concurrency` groups are queried in parallel; while they build,
+    indexer progress is reported from _active_tasks every WARMUP_POLL_INTERVAL
+    seconds. Design documents are read from the database unless given.
+    Returns the number of warmed index groups and the per-group errors.
+    """
+    if design_docs is None:
+        design_docs = get_design_docs(db_url, auth)
+    queries = index_queries(design_docs)
+    if not queries:
+        log.info(f"ℹ️ [WARMUP] No view or Mango indexes to warm")
+        return 0, []
+
+    server_url, db_name = db_url.rsplit('/', 1)
+    log.info(f"🔥 [WARMUP] Warming {len(queries)} index group(s), {concurrency} at a time...")
+    warmed = 0
+    errors = []
+    with ThreadPoolExecutor(max_workers=max(1, concurrency)) as executor:
+        pending = {executor.submit(query_index, db_url, auth, query, timeout): query['ddoc'] for query in queries}
+        while pending:
+            done, _ = wait(pending, timeout=WARMUP_POLL_INTERVAL)
+            for future in done:
+                ddoc = pending.pop(future)
+                try:
+                    seconds = future.result()
+                    warmed += 1
+                    log.info(f"✅ [WARMUP] {ddoc} ready ({seconds:.1f}s)")
+                except Exception as e:
+                    errors.append(f"{ddoc}: {e}")
+                    log.error(f"❌ [WARMUP] {ddoc}: {e}")
+            if pending:
+                progress = indexer_progress(server_url, auth, db_name)
+                building = ", ".join(f"{ddoc} {percent}%" for ddoc, percent in sorted(progress.items()))
+                log.info(f"⏳ [WARMUP] {len(pending)} index group(s) building" + (f": {building}" if building else ""))
+    return warmed, errors
@@ -0,0 +1,251 @@
+"""
+Background jobs - long operations (backup, restore, sync, delete) run as
+`python -m couchdb_engine` subprocesses, independent of the UI session that started them.
+
+Each job is persisted as {id}.json next to its log ({id}.log) in JOBS_DIR. A job
+streams one JSON line per database on stdout (the CLI's --jsonl mode), which
+drives its progress, while the engine logs go to the log file. Replication syncs
+also stream {"progress": {...}} lines while they run, kept per database in the
+job's 'progress' until the database's result arrives. On exit it
+writes its metrics to {id}.metrics.json; their summary is kept with the job
+and the values are added to the metrics of this process. At most
+JOB_CONCURRENCY jobs run at once; further jobs wait in the queue.
+"""
+
+import json
+import os
+import subprocess
+import sys
+import threading
+import uuid
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import List, Dict, Optional
+
+from .config import BASE_DIR, JOB_CANCEL_GRACE, JOB_CONCURRENCY, JOB_HISTORY, JOB_LOG_TAIL, JOBS_DIR
+from .logs import get_logger
+from .metrics import metrics
+from .storage import read_checkpoint, write_json_atomic
+
+log = get_logger(__name__)
+
+ACTIVE_STATES = ('queued', 'running')
+
+class JobRunner:
+    """Queue and run background jobs with a bounded number of worker threads.
+
+    Job state survives restarts of the UI: jobs still queued or running when
+    the previous runner went away are marked 'interrupted' (an interrupted
+    backup or restore can be resumed from its checkpoints).
+    """
+
+    def __init__(self, jobs_dir: Path = JOBS_DIR, max_jobs: int = JOB_CONCURRENCY):
+        self.jobs_dir = jobs_dir
+        self.jobs_dir.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._processes: Dict[str, subprocess.Popen] = {}
+        self._executor = ThreadPoolExecutor(max_workers=max(1, max_jobs), thread_name_prefix='job')
+        self._jobs: Dict[str, Dict] = {}
+        for job_file in self.jobs_dir.glob('*.json'):
+            job = None if job_file.name.endswith('.metrics.json') else read_checkpoint(job_file)
+            if job is None:
+                continue
+            if job['status'] in ACTIVE_STATES:
+                job.update(status='interrupted', finished=datetime.now().isoformat(timespec='seconds'))
+                write_json_atomic(job_file, job)
+            self._jobs[job['id']] = job
+        self._prune()
+
+    def _save(self, job: Dict):
+        write_json_atomic(self.jobs_dir / f"{job['id']}.json", job)
+
+    def _prune(self):
+        """Forget the oldest finished jobs beyond JOB_HISTORY"""
+        finished = sorted(
+            (job for job in self._jobs.values() if job['status'] not in ACTIVE_STATES),
+            key=lambda job: job['created'], reverse=True
+        )
+        for job in finished[JOB_HISTORY:]:
+            self._remove(job['id'])
+
+    def log_file(self, job_id: str) -> Path:
+        return self.jobs_dir / f"{job_id}.log"
+
+    def metrics_file(self, job_id: str) -> Path:
+        return self.jobs_dir / f"{job_id}.metrics.json"
+
+    def submit(self, kind: str, title: str, args: List[str], total: Optional[int] = None,
+               env: Optional[Dict[str, str]] = None) -> str:
+        """Queue a job running `python -m couchdb_engine <args>`; returns its id.
+
+        env is passed to the subprocess but not persisted - use it for server
+        URLs carrying credentials (the CLI reads SOURCE_COUCHDB_URL and
+        TARGET_COUCHDB_URL). total is the expected number of databases, for progress.
+        """
+        job = {
+            'id': f"{datetime.now().strftime('%Y%m%d-%H%M%S')}-{uuid.uuid4().hex[:6]}",
+            'kind': kind,
+            'title': title,
+            'args': list(args),
+            'status': 'queued',
+            'created': datetime.now().isoformat(timespec='seconds'),
+            'started': None,
+            'finished': None,
+            'total': total,
+            'succeeded': 0,
+            'failed': 0,
+            'results': [],
+            'progress': {},
+            'returncode': None,
+            'pid': None,
+            'cancel_requested': False,
+            'metrics': None
+        }
+        with self._lock:
+            self._jobs[job['id']] = job
+            self._save(job)
+            self._prune()
+        self._executor.submit(self._run, job['id'], env or {})
+        log.info(f"🗂️ [JOBS] Queued {kind} job {job['id']}: {title}")
+        return job['id']
+
+    def _run(self, job_id: str, env: Dict[str, str]):
+        with self._lock:
+            job = self._jobs[job_id]
+            if job['status'] != 'queued':
+                return
+            job.update(status='running', started=datetime.now().isoformat(timespec='seconds'))
+            self._save(job)
+
+        log.info(f"▶️ [JOBS] Starting job {job_id}: {job['title']}")
+        try:
+            with open(self.log_file(job_id), 'a', encoding='utf-8') as log_out:
+                process = subprocess.Popen(
+                    [sys.executable, '-m', 'couchdb_engine', '--jsonl',
+                     '--metrics-file', str(self.metrics_file(job_id)), *job['args']],
+                    stdout=subprocess.PIPE,
+                    stderr=log_out,
+                    text=True,
+                    cwd=str(BASE_DIR),
+                    env={**os.environ, **env, 'PYTHONUNBUFFERED': '1'}
+                )
+                with self._lock:
+                    self._processes[job_id] = process
+                    job['pid'] = process.pid
+                    self._save(job)
+                    # Cancelled between being dequeued and starting
+                    if job['cancel_requested']:
+                        process.terminate()
+
+                for line in process.stdout:
+                    try:
+                        result = json.loads(line)
+                    except ValueError:
+                        continue
+                    with self._lock:
+                        progress = job.setdefault('progress', {})
+                        if 'progress' in result:
+                            progress[result['progress']['database']] = result['progress']
+                        else:
+                            progress.pop(result['database'], None)
+                            job['results'].append(result)
+                            job['succeeded' if result['success'] else 'failed'] += 1
+                        self._save(job)
+                returncode = process.wait()
+        except Exception as e:
+            log.error(f"❌ [JOBS] Job {job_id} could not run: {e}")
+            with open(self.log_file(job_id), 'a', encoding='utf-8') as log_out:
+                log_out.write(f"Job could not run: {e}\n")
+            returncode = None
+
+        job_metrics = read_checkpoint(self.metrics_file(job_id))
+        if job_metrics is not None:
+            metrics.merge(job_metrics)
+        with self._lock:
+            self._processes.pop(job_id, None)
+            if job_metrics is not None:
+                job['metrics'] = job_metrics['summary']
+            if job['cancel_requested']:
+                status = 'cancelled'
+            else:
+                status = 'succeeded' if returncode == 0 else 'failed'
+            job.update(status=status, returncode=returncode, finished=datetime.now().isoformat(timespec='seconds'))
+            self._save(job)
+        log.info(f"🏁 [JOBS] Job {job_id} {status}: {job['succeeded']} succeeded, {job['failed']} failed")
+
+    def cancel(self, job_id: str) -> bool:
+        """Cancel a queued or running job; returns False if it already finished.
+
+        A running job is terminated, and killed if still running after JOB_CANCEL_GRACE seconds.
+        Backups and restores cut short this way can be resumed from their checkpoints.
+        """
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None or job['status'] not in ACTIVE_STATES:
+                return False
+            job['cancel_requested'] = True
+            if job['status'] == 'queued':
+                job.update(status='cancelled', finished=datetime.now().isoformat(timespec='seconds'))
+            self._save(job)
+            process = self._processes.get(job_id)
+
+        if process is not None:
+            log.info(f"⏹️ [JOBS] Cancelling job {job_id} (pid {process.pid})")
+            process.terminate()
+            
+            def kill_if_running():
+                if process.poll() is None:
+                    process.kill()
+            
+            timer = threading.Timer(JOB_CANCEL_GRACE, kill_if_running)
+            timer.daemon = True
+            timer.start()
+        return True
+
+    def remove(self, job_id: str) -> bool:
+        """Delete a finished job and its log; returns False for unknown or active jobs"""
+        with self._lock:
+            return self._remove(job_id)
+
+    def _remove(self, job_id: str) -> bool:
+        job = self._jobs.get(job_id)
+        if job is None or job['status'] in ACTIVE_STATES:
+            return False
+        del self._jobs[job_id]
+        (self.jobs_dir / f"{job_id}.json").unlink(missing_ok=True)
+        self.log_file(job_id).unlink(missing_ok=True)
+        self.metrics_file(job_id).unlink(missing_ok=True)
+        return True
+
+    def get(self, job_id: str) -> Optional[Dict]:
+        with self._lock:
+            job = self._jobs.get(job_id)
+            return json.loads(json.dumps(job)) if job is not None else None
+
+    def list(self) -> List[Dict]:
+        """All known jobs, newest first (copies, safe to read while jobs update)"""
+        with self._lock:
+            jobs = json.loads(json.dumps(list(self._jobs.values())))
+        return sorted(jobs, key=lambda job: job['created'], reverse=True)
+
+    def read_log(self, job_id: str, max_bytes: int = JOB_LOG_TAIL) -> str:
+        """The end of a job's log (up to max_bytes)"""
+        try:
+            with open(self.log_file(job_id), 'rb') as f:
+                f.seek(0, os.SEEK_END)
+                f.seek(max(0, f.tell() - max_bytes))
+                return f.read().decode('utf-8', errors='replace')
+        except OSError:
+            return ''
+
+_runner: Optional[JobRunner] = None
+_runner_lock = threading.Lock()
+
+def get_job_runner() -> JobRunner:
+    """The job runner of this process, created on first use and shared by every UI session"""
+    global _runner
+    with _runner_lock:
+        if _runner is None:
+            _runner = JobRunner()
+        return _runner
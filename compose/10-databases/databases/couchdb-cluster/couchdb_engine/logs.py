@@ -0,0 +1,58 @@
+"""
+Logging - the engine's progress messages go through the "couchdb_engine" logger, filtered by
+LOG_LEVEL and written to the current stdout as plain lines or JSON objects (LOG_FORMAT=json)
+"""
+
+import json
+import logging
+import sys
+from datetime import datetime, timezone
+
+from .config import LOG_FORMAT, LOG_LEVEL
+
+ROOT_LOGGER = "couchdb_engine"
+
+class _StdoutHandler(logging.StreamHandler):
+    """Writes to whatever sys.stdout is at the time, so contextlib.redirect_stdout applies
+    (the CLI moves logs to stderr in its JSON modes, the benchmark silences them)"""
+
+    def __init__(self):
+        super().__init__(sys.stdout)
+
+    @property
+    def stream(self):
+        return sys.stdout
+
+    @stream.setter
+    def stream(self, value):
+        pass
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line: time, level, logger, thread and message"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            'ts': datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec='milliseconds'),
+            'level': record.levelname.lower(),
+            'logger': record.name,
+            'thread': record.threadName,
+            'msg': record.getMessage()
+        }
+        if record.exc_info:
+            entry['exc'] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False)
+
+def configure_logging(level: str = LOG_LEVEL, fmt: str = LOG_FORMAT):
+    """(Re)configure the engine logger; called on import with the environment settings"""
+    logger = logging.getLogger(ROOT_LOGGER)
+    logger.setLevel(level)
+    logger.propagate = False
+    if not logger.handlers:
+        logger.addHandler(_StdoutHandler())
+    logger.handlers[0].setFormatter(JsonFormatter() if fmt == 'json' else logging.Formatter('%(message)s'))
+
+def get_logger(name: str) -> logging.Logger:
+    """Logger of an engine module (couchdb_engine.backup, ...) or of a program using the engine"""
+    return logging.getLogger(name if name.startswith(ROOT_LOGGER) else f"{ROOT_LOGGER}.{name}")
+
+configure_logging()
@@ -0,0 +1,230 @@
+"""
+Metrics - counters, gauges, per-phase timers and HTTP latency histograms of the engine operations,
+rendered as Prometheus text (served on METRICS_PORT or written by the CLI) or as a JSON summary
+"""
+
+import bisect
+import json
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import List, Dict, Optional, Tuple
+
+from .config import METRICS_LATENCY_BUCKETS, METRICS_PREFIX
+
+# name: (Prometheus type, help)
+METRICS = {
+    'docs_total': ('counter', "Documents processed, by operation"),
+    'bytes_total': ('counter', "Uncompressed document bytes written to backups or sent to CouchDB, by operation"),
+    'phase_seconds_total': ('counter', "Seconds spent per operation phase (fetch, parse, write, encode, upload, ...)"),
+    'http_request_duration_seconds': ('histogram', "CouchDB request latency, by method, endpoint and status"),
+    'concurrency_limit': ('gauge', "Current limit of _bulk_docs requests in flight, by server"),
+    'backoffs_total': ('counter', "Concurrency reductions after overload signals, by server and reason")
+}
+
+LabelKey = Tuple[Tuple[str, str], ...]
+
+class Metrics:
+    """Thread-safe registry of labelled counters, gauges and histograms.
+
+    Hot loops should not update it per document: accumulate locally and add
+    per page or batch (add_phase, inc), which keeps the cost per call negligible.
+    """
+
+    def __init__(self, buckets: List[float] = METRICS_LATENCY_BUCKETS):
+        self.buckets = sorted(buckets)
+        self._lock = threading.Lock()
+        self._counters: Dict[Tuple[str, LabelKey], float] = {}
+        self._gauges: Dict[Tuple[str, LabelKey], float] = {}
+        # (name, labels) -> [per-bucket counts (+Inf last), sum, count]
+        self._histograms: Dict[Tuple[str, LabelKey], list] = {}
+
+    def inc(self, name: str, value: float = 1.0, **labels: str):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0.0) + value
+
+    def set(self, name: str, value: float, **labels: str):
+        with self._lock:
+            self._gauges[(name, tuple(sorted(labels.items())))] = value
+
+    def observe(self, name: str, value: float, **labels: str):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            histogram[0][bisect.bisect_left(self.buckets, value)] += 1
+            histogram[1] += value
+            histogram[2] += 1
+
+    def add_phase(self, operation: str, phase: str, seconds: float):
+        self.inc('phase_seconds_total', seconds, operation=operation, phase=phase)
+
+    @contextmanager
+    def phase(self, operation: str, phase: str):
+        """Time a block as one phase of an operation"""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_phase(operation, phase, time.perf_counter() - started)
+
+    def snapshot(self) -> Dict:
+        """All values as JSON-serializable data (the per-job summary; see merge)"""
+        with self._lock:
+            return {
+                'buckets': self.buckets,
+                'counters': [
+                    {'name': name, 'labels': dict(labels), 'value': value}
+                    for (name, labels), value in sorted(self._counters.items())
+                ],
+                'gauges': [
+                    {'name': name, 'labels': dict(labels), 'value': value}
+                    for (name, labels), value in sorted(self._gauges.items())
+                ],
+                'histograms': [
+                    {'name': name, 'labels': dict(labels), 'counts': list(counts), 'sum': total, 'count': count}
+                    for (name, labels), (counts, total, count) in sorted(self._histograms.items())
+                ]
+            }
+
+    def merge(self, snapshot: Dict):
+        """Add the counters and histograms of a snapshot taken elsewhere (e.g. by a background job)
+        to this registry; its gauges describe a process that has ended and are left out"""
+        if snapshot.get('buckets') != self.buckets:
+            return
+        for counter in snapshot['counters']:
+            self.inc(counter['name'], counter['value'], **counter['labels'])
+        with self._lock:
+            for entry in snapshot['histograms']:
+                key = (entry['name'], tuple(sorted(entry['labels'].items())))
+                histogram = self._histograms.setdefault(key, [[0] * (len(self.buckets) + 1), 0.0, 0])
+                histogram[0] = [a + b for a, b in zip(histogram[0], entry['counts'])]
+                histogram[1] += entry['sum']
+                histogram[2] += entry['count']
+
+    def reset(self):
+        with self._lock:
+            self._counters.clear()
+            self._gauges.clear()
+            self._histograms.clear()
+
+    def render_prometheus(self) -> str:
+        """Prometheus text exposition format (version 0.0.4)"""
+        snapshot = self.snapshot()
+        lines = []
+        for name, (kind, help_text) in METRICS.items():
+            full_name = f"{METRICS_PREFIX}_{name}"
+            lines += [f"# HELP {full_name} {help_text}", f"# TYPE {full_name} {kind}"]
+            for counter in snapshot['counters'] + snapshot['gauges']:
+                if counter['name'] == name:
+                    lines.append(f"{full_name}{format_labels(counter['labels'])} {counter['value']:g}")
+            for entry in snapshot['histograms']:
+                if entry['name'] != name:
+                    continue
+                cumulative = 0
+                for bound, count in zip([*self.buckets, '+Inf'], entry['counts']):
+                    cumulative += count
+                    labels = format_labels({**entry['labels'], 'le': f"{bound:g}" if bound != '+Inf' else bound})
+                    lines.append(f"{full_name}_bucket{labels} {cumulative}")
+                lines.append(f"{full_name}_sum{format_labels(entry['labels'])} {entry['sum']:g}")
+                lines.append(f"{full_name}_count{format_labels(entry['labels'])} {entry['count']}")
+        return '\n'.join(lines) + '\n'
+
+def escape_label(value) -> str:
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+def format_labels(labels: Dict[str, str]) -> str:
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{key}="{escape_label(value)}"' for key, value in labels.items()) + '}'
+
+def histogram_quantile(buckets: List[float], counts: List[int], q: float) -> Optional[float]:
+    """Upper bound of the bucket holding the q-quantile (None if empty or beyond the last bucket)"""
+    total = sum(counts)
+    if not total:
+        return None
+    cumulative = 0
+    for bound, count in zip(buckets, counts):
+        cumulative += count
+        if cumulative >= q * total:
+            return bound
+    return None
+
+def summarize_metrics(snapshot: Dict) -> Dict:
+    """Readable summary of a snapshot: documents and bytes per operation, seconds per phase,
+    and request counts and latency (mean, p50/p95/p99 bucket bounds) per method and endpoint"""
+    summary = {'docs': {}, 'bytes': {}, 'phases': {}, 'backoffs': {}, 'requests': []}
+    for counter in snapshot['counters']:
+        labels = counter['labels']
+        if counter['name'] == 'docs_total':
+            summary['docs'][labels['operation']] = int(counter['value'])
+        elif counter['name'] == 'bytes_total':
+            summary['bytes'][labels['operation']] = int(counter['value'])
+        elif counter['name'] == 'phase_seconds_total':
+            summary['phases'][f"{labels['operation']}.{labels['phase']}"] = round(counter['value'], 3)
+        elif counter['name'] == 'backoffs_total':
+            summary['backoffs'][labels['reason']] = summary['backoffs'].get(labels['reason'], 0) + int(counter['value'])
+    for entry in snapshot['histograms']:
+        if entry['name'] != 'http_request_duration_seconds' or not entry['count']:
+            continue
+        summary['requests'].append({
+            **entry['labels'],
+            'count': entry['count'],
+            'mean_s': round(entry['sum'] / entry['count'], 4),
+            **{f"p{int(q * 100)}_s": histogram_quantile(snapshot['buckets'], entry['counts'], q) for q in (0.5, 0.95, 0.99)}
+        })
+    return summary
+
+def write_metrics_file(path: Path, registry: Optional[Metrics] = None):
+    """Write the metrics to a file: Prometheus text for *.prom (node_exporter textfile
+    collector), otherwise the JSON snapshot with its summary"""
+    registry = registry or metrics
+    if path.suffix == '.prom':
+        content = registry.render_prometheus()
+    else:
+        snapshot = registry.snapshot()
+        content = json.dumps({**snapshot, 'summary': summarize_metrics(snapshot)}, indent=1)
+    tmp_path = path.with_name(f"{path.name}.tmp")
+    tmp_path.write_text(content, encoding='utf-8')
+    tmp_path.replace(path)
+
+_server: Optional[ThreadingHTTPServer] = None
+_server_lock = threading.Lock()
+
+def start_metrics_server(port: int, registry: Optional[Metrics] = None) -> Optional[ThreadingHTTPServer]:
+    """Serve /metrics (Prometheus text) and /metrics.json on port from a daemon thread, once per process"""
+    global _server
+    registry = registry or metrics
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split('?')[0] == '/metrics':
+                body, content_type = registry.render_prometheus(), 'text/plain; version=0.0.4; charset=utf-8'
+            elif self.path.split('?')[0] == '/metrics.json':
+                snapshot = registry.snapshot()
+                body, content_type = json.dumps({**snapshot, 'summary': summarize_metrics(snapshot)}), 'application/json'
+            else:
+                self.send_error(404)
+                return
+            data = body.encode('utf-8')
+            self.send_response(200)
+            self.send_header('Content-Type', content_type)
+            self.send_header('Content-Length', str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def log_message(self, *args):
+            pass
+
+    with _server_lock:
+        if _server is None and port:
+            _server = ThreadingHTTPServer(('0.0.0.0', port), Handler)
+            threading.Thread(target=_server.serve_forever, name='metrics', daemon=True).start()
+        return _server
+
+# Shared by every operation of the process
+metrics = Metrics()
@@ -0,0 +1,277 @@
+"""
+Cluster monitoring - request rates, latencies, memory and run queue of every node (/_node/{node}/_stats
+and _system), compaction and indexing progress (_active_tasks) and replication lag (_scheduler/jobs),
+polled concurrently into a time series
+"""
+
+import requests
+import threading
+import time
+from collections import deque
+from urllib.parse import quote
+from concurrent.futures import ThreadPoolExecutor
+from typing import Deque, List, Dict, Optional, Tuple
+
+from .client import couch_http, server_label
+from .config import (
+    MONITOR_HISTORY, MONITOR_INTERVAL, MONITOR_LATENCY_WARN_MS, MONITOR_RUN_QUEUE_WARN, MONITOR_TIMEOUT
+)
+from .indexes import SHARD_NAME_PATTERN
+from .logs import get_logger
+
+log = get_logger(__name__)
+
+# Cumulative _stats counters of a node, reported as per-second rates between samples
+NODE_COUNTERS = ('requests', 'reads', 'writes', 'errors')
+# Memory areas of the Erlang VM in _system (their sum is what the node has allocated)
+MEMORY_AREAS = ('processes', 'binary', 'ets', 'code', 'atom', 'other')
+# _active_tasks types reported as compaction or indexing progress
+PROGRESS_TASKS = ('database_compaction', 'view_compaction', 'indexer', 'search_indexer')
+
+def get_cluster_nodes(url: str) -> List[str]:
+    """Erlang names of the cluster nodes (_membership), or ['_local'] - the node answering - without a cluster"""
+    try:
+        response = couch_http.get(f"{url.rstrip('/')}/_membership", timeout=MONITOR_TIMEOUT)
+        if response.status_code == 200 and response.json().get('cluster_nodes'):
+            return sorted(response.json()['cluster_nodes'])
+    except (requests.exceptions.RequestException, ValueError):
+        pass
+    return ['_local']
+
+def fetch_json(url: str) -> Tuple[Optional[object], Optional[str]]:
+    """GET a JSON resource: (body, None), or (None, error) when it cannot be read"""
+    try:
+        response = couch_http.get(url, timeout=MONITOR_TIMEOUT)
+    except requests.exceptions.RequestException as e:
+        return None, type(e).__name__
+    if response.status_code != 200:
+        return None, f"HTTP {response.status_code}"
+    try:
+        return response.json(), None
+    except ValueError as e:
+        return None, f"invalid JSON: {e}"
+
+def stat_value(stats: Dict, *path: str):
+    """Value of a _stats metric (a number for counters and gauges, a summary dict for histograms), None if absent"""
+    for key in path:
+        stats = stats.get(key) if isinstance(stats, dict) else None
+    return stats.get('value') if isinstance(stats, dict) else None
+
+def node_figures(stats: Dict, system: Dict) -> Dict:
+    """Figures of one node: cumulative counters (requests, database reads and writes, 5xx answers)
+    and current values (request time percentiles over CouchDB's stats interval, memory, run queue)"""
+    request_time = stat_value(stats, 'couchdb', 'request_time')
+    percentiles = {int(p): ms for p, ms in request_time.get('percentile', [])} if isinstance(request_time, dict) else {}
+    status_codes = stats.get('httpd_status_codes', {})
+    return {
+        'requests': stat_value(stats, 'httpd', 'requests') or 0,
+        'reads': stat_value(stats, 'couchdb', 'database_reads') or 0,
+        'writes': stat_value(stats, 'couchdb', 'database_writes') or 0,
+        'errors': sum(stat_value(status_codes, code) or 0 for code in status_codes if code.startswith('5')),
+        'latency_p50_ms': percentiles.get(50),
+        'latency_p95_ms': percentiles.get(95),
+        'latency_p99_ms': percentiles.get(99),
+        'memory_mb': round(sum(system.get('memory', {}).get(area, 0) for area in MEMORY_AREAS) / (1024 * 1024), 1),
+        'run_queue': system.get('run_queue', 0),
+        'open_databases': stat_value(stats, 'couchdb', 'open_databases')
+    }
+
+def task_rows(tasks: List[Dict]) -> List[Dict]:
+    """Compactions and index builds in progress, one row per type, database, design document
+    and node with the changes of its shards summed up"""
+    totals: Dict[Tuple, List[int]] = {}
+    for task in tasks:
+        if task.get('type') not in PROGRESS_TASKS:
+            continue
+        match = SHARD_NAME_PATTERN.match(task.get('database', ''))
+        key = (task['type'], match.group('db') if match else task.get('database'),
+               task.get('design_document'), task.get('node'))
+        done_total = totals.setdefault(key, [0, 0, 0])
+        done_total[0] += task.get('changes_done', 0)
+        done_total[1] += task.get('total_changes', 0)
+        done_total[2] += 1
+    return [
+        {
+            'type': task_type, 'database': database, 'design_document': ddoc, 'node': node, 'shards': shards,
+            'progress': int(100 * done / total) if total else 0
+        }
+        for (task_type, database, ddoc, node), (done, total, shards) in sorted(totals.items(), key=str)
+    ]
+
+def replication_rows(jobs: List[Dict], tasks: List[Dict]) -> List[Dict]:
+    """Replication jobs with their lag, the source changes not processed yet (changes_pending:
+    in the job info of _scheduler/jobs since CouchDB 3, in _active_tasks before)"""
+    pending = {
+        task.get('doc_id') or task.get('replication_id'): task.get('changes_pending')
+        for task in tasks if task.get('type') == 'replication'
+    }
+    rows = []
+    for job in jobs:
+        info = job.get('info') or {}
+        history = job.get('history') or []
+        doc_id = job.get('doc_id') or job.get('id')
+        rows.append({
+            'doc_id': doc_id,
+            'node': job.get('node'),
+            'source': job.get('source'),
+            'target': job.get('target'),
+            # Newest event first: added, started, crashed, stopped
+            'state': history[0].get('type') if history else None,
+            'crashes': sum(1 for event in history if event.get('type') == 'crashed'),
+            'changes_pending': info.get('changes_pending', pending.get(doc_id)),
+            'docs_written': info.get('docs_written')
+        })
+    return rows
+
+def poll_cluster(url: str, nodes: Optional[List[str]] = None) -> Dict:
+    """One sample of the cluster: the figures of every node, tasks and replications.
+
+    Every request (_stats and _system per node, _active_tasks, _scheduler/jobs)
+    is sent at once over the pooled keep-alive connections, so a poll takes as
+    long as the slowest answer. Nodes that do not answer get an 'error' instead
+    of figures; tasks and replications are empty when unreadable (they need
+    admin rights).
+    """
+    base_url = url.rstrip('/')
+    nodes = nodes or get_cluster_nodes(base_url)
+    paths = [f"_node/{quote(node, safe='@')}/{endpoint}" for node in nodes for endpoint in ('_stats', '_system')]
+    paths += ['_active_tasks', '_scheduler/jobs']
+    started = time.monotonic()
+    with ThreadPoolExecutor(max_workers=len(paths)) as executor:
+        answers = dict(zip(paths, executor.map(lambda path: fetch_json(f"{base_url}/{path}"), paths)))
+
+    node_samples = {}
+    for node, stats_path, system_path in zip(nodes, paths[0::2], paths[1::2]):
+        (stats, stats_error), (system, system_error) = answers[stats_path], answers[system_path]
+        if stats_error or system_error:
+            node_samples[node] = {'error': stats_error or system_error}
+        else:
+            node_samples[node] = node_figures(stats, system)
+    tasks = answers['_active_tasks'][0] or []
+    jobs = (answers['_scheduler/jobs'][0] or {}).get('jobs', [])
+    return {
+        'time': time.time(),
+        'duration_s': round(time.monotonic() - started, 3),
+        'nodes': node_samples,
+        'tasks': task_rows(tasks),
+        'replications': replication_rows(jobs, tasks)
+    }
+
+def node_rows(previous: Optional[Dict], sample: Dict) -> List[Dict]:
+    """Time-series rows of a sample, one per node: the counters as per-second rates since the
+    previous sample (None without one, or after a node restart reset them) and the current values"""
+    elapsed = sample['time'] - previous['time'] if previous else 0
+    rows = []
+    for node, figures in sample['nodes'].items():
+        row = {'time': sample['time'], 'node': node}
+        if 'error' in figures:
+            rows.append({**row, 'error': figures['error']})
+            continue
+        before = previous['nodes'].get(node, {}) if previous else {}
+        for counter in NODE_COUNTERS:
+            delta = figures[counter] - before[counter] if counter in before and elapsed > 0 else -1
+            row[f"{counter}_per_s"] = round(delta / elapsed, 2) if delta >= 0 else None
+        row.update({key: value for key, value in figures.items() if key not in NODE_COUNTERS})
+        rows.append(row)
+    return rows
+
+def assess_cluster(sample: Dict, rows: List[Dict]) -> Tuple[bool, List[str]]:
+    """Whether the cluster has room for heavy jobs (restores, syncs, large backups), and why not:
+    unreachable nodes, busy nodes (p95 request time above MONITOR_LATENCY_WARN_MS, run queue above
+    MONITOR_RUN_QUEUE_WARN, 5xx answers), compactions or index builds running, crashing replications"""
+    reasons = []
+    for row in rows:
+        node = row['node']
+        if 'error' in row:
+            reasons.append(f"{node} unreachable ({row['error']})")
+            continue
+        if (row['latency_p95_ms'] or 0) > MONITOR_LATENCY_WARN_MS:
+            reasons.append(f"{node} p95 request time {row['latency_p95_ms']:.0f} ms")
+        if row['run_queue'] > MONITOR_RUN_QUEUE_WARN:
+            reasons.append(f"{node} run queue {row['run_queue']}")
+        if row['errors_per_s']:
+            reasons.append(f"{node} {row['errors_per_s']:g} 5xx answers/s")
+    compactions = sum(1 for task in sample['tasks'] if task['type'].endswith('compaction'))
+    if compactions:
+        reasons.append(f"{compactions} compaction(s) running")
+    builds = len(sample['tasks']) - compactions
+    if builds:
+        reasons.append(f"{builds} index build(s) running")
+    for replication in sample['replications']:
+        if replication['state'] == 'crashed':
+            reasons.append(f"replication {replication['doc_id']} crashing ({replication['crashes']} crashes)")
+    return not reasons, reasons
+
+def slowest_node(rows: List[Dict]) -> Optional[Dict]:
+    """Row of the reachable node with the highest p95 request time (then the longest run queue)"""
+    reachable = [row for row in rows if 'error' not in row and row['latency_p95_ms'] is not None]
+    if not reachable:
+        return None
+    return max(reachable, key=lambda row: (row['latency_p95_ms'], row['run_queue']))
+
+class ClusterMonitor:
+    """Time series of the samples of one cluster, the last `history` polls.
+
+    poll() can be called as often as convenient: within half an interval of
+    the last sample it returns that sample instead of polling again, and
+    concurrent callers wait for the poll in progress, so every UI session
+    watching the same cluster shares one polling loop. Node rows are computed
+    once per poll. Cluster membership is looked up again after a node failed
+    to answer.
+    """
+
+    def __init__(self, url: str, interval: float = MONITOR_INTERVAL, history: int = MONITOR_HISTORY):
+        self.url = url.rstrip('/')
+        self.interval = interval
+        self.samples: Deque[Dict] = deque(maxlen=history)
+        self.rows: Deque[List[Dict]] = deque(maxlen=history)
+        self.nodes: Optional[List[str]] = None
+        self._lock = threading.Lock()
+
+    def poll(self) -> Dict:
+        """The latest sample, polling the cluster unless it is recent enough"""
+        with self._lock:
+            if self.samples and time.time() - self.samples[-1]['time'] < self.interval / 2:
+                return self.samples[-1]
+            if self.nodes is None:
+                self.nodes = get_cluster_nodes(self.url)
+            sample = poll_cluster(self.url, self.nodes)
+            unreachable = [node for node, figures in sample['nodes'].items() if 'error' in figures]
+            if unreachable:
+                log.warning(f"⚠️ [MONITOR] {server_label(self.url)}: no stats from {', '.join(unreachable)}")
+                self.nodes = None
+            log.debug("📈 [MONITOR] %s polled in %.3fs", server_label(self.url), sample['duration_s'])
+            self.rows.append(node_rows(self.samples[-1] if self.samples else None, sample))
+            self.samples.append(sample)
+            return sample
+
+    def latest_rows(self) -> List[Dict]:
+        """Node rows of the latest sample"""
+        with self._lock:
+            return list(self.rows[-1]) if self.rows else []
+
+    def series(self) -> Dict[str, List[Dict]]:
+        """The whole history as flat rows: nodes (rates, latencies, memory, run queue),
+        tasks (progress) and replications (lag), each row with the time of its sample"""
+        with self._lock:
+            return {
+                'nodes': [row for rows in self.rows for row in rows],
+                'tasks': [{'time': sample['time'], **task} for sample in self.samples for task in sample['tasks']],
+                'replications': [
+                    {'time': sample['time'], **replication}
+                    for sample in self.samples for replication in sample['replications']
+                ]
+            }
+
+_monitors: Dict[str, ClusterMonitor] = {}
+_monitors_lock = threading.Lock()
+
+def monitor_for(url: str) -> ClusterMonitor:
+    """The monitor of the cluster serving url, shared by the UI sessions of this process that
+    connect with the same URL and credentials - never polling with another session's credentials"""
+    key = url.rstrip('/')
+    with _monitors_lock:
+        monitor = _monitors.get(key)
+        if monitor is None:
+            monitor = _monitors[key] = ClusterMonitor(url)
+        return monitor
@@ -0,0 +1,876 @@
+"""
+Restores - streamed, batched _bulk_docs uploads and incremental delta replay, resumable from checkpoints,
+and selective restores of documents looked up in the offset index of a backup
+"""
+
+import hashlib
+import itertools
+import json
+import re
+import requests
+import subprocess
+import time
+from pathlib import Path
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Callable, Iterable, Iterator, List, Dict, Optional, Tuple, Union
+
+from .client import couch_http, parse_couchdb_url, server_label
+from .codec import codec_processes, dumps_doc, loads, map_ordered
+from .config import (
+    BACKUP_SCRIPT, CODEC_CHUNK_BYTES, CODEC_POOL_MIN_BYTES, RESTORE_BATCH_BYTES, RESTORE_BATCH_SIZE,
+    RESTORE_BATCH_TIMEOUT, RESTORE_CHECKPOINT_BATCHES, RESTORE_MAX_READ_CHUNK, RESTORE_READ_CHUNK, RESTORE_RETRIES,
+    RESTORE_WARM_INDEXES
+)
+from .indexes import warm_indexes
+from .logs import get_logger
+from .metrics import metrics
+from .storage import (
+    backup_db_name, checkpoint_file_for, find_blob_store, find_delta_files, open_backup_index, open_backup_reader,
+    read_backup_meta, read_checkpoint, read_indexed_docs, reattach_attachments, write_json_atomic
+)
+from .throttle import AdaptiveLimiter, limiter_for
+
+log = get_logger(__name__)
+
+def iter_backup_docs(backup_path: Path, chunk_size: int = RESTORE_READ_CHUNK,
+                     operation: str = 'restore') -> Iterator[Dict]:
+    """Stream documents out of a backup or delta file without loading it whole.
+
+    Accepts the bulk_docs format ({"new_edits":false,"docs":[...]}) as well as
+    the old _all_docs format ({"rows":[{"doc":...}]}). Documents are decoded
+    one at a time from a sliding text buffer; the read size doubles while a
+    single document is larger than the buffer. Reading and decoding time is
+    recorded as the parse phase of operation, once per chunk read.
+    """
+    decoder = json.JSONDecoder()
+    header_pattern = re.compile(r'"(docs|rows)"\s*:\s*\[')
+    parse_time = 0.0
+    
+    try:
+        with open_backup_reader(backup_path) as f:
+            buf = f.read(chunk_size)
+            eof = not buf
+            match = header_pattern.search(buf)
+            while match is None and not eof:
+                more = f.read(chunk_size)
+                eof = not more
+                buf += more
+                match = header_pattern.search(buf)
+            if match is None:
+                raise ValueError("missing 'docs' or 'rows' key")
+        
+            rows_format = match.group(1) == 'rows'
+            pos = match.end()
+            read_size = chunk_size
+        
+            while True:
+                # Skip separators between array items
+                while pos < len(buf) and buf[pos] in ' \t\r\n,':
+                    pos += 1
+                if pos < len(buf) and buf[pos] == ']':
+                    return
+            
+                started = time.perf_counter()
+                try:
+                    if pos >= len(buf):
+                        raise json.JSONDecodeError("Need more data", buf, pos)
+                    obj, end = decoder.raw_decode(buf, pos)
+                except json.JSONDecodeError:
+                    if eof:
+                        raise
+                    # Incomplete item: drop consumed text and read more
+                    buf = buf[pos:]
+                    pos = 0
+                    more = f.read(read_size)
+                    eof = not more
+                    buf += more
+                    read_size = min(read_size * 2, RESTORE_MAX_READ_CHUNK)
+                    metrics.add_phase(operation, 'parse', parse_time + time.perf_counter() - started)
+                    parse_time = 0.0
+                    continue
+            
+                parse_time += time.perf_counter() - started
+                pos = end
+                read_size = chunk_size
+                if rows_format:
+                    if 'doc' in obj:
+                        yield obj['doc']
+                else:
+                    yield obj
+    finally:
+        metrics.add_phase(operation, 'parse', parse_time)
+
+def iter_backup_lines(backup_path: Path, chunk_bytes: int = CODEC_CHUNK_BYTES) -> Iterator[List[str]]:
+    """Stream the documents of a backup written by the engine - one JSON document per line, as
+    BackupIndexWriter lays them out - as lists of their lines of about chunk_bytes characters"""
+    with open_backup_reader(backup_path) as f:
+        if f.readline().strip() != '{"new_edits":false,"docs":[':
+            raise ValueError("not a one-document-per-line backup")
+        chunk = []
+        chunk_size = 0
+        for line in f:
+            if line.startswith(']'):
+                break
+            if not line.strip():
+                continue
+            chunk.append(line)
+            chunk_size += len(line)
+            if chunk_size >= chunk_bytes:
+                yield chunk
+                chunk = []
+                chunk_size = 0
+        if chunk:
+            yield chunk
+
+def prepare_restore_lines(lines: List[str],
+                          blob_store: Optional[Path]) -> Tuple[List[Tuple[str, Union[Dict, str]]], float, float]:
+    """Decode backup lines into (id, document) pairs ready for restoring: regular documents
+    encoded for _bulk_docs (attachments reattached, stubs dropped), design documents decoded with
+    their attachments. Returns them with the seconds spent decoding and encoding.
+
+    A module-level function so the codec pool can run it in its worker processes.
+    """
+    docs = []
+    parse_time = encode_time = 0.0
+    for line in lines:
+        started = time.perf_counter()
+        doc = loads(line.rstrip().rstrip(','))
+        parsed = time.perf_counter()
+        parse_time += parsed - started
+        doc_id = doc.get('_id', '')
+        if doc_id.startswith('_design/'):
+            docs.append((doc_id, reattach_attachments(doc, blob_store)))
+        else:
+            docs.append((doc_id, dumps_doc(clean_attachment_stubs(reattach_attachments(doc, blob_store)))))
+            encode_time += time.perf_counter() - parsed
+    return docs, parse_time, encode_time
+
+def iter_restore_docs(backup_path: Path, db_name: str, blob_store: Optional[Path],
+                      operation: str = 'restore') -> Iterator[Tuple[str, Union[Dict, str]]]:
+    """Stream the (id, document) pairs of a backup file ready for restoring, as prepare_restore_lines.
+
+    Backups written by the engine (those with an offset index) are read line by
+    line and, from CODEC_POOL_MIN_BYTES on disk, decoded and re-encoded in the
+    codec pool, one CODEC_CHUNK_BYTES chunk per task, while this process only
+    reads and posts. Other backups are decoded here by iter_backup_docs.
+    """
+    if 'index' not in read_backup_meta(backup_path, db_name):
+        for doc in iter_backup_docs(backup_path, operation=operation):
+            doc = reattach_attachments(doc, blob_store)
+            doc_id = doc.get('_id', '')
+            yield doc_id, doc if doc_id.startswith('_design/') else clean_attachment_stubs(doc)
+        return
+    
+    chunks = iter_backup_lines(backup_path)
+    if codec_processes() > 1 and backup_path.stat().st_size >= CODEC_POOL_MIN_BYTES:
+        log.info(f"🧮 [RESTORE] Decoding {backup_path.name} in {codec_processes()} codec processes")
+        prepared = map_ordered(prepare_restore_lines, chunks, blob_store)
+    else:
+        prepared = (prepare_restore_lines(chunk, blob_store) for chunk in chunks)
+    for docs, parse_time, encode_time in prepared:
+        metrics.add_phase(operation, 'parse', parse_time)
+        metrics.add_phase(operation, 'encode', encode_time)
+        yield from docs
+
+
+def post_bulk_docs(db_url: str, auth: Tuple[str, str], encoded_docs: List[str],
+                   retries: int = RESTORE_RETRIES, operation: str = 'restore',
+                   limiter: Optional[AdaptiveLimiter] = None) -> Tuple[int, List[str]]:
+    """POST one batch of pre-encoded documents to _bulk_docs with new_edits=false.
+
+    Transient failures (network errors, 429, 5xx) are retried with exponential
+    backoff. A batch rejected as too large (413) is split in two. Returns the
+    number of stored documents and the per-document errors. Every attempt waits
+    for a slot of the server's limiter and reports its answer to it.
+    """
+    payload = ('{"new_edits":false,"docs":[' + ','.join(encoded_docs) + ']}').encode('utf-8')
+    limiter = limiter or limiter_for(db_url)
+    
+    for attempt in range(retries + 1):
+        with metrics.phase(operation, 'wait'):
+            seq = limiter.acquire(len(payload))
+        started = time.perf_counter()
+        status = None
+        try:
+            with metrics.phase(operation, 'upload'):
+                response = couch_http.post(
+                    f"{db_url}/_bulk_docs",
+                    auth=auth,
+                    data=payload,
+                    headers={'Content-Type': 'application/json'},
+                    timeout=RESTORE_BATCH_TIMEOUT
+                )
+            status = response.status_code
+        except requests.exceptions.RequestException as e:
+            if attempt == retries:
+                raise
+            log.warning(f"🔁 [RESTORE] Batch of {len(encoded_docs)} failed ({e}), retrying...")
+            time.sleep(2 ** attempt)
+            continue
+        finally:
+            limiter.release(seq, time.perf_counter() - started, status)
+        
+        if response.status_code == 413 and len(encoded_docs) > 1:
+            middle = len(encoded_docs) // 2
+            log.info(f"✂️ [RESTORE] Batch too large, splitting {len(encoded_docs)} documents in two")
+            first_ok, first_errors = post_bulk_docs(db_url, auth, encoded_docs[:middle], retries, operation, limiter)
+            second_ok, second_errors = post_bulk_docs(db_url, auth, encoded_docs[middle:], retries, operation, limiter)
+            return first_ok + second_ok, first_errors + second_errors
+        
+        if (response.status_code == 429 or response.status_code >= 500) and attempt < retries:
+            log.warning(f"🔁 [RESTORE] Batch of {len(encoded_docs)} got HTTP {response.status_code}, retrying...")
+            time.sleep(2 ** attempt)
+            continue
+        
+        if response.status_code not in [200, 201, 202]:  # Accept HTTP 202 for bulk operations
+            raise requests.exceptions.HTTPError(
+                f"Bulk restore failed (HTTP {response.status_code}): {response.text}",
+                response=response
+            )
+        
+        # new_edits=false only reports failed documents (some versions return [] on success)
+        try:
+            results = response.json()
+        except json.JSONDecodeError:
+            results = []
+        errors = [
+            f"{result.get('id', 'unknown')}: {result.get('error')} ({result.get('reason', 'no reason')})"
+            for result in results if result.get('error')
+        ]
+        metrics.inc('docs_total', len(encoded_docs) - len(errors), operation=operation)
+        metrics.inc('bytes_total', len(payload), operation=operation)
+        return len(encoded_docs) - len(errors), errors
+
+def iter_bulk_batches(docs: Iterator[Union[Dict, str]], max_docs: int = RESTORE_BATCH_SIZE,
+                      max_bytes: int = RESTORE_BATCH_BYTES, operation: str = 'restore') -> Iterator[List[str]]:
+    """Group documents into JSON-encoded batches bounded by document count and byte size.
+    Documents already encoded (str, e.g. by prepare_restore_lines) are taken as they are;
+    encoding time is recorded per batch as the encode phase of operation."""
+    batch = []
+    batch_bytes = 0
+    encode_time = 0.0
+    for doc in docs:
+        if isinstance(doc, str):
+            encoded = doc
+        else:
+            started = time.perf_counter()
+            encoded = dumps_doc(doc)
+            encode_time += time.perf_counter() - started
+        if batch and (len(batch) >= max_docs or batch_bytes + len(encoded) > max_bytes):
+            metrics.add_phase(operation, 'encode', encode_time)
+            encode_time = 0.0
+            yield batch
+            batch = []
+            batch_bytes = 0
+        batch.append(encoded)
+        batch_bytes += len(encoded)
+    metrics.add_phase(operation, 'encode', encode_time)
+    if batch:
+        yield batch
+
+def restore_docs_batched(db_url: str, auth: Tuple[str, str], docs: Iterator[Union[Dict, str]],
+                         limiter: Optional[AdaptiveLimiter] = None,
+                         on_progress: Optional[Callable[[int], None]] = None,
+                         operation: str = 'restore') -> Tuple[int, List[str]]:
+    """Restore a stream of documents as byte-budgeted _bulk_docs batches, several in flight.
+
+    The target server's limiter (shared with other restores to it) decides how
+    many batches are sent at once, and only twice its current limit are held in
+    memory, so memory stays bounded whatever the backup size.
+    Every RESTORE_CHECKPOINT_BATCHES completed batches, on_progress is called
+    with the number of leading documents of the stream that are all stored
+    (batches complete out of order, so later ones may be stored too).
+    """
+    restored = 0
+    errors = []
+    pending = {}
+    # Batches completed ahead of an earlier one still in flight: batch number -> document count
+    completed_ahead = {}
+    next_batch = 1
+    acknowledged = 0
+    completed = 0
+    
+    def collect(done):
+        nonlocal restored, next_batch, acknowledged, completed
+        for future in done:
+            ok, batch_errors = future.result()
+            restored += ok
+            errors.extend(batch_errors)
+            batch_num, batch_size = pending.pop(future)
+            completed_ahead[batch_num] = batch_size
+            while next_batch in completed_ahead:
+                acknowledged += completed_ahead.pop(next_batch)
+                next_batch += 1
+            completed += 1
+            if on_progress is not None and completed % RESTORE_CHECKPOINT_BATCHES == 0:
+                on_progress(acknowledged)
+    
+    limiter = limiter or limiter_for(db_url)
+    with ThreadPoolExecutor(max_workers=limiter.ceiling) as executor:
+        for batch_num, batch in enumerate(iter_bulk_batches(docs, operation=operation), 1):
+            while len(pending) >= 2 * limiter.current:
+                collect(wait(pending, return_when=FIRST_COMPLETED).done)
+            pending[executor.submit(
+                post_bulk_docs, db_url, auth, batch, operation=operation, limiter=limiter
+            )] = (batch_num, len(batch))
+            if batch_num % 10 == 0:
+                log.debug("📦 [RESTORE] %d batches queued, %d documents restored", batch_num, restored)
+        collect(wait(pending).done)
+    
+    return restored, errors
+
+def clean_attachment_stubs(doc: Dict) -> Dict:
+    """Drop _attachments made only of stubs (they cause errors); keep attachments with data"""
+    if '_attachments' not in doc:
+        return doc
+    attachments = doc['_attachments']
+    has_stubs = any(att.get('stub') == True for att in attachments.values())
+    has_data = any('data' in att for att in attachments.values())
+    if has_stubs and not has_data:
+        log.debug("📎 [RESTORE] Removing all attachment stubs from %s", doc.get('_id', 'unknown'))
+        return {k: v for k, v in doc.items() if k != '_attachments'}
+    return doc
+
+def restore_design_docs(db_url: str, auth: Tuple[str, str], design_docs: List[Dict]) -> Tuple[int, List[str]]:
+    """Restore design documents with one _bulk_docs request, overwriting existing ones.
+
+    The current revisions of the design documents are looked up first with a
+    single POST _all_docs (keys), so existing design documents are updated
+    rather than reported as conflicts. Returns the number restored and the
+    per-document errors.
+    """
+    response = couch_http.post(
+        f"{db_url}/_all_docs", auth=auth, json={'keys': [doc['_id'] for doc in design_docs]}, timeout=30
+    )
+    if response.status_code != 200:
+        raise requests.exceptions.HTTPError(
+            f"Failed to look up design documents: HTTP {response.status_code} - {response.text}",
+            response=response
+        )
+    current_revs = {
+        row['key']: row['value']['rev']
+        for row in response.json()['rows']
+        if 'error' not in row and not row['value'].get('deleted')
+    }
+    
+    docs = []
+    for design_doc in design_docs:
+        doc = {k: v for k, v in design_doc.items() if k != '_rev'}
+        if doc['_id'] in current_revs:
+            doc['_rev'] = current_revs[doc['_id']]
+        docs.append(doc)
+    
+    response = couch_http.post(f"{db_url}/_bulk_docs", auth=auth, json={'docs': docs}, timeout=RESTORE_BATCH_TIMEOUT)
+    if response.status_code not in [201, 202]:
+        raise requests.exceptions.HTTPError(
+            f"Design document restore failed (HTTP {response.status_code}): {response.text}", response=response
+        )
+    errors = [
+        f"{result.get('id', 'unknown')}: {result.get('error')} ({result.get('reason', 'no reason')})"
+        for result in response.json() if result.get('error')
+    ]
+    return len(docs) - len(errors), errors
+
+def restore_delta_files(db_url: str, auth: Tuple[str, str], delta_files: List[Path],
+                        blob_store: Optional[Path] = None, skip_docs: int = 0,
+                        on_progress: Optional[Callable[[int, int], None]] = None) -> Tuple[int, List[str]]:
+    """Replay incremental delta files in order with _bulk_docs (new_edits=false).
+
+    Returns the number of replayed documents and the per-document errors.
+    Raises on HTTP failure so a partially replayed chain is never reported as success.
+    To resume, skip_docs documents of the first delta file are skipped;
+    on_progress is called with (delta file index, documents stored in it).
+    """
+    replayed = 0
+    errors = []
+    
+    for index, delta_file in enumerate(delta_files):
+        log.info(f"➕ [RESTORE] Replaying delta {delta_file.name}")
+        skip = skip_docs if index == 0 else 0
+        docs = (
+            reattach_attachments(doc, blob_store)
+            for doc in itertools.islice(iter_backup_docs(delta_file), skip, None)
+        )
+        progress = None
+        if on_progress is not None:
+            progress = lambda stored, index=index, skip=skip: on_progress(index, skip + stored)
+        delta_replayed, delta_errors = restore_docs_batched(db_url, auth, docs, on_progress=progress)
+        replayed += delta_replayed
+        errors.extend(delta_errors)
+        if on_progress is not None:
+            on_progress(index + 1, 0)
+    
+    return replayed, errors
+
+def prefix_range(prefix: str) -> Tuple[str, Optional[str]]:
+    """Id range of the documents whose id starts with prefix"""
+    if not prefix:
+        return '', None
+    return prefix, prefix[:-1] + chr(ord(prefix[-1]) + 1)
+
+def id_ranges(doc_ids: Iterable[str] = (), prefixes: Iterable[str] = (), partitions: Iterable[str] = (),
+              start_key: Optional[str] = None, end_key: Optional[str] = None) -> List[Tuple[str, Optional[str]]]:
+    """Sorted, non-overlapping id ranges (start inclusive, end exclusive, None: unbounded)
+    covering a selection of documents: ids, id prefixes, partitions ({partition}:...) and one id range"""
+    ranges = [(doc_id, doc_id + '\0') for doc_id in doc_ids]
+    ranges += [prefix_range(prefix) for prefix in prefixes]
+    ranges += [prefix_range(f"{partition}:") for partition in partitions]
+    if start_key is not None or end_key is not None:
+        ranges.append((start_key or '', end_key))
+    merged = []
+    for start, end in sorted(ranges):
+        if merged and (merged[-1][1] is None or start <= merged[-1][1]):
+            if merged[-1][1] is not None and (end is None or end > merged[-1][1]):
+                merged[-1] = (merged[-1][0], end)
+        else:
+            merged.append((start, end))
+    return merged
+
+def in_id_ranges(doc_id: str, ranges: List[Tuple[str, Optional[str]]]) -> bool:
+    return any(start <= doc_id and (end is None or doc_id < end) for start, end in ranges)
+
+def iter_selected_docs(backup_file: Path, db_name: str, ranges: List[Tuple[str, Optional[str]]],
+                       apply_deltas: bool = True) -> Iterator[Dict]:
+    """Stream the documents of a backup whose id falls in one of the ranges, then their delta versions.
+
+    With the offset index of the backup, only the selected documents are read
+    (see read_indexed_docs); backups without one are scanned. Delta files
+    have no index and are scanned when apply_deltas is set.
+    """
+    # Sidecar files are named after the backed-up database, which may not be the restore target
+    db_name = backup_db_name(backup_file, db_name)
+    index = open_backup_index(backup_file, db_name)
+    if index is None:
+        log.info(f"ℹ️ [RESTORE] {backup_file.name} has no offset index - scanning it for the selected documents")
+        yield from (doc for doc in iter_backup_docs(backup_file) if in_id_ranges(doc.get('_id', ''), ranges))
+    else:
+        with index:
+            entries = (entry for start, end in ranges for entry in index.entries(start, end))
+            yield from read_indexed_docs(backup_file, db_name, entries)
+    
+    for delta_file in find_delta_files(backup_file, db_name) if apply_deltas else []:
+        yield from (doc for doc in iter_backup_docs(delta_file) if in_id_ranges(doc.get('_id', ''), ranges))
+
+def restore_checkpoint_file(backup_path: Path, target_url: str, db_name: str) -> Path:
+    """Checkpoint of a restore of backup_path into db_name on the server of target_url - one per
+    target, so restoring a backup into several servers or names keeps each one's progress"""
+    target = hashlib.sha256(f"{server_label(target_url)}/{db_name}".encode('utf-8')).hexdigest()[:12]
+    return checkpoint_file_for(backup_path, f"restore-{target}")
+
+def run_restore_python(target_url: str, db_name: str, backup_file: str, clean: bool = False,
+                       apply_deltas: bool = True, resume: bool = False,
+                       warm: bool = RESTORE_WARM_INDEXES) -> Tuple[bool, str]:
+    """Restore a database from backup using Python (avoids path space issues)
+
+    The backup is parsed incrementally and regular documents are sent as
+    _bulk_docs batches bounded by RESTORE_BATCH_SIZE documents and
+    RESTORE_BATCH_BYTES bytes, with as many batches in flight as the target
+    server's adaptive limiter allows and per-batch retry. Large backups written
+    by the engine are decoded and re-encoded in the codec pool (iter_restore_docs).
+    With apply_deltas, incremental delta files written next to the backup are
+    replayed in order after the base.
+    
+    Progress is checkpointed next to the backup file every
+    RESTORE_CHECKPOINT_BATCHES batches; with resume, a restore interrupted
+    into the same database continues after the stored documents (without clean).
+    With warm, every view and Mango index is built before the restore reports done.
+    """
+    try:
+        log.info(f"🔄 [RESTORE] Starting Python restore for database: {db_name}")
+        log.info(f"📁 [RESTORE] Backup file: {backup_file}")
+        log.info(f"🗑️ [RESTORE] Clean restore: {clean}")
+        
+        # Parse target URL
+        parsed = parse_couchdb_url(target_url)
+        base_url = f"http://{parsed['host']}:{parsed['port']}"
+        auth = (parsed['username'], parsed['password'])
+        log.info(f"🌐 [RESTORE] Target URL: {base_url}")
+        
+        # Check if backup file exists
+        backup_path = Path(backup_file)
+        if not backup_path.exists():
+            log.error(f"❌ [RESTORE] Backup file not found: {backup_file}")
+            return False, f"Backup file not found: {backup_file}"
+        
+        # Attachments stored out-of-line in the blob store are inlined again
+        blob_store = find_blob_store(backup_path)
+        # Sidecar, index and delta files are named after the backed-up database, not the target
+        source_db = backup_db_name(backup_path, db_name)
+        
+        # Validate the format by decoding the first document before touching the database
+        try:
+            log.info(f"🔍 [RESTORE] Streaming backup file ({backup_path.stat().st_size} bytes on disk)...")
+            doc_stream = iter_restore_docs(backup_path, source_db, blob_store)
+            first_doc = next(doc_stream, None)
+        except ValueError as e:
+            log.error(f"❌ [RESTORE] Invalid backup file: {e}")
+            return False, f"Invalid backup file: {e}"
+        
+        if first_doc is None:
+            log.error(f"❌ [RESTORE] No documents found in backup")
+            return False, "No documents found in backup"
+        
+        checkpoint_file = restore_checkpoint_file(backup_path, target_url, db_name)
+        checkpoint = read_checkpoint(checkpoint_file) if resume else None
+        if checkpoint and (checkpoint['target'], checkpoint['db']) != (server_label(target_url), db_name):
+            log.warning(f"⚠️ [RESTORE] Checkpoint belongs to a restore into {checkpoint['target']}/{checkpoint['db']} - ignoring it")
+            checkpoint = None
+        if checkpoint:
+            log.info(f"⏯️ [RESTORE] Resuming after {checkpoint['regular_done']} regular documents "
+                     f"and {checkpoint['deltas_done']} delta file(s)")
+            clean = False
+        else:
+            if resume:
+                log.info(f"ℹ️ [RESTORE] No checkpoint found - restoring from the start")
+            checkpoint_file.unlink(missing_ok=True)
+            checkpoint = {
+                'target': server_label(target_url),
+                'db': db_name,
+                'regular_done': 0,
+                'design_done': False,
+                'deltas_done': 0,
+                'delta_docs_done': 0
+            }
+        
+        def save_checkpoint(**progress):
+            checkpoint.update(progress)
+            write_json_atomic(checkpoint_file, checkpoint)
+                
+        # Check if database exists
+        db_url = f"{base_url}/{db_name}"
+        log.info(f"🔍 [RESTORE] Checking if database exists: {db_name}")
+        response = couch_http.head(db_url, auth=auth, timeout=10)
+        db_exists = response.status_code == 200
+        log.info(f"📊 [RESTORE] Database exists: {db_exists} (HTTP {response.status_code})")
+        
+        if clean and db_exists:
+            log.info(f"🗑️ [RESTORE] Clean restore requested - deleting existing database")
+            # Delete existing database
+            response = couch_http.delete(db_url, auth=auth, timeout=10)
+            if response.status_code not in [200, 202, 404]:  # 200=deleted, 202=accepted, 404=not found
+                log.error(f"❌ [RESTORE] Failed to delete existing database: HTTP {response.status_code}")
+                return False, f"Failed to delete existing database: {response.text}"
+            log.info(f"✅ [RESTORE] Database deleted successfully (HTTP {response.status_code})")
+        
+        # Create database if it doesn't exist
+        if not db_exists or clean:
+            log.info(f"🏗️ [RESTORE] Creating database: {db_name}")
+            response = couch_http.put(db_url, auth=auth, timeout=10)
+            if response.status_code not in [201, 202, 412]:  # 201=created, 202=accepted, 412=already exists
+                log.error(f"❌ [RESTORE] Failed to create database: HTTP {response.status_code}")
+                return False, f"Failed to create database: {response.text}"
+            log.info(f"✅ [RESTORE] Database created successfully (HTTP {response.status_code})")
+        
+        if blob_store is not None:
+            log.info(f"📎 [RESTORE] Reattaching attachments from blob store: {blob_store}")
+        
+        # Design documents are set aside (like bash script does) and restored in one batch
+        # after the regular documents, which stream straight into bulk batches
+        design_docs = []
+        regular_count = 0
+        # Regular documents stored by the interrupted run, skipped when resuming
+        skip_regular = checkpoint['regular_done']
+        
+        def regular_docs():
+            nonlocal regular_count
+            skipped = 0
+            for doc_id, doc in itertools.chain([first_doc], doc_stream):
+                if doc_id.startswith('_design/'):
+                    design_docs.append(doc)
+                elif skipped < skip_regular:
+                    skipped += 1
+                else:
+                    regular_count += 1
+                    yield doc
+        
+        total_restored = 0
+        messages = []
+        
+        log.info(f"📝 [RESTORE] Restoring regular documents in batches of up to {RESTORE_BATCH_SIZE} docs / "
+                 f"{RESTORE_BATCH_BYTES} bytes ({limiter_for(db_url).current} in flight)...")
+        successful, errors = restore_docs_batched(
+            db_url, auth, regular_docs(),
+            on_progress=lambda stored: save_checkpoint(regular_done=skip_regular + stored)
+        )
+        save_checkpoint(regular_done=skip_regular + regular_count)
+        total_restored += successful
+        log.info(f"✅ [RESTORE] Bulk operation completed: {successful}/{regular_count} documents successful")
+        if regular_count:
+            messages.append(f"Bulk restored {successful}/{regular_count} regular documents")
+        if skip_regular:
+            messages.append(f"Resumed after {skip_regular} regular documents")
+        
+        if errors:
+            log.warning(f"⚠️ [RESTORE] {len(errors)} documents had errors")
+            for error in errors[:5]:  # Log first 5 errors to console
+                log.error(f"   ❌ [RESTORE] {error}")
+            if len(errors) <= 10:
+                messages.append(f"Errors: {'; '.join(errors)}")
+            else:
+                messages.append(f"First 5 errors: {'; '.join(errors[:5])}... and {len(errors)-5} more")
+        
+        # Then, restore design documents in one batch (new revisions, replacing existing ones)
+        if design_docs and not checkpoint['design_done']:
+            log.info(f"🎨 [RESTORE] Restoring {len(design_docs)} design documents in one batch...")
+            design_restored, design_errors = restore_design_docs(db_url, auth, design_docs)
+            total_restored += design_restored
+            log.info(f"✅ [RESTORE] Design documents restored: {design_restored}/{len(design_docs)}")
+            messages.append(f"Restored {design_restored}/{len(design_docs)} design documents")
+            for error in design_errors:
+                log.error(f"   ❌ [RESTORE] {error}")
+            if design_errors:
+                messages.append(f"Design document errors: {'; '.join(design_errors)}")
+        save_checkpoint(design_done=True)
+        
+        # Replay incremental deltas on top of the base, oldest first
+        delta_files = find_delta_files(backup_path, source_db) if apply_deltas else []
+        deltas_done = checkpoint['deltas_done']
+        if delta_files[deltas_done:]:
+            log.info(f"➕ [RESTORE] Replaying {len(delta_files) - deltas_done} incremental delta file(s)...")
+            replayed, delta_errors = restore_delta_files(
+                db_url, auth, delta_files[deltas_done:], blob_store, checkpoint['delta_docs_done'],
+                on_progress=lambda index, stored: save_checkpoint(
+                    deltas_done=deltas_done + index, delta_docs_done=stored
+                )
+            )
+            total_restored += replayed
+            messages.append(f"Replayed {len(delta_files) - deltas_done} delta(s) with {replayed} documents")
+            if delta_errors:
+                messages.append(f"Delta errors: {'; '.join(delta_errors[:5])}")
+        
+        # Verify the restore by checking document count
+        log.info(f"🔍 [RESTORE] Verifying restore by checking database info...")
+        try:
+            verify_response = couch_http.get(db_url, auth=auth, timeout=10)
+            if verify_response.status_code == 200:
+                db_info = verify_response.json()
+                actual_count = db_info.get('doc_count', 0)
+                deleted_count = db_info.get('doc_del_count', 0)
+                
+                log.info(f"📊 [RESTORE] Database verification:")
+                log.info(f"   - 📄 Total documents: {actual_count}")
+                log.info(f"   - 🗑️ Deleted documents: {deleted_count}")
+                
+                messages.append(f"Database now contains {actual_count} documents")
+                
+                if actual_count == 0 and total_restored > 0:
+                    log.warning(f"⚠️ [RESTORE] WARNING: Documents restored but database shows 0 count - possible conflicts")
+                    messages.append("⚠️ WARNING: Documents may not be visible due to conflicts")
+                elif actual_count != total_restored + skip_regular:
+                    log.warning(f"⚠️ [RESTORE] NOTE: Restored {total_restored + skip_regular} but database shows {actual_count} documents")
+            else:
+                log.warning(f"⚠️ [RESTORE] Could not verify database info: HTTP {verify_response.status_code}")
+        except Exception as e:
+            log.warning(f"⚠️ [RESTORE] Verification error (non-critical): {e}")
+        
+        # Build the indexes now rather than on the first production query
+        if warm:
+            try:
+                warmed, warm_errors = warm_indexes(db_url, auth)
+                messages.append(f"Warmed {warmed} index group(s)")
+                if warm_errors:
+                    messages.append(f"Index warm-up errors: {'; '.join(warm_errors[:5])}")
+            except requests.RequestException as e:
+                # The data is restored; a cold index only costs time on the first query
+                log.warning(f"⚠️ [RESTORE] Index warm-up failed (non-critical): {e}")
+                messages.append(f"Index warm-up failed: {e}")
+                        
+        checkpoint_file.unlink(missing_ok=True)
+        log.info(f"✅ [RESTORE] Restore operation completed!")
+        log.info(f"📊 [RESTORE] Summary: {total_restored} documents restored to '{db_name}'")
+        
+        result_msg = f"Successfully restored {total_restored} documents to '{db_name}'. " + " | ".join(messages)
+        return True, result_msg
+            
+    except requests.RequestException as e:
+        log.error(f"❌ [RESTORE] Network error during restore: {str(e)}")
+        return False, f"Network error during restore: {str(e)}"
+    except Exception as e:
+        log.error(f"❌ [RESTORE] Restore error: {str(e)}")
+        return False, f"Restore error: {str(e)}"
+
+def run_restore_bash(target_url: str, db_name: str, backup_path: str, clean: bool = False) -> Tuple[bool, str]:
+    """Restore a database from backup using bash script"""
+    log.info(f"🔄 [RESTORE-BASH] Starting bash restore for database: {db_name}")
+    log.info(f"📁 [RESTORE-BASH] Backup path: {backup_path}")
+    log.info(f"🗑️ [RESTORE-BASH] Clean restore: {clean}")
+    
+    parsed = parse_couchdb_url(target_url)
+    log.info(f"🌐 [RESTORE-BASH] Parsed URL - Host: {parsed['host']}, Port: {parsed['port']}")
+    
+    # Check if backup exists
+    if not Path(backup_path).exists():
+        log.error(f"❌ [RESTORE-BASH] Backup file not found: {backup_path}")
+        return False, f"Backup file not found: {backup_path}"
+    
+    log.info(f"✅ [RESTORE-BASH] Found backup file: {backup_path}")
+    
+    # Build command with proper path handling
+    backup_dir = str(Path(backup_path).parent)
+    cmd = [
+        "bash", str(BACKUP_SCRIPT),
+        "-r",  # restore mode
+        "-H", parsed['host'],
+        "-P", parsed['port'],
+        "-u", parsed['username'],
+        "-p", parsed['password'],
+        "-d", db_name,
+        "-i", backup_dir
+    ]
+    
+    if clean:
+        cmd.append("-c")  # clean/recreate database
+        log.info(f"🗑️ [RESTORE-BASH] Clean mode enabled - will recreate database")
+    
+    log.info(f"🚀 [RESTORE-BASH] Executing bash restore command:")
+    cmd_display = cmd.copy()
+    cmd_display[9] = "****"  # Hide password in logs
+    log.info(f"   {' '.join(cmd_display)}")
+    
+    try:
+        log.info(f"⏳ [RESTORE-BASH] Running bash restore script...")
+        result = subprocess.run(
+            cmd,
+            capture_output=True,
+            text=True,
+            timeout=600,  # 10 minutes timeout
+            input="N\nN\n"  # Auto-answer interactive prompts
+        )
+        
+        log.info(f"📊 [RESTORE-BASH] Script completed with exit code: {result.returncode}")
+        
+        if result.stdout:
+            log.info(f"📝 [RESTORE-BASH] Script output:")
+            for line in result.stdout.split('\n'):
+                if line.strip():
+                    log.info(f"   {line}")
+        
+        if result.stderr:
+            log.warning(f"⚠️ [RESTORE-BASH] Script errors:")
+            for line in result.stderr.split('\n'):
+                if line.strip():
+                    log.info(f"   {line}")
+        
+        full_output = result.stdout + "\n" + result.stderr
+        
+        if result.returncode == 0:
+            log.info(f"✅ [RESTORE-BASH] Database '{db_name}' restored successfully")
+            return True, f"Database '{db_name}' restored successfully"
+        else:
+            log.error(f"❌ [RESTORE-BASH] Restore failed with exit code {result.returncode}")
+            return False, f"Restore failed (exit code {result.returncode}):\n{full_output}"
+            
+    except subprocess.TimeoutExpired:
+        log.info(f"⏰ [RESTORE-BASH] Restore script timed out after 10 minutes")
+        return False, "Restore timeout (10 minutes)"
+    except Exception as e:
+        log.error(f"❌ [RESTORE-BASH] Restore error: {str(e)}")
+        return False, f"Restore error: {str(e)}"
+
+def run_restore(target_url: str, db_name: str, backup_path: str, clean: bool = False,
+                apply_deltas: bool = True, resume: bool = False,
+                warm: bool = RESTORE_WARM_INDEXES) -> Tuple[bool, str]:
+    """Restore a database from backup - try Python method first, fallback to bash script"""
+    # Try Python-based restore first (no path space issues)
+    success, msg = run_restore_python(target_url, db_name, backup_path, clean, apply_deltas, resume, warm)
+    if success:
+        return success, msg
+    
+    # A checkpointed restore is resumed rather than redone by the bash script
+    if restore_checkpoint_file(Path(backup_path), target_url, db_name).exists():
+        return False, f"{msg} (progress saved - resume the restore to continue)"
+        
+    # Fallback to bash script if Python restore fails
+    log.warning("Python restore failed, trying bash script...")
+    success, msg = run_restore_bash(target_url, db_name, backup_path, clean)
+    if success and apply_deltas and find_delta_files(Path(backup_path), db_name):
+        msg += " (base only - incremental deltas were not applied)"
+    return success, msg
+
+def run_restore_selected(target_url: str, db_name: str, backup_file: str,
+                         ranges: List[Tuple[str, Optional[str]]], apply_deltas: bool = True) -> Tuple[bool, str]:
+    """Restore only the documents of a backup whose id falls in one of the ranges (see id_ranges).
+
+    The documents are looked up in the offset index of the backup and read
+    without parsing the rest of the file, then stored like a full restore:
+    _bulk_docs with new_edits=false (design documents as new revisions).
+    The database is created if needed and is otherwise left as is.
+    """
+    try:
+        started = time.monotonic()
+        log.info(f"🎯 [RESTORE] Selective restore of {db_name} from {backup_file}: {len(ranges)} id range(s)")
+        parsed = parse_couchdb_url(target_url)
+        db_url = f"http://{parsed['host']}:{parsed['port']}/{db_name}"
+        auth = (parsed['username'], parsed['password'])
+        backup_path = Path(backup_file)
+        if not backup_path.exists():
+            return False, f"Backup file not found: {backup_file}"
+        
+        response = couch_http.put(db_url, auth=auth, timeout=10)
+        if response.status_code not in [201, 202, 412]:  # 412=already exists
+            return False, f"Failed to create database: {response.text}"
+        
+        blob_store = find_blob_store(backup_path)
+        design_docs = []
+        matched = 0
+        
+        def regular_docs():
+            nonlocal matched
+            for doc in iter_selected_docs(backup_path, db_name, ranges, apply_deltas):
+                matched += 1
+                doc = reattach_attachments(doc, blob_store)
+                if doc.get('_id', '').startswith('_design/'):
+                    design_docs.append(doc)
+                else:
+                    yield clean_attachment_stubs(doc)
+        
+        restored, errors = restore_docs_batched(db_url, auth, regular_docs())
+        if design_docs:
+            design_restored, design_errors = restore_design_docs(db_url, auth, design_docs)
+            restored += design_restored
+            errors += design_errors
+        
+        elapsed = time.monotonic() - started
+        log.info(f"✅ [RESTORE] Selective restore of {db_name}: {restored}/{matched} documents in {elapsed:.2f}s")
+        if matched == 0:
+            return False, "No document of the backup matches the selection"
+        msg = f"Restored {restored}/{matched} selected documents to '{db_name}' in {elapsed:.2f}s"
+        if errors:
+            msg += f" | Errors: {'; '.join(errors[:5])}"
+        return not errors, msg
+    
+    except requests.RequestException as e:
+        log.error(f"❌ [RESTORE] Network error during selective restore: {e}")
+        return False, f"Network error during selective restore: {e}"
+    except Exception as e:
+        log.error(f"❌ [RESTORE] Selective restore error: {e}")
+        return False, f"Selective restore error: {e}"
+
+def extract_docs(backup_file: str, db_name: str, ranges: List[Tuple[str, Optional[str]]], output_file: str,
+                 apply_deltas: bool = True) -> Tuple[bool, str]:
+    """Write the selected documents of a backup to output_file, a backup file in the same
+    new_edits=false format (attachments from the blob store inlined) that can itself be restored"""
+    try:
+        started = time.monotonic()
+        backup_path = Path(backup_file)
+        if Path(output_file).resolve() == backup_path.resolve():
+            return False, f"Refusing to overwrite the backup file {backup_file}"
+        db_name = backup_db_name(backup_path, db_name)
+        blob_store = find_blob_store(backup_path)
+        count = 0
+        with open(output_file, 'w', encoding='utf-8') as f:
+            f.write('{"new_edits":false,"docs":[\n')
+            for doc in iter_selected_docs(backup_path, db_name, ranges, apply_deltas):
+                if count:
+                    f.write(',\n')
+                f.write(dumps_doc(reattach_attachments(doc, blob_store)))
+                count += 1
+            f.write('\n]}')
+        elapsed = time.monotonic() - started
+        log.info(f"✅ [EXTRACT] {count} documents of {db_name} written to {output_file} in {elapsed:.2f}s")
+        if count == 0:
+            return False, "No document of the backup matches the selection"
+        return True, f"Extracted {count} documents to {output_file} in {elapsed:.2f}s"
+    except Exception as e:
+        log.error(f"❌ [EXTRACT] Extract error: {e}")
+        return False, f"Extract error: {e}"
@@ -0,0 +1,67 @@
+"""
+Document scopes - the part of a database a backup, sync or export reads (document ids, id prefixes
+and ranges, partitions, a Mango selector), filtered by CouchDB so only matching documents leave it
+"""
+
+import json
+import re
+from typing import Dict, Iterable, Optional
+
+from .restore import id_ranges, prefix_range
+
+def make_scope(doc_ids: Iterable[str] = (), prefixes: Iterable[str] = (), partitions: Iterable[str] = (),
+               start_key: Optional[str] = None, end_key: Optional[str] = None,
+               selector: Optional[Dict] = None) -> Optional[Dict]:
+    """Scope of the documents selected by ids, id prefixes, partitions and one id range (any of
+    them, as id_ranges), narrowed to those matching a Mango selector; None selects whole databases.
+
+    The scope is plain JSON data ({ranges, partitions, selector}) so it can be
+    recorded in run plans and backup metadata.
+    """
+    partitions = sorted(set(partitions))
+    ranges = id_ranges(doc_ids, prefixes, partitions, start_key, end_key)
+    if not ranges and not selector:
+        return None
+    return {'ranges': [list(id_range) for id_range in ranges], 'partitions': partitions, 'selector': selector or None}
+
+def range_partition(scope: Dict, start: str, end: Optional[str]) -> Optional[str]:
+    """The partition of the scope whose documents are exactly the id range [start, end), if any"""
+    for partition in scope['partitions']:
+        if [start, end] == list(prefix_range(f"{partition}:")):
+            return partition
+    return None
+
+def range_selector(start: str, end: Optional[str]) -> Dict:
+    """Mango selector of the ids in [start, end).
+
+    Single ids and prefixes are matched exactly ($eq, anchored $regex); other
+    ranges use $gte/$lt, which compare with CouchDB's collation rather than the
+    raw id order of _all_docs and can differ for ids mixing case or punctuation.
+    """
+    if end == start + '\0':
+        return {'_id': start}
+    if start and end == prefix_range(start)[1]:
+        return {'_id': {'$regex': f"^{re.escape(start)}"}}
+    return {'_id': {'$gte': start, **({'$lt': end} if end is not None else {})}}
+
+def scope_selector(scope: Dict) -> Dict:
+    """Mango selector matching the documents of a scope (for _find and filtered replications)"""
+    clauses = []
+    if scope['ranges']:
+        id_clauses = [range_selector(start, end) for start, end in scope['ranges']]
+        clauses.append(id_clauses[0] if len(id_clauses) == 1 else {'$or': id_clauses})
+    if scope['selector']:
+        clauses.append(scope['selector'])
+    return clauses[0] if len(clauses) == 1 else {'$and': clauses}
+
+def describe_scope(scope: Optional[Dict]) -> str:
+    """Readable scope for logs and messages"""
+    if scope is None:
+        return "all documents"
+    parts = [f"partition {partition}" for partition in scope['partitions']]
+    ranges = [id_range for id_range in scope['ranges'] if range_partition(scope, *id_range) is None]
+    if ranges:
+        parts.append(f"{len(ranges)} id range(s)")
+    if scope['selector']:
+        parts.append(f"selector {json.dumps(scope['selector'], ensure_ascii=False)}")
+    return ", ".join(parts)
@@ -0,0 +1,101 @@
+"""
+Cluster shards - the nodes holding a database and document id ranges for exporting it
+from several nodes at once
+"""
+
+import json
+import requests
+from urllib.parse import urlparse
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Dict, Optional, Tuple
+
+from .client import couch_http, parse_couchdb_url, test_connection
+from .config import BACKUP_PAGE_TIMEOUT, CLUSTER_NODE_PORT, CLUSTER_NODE_URLS, SHARD_SPLIT_PAGE_SIZE
+
+def get_shard_map(base_url: str, db_name: str) -> Dict[str, List[str]]:
+    """Shard ranges of a database and the nodes holding each (empty without a shard map, e.g. CouchDB 1.x)"""
+    try:
+        response = couch_http.get(f"{base_url}/{db_name}/_shards", timeout=10)
+    except requests.exceptions.RequestException:
+        return {}
+    if response.status_code != 200:
+        return {}
+    return response.json().get('shards', {})
+
+def with_credentials(url: str, source_url: str) -> str:
+    """url with the credentials of source_url, unless it carries its own"""
+    parsed = urlparse(url)
+    source = parse_couchdb_url(source_url)
+    if parsed.username or not source['username']:
+        return url.rstrip('/')
+    return parsed._replace(netloc=f"{source['username']}:{source['password']}@{parsed.netloc}").geturl().rstrip('/')
+
+def node_url(source_url: str, node: str) -> str:
+    """Direct URL of a cluster node from its Erlang node name (couchdb@<host>)"""
+    source = parse_couchdb_url(source_url)
+    return with_credentials(f"{source['protocol']}://{node.split('@', 1)[-1]}:{CLUSTER_NODE_PORT}", source_url)
+
+def cluster_node_urls(source_url: str, db_name: str, node_urls: Optional[List[str]] = None) -> List[str]:
+    """Direct URLs of the cluster nodes serving a database that answer _up.
+
+    Taken from node_urls (by default CLUSTER_NODE_URLS) when set, otherwise from
+    the nodes listed in the shard map. Nodes that cannot be reached from here
+    (e.g. Docker host names outside the compose network) are left out.
+    """
+    base_url = source_url.rstrip('/')
+    node_urls = CLUSTER_NODE_URLS if node_urls is None else node_urls
+    if node_urls:
+        candidates = [with_credentials(url, source_url) for url in node_urls]
+    else:
+        nodes = sorted({node for holders in get_shard_map(base_url, db_name).values() for node in holders})
+        candidates = [node_url(source_url, node) for node in nodes]
+    if not candidates:
+        return []
+    with ThreadPoolExecutor(max_workers=len(candidates)) as executor:
+        reachable = list(executor.map(lambda url: test_connection(url)[0], candidates))
+    return [url for url, up in zip(candidates, reachable) if up]
+
+def split_id_ranges(base_url: str, db_name: str, doc_count: int,
+                    parts: int) -> List[Tuple[Optional[str], Optional[str]]]:
+    """Split the document ids of a database into about `parts` contiguous ranges of similar size.
+
+    Returns (start, end) pairs in id order: start is inclusive, end exclusive
+    and None means unbounded. The boundaries are the ids at evenly spaced
+    positions of one ids-only pass over _all_docs (no documents, paged on
+    startkey, stopping at the last boundary) - not a skip per boundary, which a
+    cluster serves by reading and discarding every skipped row on every shard.
+    """
+    if parts <= 1 or doc_count <= parts:
+        return [(None, None)]
+
+    positions = [doc_count * i // parts for i in range(1, parts)]
+    boundaries = []
+    offset = 0
+    page_key = None
+    while positions:
+        params = {'limit': SHARD_SPLIT_PAGE_SIZE + 1}
+        if page_key is not None:
+            params['startkey'] = json.dumps(page_key)
+        response = couch_http.get(f"{base_url}/{db_name}/_all_docs", params=params, timeout=BACKUP_PAGE_TIMEOUT)
+        if response.status_code != 200:
+            raise requests.exceptions.HTTPError(
+                f"Failed to split {db_name} into ranges: HTTP {response.status_code} - {response.text}",
+                response=response
+            )
+        rows = response.json().get('rows', [])
+        page = rows[:SHARD_SPLIT_PAGE_SIZE]
+        while positions and positions[0] < offset + len(page):
+            boundaries.append(page[positions.pop(0) - offset]['id'])
+        if len(rows) <= SHARD_SPLIT_PAGE_SIZE:
+            break
+        offset += len(page)
+        # The extra row starts the next page
+        page_key = rows[SHARD_SPLIT_PAGE_SIZE]['id']
+    boundaries = sorted(set(boundaries))
+    starts = [None] + boundaries
+    ends = boundaries + [None]
+    return list(zip(starts, ends))
+
+def describe_range(start: Optional[str], end: Optional[str]) -> str:
+    """Readable id range for logs"""
+    return f"[{json.dumps(start) if start is not None else 'start'}, {json.dumps(end) if end is not None else 'end'})"
@@ -0,0 +1,506 @@
+"""
+Backup file storage - compression, sidecar and checkpoint files and the attachment blob store
+"""
+
+import base64
+import bisect
+import gzip
+import hashlib
+import io
+import json
+import mmap
+import os
+import re
+import zlib
+import requests
+import shutil
+import threading
+from pathlib import Path
+from urllib.parse import quote
+from typing import Iterable, Iterator, List, Dict, Optional, Tuple
+
+try:
+    import zstandard
+except ImportError:  # zstd compression is optional
+    zstandard = None
+
+from .client import couch_http
+from .codec import dumps_doc, loads
+from .config import (
+    BACKUP_FILE_PATTERN, BACKUP_PAGE_TIMEOUT, BLOB_STORE_NAME, COMPRESSION_EXTENSIONS, INDEX_READ_CHUNK, JOBS_DIR_NAME,
+    MANIFEST_NAME, RUN_PLAN_NAME
+)
+
+def available_compressions() -> List[str]:
+    """Compression formats usable in this environment"""
+    return [c for c in COMPRESSION_EXTENSIONS if c != 'zstd' or zstandard is not None]
+
+class _SegmentWriter(io.RawIOBase):
+    """Binary writer compressing into independently decodable segments (gzip members, zstd frames).
+
+    end_segment() completes the current segment and returns the file size:
+    a point the file can later be truncated back to and appended from.
+    """
+
+    def __init__(self, file, compression: str):
+        self.file = file
+        self.compression = compression
+        self.segment = None
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, b) -> int:
+        if self.segment is None:
+            if self.compression == 'gzip':
+                self.segment = gzip.GzipFile(fileobj=self.file, mode='wb')
+            elif self.compression == 'zstd':
+                self.segment = zstandard.ZstdCompressor().stream_writer(self.file, closefd=False)
+            else:
+                self.segment = self.file
+        self.segment.write(b)
+        return len(b)
+
+    def end_segment(self) -> int:
+        if self.segment is not None and self.segment is not self.file:
+            self.segment.close()
+        self.segment = None
+        self.file.flush()
+        return self.file.tell()
+
+    def close(self):
+        if not self.closed:
+            self.end_segment()
+            self.file.close()
+        super().close()
+
+class _CountingWriter(io.RawIOBase):
+    """Binary pass-through writer that counts the bytes written to it"""
+
+    def __init__(self, raw):
+        self.raw = raw
+        self.bytes_written = 0
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, b) -> int:
+        self.raw.write(b)
+        self.bytes_written += len(b)
+        return len(b)
+
+    def end_segment(self) -> int:
+        """Complete the compressed segment written so far; returns the resumable file offset"""
+        return self.raw.end_segment()
+
+    def append_file(self, path: Path, uncompressed_size: int) -> int:
+        """Append a file written by another writer with the same compression, whose
+        segments decode as a continuation of this one; returns the file offset after it"""
+        self.raw.end_segment()
+        with open(path, 'rb') as src:
+            shutil.copyfileobj(src, self.raw.file, 1024 * 1024)
+        self.bytes_written += uncompressed_size
+        return self.raw.end_segment()
+
+    def close(self):
+        if not self.closed:
+            self.raw.close()
+        super().close()
+
+def open_backup_writer(path: Path, compression: str = 'none',
+                       resume_offset: Optional[int] = None) -> Tuple[io.TextIOWrapper, _CountingWriter]:
+    """Open a backup file for streaming text output, compressed on the fly.
+
+    Returns the text stream and the counter of uncompressed bytes written to it.
+    To checkpoint, flush the text stream and call counter.end_segment(); with
+    resume_offset, the file is truncated to such an offset and appended to.
+    """
+    if compression not in COMPRESSION_EXTENSIONS:
+        raise ValueError(f"Unknown compression: {compression}")
+    if compression == 'zstd' and zstandard is None:
+        raise ValueError("zstd compression requires the 'zstandard' package")
+    if resume_offset is None:
+        file = open(path, 'wb')
+    else:
+        file = open(path, 'r+b')
+        file.truncate(resume_offset)
+        file.seek(resume_offset)
+    counter = _CountingWriter(_SegmentWriter(file, compression))
+    return io.TextIOWrapper(io.BufferedWriter(counter), encoding='utf-8'), counter
+
+def open_backup_reader(path: Path) -> io.TextIOBase:
+    """Open a backup or delta file for text reading, decompressing by file extension"""
+    if path.name.endswith('.gz'):
+        return gzip.open(path, 'rt', encoding='utf-8')
+    if path.name.endswith('.zst'):
+        if zstandard is None:
+            raise ValueError("Reading .zst backups requires the 'zstandard' package")
+        reader = zstandard.ZstdDecompressor().stream_reader(open(path, 'rb'), read_across_frames=True)
+        return io.TextIOWrapper(reader, encoding='utf-8')
+    return open(path, 'r', encoding='utf-8')
+
+class BackupIndexWriter:
+    """Writes documents to a backup stream while recording the sidecar offset index.
+
+    Every document gets one index line - its JSON-encoded id, its byte offset in
+    the uncompressed stream and its length - in the order written, which is id
+    order for _all_docs exports (the index is sorted on finish() otherwise).
+    Compressed files also need the segments: [uncompressed offset, file offset]
+    pairs marking where a gzip member / zstd frame starts, from which a reader
+    decompresses up to a document instead of from the start of the file.
+    All text of the stream goes through write() or write_doc() to keep offsets exact.
+    """
+
+    def __init__(self, path: Path, state: Optional[Dict] = None):
+        self.path = path
+        self.state = state or {'index_offset': 0, 'position': 0, 'entries': 0, 'segments': [[0, 0]],
+                               'last_id': None, 'sorted': True}
+        if state is None:
+            self.file = open(path, 'w', encoding='utf-8', newline='\n')
+        else:
+            self.file = open(path, 'r+', encoding='utf-8', newline='\n')
+            self.file.truncate(state['index_offset'])
+            self.file.seek(state['index_offset'])
+
+    @property
+    def position(self) -> int:
+        return self.state['position']
+
+    def write(self, f: io.TextIOBase, text: str):
+        """Write text that is not a document (header, separators, footer) to the stream"""
+        f.write(text)
+        self.state['position'] += len(text) if text.isascii() else len(text.encode('utf-8'))
+
+    def write_doc(self, f: io.TextIOBase, doc: Dict):
+        """Write a document to the stream (after a ',\n' separator unless it is the first) and index it"""
+        if self.state['entries']:
+            self.write(f, ',\n')
+        encoded = dumps_doc(doc)
+        offset = self.position
+        self.write(f, encoded)
+        self.add(doc.get('_id', ''), offset, self.position - offset)
+
+    def add(self, doc_id: str, offset: int, length: int):
+        last_id = self.state['last_id']
+        if last_id is not None and doc_id < last_id:
+            self.state['sorted'] = False
+        self.file.write(f"{json.dumps(doc_id, ensure_ascii=False)}\t{offset}\t{length}\n")
+        self.state['entries'] += 1
+        self.state['last_id'] = doc_id
+
+    def mark_segment(self, file_offset: int):
+        """Record that a new compressed segment starts here (call right after counter.end_segment())"""
+        if self.state['segments'][-1][0] == self.position:
+            self.state['segments'][-1] = [self.position, file_offset]
+        else:
+            self.state['segments'].append([self.position, file_offset])
+
+    def append_part(self, part_index: Path, part_segments: List[List[int]], file_offset: int, size: int):
+        """Record a part file appended at file_offset (see _CountingWriter.append_file), whose
+        own index and segments are relative to its start, and advance past its size uncompressed bytes"""
+        base = self.position
+        self.state['segments'].extend([[base + start, file_offset + offset] for start, offset in part_segments])
+        with open(part_index, 'r', encoding='utf-8', newline='\n') as lines:
+            for line in lines:
+                encoded_id, offset, length = line.rstrip('\n').rsplit('\t', 2)
+                self.add(json.loads(encoded_id), base + int(offset), int(length))
+        self.state['position'] += size
+
+    def checkpoint(self) -> Dict:
+        """Resumable state, for the checkpoint of the backup"""
+        self.file.flush()
+        self.state['index_offset'] = self.file.tell()
+        return json.loads(json.dumps(self.state))
+
+    def close(self):
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def finish(self, index_file: Path) -> Dict:
+        """Close the index, sort it if needed, move it to index_file; returns its description for the metadata"""
+        self.close()
+        if not self.state['sorted']:
+            lines = self.path.read_text(encoding='utf-8').splitlines(keepends=True)
+            lines.sort(key=lambda line: json.loads(line.rsplit('\t', 2)[0]))
+            self.path.write_text(''.join(lines), encoding='utf-8')
+        self.path.replace(index_file)
+        return {'file': index_file.name, 'entries': self.state['entries'], 'segments': self.state['segments']}
+
+def index_file_for(backup_file: Path, db_name: str) -> Path:
+    """Sidecar offset index of a backup file (document id -> offset and length, sorted by id)"""
+    return backup_file.parent / f"{db_name}.idx"
+
+class BackupIndex:
+    """Memory-mapped offset index of a backup file, binary-searched by document id"""
+
+    def __init__(self, path: Path):
+        self.file = open(path, 'rb')
+        size = os.fstat(self.file.fileno()).st_size
+        self.map = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ) if size else b''
+
+    def close(self):
+        if isinstance(self.map, mmap.mmap):
+            self.map.close()
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _entry_at(self, start: int) -> Tuple[str, int, int, int]:
+        """(id, offset, length, start of the next line) of the index line starting at start"""
+        end = self.map.find(b'\n', start)
+        encoded_id, offset, length = self.map[start:end].rsplit(b'\t', 2)
+        return json.loads(encoded_id), int(offset), int(length), end + 1
+
+    def seek(self, key: str) -> int:
+        """Position of the first index line whose id is >= key"""
+        lo, hi = 0, len(self.map)
+        while lo < hi:
+            start = self.map.rfind(b'\n', lo, (lo + hi) // 2) + 1 or lo
+            doc_id, _, _, next_start = self._entry_at(start)
+            if doc_id < key:
+                lo = next_start
+            else:
+                hi = start
+        return lo
+
+    def entries(self, start_key: str = '', end_key: Optional[str] = None) -> Iterator[Tuple[str, int, int]]:
+        """(id, offset, length) of the documents with start_key <= id < end_key (None: no upper bound)"""
+        pos = self.seek(start_key)
+        while pos < len(self.map):
+            doc_id, offset, length, pos = self._entry_at(pos)
+            if end_key is not None and doc_id >= end_key:
+                return
+            yield doc_id, offset, length
+
+    def get(self, doc_id: str) -> Optional[Tuple[int, int]]:
+        """(offset, length) of a document, None if the backup does not contain it"""
+        for found, offset, length in self.entries(doc_id):
+            return (offset, length) if found == doc_id else None
+        return None
+
+def open_backup_index(backup_file: Path, db_name: str) -> Optional[BackupIndex]:
+    """Open the offset index of a backup file (None for backups without one, e.g. bash or older backups)"""
+    index_file = index_file_for(backup_file, db_name)
+    if not index_file.exists() or 'index' not in read_backup_meta(backup_file, db_name):
+        return None
+    return BackupIndex(index_file)
+
+def read_indexed_docs(backup_file: Path, db_name: str,
+                      entries: Iterable[Tuple[str, int, int]]) -> Iterator[Dict]:
+    """Read the documents at the given index entries from a memory-mapped backup file.
+
+    Uncompressed files are sliced directly. Compressed files are decompressed
+    from the start of the segment holding each document up to its end; entries
+    in file order (as returned by the index) share the decompression of a segment.
+    """
+    meta = read_backup_meta(backup_file, db_name)
+    compression = meta.get('compression', 'none')
+    segments = meta['index']['segments']
+    segment_starts = [start for start, _ in segments]
+    with open(backup_file, 'rb') as raw:
+        if os.fstat(raw.fileno()).st_size == 0:
+            return
+        with mmap.mmap(raw.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            if compression == 'none':
+                for _, offset, length in entries:
+                    yield loads(data[offset:offset + length])
+                return
+            
+            current = None
+            for doc_id, offset, length in entries:
+                segment = bisect.bisect_right(segment_starts, offset) - 1
+                if current is None or current[0] != segment or offset < current[1]:
+                    # (segment, uncompressed offset of buf[0], decompressor, file position, buf)
+                    start, file_offset = segments[segment]
+                    decompressor = (zlib.decompressobj(wbits=31) if compression == 'gzip'
+                                    else zstandard.ZstdDecompressor().decompressobj())
+                    current = [segment, start, decompressor, file_offset, bytearray()]
+                _, buf_start, decompressor, file_pos, buf = current
+                while True:
+                    # Drop what lies before the document, then decompress until it is complete
+                    skip = min(len(buf), offset - buf_start)
+                    del buf[:skip]
+                    buf_start += skip
+                    if buf_start + len(buf) >= offset + length:
+                        break
+                    if decompressor.eof or file_pos >= len(data):
+                        raise ValueError(f"Backup index entry of {doc_id} lies beyond its compressed segment")
+                    chunk = data[file_pos:file_pos + INDEX_READ_CHUNK]
+                    file_pos += len(chunk)
+                    buf += decompressor.decompress(chunk)
+                current[1], current[3] = buf_start, file_pos
+                yield loads(bytes(buf[:length]))
+
+def find_backup_file(backup_path: Path, db_name: str) -> Optional[Path]:
+    """Find the backup file of a database under a backup directory, whatever its compression"""
+    # The manifest knows where every file is; search the directory only without one
+    try:
+        manifest = json.loads((backup_path / MANIFEST_NAME).read_text(encoding='utf-8'))
+        entry = manifest['databases'].get(db_name)
+        if entry and (backup_path / entry['file']).exists():
+            return backup_path / entry['file']
+    except (OSError, ValueError, KeyError):
+        pass
+    for ext in COMPRESSION_EXTENSIONS.values():
+        matches = [f for f in backup_path.glob(f"**/{db_name}.json{ext}") if f != backup_path / RUN_PLAN_NAME]
+        if matches:
+            return matches[0]
+    return None
+
+def backup_db_name(backup_file: Path, default: str) -> str:
+    """Name of the database a backup file was made from ({db}.json[.gz|.zst]), which names its
+    sidecar, index and delta files - not necessarily the database it is restored into"""
+    match = BACKUP_FILE_PATTERN.match(backup_file.name)
+    return match.group('db') if match else default
+
+def find_backup_files(backup_path: Path) -> Dict[str, Path]:
+    """Map each database to its backup file under a backup directory (blob store, manifest and run plan excluded)"""
+    backup_files = {}
+    for f in sorted(backup_path.glob("**/*.json*")):
+        if f in (backup_path / MANIFEST_NAME, backup_path / RUN_PLAN_NAME):
+            continue
+        match = BACKUP_FILE_PATTERN.match(f.name)
+        if match and BLOB_STORE_NAME not in f.relative_to(backup_path).parts:
+            backup_files.setdefault(match.group('db'), f)
+    return backup_files
+
+def blob_path(blob_store: Path, digest: str) -> Path:
+    """Location of an attachment in the blob store, keyed by its CouchDB digest (e.g. md5-<base64>)"""
+    algorithm, _, encoded = digest.partition('-')
+    blob_hex = base64.b64decode(encoded).hex()
+    return blob_store / algorithm / blob_hex[:2] / blob_hex
+
+def find_blob_store(backup_file: Path) -> Optional[Path]:
+    """Find the blob store of a backup file by walking up its parent directories"""
+    for parent in backup_file.parents:
+        if (parent / BLOB_STORE_NAME).is_dir():
+            return parent / BLOB_STORE_NAME
+    return None
+
+def store_attachments(base_url: str, db_name: str, doc: Dict, blob_store: Path) -> int:
+    """Copy the attachments of a document into the blob store, skipping those already stored.
+
+    The document keeps its attachment stubs, whose digest references the
+    stored blob. Returns the number of bytes downloaded.
+    """
+    fetched = 0
+    for att_name, att in doc.get('_attachments', {}).items():
+        digest = att.get('digest')
+        if not digest:
+            continue
+        target = blob_path(blob_store, digest)
+        if target.exists():
+            continue
+        
+        att_url = f"{base_url}/{db_name}/{quote(doc['_id'], safe='')}/{quote(att_name, safe='')}"
+        response = couch_http.get(att_url, params={'rev': doc['_rev']}, timeout=BACKUP_PAGE_TIMEOUT)
+        if response.status_code != 200:
+            raise requests.exceptions.HTTPError(
+                f"Failed to fetch attachment {doc['_id']}/{att_name}: HTTP {response.status_code}",
+                response=response
+            )
+        
+        # Write then rename so concurrent backups never see a partial blob
+        target.parent.mkdir(parents=True, exist_ok=True)
+        tmp_file = target.with_name(f"{target.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+        tmp_file.write_bytes(response.content)
+        tmp_file.replace(target)
+        fetched += len(response.content)
+    return fetched
+
+def reattach_attachments(doc: Dict, blob_store: Optional[Path]) -> Dict:
+    """Replace attachment stubs whose blob is in the store with inline data, for restore"""
+    if blob_store is None or '_attachments' not in doc:
+        return doc
+    attachments = {}
+    for att_name, att in doc['_attachments'].items():
+        digest = att.get('digest')
+        if att.get('stub') and digest and blob_path(blob_store, digest).exists():
+            attachments[att_name] = {
+                'content_type': att.get('content_type', 'application/octet-stream'),
+                'data': base64.b64encode(blob_path(blob_store, digest).read_bytes()).decode('ascii')
+            }
+        else:
+            attachments[att_name] = att
+    return {**doc, '_attachments': attachments}
+
+def file_sha256(path: Path) -> str:
+    """SHA-256 of a file as stored on disk (compressed bytes for compressed backups)"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def write_json_atomic(path: Path, data: Dict):
+    """Write a JSON file atomically, so readers never see it half-written"""
+    tmp_path = path.with_name(f"{path.name}.tmp")
+    tmp_path.write_text(json.dumps(data, indent=1), encoding='utf-8')
+    tmp_path.replace(path)
+
+def checkpoint_file_for(path: Path, operation: str = 'backup') -> Path:
+    """Checkpoint of an interrupted operation on a backup file, kept next to it"""
+    return path.with_name(f"{path.name}.{operation}.checkpoint")
+
+def read_checkpoint(checkpoint_file: Path) -> Optional[Dict]:
+    """Read a checkpoint or run plan (None if there is none or it is unreadable)"""
+    try:
+        return json.loads(checkpoint_file.read_text(encoding='utf-8'))
+    except (OSError, ValueError):
+        return None
+
+def seq_file_for(backup_file: Path, db_name: str) -> Path:
+    """Checkpoint file holding the update_seq covered by a base backup and its deltas"""
+    return backup_file.parent / f"{db_name}.seq"
+
+def meta_file_for(backup_file: Path, db_name: str) -> Path:
+    """Sidecar file describing a backup file (compression, sizes, document count)"""
+    return backup_file.parent / f"{db_name}.meta"
+
+def write_backup_meta(backup_file: Path, db_name: str, meta: Dict):
+    """Record the metadata of a backup file next to it"""
+    meta_file_for(backup_file, db_name).write_text(json.dumps(meta), encoding='utf-8')
+
+def read_backup_meta(backup_file: Path, db_name: str) -> Dict:
+    """Read the metadata of a backup file (empty for backups made without it, e.g. by the bash script)"""
+    try:
+        return json.loads(meta_file_for(backup_file, db_name).read_text(encoding='utf-8'))
+    except (OSError, ValueError):
+        return {}
+
+def find_latest_base(backup_root: Path, db_name: str, source: str) -> Optional[Path]:
+    """Find the most recently updated base backup of a database that has an update_seq checkpoint
+    and was made from source (a server_label).
+
+    An update_seq only means something to the server it came from, so bases
+    of other servers - and bash backups, which do not record theirs - are
+    left out, as are temporary sync backups, the job state and the blob store.
+    """
+    if not backup_root.exists():
+        return None
+    candidates = []
+    for seq_file in backup_root.glob(f"**/{db_name}.seq"):
+        top = seq_file.relative_to(backup_root).parts[0]
+        if top in (BLOB_STORE_NAME, JOBS_DIR_NAME) or top.startswith('temp_sync_'):
+            continue
+        for ext in COMPRESSION_EXTENSIONS.values():
+            base_file = seq_file.parent / f"{db_name}.json{ext}"
+            if base_file.exists() and read_backup_meta(base_file, db_name).get('source') == source:
+                candidates.append(base_file)
+    if not candidates:
+        return None
+    return max(candidates, key=lambda f: seq_file_for(f, db_name).stat().st_mtime)
+
+def find_delta_files(backup_file: Path, db_name: str) -> List[Path]:
+    """List the incremental delta files written next to a base backup, oldest first"""
+    pattern = re.compile(rf"^{re.escape(db_name)}\.\d{{8}}-\d{{6}}\.delta(\.gz|\.zst)?$")
+    return sorted(f for f in backup_file.parent.iterdir() if pattern.match(f.name))
@@ -0,0 +1,463 @@
+"""
+Synchronization - server-to-server replication, a revision diff copying only missing
+revisions through the manager, a streaming copy through the manager's memory, or backup
+and restore through the manager; all but the revision diff can copy a document scope only
+"""
+
+import functools
+import queue
+import re
+import requests
+import shutil
+import threading
+import time
+from datetime import datetime
+from urllib.parse import quote
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Callable, Iterator, List, Dict, Optional, Tuple
+
+from .backup import iter_all_docs_pages, iter_scope_pages, run_backup
+from .client import couch_http, delete_database, parse_couchdb_url, server_label
+from .codec import loads
+from .config import (
+    BACKUP_DIR, BACKUP_PAGE_TIMEOUT, SYNC_DIFF_PAGE_SIZE, SYNC_POLL_INTERVAL, SYNC_REPLICATION_CONCURRENCY,
+    SYNC_REPLICATION_TIMEOUT, SYNC_STREAM_QUEUE_PAGES
+)
+from .logs import get_logger
+from .metrics import metrics
+from .restore import restore_docs_batched, run_restore
+from .scope import describe_scope, scope_selector
+from .storage import find_backup_file
+
+log = get_logger(__name__)
+
+def replication_state(base_url: str, auth: Tuple[str, str], doc_id: str) -> Dict:
+    """Get the state of a _replicator job: {'state': ..., 'info': {...}}
+
+    Uses the scheduler API (CouchDB 2.1+) and falls back to the
+    _replication_state fields of the replicator document itself.
+    """
+    doc_path = quote(doc_id, safe='')
+    response = couch_http.get(f"{base_url}/_scheduler/docs/_replicator/{doc_path}", auth=auth, timeout=10)
+    if response.status_code == 200:
+        job = response.json()
+        return {'state': job.get('state'), 'info': job.get('info') or {}}
+    
+    response = couch_http.get(f"{base_url}/_replicator/{doc_path}", auth=auth, timeout=10)
+    if response.status_code == 200:
+        doc = response.json()
+        return {
+            'state': doc.get('_replication_state'),
+            'info': doc.get('_replication_stats') or {'error': doc.get('_replication_state_reason')}
+        }
+    return {'state': None, 'info': {}}
+
+def replication_progress(db_name: str, state: Optional[str], info: Dict) -> Dict:
+    """Progress of a replication as passed to on_progress callbacks"""
+    return {
+        'database': db_name,
+        'state': state,
+        'docs_read': info.get('docs_read'),
+        'docs_written': info.get('docs_written'),
+        'changes_pending': info.get('changes_pending'),
+        'error': info.get('error')
+    }
+
+def run_sync_replication(source_url: str, target_url: str, db_name: str, clean: bool = False,
+                         timeout: int = SYNC_REPLICATION_TIMEOUT, scope: Optional[Dict] = None,
+                         on_progress: Optional[Callable[[Dict], None]] = None) -> Tuple[bool, str]:
+    """Sync a database by replication: the target cluster pulls missing revisions from the source.
+
+    Creates a one-shot _replicator document on the target server, polls it
+    until it completes or fails (states 'failed' and 'error'), then removes it.
+    No data passes through the manager, and re-running only transfers what
+    changed since the last sync. With a scope, the replication carries its
+    Mango selector (scope_selector) and the source only sends the matching
+    documents. After every poll, on_progress gets the state, documents written
+    and changes pending (see replication_progress).
+    """
+    try:
+        log.info(f"🔄 [SYNC] Starting replication for database: {db_name}")
+        
+        parsed = parse_couchdb_url(target_url)
+        base_url = server_label(target_url)
+        auth = (parsed['username'], parsed['password'])
+        
+        if clean:
+            response = couch_http.head(f"{base_url}/{quote(db_name, safe='')}", auth=auth, timeout=10)
+            if response.status_code == 200:
+                log.info(f"🗑️ [SYNC] Clean sync requested - deleting target database")
+                success, msg = delete_database(target_url, db_name)
+                if not success:
+                    return False, f"Failed to delete target database: {msg}"
+        
+        # _replicator is not created automatically on every setup
+        response = couch_http.put(f"{base_url}/_replicator", auth=auth, timeout=10)
+        if response.status_code not in [201, 202, 412]:
+            log.error(f"❌ [SYNC] Cannot create _replicator database: HTTP {response.status_code}")
+            return False, f"Cannot create _replicator database: HTTP {response.status_code} - {response.text}"
+        
+        doc_id = f"couchdb-manager-{re.sub(r'[^A-Za-z0-9_-]', '_', db_name)}-{datetime.now().strftime('%Y%m%d-%H%M%S-%f')}"
+        replication = {
+            '_id': doc_id,
+            'source': f"{source_url.rstrip('/')}/{quote(db_name, safe='')}",
+            'target': f"{target_url.rstrip('/')}/{quote(db_name, safe='')}",
+            'create_target': True,
+            'continuous': False
+        }
+        if scope is not None:
+            replication['selector'] = scope_selector(scope)
+            log.info(f"🎯 [SYNC] Replicating {describe_scope(scope)}")
+        doc_url = f"{base_url}/_replicator/{quote(doc_id, safe='')}"
+        response = couch_http.put(doc_url, auth=auth, json=replication, timeout=30)
+        if response.status_code not in [201, 202]:
+            log.error(f"❌ [SYNC] Failed to create replication: HTTP {response.status_code}")
+            return False, f"Failed to create replication: HTTP {response.status_code} - {response.text}"
+        log.info(f"📝 [SYNC] Created replication job: {doc_id}")
+        
+        deadline = time.monotonic() + timeout
+        state, info = None, {}
+        try:
+            while time.monotonic() < deadline:
+                time.sleep(SYNC_POLL_INTERVAL)
+                job = replication_state(base_url, auth, doc_id)
+                state, info = job['state'], job['info']
+                if on_progress is not None:
+                    on_progress(replication_progress(db_name, state, info))
+                if state == 'completed':
+                    break
+                if state in ('failed', 'error'):
+                    # 'error': the document could not become a job, e.g. an unreachable source or target
+                    log.error(f"❌ [SYNC] Replication {state}: {info.get('error', 'unknown error')}")
+                    return False, f"Replication {state}: {info.get('error', 'unknown error')}"
+                if state == 'crashing':
+                    log.warning(f"⚠️ [SYNC] Replication crashing, CouchDB will retry: {info.get('error', 'unknown error')}")
+                elif state == 'running' and info.get('docs_written') is not None:
+                    log.debug("🔁 [SYNC] %s: %s documents written, %s changes pending",
+                              db_name, info.get('docs_written'), info.get('changes_pending'))
+            else:
+                log.error(f"❌ [SYNC] Replication timed out after {timeout}s (last state: {state})")
+                return False, f"Replication timed out after {timeout}s (last state: {state})"
+        finally:
+            # One-shot jobs are done (or abandoned) either way; remove the document
+            response = couch_http.get(doc_url, auth=auth, timeout=10)
+            if response.status_code == 200:
+                couch_http.delete(doc_url, auth=auth, params={'rev': response.json()['_rev']}, timeout=10)
+        
+        docs_written = info.get('docs_written', 0)
+        failures = info.get('doc_write_failures', 0)
+        log.info(f"✅ [SYNC] Replication of '{db_name}' completed: {docs_written} documents written, {failures} failures")
+        if failures:
+            return False, f"Replication completed with {failures} document write failures ({docs_written} written)"
+        return True, f"Replicated '{db_name}': {docs_written} documents written"
+        
+    except requests.RequestException as e:
+        log.error(f"❌ [SYNC] Network error: {str(e)}")
+        return False, f"Network error: {str(e)}"
+    except Exception as e:
+        log.error(f"❌ [SYNC] Error: {str(e)}")
+        return False, f"Error: {str(e)}"
+
+def iter_leaf_revs(db_url: str, auth: Tuple[str, str],
+                   page_size: int = SYNC_DIFF_PAGE_SIZE) -> Iterator[Dict[str, List[str]]]:
+    """Yield pages of {doc_id: [leaf revisions]} from _changes with style=all_docs.
+
+    No document bodies are read; deleted documents (tombstones) and
+    conflicting revisions are included, as in CouchDB's own replicator.
+    """
+    since = '0'
+    while True:
+        with metrics.phase('sync', 'scan'):
+            response = couch_http.get(
+                f"{db_url}/_changes",
+                auth=auth,
+                params={'style': 'all_docs', 'since': since, 'limit': page_size},
+                timeout=BACKUP_PAGE_TIMEOUT
+            )
+        if response.status_code != 200:
+            raise requests.exceptions.HTTPError(
+                f"Failed to read changes: HTTP {response.status_code} - {response.text}", response=response
+            )
+        data = loads(response.content)
+        results = data.get('results', [])
+        if not results:
+            return
+        yield {change['id']: [rev['rev'] for rev in change['changes']] for change in results}
+        since = data['last_seq']
+        # CouchDB 1.x reports no 'pending': page until an empty result there
+        if data.get('pending') == 0:
+            return
+
+def fetch_missing_revs(db_url: str, auth: Tuple[str, str], revs_diff: Dict[str, Dict]) -> Tuple[List[Dict], List[str]]:
+    """Fetch the revisions reported missing by _revs_diff with one _bulk_get.
+
+    Each document comes with its revision history, so it can be written with
+    new_edits=false. Attachments are inlined, except those the target already
+    has in a possible ancestor (atts_since), which stay stubs.
+    Returns the documents and the per-revision errors.
+    """
+    requested = [
+        {'id': doc_id, 'rev': rev, **({'atts_since': diff['possible_ancestors']} if diff.get('possible_ancestors') else {})}
+        for doc_id, diff in revs_diff.items()
+        for rev in diff.get('missing', [])
+    ]
+    with metrics.phase('sync', 'fetch'):
+        response = couch_http.post(
+            f"{db_url}/_bulk_get",
+            auth=auth,
+            params={'revs': 'true', 'attachments': 'true'},
+            json={'docs': requested},
+            headers={'Accept': 'application/json'},
+            timeout=BACKUP_PAGE_TIMEOUT
+        )
+    if response.status_code != 200:
+        raise requests.exceptions.HTTPError(
+            f"_bulk_get failed: HTTP {response.status_code} - {response.text}", response=response
+        )
+    docs = []
+    errors = []
+    with metrics.phase('sync', 'parse'):
+        results = loads(response.content).get('results', [])
+    for result in results:
+        for entry in result.get('docs', []):
+            if 'ok' in entry:
+                docs.append(entry['ok'])
+            else:
+                error = entry.get('error', {})
+                errors.append(f"{result.get('id')} {error.get('rev', '')}: {error.get('error')} ({error.get('reason', 'no reason')})")
+    return docs, errors
+
+def run_sync_revs_diff(source_url: str, target_url: str, db_name: str, clean: bool = False) -> Tuple[bool, str]:
+    """Sync a database by revision diff: copy only the revisions the target is missing.
+
+    The source's leaf revisions are scanned SYNC_DIFF_PAGE_SIZE at a time
+    without document bodies, the target's _revs_diff tells which of them it
+    lacks, and only those are fetched (_bulk_get) and written (_bulk_docs,
+    new_edits=false, batched like a restore). A target that is already up to
+    date costs a metadata scan. Unlike replication, documents pass through the
+    manager, so the target cluster does not need to reach the source.
+    """
+    try:
+        log.info(f"🔄 [SYNC] Starting revision-diff sync for database: {db_name}")
+        
+        source = parse_couchdb_url(source_url)
+        source_db = f"{source['protocol']}://{source['host']}:{source['port']}/{quote(db_name, safe='')}"
+        source_auth = (source['username'], source['password'])
+        target = parse_couchdb_url(target_url)
+        target_db = f"{target['protocol']}://{target['host']}:{target['port']}/{quote(db_name, safe='')}"
+        target_auth = (target['username'], target['password'])
+        
+        if clean:
+            response = couch_http.head(target_db, auth=target_auth, timeout=10)
+            if response.status_code == 200:
+                log.info(f"🗑️ [SYNC] Clean sync requested - deleting target database")
+                success, msg = delete_database(target_url, db_name)
+                if not success:
+                    return False, f"Failed to delete target database: {msg}"
+        
+        response = couch_http.put(target_db, auth=target_auth, timeout=30)
+        if response.status_code not in [201, 202, 412]:
+            return False, f"Failed to create target database: HTTP {response.status_code} - {response.text}"
+        
+        scanned = 0
+        missing = 0
+        fetch_errors = []
+        
+        def missing_docs() -> Iterator[Dict]:
+            nonlocal scanned, missing
+            for page_num, leaf_revs in enumerate(iter_leaf_revs(source_db, source_auth), 1):
+                scanned += sum(len(revs) for revs in leaf_revs.values())
+                with metrics.phase('sync', 'diff'):
+                    response = couch_http.post(
+                        f"{target_db}/_revs_diff", auth=target_auth, json=leaf_revs, timeout=BACKUP_PAGE_TIMEOUT
+                    )
+                if response.status_code != 200:
+                    raise requests.exceptions.HTTPError(
+                        f"_revs_diff failed: HTTP {response.status_code} - {response.text}", response=response
+                    )
+                revs_diff = loads(response.content)
+                if revs_diff:
+                    missing += sum(len(diff.get('missing', [])) for diff in revs_diff.values())
+                    docs, errors = fetch_missing_revs(source_db, source_auth, revs_diff)
+                    fetch_errors.extend(errors)
+                    yield from docs
+                log.debug("🔍 [SYNC] Page %d: %d revisions compared, %d missing on the target", page_num, scanned, missing)
+        
+        written, errors = restore_docs_batched(target_db, target_auth, missing_docs(), operation='sync')
+        errors = fetch_errors + errors
+        
+        log.info(f"✅ [SYNC] Revision-diff sync of '{db_name}': {scanned} revisions compared, "
+                 f"{missing} missing, {written} written, {len(errors)} errors")
+        if errors:
+            return False, (f"Revision-diff sync of '{db_name}' wrote {written} of {missing} missing revisions, "
+                           f"{len(errors)} errors: {'; '.join(errors[:5])}")
+        return True, f"Synced '{db_name}' by revision diff: {scanned} revisions compared, {missing} missing, {written} written"
+        
+    except requests.RequestException as e:
+        log.error(f"❌ [SYNC] Network error: {str(e)}")
+        return False, f"Network error: {str(e)}"
+    except Exception as e:
+        log.error(f"❌ [SYNC] Error: {str(e)}")
+        return False, f"Error: {str(e)}"
+
+def iter_prefetched(pages: Iterator[List[Dict]], depth: int = SYNC_STREAM_QUEUE_PAGES) -> Iterator[List[Dict]]:
+    """Run a page iterator on a background thread, at most `depth` pages ahead of the consumer.
+
+    Errors of the iterator are raised in the consumer; when the consumer stops
+    early, the reader thread stops after the page it is fetching.
+    """
+    buffer = queue.Queue(maxsize=max(1, depth))
+    stop = threading.Event()
+    end = object()
+
+    def put(item) -> bool:
+        while not stop.is_set():
+            try:
+                buffer.put(item, timeout=0.5)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def read():
+        try:
+            for page in pages:
+                if not put(page):
+                    return
+            put(end)
+        except Exception as e:
+            put(e)
+
+    threading.Thread(target=read, name='sync-reader', daemon=True).start()
+    try:
+        while True:
+            item = buffer.get()
+            if item is end:
+                return
+            if isinstance(item, Exception):
+                raise item
+            yield item
+    finally:
+        stop.set()
+
+def run_sync_stream(source_url: str, target_url: str, db_name: str, clean: bool = False,
+                    scope: Optional[Dict] = None) -> Tuple[bool, str]:
+    """Sync a database by streaming a full copy through the manager's memory.
+
+    Source _all_docs pages (with inline attachments) are read on a background
+    thread and written to the target as _bulk_docs batches (new_edits=false,
+    batched and throttled like a restore) while the next pages are read, so
+    the sync takes about as long as the slower side. Nothing is written to
+    local disk and memory is bounded by SYNC_STREAM_QUEUE_PAGES pages plus the
+    batches in flight. Like a backup and restore, only winning revisions of
+    live documents are copied; unlike replication, the target cluster does
+    not need to reach the source and different credentials are fine.
+    With a scope, only its documents are read from the source (iter_scope_pages).
+    """
+    try:
+        log.info(f"🔄 [SYNC] Starting streaming sync for database: {db_name}")
+        
+        source = parse_couchdb_url(source_url)
+        source_base = source_url.rstrip('/')
+        target = parse_couchdb_url(target_url)
+        target_db = f"{target['protocol']}://{target['host']}:{target['port']}/{quote(db_name, safe='')}"
+        target_auth = (target['username'], target['password'])
+        
+        if clean:
+            response = couch_http.head(target_db, auth=target_auth, timeout=10)
+            if response.status_code == 200:
+                log.info(f"🗑️ [SYNC] Clean sync requested - deleting target database")
+                success, msg = delete_database(target_url, db_name)
+                if not success:
+                    return False, f"Failed to delete target database: {msg}"
+        
+        response = couch_http.put(target_db, auth=target_auth, timeout=30)
+        if response.status_code not in [201, 202, 412]:
+            return False, f"Failed to create target database: HTTP {response.status_code} - {response.text}"
+        
+        read = 0
+        
+        def source_docs() -> Iterator[Dict]:
+            nonlocal read
+            if scope is not None:
+                log.info(f"🎯 [SYNC] Streaming {describe_scope(scope)}")
+                pages = iter_scope_pages(source_base, quote(db_name, safe=''), scope, operation='sync')
+            else:
+                pages = iter_all_docs_pages(source_base, quote(db_name, safe=''), operation='sync')
+            for page_num, docs in enumerate(iter_prefetched(pages), 1):
+                read += len(docs)
+                log.debug("📄 [SYNC] Page %d: %d documents read from %s", page_num, read, source['host'])
+                yield from docs
+        
+        written, errors = restore_docs_batched(target_db, target_auth, source_docs(), operation='sync')
+        
+        log.info(f"✅ [SYNC] Streaming sync of '{db_name}': {read} documents read, "
+                 f"{written} written, {len(errors)} errors")
+        if errors:
+            return False, (f"Streaming sync of '{db_name}' wrote {written} of {read} documents, "
+                           f"{len(errors)} errors: {'; '.join(errors[:5])}")
+        return True, f"Streamed '{db_name}': {written} documents copied"
+        
+    except requests.RequestException as e:
+        log.error(f"❌ [SYNC] Network error: {str(e)}")
+        return False, f"Network error: {str(e)}"
+    except Exception as e:
+        log.error(f"❌ [SYNC] Error: {str(e)}")
+        return False, f"Error: {str(e)}"
+
+def run_syncs_parallel(sync_fn: Callable[[str, str, str, bool], Tuple[bool, str]], source_url: str,
+                       target_url: str, db_names: List[str], max_workers: int = SYNC_REPLICATION_CONCURRENCY,
+                       clean: bool = False) -> Iterator[Tuple[str, bool, str]]:
+    """Sync several databases with sync_fn (run_sync_replication, run_sync_revs_diff or run_sync_stream,
+    with functools.partial for a scope), max_workers at a time.
+
+    Yields (db_name, success, message) in completion order.
+    """
+    log.info(f"🚀 [SYNC] Syncing {len(db_names)} databases, {max_workers} at a time")
+    
+    with ThreadPoolExecutor(max_workers=max(1, max_workers)) as executor:
+        futures = {
+            executor.submit(sync_fn, source_url, target_url, db, clean): db
+            for db in db_names
+        }
+        for future in as_completed(futures):
+            db = futures[future]
+            try:
+                success, msg = future.result()
+            except Exception as e:
+                success, msg = False, f"Sync error: {str(e)}"
+            yield db, success, msg
+
+def run_syncs_replication(source_url: str, target_url: str, db_names: List[str],
+                          max_workers: int = SYNC_REPLICATION_CONCURRENCY,
+                          clean: bool = False, scope: Optional[Dict] = None,
+                          on_progress: Optional[Callable[[Dict], None]] = None) -> Iterator[Tuple[str, bool, str]]:
+    """Replicate several databases (or a scope of each) with at most max_workers replication jobs at a time;
+    on_progress is called from the worker threads"""
+    return run_syncs_parallel(
+        functools.partial(run_sync_replication, scope=scope, on_progress=on_progress),
+        source_url, target_url, db_names, max_workers, clean
+    )
+
+def run_sync_backup(source_url: str, target_url: str, db_name: str, clean: bool = False,
+                    scope: Optional[Dict] = None) -> Tuple[bool, str]:
+    """Sync a database (or a scope of it) through the manager: back it up to a temporary directory and restore it"""
+    temp_backup = BACKUP_DIR / f"temp_sync_{datetime.now().strftime('%Y%m%d_%H%M%S_%f')}"
+    try:
+        success, msg = run_backup(source_url, db_name, str(temp_backup), scope=scope)
+        if not success:
+            return False, f"Backup failed: {msg}"
+        
+        # Find backup file (plain or compressed)
+        db_file = find_backup_file(temp_backup, db_name)
+        if not db_file:
+            return False, "Backup file not found"
+        
+        success, msg = run_restore(target_url, db_name, str(db_file), clean)
+        if not success:
+            return False, f"Restore failed: {msg}"
+        return True, msg
+    finally:
+        # Clean up temp backup
+        if temp_backup.exists():
+            shutil.rmtree(temp_backup)
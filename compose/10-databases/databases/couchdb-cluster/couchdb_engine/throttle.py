@@ -0,0 +1,132 @@
+"""
+Adaptive concurrency - the number of _bulk_docs requests in flight to a CouchDB server is
+tuned from the answers it gives (AIMD, as TCP congestion control), under a hard ceiling and
+an optional byte-rate cap, so restores and syncs run as fast as the cluster can take
+"""
+
+import threading
+import time
+from urllib.parse import urlparse
+from typing import Dict, Optional
+
+from .config import (
+    RESTORE_ADAPTIVE, RESTORE_BACKOFF_FACTOR, RESTORE_CONCURRENCY, RESTORE_LATENCY_TARGET,
+    RESTORE_MAX_BYTES_PER_SEC, RESTORE_MAX_CONCURRENCY, RESTORE_MIN_CONCURRENCY
+)
+from .logs import get_logger
+from .metrics import metrics
+
+log = get_logger(__name__)
+
+class AdaptiveLimiter:
+    """Limit on the requests in flight to one server, adjusted after every answer.
+
+    - Slow start: until the first overload signal, each answer within half of
+      latency_target adds 1, doubling the limit per round of `limit` requests
+    - Additive increase: after that, each such answer adds 1/limit, i.e. about
+      +1 per round
+    - Multiplicative decrease: 429, 5xx, network errors and timeouts, or answers
+      slower than latency_target multiply the limit by backoff - at most once per
+      round: requests sent before the last decrease do not count again
+    - Answers between half the target and the target keep the limit as it is
+
+    The limit stays between floor and ceiling. With max_bytes_per_sec, requests
+    are also paced so the payload sent averages at most that rate.
+    """
+
+    def __init__(self, server: str, initial: int = RESTORE_CONCURRENCY, ceiling: int = RESTORE_MAX_CONCURRENCY,
+                 floor: int = RESTORE_MIN_CONCURRENCY, latency_target: float = RESTORE_LATENCY_TARGET,
+                 backoff: float = RESTORE_BACKOFF_FACTOR, max_bytes_per_sec: int = RESTORE_MAX_BYTES_PER_SEC,
+                 adaptive: bool = RESTORE_ADAPTIVE):
+        self.server = server
+        self.ceiling = max(1, ceiling)
+        self.floor = max(1, min(floor, self.ceiling))
+        self.limit = float(min(max(initial, self.floor), self.ceiling))
+        self.latency_target = latency_target
+        self.backoff = backoff
+        self.max_bytes_per_sec = max_bytes_per_sec
+        self.adaptive = adaptive
+        self.in_flight = 0
+        self._cond = threading.Condition()
+        self._sent = 0
+        self._last_decrease = 0
+        self._slow_start = True
+        self._rate_lock = threading.Lock()
+        self._next_send = 0.0
+        metrics.set('concurrency_limit', self.current, server=server)
+
+    @property
+    def current(self) -> int:
+        """Requests allowed in flight right now"""
+        return int(self.limit)
+
+    def acquire(self, nbytes: int = 0) -> int:
+        """Wait for the byte-rate cap and a free slot; returns the sequence number to release with"""
+        self._pace(nbytes)
+        with self._cond:
+            while self.in_flight >= self.current:
+                self._cond.wait()
+            self.in_flight += 1
+            self._sent += 1
+            return self._sent
+
+    def release(self, seq: int, latency: float, status: Optional[int]):
+        """Free the slot of request seq and adjust the limit from its answer (status None: no answer)"""
+        with self._cond:
+            self.in_flight -= 1
+            if self.adaptive:
+                reason = overload_reason(status, latency, self.latency_target)
+                if reason is not None:
+                    if seq > self._last_decrease:
+                        self._decrease(reason)
+                elif latency <= self.latency_target / 2 and self.limit < self.ceiling:
+                    previous = self.current
+                    self.limit = min(self.ceiling, self.limit + (1 if self._slow_start else 1 / self.limit))
+                    if self.current != previous:
+                        log.debug("📈 [THROTTLE] %s: %d requests in flight allowed", self.server, self.current)
+                        metrics.set('concurrency_limit', self.current, server=self.server)
+            self._cond.notify_all()
+
+    def _decrease(self, reason: str):
+        previous = self.current
+        self.limit = max(self.floor, self.limit * self.backoff)
+        self._last_decrease = self._sent
+        self._slow_start = False
+        metrics.inc('backoffs_total', server=self.server, reason=reason)
+        metrics.set('concurrency_limit', self.current, server=self.server)
+        log.info(f"🐢 [THROTTLE] {self.server} is under pressure ({reason}): "
+                 f"{previous} -> {self.current} requests in flight")
+
+    def _pace(self, nbytes: int):
+        """Delay a request so the bytes sent since the first one average at most max_bytes_per_sec"""
+        if not self.max_bytes_per_sec or not nbytes:
+            return
+        with self._rate_lock:
+            now = time.monotonic()
+            send_at = max(now, self._next_send)
+            self._next_send = send_at + nbytes / self.max_bytes_per_sec
+        if send_at > now:
+            time.sleep(send_at - now)
+
+def overload_reason(status: Optional[int], latency: float, latency_target: float) -> Optional[str]:
+    """Why an answer signals an overloaded server (None if it does not)"""
+    if status is None:
+        return 'error'
+    if status == 429 or status >= 500:
+        return f"HTTP {status}"
+    if latency > latency_target:
+        return 'latency'
+    return None
+
+_limiters: Dict[str, AdaptiveLimiter] = {}
+_limiters_lock = threading.Lock()
+
+def limiter_for(url: str) -> AdaptiveLimiter:
+    """The limiter of the server hosting url, shared by every restore and sync writing to it"""
+    parsed = urlparse(url)
+    server = f"{parsed.hostname}:{parsed.port or 5984}"
+    with _limiters_lock:
+        limiter = _limiters.get(server)
+        if limiter is None:
+            limiter = _limiters[server] = AdaptiveLimiter(server)
+        return limiter
@@ -0,0 +1,295 @@
+"""
+Verification - check backup files against their manifest (checksums, document counts)
+and optionally against the live databases (document counts, id/rev pairs)
+"""
+
+import heapq
+import itertools
+import json
+import random
+import requests
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from pathlib import Path
+from typing import Iterable, Iterator, List, Dict, Optional, Tuple
+
+from .catalog import read_backup_manifest
+from .client import couch_http, get_database_info, get_databases_info
+from .config import VERIFY_CONCURRENCY, VERIFY_PAGE_SIZE, VERIFY_SAMPLE_SIZE
+from .logs import get_logger
+from .restore import iter_backup_docs
+from .storage import backup_db_name, file_sha256, find_backup_files, find_delta_files, read_backup_meta
+
+log = get_logger(__name__)
+
+
+def read_delta_revs(delta_files: List[Path]) -> Dict[str, Optional[str]]:
+    """Latest rev of every document changed by the deltas (None for deletions), oldest delta first"""
+    revs = {}
+    for delta_file in delta_files:
+        for doc in iter_backup_docs(delta_file, operation='verify'):
+            revs[doc['_id']] = None if doc.get('_deleted') else doc.get('_rev')
+    return revs
+
+def iter_backup_revs(backup_path: Path, delta_revs: Dict[str, Optional[str]]) -> Iterator[Tuple[str, str]]:
+    """(id, rev) pairs of a backup as it restores - deltas applied, deletions dropped - in id order.
+
+    Base backups are written in _all_docs order, so the pairs stream without
+    holding the backup in memory; only the (small) delta changes are sorted.
+    """
+    def base_revs():
+        previous = None
+        for doc in iter_backup_docs(backup_path, operation='verify'):
+            if previous is not None and doc['_id'] < previous:
+                raise ValueError("backup is not in document id order")
+            previous = doc['_id']
+            yield doc['_id'], doc.get('_rev')
+
+    # Equal ids come out of the merge base first, so the delta rev wins
+    merged = heapq.merge(base_revs(), sorted(delta_revs.items()), key=lambda pair: pair[0])
+    for doc_id, group in itertools.groupby(merged, key=lambda pair: pair[0]):
+        rev = list(group)[-1][1]
+        if rev is not None:
+            yield doc_id, rev
+
+def iter_live_revs(base_url: str, db_name: str, page_size: int = VERIFY_PAGE_SIZE) -> Iterator[Tuple[str, str]]:
+    """(id, rev) pairs of a live database in id order, paged through _all_docs without document bodies"""
+    all_docs_url = f"{base_url}/{db_name}/_all_docs"
+    start_key = None
+    while True:
+        params = {'limit': page_size + 1}
+        if start_key is not None:
+            params['startkey'] = json.dumps(start_key)
+        response = couch_http.get(all_docs_url, params=params, timeout=60)
+        if response.status_code != 200:
+            raise requests.exceptions.HTTPError(
+                f"Failed to list documents: HTTP {response.status_code} - {response.text}", response=response
+            )
+        rows = response.json()['rows']
+        for row in rows[:page_size]:
+            yield row['id'], row['value']['rev']
+        if len(rows) <= page_size:
+            return
+        start_key = rows[page_size]['id']
+
+class RevDifferences:
+    """Differences between backup and live id/rev pairs: counts by kind plus a few example ids"""
+
+    MAX_EXAMPLES = 5
+
+    def __init__(self):
+        self.counts = {'missing': 0, 'extra': 0, 'changed': 0}
+        self.examples: List[str] = []
+
+    def add(self, kind: str, doc_id: str):
+        self.counts[kind] += 1
+        if len(self.examples) < self.MAX_EXAMPLES:
+            self.examples.append(doc_id)
+
+    def describe(self, compared: int, scope: str) -> Optional[str]:
+        """Problem message (None if there are no differences)"""
+        total = sum(self.counts.values())
+        if not total:
+            return None
+        kinds = ", ".join(f"{count} {kind}" for kind, count in self.counts.items() if count)
+        return f"{total}/{compared} {scope} differ from the live database ({kinds}; e.g. {', '.join(self.examples)})"
+
+def compare_revs(backup_revs: Iterable[Tuple[str, str]],
+                 live_revs: Iterable[Tuple[str, str]]) -> Tuple[int, RevDifferences]:
+    """Merge-join two id-ordered (id, rev) streams.
+
+    Returns the number of documents compared and the differences: 'missing'
+    (only in the backup), 'extra' (only live) and 'changed' (other rev).
+    """
+    differences = RevDifferences()
+    compared = 0
+    backup_iter, live_iter = iter(backup_revs), iter(live_revs)
+    backup_pair, live_pair = next(backup_iter, None), next(live_iter, None)
+    while backup_pair is not None or live_pair is not None:
+        compared += 1
+        if live_pair is None or (backup_pair is not None and backup_pair[0] < live_pair[0]):
+            differences.add('missing', backup_pair[0])
+            backup_pair = next(backup_iter, None)
+        elif backup_pair is None or live_pair[0] < backup_pair[0]:
+            differences.add('extra', live_pair[0])
+            live_pair = next(live_iter, None)
+        else:
+            if backup_pair[1] != live_pair[1]:
+                differences.add('changed', backup_pair[0])
+            backup_pair, live_pair = next(backup_iter, None), next(live_iter, None)
+    return compared, differences
+
+def scan_backup(backup_path: Path, sample_size: int = 0) -> Tuple[int, Dict[str, Optional[str]]]:
+    """Decode every document of a backup file; returns the document count and a
+    uniform random sample (reservoir sampling) of sample_size id -> rev pairs"""
+    rng = random.Random()
+    sample: List[Tuple[str, Optional[str]]] = []
+    doc_count = 0
+    for doc in iter_backup_docs(backup_path, operation='verify'):
+        if len(sample) < sample_size:
+            sample.append((doc['_id'], doc.get('_rev')))
+        elif sample_size:
+            slot = rng.randrange(doc_count + 1)
+            if slot < sample_size:
+                sample[slot] = (doc['_id'], doc.get('_rev'))
+        doc_count += 1
+    return doc_count, dict(sample)
+
+def compare_sampled_revs(base_url: str, db_name: str, sample: Dict[str, Optional[str]]) -> RevDifferences:
+    """Look up sampled ids with one POST _all_docs?keys request and report the differences like compare_revs"""
+    response = couch_http.post(f"{base_url}/{db_name}/_all_docs", json={'keys': list(sample)}, timeout=60)
+    if response.status_code != 200:
+        raise requests.exceptions.HTTPError(
+            f"Failed to look up documents: HTTP {response.status_code} - {response.text}", response=response
+        )
+    live = {
+        row['key']: None if 'error' in row or row['value'].get('deleted') else row['value']['rev']
+        for row in response.json()['rows']
+    }
+    differences = RevDifferences()
+    for doc_id, rev in sample.items():
+        live_rev = live.get(doc_id)
+        if rev == live_rev:
+            continue
+        if live_rev is None:
+            differences.add('missing', doc_id)
+        elif rev is None:
+            differences.add('extra', doc_id)
+        else:
+            differences.add('changed', doc_id)
+    return differences
+
+def verify_backup(backup_file: str, db_name: str, compare_url: Optional[str] = None,
+                  expected: Optional[Dict] = None, sample: int = VERIFY_SAMPLE_SIZE, full: bool = False,
+                  live_info: Optional[Dict] = None) -> Tuple[bool, str]:
+    """Verify a backup file against its manifest entry (or metadata when expected is None).
+
+    With a recorded SHA-256, the file (and every delta) is checked byte for
+    byte and the recorded document count is trusted without decoding the file;
+    otherwise every document is decoded and counted. With compare_url, the
+    count is also checked against the live database (skipped when incremental
+    deltas exist, since they change the count), and either `sample` random
+    id/rev pairs or, with full, all of them are compared with the live database.
+    A scoped backup holds part of the database: only its sample is compared.
+    """
+    backup_path = Path(backup_file)
+    if not backup_path.exists():
+        return False, f"Backup file not found: {backup_file}"
+
+    # Sidecar and delta files are named after the backed-up database, db_name is the live one
+    source_db = backup_db_name(backup_path, db_name)
+    expected = expected if expected is not None else read_backup_meta(backup_path, source_db)
+    problems = []
+    checks = []
+
+    # A matching checksum proves the file is exactly what the backup wrote
+    checksum_ok = False
+    if expected.get('sha256'):
+        if file_sha256(backup_path) != expected['sha256']:
+            return False, "Checksum mismatch: the backup file is corrupt or was modified"
+        checksum_ok = True
+        checks.append("checksum")
+    for delta in expected.get('deltas', []):
+        delta_path = backup_path.parent / Path(delta['file']).name
+        if not delta_path.exists():
+            problems.append(f"delta {delta_path.name} is missing")
+        elif delta.get('sha256') and file_sha256(delta_path) != delta['sha256']:
+            problems.append(f"delta {delta_path.name} checksum mismatch")
+
+    doc_count = expected.get('doc_count') if checksum_ok else None
+    sampled = {}
+    scoped = expected.get('scope') is not None
+    if scoped and full:
+        checks.append("scoped backup: sampled instead of fully compared")
+        full = False
+    want_sample = bool(compare_url) and sample > 0 and not full
+    if doc_count is None or want_sample:
+        try:
+            doc_count, sampled = scan_backup(backup_path, sample if want_sample else 0)
+        except (ValueError, OSError, EOFError) as e:
+            return False, f"Invalid backup file: {e}"
+        if expected.get('doc_count') is not None and expected['doc_count'] != doc_count:
+            problems.append(f"metadata records {expected['doc_count']} documents")
+
+    delta_files = find_delta_files(backup_path, source_db)
+    if compare_url:
+        base_url = compare_url.rstrip('/')
+        info = live_info if live_info is not None else get_database_info(base_url, db_name)
+        if not info:
+            problems.append("live database not found")
+        else:
+            if scoped:
+                checks.append("live count skipped: scoped backup")
+            elif delta_files:
+                checks.append("live count skipped: incremental deltas present")
+            elif info.get('doc_count') != doc_count:
+                problems.append(f"live database has {info.get('doc_count')} documents")
+            else:
+                checks.append("live count")
+
+            try:
+                delta_revs = read_delta_revs(delta_files) if (full or sampled) and delta_files else {}
+                if full:
+                    compared, differences = compare_revs(
+                        iter_backup_revs(backup_path, delta_revs), iter_live_revs(base_url, db_name)
+                    )
+                    scope = "documents"
+                elif sampled:
+                    sampled.update((doc_id, delta_revs[doc_id]) for doc_id in sampled.keys() & delta_revs.keys())
+                    compared, differences = len(sampled), compare_sampled_revs(base_url, db_name, sampled)
+                    scope = "sampled documents"
+                else:
+                    compared, differences = 0, RevDifferences()
+            except (requests.exceptions.RequestException, ValueError, OSError, EOFError) as e:
+                return False, f"Live comparison failed: {e}"
+            if compared:
+                problem = differences.describe(compared, scope)
+                if problem:
+                    problems.append(problem)
+                else:
+                    checks.append(f"{compared} revisions")
+
+    if problems:
+        return False, f"{doc_count} documents in backup, but " + ", ".join(problems)
+    return True, f"{doc_count} documents verified" + (f" ({', '.join(checks)})" if checks else "")
+
+def verify_backups_parallel(backup_dir: Path, db_names: Optional[List[str]] = None,
+                            compare_url: Optional[str] = None, sample: int = VERIFY_SAMPLE_SIZE,
+                            full: bool = False,
+                            max_workers: int = VERIFY_CONCURRENCY) -> Iterator[Tuple[str, bool, str]]:
+    """Verify the databases of a backup directory concurrently.
+
+    Files are taken from the directory's manifest (searched for without one),
+    and live document counts are fetched up front in _dbs_info batches.
+    Hashing and decompression release the GIL, so checksum-only runs scale
+    with the workers. Yields (db_name, success, message) in completion order.
+    """
+    backup_dir = Path(backup_dir)
+    manifest = read_backup_manifest(backup_dir)
+    if manifest is not None:
+        entries = {db: (backup_dir / entry['file'], entry) for db, entry in manifest['databases'].items()}
+    else:
+        entries = {db: (path, None) for db, path in find_backup_files(backup_dir).items()}
+
+    if db_names:
+        for db in db_names:
+            if db not in entries:
+                yield db, False, f"No backup file for '{db}' in {backup_dir}"
+        entries = {db: entries[db] for db in db_names if db in entries}
+
+    live_infos = get_databases_info(compare_url, sorted(entries)) if compare_url else {}
+    log.info(f"🔍 [VERIFY] Verifying {len(entries)} backups in {backup_dir} with {max_workers} workers")
+
+    with ThreadPoolExecutor(max_workers=max(1, max_workers)) as executor:
+        futures = {
+            executor.submit(
+                verify_backup, str(path), db, compare_url, expected, sample, full, live_infos.get(db)
+            ): db
+            for db, (path, expected) in entries.items()
+        }
+        for future in as_completed(futures):
+            db = futures[future]
+            try:
+                success, msg = future.result()
+            except Exception as e:
+                success, msg = False, f"Verification error: {str(e)}"
+            yield db, success, msg
@@ -2,32 +2,41 @@
 """
 CouchDB Manager - Streamlit Application
 Manage CouchDB backups, restores, and synchronization
+
+The operations themselves live in the couchdb_engine package, which is shared
+with the command line (python -m couchdb_engine) and the scheduled backup job.
 """
 
 import streamlit as st
-import subprocess
+import functools
 import json
 import os
-import requests
+import queue
+import threading
 from datetime import datetime
 from pathlib import Path
-import shutil
-from urllib.parse import urlparse
-import time
-from typing import List, Dict, Optional, Tuple
+from typing import Callable, Iterator, List, Dict, Optional, Tuple
 import pandas as pd
-from dotenv import load_dotenv
-
-# Load environment variables from .env file
-load_dotenv()
-
-# Configuration - Base directory is the application directory
-BASE_DIR = Path(__file__).parent.resolve()
 
-# Configuration
-BACKUP_DIR = BASE_DIR / "backups"
-BACKUP_SCRIPT = BASE_DIR / "manage" / "backup_restore_couchdb.sh"
+from couchdb_engine import (
+    assess_cluster, available_compressions, default_backup_concurrency, delete_database, find_backup_file,
+    find_interrupted_backups, get_databases, get_databases_info, get_job_runner, id_ranges, list_backups, make_scope,
+    monitor_for, slowest_node,
+    resume_backups_parallel, run_backups_parallel, run_restore, run_restore_selected, run_sync_backup,
+    run_sync_replication,
+    run_sync_revs_diff, run_sync_stream, run_syncs_parallel,
+    get_logger, start_metrics_server, test_connection
+)
+from couchdb_engine.config import (
+    BASE_DIR, BACKUP_DIR, BACKUP_SCRIPT, BACKUP_COMPRESSION, BACKUP_DEDUP_ATTACHMENTS, BACKUP_MAX_CONCURRENCY,
+    BACKUP_SHARDED, BACKUP_SHARDED_MIN_DOCS,
+    DBS_INFO_CACHE_TTL, JOB_CONCURRENCY, JOB_REFRESH_INTERVAL, METRICS_PORT, MONITOR_HISTORY, MONITOR_INTERVAL,
+    MONITOR_LATENCY_WARN_MS, MONITOR_RUN_QUEUE_WARN, RESTORE_WARM_INDEXES, SYNC_REPLICATION_CONCURRENCY
+)
 
+log = get_logger('ui')
+# Prometheus endpoint of the manager process (started once, on the first page load)
+start_metrics_server(METRICS_PORT)
 
 # Page config
 st.set_page_config(
@@ -37,706 +46,6 @@ st.set_page_config(
     initial_sidebar_state="expanded"
 )
 
-def parse_couchdb_url(url: str) -> Dict[str, str]:
-    """Parse CouchDB URL to extract components"""
-    parsed = urlparse(url)
-    return {
-        'host': parsed.hostname,
-        'port': str(parsed.port) if parsed.port else '5984',
-        'username': parsed.username or '',
-        'password': parsed.password or '',
-        'protocol': parsed.scheme
-    }
-
-def test_connection(url: str) -> Tuple[bool, str]:
-    """Test CouchDB connection"""
-    try:
-        response = requests.get(f"{url.rstrip('/')}/_up", timeout=5)
-        if response.status_code == 200:
-            return True, "✅ Connection successful"
-        else:
-            return False, f"❌ Connection failed: HTTP {response.status_code}"
-    except requests.exceptions.RequestException as e:
-        return False, f"❌ Connection failed: {str(e)}"
-
-def get_databases(url: str) -> List[str]:
-    """Get list of databases from CouchDB"""
-    try:
-        response = requests.get(f"{url.rstrip('/')}/_all_dbs", timeout=10)
-        if response.status_code == 200:
-            # Filter out system databases
-            dbs = [db for db in response.json() if not db.startswith('_')]
-            return dbs
-        return []
-    except:
-        return []
-
-def get_database_info(url: str, db_name: str) -> Dict:
-    """Get database information"""
-    try:
-        response = requests.get(f"{url.rstrip('/')}/{db_name}", timeout=5)
-        if response.status_code == 200:
-            return response.json()
-        return {}
-    except:
-        return {}
-
-def run_backup_python(source_url: str, db_name: str, output_dir: str) -> Tuple[bool, str]:
-    """Python-based backup using requests instead of curl"""
-    try:
-        print(f"🔄 [BACKUP] Starting Python backup for database: {db_name}")
-        
-        # Create output directory with timestamp
-        timestamp = datetime.now().strftime('%Y%m%d-%H%M%S')
-        backup_subdir = Path(output_dir) / f"backup_{timestamp}"
-        backup_subdir.mkdir(parents=True, exist_ok=True)
-        print(f"📁 [BACKUP] Created output directory: {backup_subdir}")
-        
-        # Build the CouchDB URL for _all_docs with attachments
-        base_url = source_url.rstrip('/')
-        all_docs_url = f"{base_url}/{db_name}/_all_docs?include_docs=true&attachments=true"
-        
-        print(f"🌐 [BACKUP] Fetching all documents from: {all_docs_url}")
-        
-        # Fetch all documents
-        response = requests.get(all_docs_url, timeout=300)
-        print(f"📊 [BACKUP] HTTP Response: {response.status_code}")
-        
-        if response.status_code != 200:
-            print(f"❌ [BACKUP] Failed to fetch documents: HTTP {response.status_code}")
-            return False, f"Failed to fetch documents: HTTP {response.status_code} - {response.text}"
-        
-        # Apply the SAME transformations as bash script does with sed
-        data = response.json()
-        print(f"📋 [BACKUP] Parsing response data...")
-        
-        if 'rows' not in data:
-            print(f"❌ [BACKUP] Invalid response format: missing 'rows' key")
-            return False, f"Invalid response format: {data}"
-        
-        # Extract docs from rows (like bash script sed transformations)
-        docs = []
-        design_docs = []
-        regular_docs = []
-        
-        for row in data['rows']:
-            if 'doc' in row:
-                doc = row['doc']
-                docs.append(doc)
-                if doc.get('_id', '').startswith('_design/'):
-                    design_docs.append(doc)
-                else:
-                    regular_docs.append(doc)
-        
-        print(f"📄 [BACKUP] Found {len(docs)} total documents:")
-        print(f"   - 🎨 Design documents: {len(design_docs)}")
-        print(f"   - 📝 Regular documents: {len(regular_docs)}")
-        
-        # Create the EXACT format that bash script produces
-        backup_data = {
-            "new_edits": False,
-            "docs": docs
-        }
-        
-        # Write to JSON file in compact format (like bash script)
-        backup_file = backup_subdir / f"{db_name}.json"
-        print(f"💾 [BACKUP] Writing to file: {backup_file}")
-        
-        with open(backup_file, 'w', encoding='utf-8') as f:
-            # Write in compact format with proper line breaks like bash script
-            f.write('{"new_edits":false,"docs":[\n')
-            for i, doc in enumerate(docs):
-                if i > 0:
-                    f.write(',\n')
-                json.dump(doc, f, separators=(',', ':'), ensure_ascii=False)
-            f.write('\n]}')
-        
-        file_size = backup_file.stat().st_size
-        doc_count = len(docs)
-        
-        print(f"✅ [BACKUP] Python backup completed successfully:")
-        print(f"   - 📁 File: {backup_file}")
-        print(f"   - 📊 Documents: {doc_count}")
-        print(f"   - 💾 Size: {file_size} bytes")
-        
-        return True, f"Python backup completed: {backup_file} ({doc_count} docs, {file_size} bytes)"
-        
-    except requests.exceptions.RequestException as e:
-        return False, f"HTTP request failed: {str(e)}"
-    except json.JSONDecodeError as e:
-        return False, f"JSON parsing failed: {str(e)}"
-    except Exception as e:
-        return False, f"Python backup error: {str(e)}"
-
-def run_backup_bash(source_url: str, db_name: str, output_dir: str) -> Tuple[bool, str]:
-    """Run backup for a specific database using bash script"""
-    print(f"🔄 [BACKUP-BASH] Starting bash backup for database: {db_name}")
-    
-    parsed = parse_couchdb_url(source_url)
-    print(f"🌐 [BACKUP-BASH] Parsed URL - Host: {parsed['host']}, Port: {parsed['port']}")
-    
-    # Create output directory
-    os.makedirs(output_dir, exist_ok=True)
-    print(f"📁 [BACKUP-BASH] Created output directory: {output_dir}")
-    
-    # Check if backup script exists
-    if not BACKUP_SCRIPT.exists():
-        print(f"❌ [BACKUP-BASH] Backup script not found at {BACKUP_SCRIPT}")
-        return False, f"Backup script not found at {BACKUP_SCRIPT}"
-    
-    print(f"✅ [BACKUP-BASH] Found backup script: {BACKUP_SCRIPT}")
-    
-    # Make sure script is executable
-    try:
-        os.chmod(str(BACKUP_SCRIPT), 0o755)
-        print(f"✅ [BACKUP-BASH] Made script executable")
-    except Exception as e:
-        print(f"❌ [BACKUP-BASH] Could not make script executable: {str(e)}")
-        return False, f"Could not make script executable: {str(e)}"
-    
-    # Escape spaces in paths with backslashes
-    escaped_script = str(BACKUP_SCRIPT).replace(' ', '\\ ')
-    escaped_output_dir = output_dir.replace(' ', '\\ ')
-    
-    # Build command string with escaped spaces
-    cmd_str = (
-        f'bash {escaped_script} '
-        f'-b '
-        f'-H {parsed["host"]} '
-        f'-P {parsed["port"]} '
-        f'-u {parsed["username"]} '
-        f'-p {parsed["password"]} '
-        f'-d {db_name} '
-        f'-o {escaped_output_dir}'
-    )
-    
-    print(f"🚀 [BACKUP-BASH] Executing command:")
-    print(f"   {cmd_str}")
-    
-    try:
-        # Use shell=True with proper quoting to handle spaces
-        # Provide "N\nN\n" as input to answer "No" to any prompts
-        print(f"⏳ [BACKUP-BASH] Running bash script...")
-        result = subprocess.run(
-            cmd_str,
-            shell=True,
-            capture_output=True,
-            text=True,
-            input="N\nN\n",  # Answer "No" to any prompts
-            timeout=300,  # 5 minutes timeout
-            cwd=str(BASE_DIR)  # Set working directory to couchdb folder
-        )
-        
-        print(f"📊 [BACKUP-BASH] Script completed with exit code: {result.returncode}")
-        
-        if result.stdout:
-            print(f"📝 [BACKUP-BASH] Script output:")
-            for line in result.stdout.split('\n'):
-                if line.strip():
-                    print(f"   {line}")
-        
-        if result.stderr:
-            print(f"⚠️ [BACKUP-BASH] Script errors:")
-            for line in result.stderr.split('\n'):
-                if line.strip():
-                    print(f"   {line}")
-        
-        # Combine stdout and stderr for full output
-        full_output = f"STDOUT:\n{result.stdout}\n\nSTDERR:\n{result.stderr}"
-        
-        if result.returncode == 0:
-            print(f"✅ [BACKUP-BASH] Script executed successfully, checking for backup file...")
-            # Check if backup file was created
-            backup_files = list(Path(output_dir).glob(f"**/{db_name}.json"))
-            if backup_files:
-                file_size = backup_files[0].stat().st_size
-                print(f"✅ [BACKUP-BASH] Backup file created: {backup_files[0]} ({file_size} bytes)")
-                return True, f"Backup completed: {backup_files[0]} ({file_size} bytes)"
-            else:
-                print(f"❌ [BACKUP-BASH] Backup script ran but no file created")
-                return False, f"Backup script ran but no file created.\n{full_output}"
-        else:
-            print(f"❌ [BACKUP-BASH] Script failed with exit code {result.returncode}")
-            return False, f"Backup failed (exit code {result.returncode}):\n{full_output}"
-    except subprocess.TimeoutExpired as e:
-        return False, f"Backup timeout (5 minutes):\n{e.stdout if e.stdout else ''}\n{e.stderr if e.stderr else ''}"
-    except Exception as e:
-        return False, f"Backup error: {str(e)}"
-
-def run_backup(source_url: str, db_name: str, output_dir: str) -> Tuple[bool, str]:
-    """Run backup for a specific database - try Python method first, fallback to bash script"""
-    # Try Python-based backup first (no curl/path issues)
-    success, msg = run_backup_python(source_url, db_name, output_dir)
-    if success:
-        return success, msg
-    
-    # Fallback to bash script if Python backup fails
-    print("Python backup failed, trying bash script...")
-    return run_backup_bash(source_url, db_name, output_dir)
-
-def run_restore_python(target_url: str, db_name: str, backup_file: str, clean: bool = False) -> Tuple[bool, str]:
-    """Restore a database from backup using Python (avoids path space issues)"""
-    try:
-        import requests
-        import json
-        
-        print(f"🔄 [RESTORE] Starting Python restore for database: {db_name}")
-        print(f"📁 [RESTORE] Backup file: {backup_file}")
-        print(f"🗑️ [RESTORE] Clean restore: {clean}")
-        
-        # Parse target URL
-        parsed = parse_couchdb_url(target_url)
-        base_url = f"http://{parsed['host']}:{parsed['port']}"
-        auth = (parsed['username'], parsed['password'])
-        print(f"🌐 [RESTORE] Target URL: {base_url}")
-        
-        # Check if backup file exists
-        backup_path = Path(backup_file)
-        if not backup_path.exists():
-            print(f"❌ [RESTORE] Backup file not found: {backup_file}")
-            return False, f"Backup file not found: {backup_file}"
-        
-        # Read backup data as raw text (don't parse JSON yet)
-        try:
-            print(f"📖 [RESTORE] Reading backup file...")
-            with open(backup_path, 'r', encoding='utf-8') as f:
-                raw_backup_data = f.read()
-            file_size = len(raw_backup_data)
-            print(f"📊 [RESTORE] File size: {file_size} bytes")
-        except Exception as e:
-            print(f"❌ [RESTORE] Error reading backup file: {e}")
-            return False, f"Error reading backup file: {e}"
-        
-        # Parse JSON to validate format
-        try:
-            print(f"🔍 [RESTORE] Parsing JSON data...")
-            backup_data = json.loads(raw_backup_data)
-        except json.JSONDecodeError as e:
-            print(f"❌ [RESTORE] Invalid JSON in backup file: {e}")
-            return False, f"Invalid JSON in backup file: {e}"
-        
-        # Validate and fix backup format if needed
-        if isinstance(backup_data, dict) and 'docs' in backup_data:
-            docs = backup_data.get('docs', [])
-            print(f"✅ [RESTORE] Found standard backup format with 'docs' key")
-        elif isinstance(backup_data, dict) and 'rows' in backup_data:
-            # Handle old format from _all_docs endpoint
-            print(f"🔄 [RESTORE] Converting old format (rows) to new format (docs)")
-            docs = []
-            for row in backup_data['rows']:
-                if 'doc' in row:
-                    docs.append(row['doc'])
-            # Create proper bulk_docs format
-            raw_backup_data = json.dumps({"new_edits": False, "docs": docs})
-            print(f"✅ [RESTORE] Converted {len(docs)} documents to new format")
-        else:
-            print(f"❌ [RESTORE] Invalid backup format: missing 'docs' or 'rows' key")
-            return False, "Invalid backup format: missing 'docs' or 'rows' key"
-        
-        if not docs:
-            print(f"❌ [RESTORE] No documents found in backup")
-            return False, "No documents found in backup"
-        
-        print(f"📄 [RESTORE] Found {len(docs)} documents to restore")
-        
-        # Check if database exists
-        db_url = f"{base_url}/{db_name}"
-        print(f"🔍 [RESTORE] Checking if database exists: {db_name}")
-        response = requests.head(db_url, auth=auth, timeout=10)
-        db_exists = response.status_code == 200
-        print(f"📊 [RESTORE] Database exists: {db_exists} (HTTP {response.status_code})")
-        
-        if clean and db_exists:
-            print(f"🗑️ [RESTORE] Clean restore requested - deleting existing database")
-            # Delete existing database
-            response = requests.delete(db_url, auth=auth, timeout=10)
-            if response.status_code not in [200, 202, 404]:  # 200=deleted, 202=accepted, 404=not found
-                print(f"❌ [RESTORE] Failed to delete existing database: HTTP {response.status_code}")
-                return False, f"Failed to delete existing database: {response.text}"
-            print(f"✅ [RESTORE] Database deleted successfully (HTTP {response.status_code})")
-        
-        # Create database if it doesn't exist
-        if not db_exists or clean:
-            print(f"🏗️ [RESTORE] Creating database: {db_name}")
-            response = requests.put(db_url, auth=auth, timeout=10)
-            if response.status_code not in [201, 202, 412]:  # 201=created, 202=accepted, 412=already exists
-                print(f"❌ [RESTORE] Failed to create database: HTTP {response.status_code}")
-                return False, f"Failed to create database: {response.text}"
-            print(f"✅ [RESTORE] Database created successfully (HTTP {response.status_code})")
-        
-        # Separate design documents from regular documents (like bash script does)
-        regular_docs = []
-        design_docs = []
-        
-        print(f"📋 [RESTORE] Analyzing document types...")
-        for doc in docs:
-            if doc.get('_id', '').startswith('_design/'):
-                design_docs.append(doc)
-            else:
-                regular_docs.append(doc)
-        
-        print(f"📊 [RESTORE] Document breakdown:")
-        print(f"   - 🎨 Design documents: {len(design_docs)}")
-        print(f"   - 📝 Regular documents: {len(regular_docs)}")
-        
-        total_restored = 0
-        messages = []
-        
-        # First, restore design documents individually (like bash script)
-        if design_docs:
-            print(f"🎨 [RESTORE] Restoring {len(design_docs)} design documents individually...")
-            messages.append(f"Restoring {len(design_docs)} design documents...")
-            
-            for i, design_doc in enumerate(design_docs, 1):
-                doc_id = design_doc.get('_id', '')
-                print(f"   📄 [RESTORE] [{i}/{len(design_docs)}] Restoring design doc: {doc_id}")
-                
-                # Remove _rev for design docs to avoid conflicts
-                clean_doc = {k: v for k, v in design_doc.items() if k != '_rev'}
-                
-                doc_url = f"{db_url}/{doc_id}"
-                response = requests.put(
-                    doc_url,
-                    auth=auth,
-                    json=clean_doc,
-                    timeout=30
-                )
-                
-                if response.status_code in [200, 201, 202]:  # Accept HTTP 202 for design docs
-                    print(f"   ✅ [RESTORE] Design doc restored successfully (HTTP {response.status_code})")
-                    total_restored += 1
-                else:
-                    print(f"   🔄 [RESTORE] Design doc exists, attempting update...")
-                    # Try to update if it exists
-                    get_response = requests.get(doc_url, auth=auth, timeout=10)
-                    if get_response.status_code == 200:
-                        existing_doc = get_response.json()
-                        clean_doc['_rev'] = existing_doc['_rev']
-                        update_response = requests.put(doc_url, auth=auth, json=clean_doc, timeout=30)
-                        if update_response.status_code in [200, 201, 202]:  # Accept HTTP 202 for updates
-                            print(f"   ✅ [RESTORE] Design doc updated successfully (HTTP {update_response.status_code})")
-                            total_restored += 1
-                        else:
-                            print(f"   ❌ [RESTORE] Failed to update design doc: HTTP {update_response.status_code}")
-                    else:
-                        print(f"   ❌ [RESTORE] Failed to restore design doc: HTTP {response.status_code}")
-        
-        # Then, restore regular documents using bulk API
-        if regular_docs:
-            print(f"📝 [RESTORE] Restoring {len(regular_docs)} regular documents using bulk API...")
-            
-            # Clean documents by handling different attachment types
-            cleaned_docs = []
-            for doc in regular_docs:
-                clean_doc = doc.copy()
-                # Handle attachments - keep those with data, remove stubs
-                if '_attachments' in clean_doc:
-                    attachments = clean_doc['_attachments']
-                    has_stubs = False
-                    has_data = False
-                    
-                    # Check what type of attachments we have
-                    for att_name, att_data in attachments.items():
-                        if att_data.get('stub') == True:
-                            has_stubs = True
-                            print(f"📎 [RESTORE] Found attachment stub '{att_name}' in {clean_doc.get('_id', 'unknown')}")
-                        elif 'data' in att_data:
-                            has_data = True
-                            print(f"📎 [RESTORE] Found attachment with data '{att_name}' in {clean_doc.get('_id', 'unknown')}")
-                    
-                    # Remove entire _attachments if we have stubs (they cause errors)
-                    if has_stubs and not has_data:
-                        print(f"📎 [RESTORE] Removing all attachment stubs from {clean_doc.get('_id', 'unknown')}")
-                        del clean_doc['_attachments']
-                    # Keep attachments with actual data - they should work fine
-                    
-                cleaned_docs.append(clean_doc)
-            
-            bulk_data = {"new_edits": False, "docs": cleaned_docs}
-            bulk_raw_data = json.dumps(bulk_data)
-            
-            bulk_url = f"{db_url}/_bulk_docs"
-            print(f"🌐 [RESTORE] Sending bulk request to: {bulk_url}")
-            print(f"📊 [RESTORE] Payload size: {len(bulk_raw_data)} bytes")
-            
-            response = requests.post(
-                bulk_url,
-                auth=auth,
-                data=bulk_raw_data,  # Send raw JSON data like the bash script
-                headers={'Content-Type': 'application/json'},
-                timeout=300  # 5 minutes for bulk operation
-            )
-            
-            print(f"📊 [RESTORE] Bulk API response: HTTP {response.status_code}")
-            
-            if response.status_code in [200, 201, 202]:  # Accept HTTP 202 for bulk operations
-                try:
-                    result_data = response.json()
-                    print(f"📋 [RESTORE] Processing bulk API results...")
-                    print(f"📊 [RESTORE] Raw response: {result_data}")
-                    
-                    # Handle empty response (some CouchDB versions return [] for successful bulk operations)
-                    if isinstance(result_data, list) and len(result_data) == 0:
-                        print(f"📋 [RESTORE] Empty response detected - assuming all documents succeeded")
-                        successful = len(cleaned_docs)  # Assume all succeeded
-                        errors = []
-                    else:
-                        # Check results for each document
-                        successful = 0
-                        errors = []
-                        
-                        for result in result_data:
-                            if result.get('error'):
-                                error_msg = f"{result.get('id', 'unknown')}: {result.get('error')} ({result.get('reason', 'no reason')})"
-                                errors.append(error_msg)
-                            elif result.get('ok'):
-                                successful += 1
-                    
-                    total_restored += successful
-                    print(f"✅ [RESTORE] Bulk operation completed: {successful}/{len(cleaned_docs)} documents successful")
-                    messages.append(f"Bulk restored {successful}/{len(cleaned_docs)} regular documents")
-                    
-                    if errors:
-                        print(f"⚠️ [RESTORE] {len(errors)} documents had errors")
-                        if len(errors) <= 10:
-                            messages.append(f"Errors: {'; '.join(errors)}")
-                            for error in errors[:5]:  # Log first 5 errors to console
-                                print(f"   ❌ [RESTORE] {error}")
-                        else:
-                            messages.append(f"First 5 errors: {'; '.join(errors[:5])}... and {len(errors)-5} more")
-                            for error in errors[:5]:  # Log first 5 errors to console
-                                print(f"   ❌ [RESTORE] {error}")
-                                
-                except json.JSONDecodeError:
-                    print(f"⚠️ [RESTORE] Could not parse bulk response as JSON, assuming success")
-                    total_restored += len(cleaned_docs)
-                    messages.append(f"Bulk restored {len(cleaned_docs)} regular documents (response not parsable)")
-            else:
-                print(f"❌ [RESTORE] Bulk restore failed: HTTP {response.status_code}")
-                print(f"📋 [RESTORE] Response content: {response.text}")
-                
-                # HTTP 412 is often related to precondition failures - try to provide helpful info
-                if response.status_code == 412:
-                    try:
-                        error_data = response.json()
-                        print(f"📊 [RESTORE] Error details: {error_data}")
-                        
-                        # Common issue: document conflicts or missing _rev
-                        if any(keyword in str(error_data).lower() for keyword in ['conflict', 'revision', 'rev']):
-                            print(f"💡 [RESTORE] This might be a document revision conflict. Trying alternative approach...")
-                            # Could implement a retry with individual document creation here
-                            
-                    except:
-                        pass  # Continue with regular error handling
-                
-                return False, f"Bulk restore failed (HTTP {response.status_code}): {response.text}"
-        
-        # Verify the restore by checking document count
-        print(f"🔍 [RESTORE] Verifying restore by checking database info...")
-        try:
-            verify_response = requests.get(db_url, auth=auth, timeout=10)
-            if verify_response.status_code == 200:
-                db_info = verify_response.json()
-                actual_count = db_info.get('doc_count', 0)
-                deleted_count = db_info.get('doc_del_count', 0)
-                
-                print(f"📊 [RESTORE] Database verification:")
-                print(f"   - 📄 Total documents: {actual_count}")
-                print(f"   - 🗑️ Deleted documents: {deleted_count}")
-                
-                messages.append(f"Database now contains {actual_count} documents")
-                
-                if actual_count == 0 and total_restored > 0:
-                    print(f"⚠️ [RESTORE] WARNING: Documents restored but database shows 0 count - possible conflicts")
-                    messages.append("⚠️ WARNING: Documents may not be visible due to conflicts")
-                elif actual_count != total_restored:
-                    print(f"⚠️ [RESTORE] NOTE: Restored {total_restored} but database shows {actual_count} documents")
-            else:
-                print(f"⚠️ [RESTORE] Could not verify database info: HTTP {verify_response.status_code}")
-        except Exception as e:
-            print(f"⚠️ [RESTORE] Verification error (non-critical): {e}")
-            
-        print(f"✅ [RESTORE] Restore operation completed!")
-        print(f"📊 [RESTORE] Summary: {total_restored} documents restored to '{db_name}'")
-        
-        result_msg = f"Successfully restored {total_restored} documents to '{db_name}'. " + " | ".join(messages)
-        return True, result_msg
-            
-    except requests.RequestException as e:
-        print(f"❌ [RESTORE] Network error during restore: {str(e)}")
-        return False, f"Network error during restore: {str(e)}"
-    except Exception as e:
-        print(f"❌ [RESTORE] Restore error: {str(e)}")
-        return False, f"Restore error: {str(e)}"
-
-
-def run_restore_bash(target_url: str, db_name: str, backup_path: str, clean: bool = False) -> Tuple[bool, str]:
-    """Restore a database from backup using bash script"""
-    print(f"🔄 [RESTORE-BASH] Starting bash restore for database: {db_name}")
-    print(f"📁 [RESTORE-BASH] Backup path: {backup_path}")
-    print(f"🗑️ [RESTORE-BASH] Clean restore: {clean}")
-    
-    parsed = parse_couchdb_url(target_url)
-    print(f"🌐 [RESTORE-BASH] Parsed URL - Host: {parsed['host']}, Port: {parsed['port']}")
-    
-    # Check if backup exists
-    if not Path(backup_path).exists():
-        print(f"❌ [RESTORE-BASH] Backup file not found: {backup_path}")
-        return False, f"Backup file not found: {backup_path}"
-    
-    print(f"✅ [RESTORE-BASH] Found backup file: {backup_path}")
-    
-    # Build command with proper path handling
-    backup_dir = str(Path(backup_path).parent)
-    cmd = [
-        "bash", str(BACKUP_SCRIPT),
-        "-r",  # restore mode
-        "-H", parsed['host'],
-        "-P", parsed['port'],
-        "-u", parsed['username'],
-        "-p", parsed['password'],
-        "-d", db_name,
-        "-i", backup_dir
-    ]
-    
-    if clean:
-        cmd.append("-c")  # clean/recreate database
-        print(f"🗑️ [RESTORE-BASH] Clean mode enabled - will recreate database")
-    
-    print(f"🚀 [RESTORE-BASH] Executing bash restore command:")
-    cmd_display = cmd.copy()
-    cmd_display[9] = "****"  # Hide password in logs
-    print(f"   {' '.join(cmd_display)}")
-    
-    try:
-        print(f"⏳ [RESTORE-BASH] Running bash restore script...")
-        result = subprocess.run(
-            cmd,
-            capture_output=True,
-            text=True,
-            timeout=600,  # 10 minutes timeout
-            input="N\nN\n"  # Auto-answer interactive prompts
-        )
-        
-        print(f"📊 [RESTORE-BASH] Script completed with exit code: {result.returncode}")
-        
-        if result.stdout:
-            print(f"📝 [RESTORE-BASH] Script output:")
-            for line in result.stdout.split('\n'):
-                if line.strip():
-                    print(f"   {line}")
-        
-        if result.stderr:
-            print(f"⚠️ [RESTORE-BASH] Script errors:")
-            for line in result.stderr.split('\n'):
-                if line.strip():
-                    print(f"   {line}")
-        
-        full_output = result.stdout + "\n" + result.stderr
-        
-        if result.returncode == 0:
-            print(f"✅ [RESTORE-BASH] Database '{db_name}' restored successfully")
-            return True, f"Database '{db_name}' restored successfully"
-        else:
-            print(f"❌ [RESTORE-BASH] Restore failed with exit code {result.returncode}")
-            return False, f"Restore failed (exit code {result.returncode}):\n{full_output}"
-            
-    except subprocess.TimeoutExpired:
-        print(f"⏰ [RESTORE-BASH] Restore script timed out after 10 minutes")
-        return False, "Restore timeout (10 minutes)"
-    except Exception as e:
-        print(f"❌ [RESTORE-BASH] Restore error: {str(e)}")
-        return False, f"Restore error: {str(e)}"
-
-
-def run_restore(target_url: str, db_name: str, backup_path: str, clean: bool = False) -> Tuple[bool, str]:
-    """Restore a database from backup - try Python method first, fallback to bash script"""
-    # Try Python-based restore first (no path space issues)
-    success, msg = run_restore_python(target_url, db_name, backup_path, clean)
-    if success:
-        return success, msg
-    
-    # Fallback to bash script if Python restore fails
-    print("Python restore failed, trying bash script...")
-    return run_restore_bash(target_url, db_name, backup_path, clean)
-
-
-def delete_database(server_url: str, db_name: str) -> Tuple[bool, str]:
-    """Delete a database from CouchDB server"""
-    try:
-        import requests
-        
-        print(f"🗑️ [DELETE] Starting deletion of database: {db_name}")
-        
-        # Parse server URL
-        parsed = parse_couchdb_url(server_url)
-        base_url = f"http://{parsed['host']}:{parsed['port']}"
-        auth = (parsed['username'], parsed['password'])
-        
-        print(f"🌐 [DELETE] Target server: {base_url}")
-        
-        # Check if database exists
-        db_url = f"{base_url}/{db_name}"
-        print(f"🔍 [DELETE] Checking if database exists: {db_name}")
-        
-        response = requests.head(db_url, auth=auth, timeout=10)
-        
-        if response.status_code == 404:
-            print(f"❌ [DELETE] Database '{db_name}' does not exist")
-            return False, f"Database '{db_name}' does not exist"
-        elif response.status_code != 200:
-            print(f"❌ [DELETE] Error checking database: HTTP {response.status_code}")
-            return False, f"Error checking database: HTTP {response.status_code} - {response.text}"
-        
-        print(f"✅ [DELETE] Database exists, proceeding with deletion")
-        
-        # Delete the database
-        print(f"🗑️ [DELETE] Sending DELETE request...")
-        delete_response = requests.delete(db_url, auth=auth, timeout=30)
-        
-        print(f"📊 [DELETE] Delete response: HTTP {delete_response.status_code}")
-        
-        if delete_response.status_code in [200, 202]:
-            print(f"✅ [DELETE] Database '{db_name}' deleted successfully (HTTP {delete_response.status_code})")
-            return True, f"Database '{db_name}' deleted successfully"
-        else:
-            print(f"❌ [DELETE] Failed to delete database: HTTP {delete_response.status_code}")
-            return False, f"Failed to delete database: HTTP {delete_response.status_code} - {delete_response.text}"
-            
-    except requests.RequestException as e:
-        print(f"❌ [DELETE] Network error: {str(e)}")
-        return False, f"Network error: {str(e)}"
-    except Exception as e:
-        print(f"❌ [DELETE] Error: {str(e)}")
-        return False, f"Error: {str(e)}"
-
-def list_backups() -> List[Dict]:
-    """List all available backups"""
-    backups = []
-    
-    if not BACKUP_DIR.exists():
-        return backups
-    
-    for backup_dir in BACKUP_DIR.iterdir():
-        if backup_dir.is_dir():
-            # Find all JSON files in this backup
-            json_files = list(backup_dir.glob("**/*.json"))
-            
-            if json_files:
-                # Get backup info
-                total_size = sum(f.stat().st_size for f in json_files)
-                
-                backups.append({
-                    'name': backup_dir.name,
-                    'path': str(backup_dir),
-                    'databases': [f.stem for f in json_files],
-                    'file_count': len(json_files),
-                    'size_mb': round(total_size / (1024 * 1024), 2),
-                    'created': datetime.fromtimestamp(backup_dir.stat().st_mtime)
-                })
-    
-    return sorted(backups, key=lambda x: x['created'], reverse=True)
-
 # Initialize session state
 if 'source_url' not in st.session_state:
     st.session_state.source_url = os.getenv("SOURCE_COUCHDB_URL", "")
@@ -759,6 +68,98 @@ if 'target_connected' not in st.session_state:
 if 'backups_cache' not in st.session_state:
     st.session_state.backups_cache = []
 
+@st.cache_data(ttl=DBS_INFO_CACHE_TTL, show_spinner=False)
+def cached_databases_info(url: str, db_names: Tuple[str, ...]) -> Dict[str, Dict]:
+    """get_databases_info cached across reruns for DBS_INFO_CACHE_TTL seconds"""
+    return get_databases_info(url, list(db_names))
+
+def database_args(db_names: List[str]) -> List[str]:
+    """--db arguments selecting the given databases in a background job"""
+    return [arg for db in db_names for arg in ("--db", db)]
+
+def document_scope_inputs(key: str) -> Tuple[Optional[Dict], Optional[List[str]]]:
+    """Document scope widgets of a backup or sync: the scope (None: whole databases) and its command
+    line arguments, or (None, None) while the scope is incomplete or its selector is not valid JSON"""
+    scope_kind = st.radio(
+        "Documents",
+        ["Whole Databases", "ID Prefix", "Partition", "ID Range", "Mango Selector"],
+        horizontal=True,
+        key=f"{key}_kind"
+    )
+    if scope_kind == "ID Prefix":
+        prefix = st.text_input("ID Prefix", key=f"{key}_prefix")
+        return (make_scope(prefixes=[prefix]), ["--prefix", prefix]) if prefix else (None, None)
+    if scope_kind == "Partition":
+        partition = st.text_input(
+            "Partition", key=f"{key}_partition",
+            help="Read from /{db}/_partition/{name}/ on partitioned databases, as the id prefix {name}: elsewhere"
+        )
+        return (make_scope(partitions=[partition]), ["--partition", partition]) if partition else (None, None)
+    if scope_kind == "ID Range":
+        range_col1, range_col2 = st.columns(2)
+        start_key = range_col1.text_input("From ID (inclusive)", key=f"{key}_start")
+        end_key = range_col2.text_input("To ID (exclusive)", key=f"{key}_end")
+        if not (start_key or end_key):
+            return None, None
+        return make_scope(start_key=start_key or None, end_key=end_key or None), [
+            *(["--start-key", start_key] if start_key else []), *(["--end-key", end_key] if end_key else [])
+        ]
+    if scope_kind == "Mango Selector":
+        selector_text = st.text_area("Selector (JSON)", placeholder='{"type": "invoice"}', key=f"{key}_selector")
+        if not selector_text.strip():
+            return None, None
+        try:
+            selector = json.loads(selector_text)
+        except ValueError as e:
+            st.error(f"Invalid selector: {e}")
+            return None, None
+        if not isinstance(selector, dict):
+            st.error("A Mango selector is a JSON object")
+            return None, None
+        return make_scope(selector=selector), ["--selector", json.dumps(selector)]
+    return None, []
+
+def submit_job(kind: str, title: str, args: List[str], total: int, env: Dict[str, str]):
+    """Queue a background job and point the user to the Jobs tab"""
+    job_id = get_job_runner().submit(kind, title, args, total=total, env=env)
+    log.info(f"🗂️ [UI] {title} queued as job {job_id}")
+    st.success(f"🗂️ {title} queued as job {job_id} - follow it in the ⏳ Jobs tab")
+
+def iter_sync_events(sync_fn: Callable, source_url: str, target_url: str, db_names: List[str], max_workers: int,
+                     clean: bool, live_progress: bool) -> Iterator[Tuple[str, object]]:
+    """Run run_syncs_parallel in a thread and yield its ('result', (db, success, msg)) events, and with
+    live_progress the ('progress', {...}) of the running replications, in the script's thread - Streamlit
+    elements cannot be updated from the sync worker threads"""
+    events = queue.Queue()
+    if live_progress:
+        sync_fn = functools.partial(sync_fn, on_progress=lambda p: events.put(('progress', p)))
+    
+    def produce():
+        try:
+            for result in run_syncs_parallel(sync_fn, source_url, target_url, db_names, max_workers, clean):
+                events.put(('result', result))
+        finally:
+            events.put(('done', None))
+    
+    threading.Thread(target=produce, daemon=True, name='ui-sync').start()
+    while True:
+        event = events.get()
+        if event[0] == 'done':
+            return
+        yield event
+
+def database_stats_rows(url: str, db_names: List[str]) -> List[Dict]:
+    """Overview table rows for the given databases"""
+    infos = cached_databases_info(url, tuple(db_names))
+    return [
+        {
+            'Database': db,
+            'Documents': infos[db].get('doc_count', 0),
+            'Size (MB)': round(infos[db].get('data_size', 0) / (1024 * 1024), 2) if 'data_size' in infos[db] else 0
+        }
+        for db in db_names
+    ]
+
 # Sidebar - Connection Settings
 with st.sidebar:
     st.header("🔌 Connections")
@@ -819,6 +220,8 @@ with st.sidebar:
             if connected:
                 with st.spinner("Loading databases..."):
                     st.session_state.source_dbs_cache = get_databases(source_url)
+                if refresh_source:
+                    cached_databases_info.clear()
                 st.success(f"✅ Found {len(st.session_state.source_dbs_cache)} databases")
             else:
                 st.error(f"❌ {msg}")
@@ -858,6 +261,8 @@ with st.sidebar:
             if connected:
                 with st.spinner("Loading databases..."):
                     st.session_state.target_dbs_cache = get_databases(target_url)
+                if refresh_target:
+                    cached_databases_info.clear()
                 st.success(f"✅ Found {len(st.session_state.target_dbs_cache)} databases")
             else:
                 st.error(f"❌ {msg}")
@@ -880,7 +285,9 @@ with st.sidebar:
         st.text(f"Current Dir: {Path.cwd()}")
 
 # Main content - Tabs
-tab1, tab2, tab3, tab4, tab5 = st.tabs(["🔍 Overview", "💾 Backup", "📥 Restore", "🔄 Sync", "🗑️ Delete"])
+tab1, tab2, tab3, tab4, tab5, tab6, tab7 = st.tabs(
+    ["🔍 Overview", "💾 Backup", "📥 Restore", "🔄 Sync", "🗑️ Delete", "⏳ Jobs", "📈 Cluster"]
+)
 
 # Tab 1: Overview
 with tab1:
@@ -890,14 +297,7 @@ with tab1:
         st.subheader("📊 Source Databases")
         if source_url and st.session_state.source_connected and st.session_state.source_dbs_cache:
             source_dbs = st.session_state.source_dbs_cache
-            db_info = []
-            for db in source_dbs:
-                info = get_database_info(source_url, db)
-                db_info.append({
-                    'Database': db,
-                    'Documents': info.get('doc_count', 0),
-                    'Size (MB)': round(info.get('data_size', 0) / (1024 * 1024), 2) if 'data_size' in info else 0
-                })
+            db_info = database_stats_rows(source_url, source_dbs)
             
             df = pd.DataFrame(db_info)
             st.dataframe(df, width='stretch')
@@ -908,14 +308,7 @@ with tab1:
         st.subheader("📊 Target Databases")
         if target_url and st.session_state.target_connected and st.session_state.target_dbs_cache:
             target_dbs = st.session_state.target_dbs_cache
-            db_info = []
-            for db in target_dbs:
-                info = get_database_info(target_url, db)
-                db_info.append({
-                    'Database': db,
-                    'Documents': info.get('doc_count', 0),
-                    'Size (MB)': round(info.get('data_size', 0) / (1024 * 1024), 2) if 'data_size' in info else 0
-                })
+            db_info = database_stats_rows(target_url, target_dbs)
             
             df = pd.DataFrame(db_info)
             st.dataframe(df, width='stretch')
@@ -944,7 +337,7 @@ with tab1:
         backup_df = pd.DataFrame(backups)
         backup_df['created'] = backup_df['created'].dt.strftime('%Y-%m-%d %H:%M:%S')
         st.dataframe(
-            backup_df[['name', 'file_count', 'size_mb', 'created']],
+            backup_df[['name', 'file_count', 'size_mb', 'uncompressed_mb', 'created']],
             width='stretch'
         )
         if not refresh_backups and 'backups_cache' in st.session_state:
@@ -989,6 +382,11 @@ with tab2:
                 else:
                     selected_dbs = backup_dbs
                     st.info(f"Will backup all {len(backup_dbs)} databases from {backup_source.lower()}")
+                
+                with st.expander("🎯 Document Scope"):
+                    st.caption("Back up only part of each database - CouchDB does the filtering, so only the "
+                               "selected documents are transferred (not with incremental backups)")
+                    backup_scope, backup_scope_args = document_scope_inputs("backup_scope")
             
             with col2:
                 # Backup name
@@ -998,22 +396,92 @@ with tab2:
                     "Backup Name",
                     value=default_name
                 )
+                
+                # Parallel workers (default sized to the cluster, cached per server)
+                concurrency_key = f"backup_concurrency_{backup_url}"
+                if concurrency_key not in st.session_state:
+                    st.session_state[concurrency_key] = default_backup_concurrency(backup_url)
+                backup_concurrency = st.number_input(
+                    "Parallel Backups",
+                    min_value=1,
+                    max_value=BACKUP_MAX_CONCURRENCY,
+                    value=st.session_state[concurrency_key],
+                    help="Number of databases backed up at the same time"
+                )
+                
+                compression_options = available_compressions()
+                backup_compression = st.selectbox(
+                    "Compression",
+                    compression_options,
+                    index=compression_options.index(BACKUP_COMPRESSION) if BACKUP_COMPRESSION in compression_options else 0,
+                    help="Compress backup files while they are written (restore reads them transparently)"
+                )
+                
+                dedup_attachments = st.checkbox(
+                    "Deduplicate Attachments",
+                    value=BACKUP_DEDUP_ATTACHMENTS,
+                    help="Store attachments once in a shared blob store (keyed by digest) "
+                         "instead of embedding them in every backup"
+                )
+                
+                incremental_backup = st.checkbox(
+                    "Incremental Backup",
+                    value=False,
+                    help="Only back up changes since the latest backup of each database "
+                         "(written as a delta next to that backup). Databases without a previous "
+                         "backup get a full backup."
+                )
+                
+                sharded_backup = st.checkbox(
+                    "Shard-Aware Export",
+                    value=BACKUP_SHARDED,
+                    help=f"Split databases with at least {BACKUP_SHARDED_MIN_DOCS} documents into id ranges "
+                         "exported in parallel straight from every cluster node, then merged into one file"
+                )
+                                
+                backup_in_background = st.checkbox(
+                    "Run in Background",
+                    value=True,
+                    key="backup_in_background",
+                    help="Run the backup as a job that keeps going when you leave or reload this page"
+                )
             
             # Start backup
             if st.button("🚀 Start Backup", type="primary"):
-                if selected_dbs and backup_name:
+                if backup_scope_args is None:
+                    st.warning("Complete the document scope, or choose Whole Databases")
+                elif backup_scope is not None and incremental_backup:
+                    st.error("⚠️ Incremental backups cover whole databases - clear the document scope or the incremental option")
+                elif selected_dbs and backup_name and backup_in_background:
+                    submit_job(
+                        "backup", f"Backup {backup_name} ({len(selected_dbs)} databases)",
+                        ["backup", "--backup-dir", str(BACKUP_DIR), "--name", backup_name,
+                         "--workers", str(int(backup_concurrency)), "--compression", backup_compression,
+                         "--dedup-attachments" if dedup_attachments else "--no-dedup-attachments",
+                         "--sharded" if sharded_backup else "--no-sharded",
+                         *(["--incremental"] if incremental_backup else []), *database_args(selected_dbs),
+                         *backup_scope_args],
+                        len(selected_dbs), {"SOURCE_COUCHDB_URL": backup_url}
+                    )
+                elif selected_dbs and backup_name:
                     backup_dir = BACKUP_DIR / backup_name
                     
                     # Console logging
-                    print(f"\n{'='*50}")
-                    print(f"🚀 [UI] BACKUP OPERATION STARTED")
-                    print(f"{'='*50}")
-                    print(f"📅 Timestamp: {datetime.now().isoformat()}")
-                    print(f"👤 User initiated backup via Streamlit UI")
-                    print(f"📁 Backup directory: {backup_dir}")
-                    print(f"📊 Selected databases: {selected_dbs}")
-                    print(f"🌐 Source URL: {source_url}")
-                    print(f"🛠️ Backup method: Python (with Bash fallback)")
+                    log.info(f"\n{'='*50}")
+                    log.info(f"🚀 [UI] BACKUP OPERATION STARTED")
+                    log.info(f"{'='*50}")
+                    log.info(f"📅 Timestamp: {datetime.now().isoformat()}")
+                    log.info(f"👤 User initiated backup via Streamlit UI")
+                    log.info(f"📁 Backup directory: {backup_dir}")
+                    log.info(f"📊 Selected databases: {selected_dbs}")
+                    log.info(f"🌐 Source URL: {source_url}")
+                    log.info(f"🛠️ Backup method: Python (with Bash fallback)")
+                    log.info(f"⚡ Parallel backups: {backup_concurrency}")
+                    log.info(f"➕ Incremental: {incremental_backup}")
+                    log.info(f"🗜️ Compression: {backup_compression}")
+                    log.info(f"📎 Deduplicate attachments: {dedup_attachments}")
+                    log.info(f"🧩 Shard-aware export: {sharded_backup}")
+                    log.info(f"🎯 Document scope: {backup_scope}")
                     
                     # Show debug info
                     with st.expander("Debug Information", expanded=False):
@@ -1029,11 +497,16 @@ with tab2:
                     success_count = 0
                     failed_dbs = []
                     
-                    for idx, db in enumerate(selected_dbs):
-                        status.text(f"Backing up {db}... ({idx+1}/{len(selected_dbs)})")
-                        
-                        # Use the main backup directory - the script will create its own subdirectory
-                        success, msg = run_backup(backup_url, db, str(backup_dir))
+                    status.text(f"Backing up {len(selected_dbs)} databases ({backup_concurrency} in parallel)...")
+                    
+                    # Use the main backup directory - all workers share one backup_{timestamp} subdirectory
+                    backup_results = run_backups_parallel(
+                        backup_url, selected_dbs, str(backup_dir), int(backup_concurrency),
+                        incremental=incremental_backup, compression=backup_compression,
+                        dedup_attachments=dedup_attachments, sharded=sharded_backup, scope=backup_scope
+                    )
+                    for idx, (db, success, msg) in enumerate(backup_results):
+                        status.text(f"Backed up {db} ({idx+1}/{len(selected_dbs)})")
                         
                         if success:
                             success_count += 1
@@ -1065,6 +538,40 @@ with tab2:
                             st.error(f"Failed: {len(failed_dbs)} database(s)")
                 else:
                     st.warning("Please select databases and provide a backup name")
+            
+            # Backups left unfinished by a crash or failure continue from their checkpoints
+            interrupted = find_interrupted_backups()
+            if interrupted:
+                with st.expander(f"⏯️ Resume Interrupted Backup ({len(interrupted)})", expanded=False):
+                    interrupted_names = {
+                        f"{b['name']} - {len(b['remaining'])}/{len(b['databases'])} databases left ({b['source']})": b
+                        for b in interrupted
+                    }
+                    resume_choice = interrupted_names[st.selectbox("Interrupted Backup", list(interrupted_names))]
+                    resume_clicked = st.button("⏯️ Resume Backup")
+                    if resume_clicked and backup_in_background:
+                        submit_job(
+                            "backup", f"Resume backup {resume_choice['name']} ({len(resume_choice['remaining'])} databases)",
+                            ["backup", "--backup-dir", str(Path(resume_choice['path']).parent),
+                             "--resume", resume_choice['name'], "--workers", str(int(backup_concurrency))],
+                            len(resume_choice['remaining']), {"SOURCE_COUCHDB_URL": backup_url}
+                        )
+                    elif resume_clicked:
+                        log.info(f"⏯️ [UI] Resuming backup {resume_choice['name']}")
+                        try:
+                            resume_results = list(resume_backups_parallel(
+                                backup_url, resume_choice['path'], int(backup_concurrency)
+                            ))
+                        except ValueError as e:
+                            st.error(str(e))
+                        else:
+                            for db, success, msg in resume_results:
+                                if success:
+                                    st.success(f"✅ {db}: {msg}")
+                                else:
+                                    with st.expander(f"❌ {db} - Click for details", expanded=False):
+                                        st.code(msg)
+                            st.session_state.backups_cache = list_backups()
         else:
             st.warning(f"No databases found in {backup_source.lower()}")
     else:
@@ -1142,22 +649,58 @@ with tab3:
                     )
                 else:
                     confirm_clean = True  # No confirmation needed for normal restore
+                
+                apply_deltas = st.checkbox(
+                    "Apply Incremental Deltas",
+                    value=True,
+                    help="Replay incremental backups recorded after this backup, in order"
+                )
+                
+                resume_restore = st.checkbox(
+                    "Resume Interrupted Restore",
+                    value=False,
+                    help="Continue a restore into the same server that failed midway from its "
+                         "checkpoint instead of starting over (Clean Restore is skipped)"
+                )
+                
+                warm_indexes = st.checkbox(
+                    "Warm View Indexes",
+                    value=RESTORE_WARM_INDEXES,
+                    help="Build every view and Mango index before the restore reports done, "
+                         "so the first queries do not wait for index builds"
+                )
+                
+                restore_in_background = st.checkbox(
+                    "Run in Background",
+                    value=True,
+                    key="restore_in_background",
+                    help="Run the restore as a job that keeps going when you leave or reload this page"
+                )
             
             # Start restore
             if st.button("🚀 Start Restore", type="primary"):
-                if selected_dbs and (not clean_restore or confirm_clean):
+                if selected_dbs and (not clean_restore or confirm_clean) and restore_in_background:
+                    submit_job(
+                        "restore", f"Restore {selected_backup_name} ({len(selected_dbs)} databases)",
+                        ["restore", "--backup", selected_backup['path'], *database_args(selected_dbs),
+                         *(["--clean"] if clean_restore else []), *([] if apply_deltas else ["--no-deltas"]),
+                         *(["--resume"] if resume_restore else []),
+                         "--warm-indexes" if warm_indexes else "--no-warm-indexes"],
+                        len(selected_dbs), {"TARGET_COUCHDB_URL": restore_url}
+                    )
+                elif selected_dbs and (not clean_restore or confirm_clean):
                     backup_path = Path(selected_backup['path'])
                     
                     # Console logging
-                    print(f"\n{'='*50}")
-                    print(f"🚀 [UI] RESTORE OPERATION STARTED")
-                    print(f"{'='*50}")
-                    print(f"📅 Timestamp: {datetime.now().isoformat()}")
-                    print(f"👤 User initiated restore via Streamlit UI")
-                    print(f"📁 Backup path: {backup_path}")
-                    print(f"📊 Selected databases: {selected_dbs}")
-                    print(f"🌐 Target URL: {target_url}")
-                    print(f"🗑️ Clean restore: {clean_restore}")
+                    log.info(f"\n{'='*50}")
+                    log.info(f"🚀 [UI] RESTORE OPERATION STARTED")
+                    log.info(f"{'='*50}")
+                    log.info(f"📅 Timestamp: {datetime.now().isoformat()}")
+                    log.info(f"👤 User initiated restore via Streamlit UI")
+                    log.info(f"📁 Backup path: {backup_path}")
+                    log.info(f"📊 Selected databases: {selected_dbs}")
+                    log.info(f"🌐 Target URL: {target_url}")
+                    log.info(f"🗑️ Clean restore: {clean_restore}")
                     
                     progress = st.progress(0)
                     status = st.empty()
@@ -1168,10 +711,13 @@ with tab3:
                     for idx, db in enumerate(selected_dbs):
                         status.text(f"Restoring {db}... ({idx+1}/{len(selected_dbs)})")
                         
-                        # Find backup file
-                        db_files = list(backup_path.glob(f"**/{db}.json"))
-                        if db_files:
-                            success, msg = run_restore(restore_url, db, str(db_files[0]), clean_restore)
+                        # Find backup file (plain or compressed)
+                        db_file = find_backup_file(backup_path, db)
+                        if db_file:
+                            success, msg = run_restore(
+                                restore_url, db, str(db_file), clean_restore, apply_deltas, resume_restore,
+                                warm_indexes
+                            )
                             
                             if success:
                                 success_count += 1
@@ -1199,6 +745,55 @@ with tab3:
                     st.error("⚠️ You must confirm deletion of existing data to proceed with clean restore")
                 else:
                     st.warning("Please select databases to restore")
+            
+            # Selective restore - documents are looked up in the offset index of the backup file
+            if selected_backup_name:
+                with st.expander("🎯 Restore Selected Documents"):
+                    st.caption("Restore single documents, an id prefix, a partition or an id range of one "
+                               "database without restoring the rest of it")
+                    doc_db = st.selectbox("Database", selected_backup['databases'], key="selective_restore_db")
+                    selection_kind = st.radio(
+                        "Select By",
+                        ["Document IDs", "ID Prefix", "Partition", "ID Range"],
+                        horizontal=True,
+                        key="selective_restore_kind"
+                    )
+                    if selection_kind == "Document IDs":
+                        doc_ids = st.text_area("Document IDs (one per line)", key="selective_restore_ids")
+                        doc_ranges = id_ranges([line.strip() for line in doc_ids.splitlines() if line.strip()])
+                    elif selection_kind == "ID Prefix":
+                        prefix = st.text_input("ID Prefix", key="selective_restore_prefix")
+                        doc_ranges = id_ranges(prefixes=[prefix]) if prefix else []
+                    elif selection_kind == "Partition":
+                        partition = st.text_input("Partition", key="selective_restore_partition")
+                        doc_ranges = id_ranges(partitions=[partition]) if partition else []
+                    else:
+                        range_col1, range_col2 = st.columns(2)
+                        start_key = range_col1.text_input("From ID (inclusive)", key="selective_restore_start")
+                        end_key = range_col2.text_input("To ID (exclusive)", key="selective_restore_end")
+                        doc_ranges = id_ranges(start_key=start_key, end_key=end_key or None) if start_key or end_key else []
+                    target_db = st.text_input(
+                        "Restore Into Database",
+                        value=doc_db,
+                        key="selective_restore_target",
+                        help="Restore into another database to inspect the documents before touching the original"
+                    )
+                    
+                    if st.button("🎯 Restore Documents", key="selective_restore_button"):
+                        db_file = find_backup_file(Path(selected_backup['path']), doc_db)
+                        if not doc_ranges or not target_db:
+                            st.warning("Enter the documents to restore and the database to restore them into")
+                        elif db_file is None:
+                            st.error(f"Backup file of {doc_db} not found")
+                        else:
+                            with st.spinner(f"Restoring selected documents of {doc_db}..."):
+                                success, msg = run_restore_selected(
+                                    restore_url, target_db, str(db_file), doc_ranges, apply_deltas
+                                )
+                            if success:
+                                st.success(f"✅ {msg}")
+                            else:
+                                st.error(f"❌ {msg}")
         else:
             st.info("No backups available. Create a backup first.")
     else:
@@ -1258,10 +853,38 @@ with tab4:
                     st.info(f"Will sync {len(selected_dbs)} new databases")
                     if selected_dbs:
                         st.write("New databases:", ", ".join(selected_dbs))
+                
+                with st.expander("🎯 Document Scope"):
+                    st.caption(f"Copy only part of each database - the {sync_from_name.lower()} does the filtering "
+                               "(not with Revision Diff)")
+                    sync_scope, sync_scope_args = document_scope_inputs("sync_scope")
             
             with col2:
                 st.subheader("Options")
                 
+                sync_method = st.radio(
+                    "Sync Method",
+                    ["Replication", "Revision Diff", "Streaming Copy", "Backup & Restore"],
+                    help="Replication: the target cluster pulls only missing revisions directly from the source. "
+                         "Revision Diff: this manager compares revisions and copies only the missing ones. "
+                         "Streaming Copy: this manager copies every document, reading and writing at the same "
+                         "time without touching its disk. "
+                         "Backup & Restore: data is copied through this manager via a temporary backup."
+                )
+                parallel_methods = {"Replication": run_sync_replication, "Revision Diff": run_sync_revs_diff,
+                                    "Streaming Copy": run_sync_stream}
+                
+                if sync_method in parallel_methods:
+                    sync_concurrency = st.number_input(
+                        "Parallel Replications" if sync_method == "Replication" else "Parallel Databases",
+                        min_value=1,
+                        max_value=32,
+                        value=SYNC_REPLICATION_CONCURRENCY,
+                        help="Number of databases synced at the same time"
+                    )
+                if sync_method == "Replication":
+                    st.caption(f"ℹ️ The {sync_from_name.lower()} URL must be reachable from the {sync_to_name.lower()} cluster")
+                
                 clean_sync = st.checkbox(
                     "Clean Sync",
                     value=False,
@@ -1278,6 +901,13 @@ with tab4:
                 else:
                     confirm_clean_sync = True  # No confirmation needed for normal sync
                 
+                sync_in_background = st.checkbox(
+                    "Run in Background",
+                    value=True,
+                    key="sync_in_background",
+                    help="Run the synchronization as a job that keeps going when you leave or reload this page"
+                )
+                
                 # Show comparison
                 st.divider()
                 comparison = {
@@ -1292,53 +922,90 @@ with tab4:
             
             # Start sync
             if st.button("🚀 Start Synchronization", type="primary"):
-                if selected_dbs and (not clean_sync or confirm_clean_sync):
-                    # Create temporary backup directory
-                    temp_backup = BACKUP_DIR / f"temp_sync_{datetime.now().strftime('%Y%m%d_%H%M%S')}"
+                if sync_scope_args is None:
+                    st.warning("Complete the document scope, or choose Whole Databases")
+                elif sync_scope is not None and sync_method == "Revision Diff":
+                    st.error("⚠️ Revision Diff compares whole databases - use another method to copy a document scope")
+                elif selected_dbs and (not clean_sync or confirm_clean_sync) and sync_in_background:
+                    sync_args = ["sync", *database_args(selected_dbs), *(["--clean"] if clean_sync else []),
+                                 *sync_scope_args]
+                    if sync_method in parallel_methods:
+                        cli_methods = {"Replication": "replication", "Revision Diff": "diff", "Streaming Copy": "stream"}
+                        sync_args += ["--method", cli_methods[sync_method], "--workers", str(int(sync_concurrency))]
+                    else:
+                        sync_args += ["--method", "backup"]
+                    submit_job(
+                        "sync", f"Sync {sync_from_name.lower()} → {sync_to_name.lower()} ({len(selected_dbs)} databases)",
+                        sync_args, len(selected_dbs),
+                        {"SOURCE_COUCHDB_URL": sync_from_url, "TARGET_COUCHDB_URL": sync_to_url}
+                    )
+                elif selected_dbs and (not clean_sync or confirm_clean_sync) and sync_method in parallel_methods:
+                    sync_fn = parallel_methods[sync_method]
+                    if sync_scope is not None:
+                        sync_fn = functools.partial(sync_fn, scope=sync_scope)
+                    progress = st.progress(0)
+                    status = st.empty()
+                    status.text(f"Syncing {len(selected_dbs)} databases by {sync_method.lower()} ({sync_concurrency} at a time)...")
                     
+                    success_count = 0
+                    failed_dbs = []
+                    running = {}
+                    synced = 0
+                    
+                    for event, payload in iter_sync_events(
+                        sync_fn, sync_from_url, sync_to_url, selected_dbs, int(sync_concurrency), clean_sync,
+                        live_progress=sync_method == "Replication"
+                    ):
+                        if event == 'progress':
+                            running[payload['database']] = payload
+                        else:
+                            db, success, msg = payload
+                            running.pop(db, None)
+                            synced += 1
+                            if success:
+                                success_count += 1
+                            else:
+                                failed_dbs.append((db, msg))
+                            progress.progress(synced / len(selected_dbs))
+                        status.text("\n".join([f"Synced {synced}/{len(selected_dbs)} databases"] + [
+                            f"🔁 {name}: {p['docs_written'] or 0} documents written, {p['changes_pending'] or 0} changes pending"
+                            for name, p in running.items() if p['state'] == 'running'
+                        ]))
+                    
+                    status.empty()
+                    progress.empty()
+                    
+                    if success_count == len(selected_dbs):
+                        st.success(f"✅ All {success_count} databases synchronized successfully ({sync_method.lower()})")
+                    else:
+                        st.warning(f"⚠️ Synchronized {success_count}/{len(selected_dbs)} databases")
+                        
+                        if failed_dbs:
+                            st.error("Failed databases:")
+                            for db, error in failed_dbs:
+                                st.error(f"  - {db}: {error}")
+                elif selected_dbs and (not clean_sync or confirm_clean_sync):
                     progress = st.progress(0)
                     status = st.empty()
                     
                     success_count = 0
                     failed_dbs = []
-                    total_steps = len(selected_dbs) * 2  # backup + restore
-                    current_step = 0
                     
-                    for db in selected_dbs:
-                        # Backup from source
-                        status.text(f"Backing up {db} from {sync_from_name.lower()}...")
-                        success, msg = run_backup(sync_from_url, db, str(temp_backup))
-                        current_step += 1
-                        progress.progress(current_step / total_steps)
+                    for i, db in enumerate(selected_dbs, 1):
+                        # Backup from source to a temporary directory, then restore to target
+                        status.text(f"Syncing {db} from {sync_from_name.lower()} to {sync_to_name.lower()}...")
+                        success, msg = run_sync_backup(sync_from_url, sync_to_url, db, clean_sync, sync_scope)
                         
                         if success:
-                            # Restore to target
-                            status.text(f"Restoring {db} to {sync_to_name.lower()}...")
-                            
-                            # Find backup file
-                            db_files = list(temp_backup.glob(f"**/{db}.json"))
-                            if db_files:
-                                success, msg = run_restore(sync_to_url, db, str(db_files[0]), clean_sync)
-                                
-                                if success:
-                                    success_count += 1
-                                else:
-                                    failed_dbs.append((db, f"Restore failed: {msg}"))
-                            else:
-                                failed_dbs.append((db, "Backup file not found"))
+                            success_count += 1
                         else:
-                            failed_dbs.append((db, f"Backup failed: {msg}"))
+                            failed_dbs.append((db, msg))
                         
-                        current_step += 1
-                        progress.progress(current_step / total_steps)
+                        progress.progress(i / len(selected_dbs))
                     
                     status.empty()
                     progress.empty()
                     
-                    # Clean up temp backup
-                    if temp_backup.exists():
-                        shutil.rmtree(temp_backup)
-                    
                     # Show results
                     if success_count == len(selected_dbs):
                         st.success(f"✅ All {success_count} databases synchronized successfully")
@@ -1447,19 +1114,33 @@ with tab5:
                     help="Final confirmation before deletion"
                 )
                 
+                delete_in_background = st.checkbox(
+                    "Run in Background",
+                    value=False,
+                    key="delete_in_background",
+                    help="Delete as a job, for large batches of databases (refresh the database list when it is done)"
+                )
+                
                 # Delete button
                 if confirmation_valid and final_confirm:
-                    if st.button("🗑️ DELETE DATABASES", type="primary"):
+                    delete_clicked = st.button("🗑️ DELETE DATABASES", type="primary")
+                    if delete_clicked and delete_in_background:
+                        submit_job(
+                            "delete", f"Delete {len(selected_dbs)} databases from {server_name.lower()}",
+                            ["delete", *database_args(selected_dbs)], len(selected_dbs),
+                            {"SOURCE_COUCHDB_URL": server_url}
+                        )
+                    elif delete_clicked:
                         
                         # Console logging
-                        print(f"\n{'='*50}")
-                        print(f"🗑️ [UI] DATABASE DELETION OPERATION STARTED")
-                        print(f"{'='*50}")
-                        print(f"📅 Timestamp: {datetime.now().isoformat()}")
-                        print(f"👤 User initiated deletion via Streamlit UI")
-                        print(f"🌐 Target server: {server_url}")
-                        print(f"📊 Selected databases: {selected_dbs}")
-                        print(f"⚠️ DANGER: Permanent deletion in progress!")
+                        log.info(f"\n{'='*50}")
+                        log.info(f"🗑️ [UI] DATABASE DELETION OPERATION STARTED")
+                        log.info(f"{'='*50}")
+                        log.info(f"📅 Timestamp: {datetime.now().isoformat()}")
+                        log.info(f"👤 User initiated deletion via Streamlit UI")
+                        log.info(f"🌐 Target server: {server_url}")
+                        log.info(f"📊 Selected databases: {selected_dbs}")
+                        log.warning(f"⚠️ DANGER: Permanent deletion in progress!")
                         
                         progress = st.progress(0)
                         status = st.empty()
@@ -1484,7 +1165,7 @@ with tab5:
                         status.empty()
                         progress.empty()
                         
-                        print(f"📊 [DELETE] Operation completed: {success_count}/{len(selected_dbs)} databases deleted")
+                        log.info(f"📊 [DELETE] Operation completed: {success_count}/{len(selected_dbs)} databases deleted")
                         
                         # Results summary
                         if success_count == len(selected_dbs):
@@ -1530,5 +1211,234 @@ with tab5:
             st.error(f"Not connected to {server_name.lower()} database. Please check your connection.")
 
 
+# Tab 6: Background Jobs
+JOB_STATUS_ICONS = {
+    'queued': '🕒', 'running': '▶️', 'succeeded': '✅', 'failed': '❌', 'cancelled': '⏹️', 'interrupted': '⚠️'
+}
+
+def show_job_metrics(summary: Dict):
+    """Where a finished job spent its time: documents and bytes, seconds per phase, CouchDB request latency"""
+    counts = ', '.join(
+        f"{operation}: {count} docs / {summary['bytes'].get(operation, 0) / (1024 * 1024):.1f} MB"
+        for operation, count in summary['docs'].items()
+    )
+    if counts:
+        st.caption(f"📊 {counts}")
+    if summary.get('backoffs'):
+        st.caption("🐢 Backed off under cluster pressure: " + ', '.join(
+            f"{count}× {reason}" for reason, count in summary['backoffs'].items()
+        ))
+    col1, col2 = st.columns([1, 2])
+    with col1:
+        if summary['phases']:
+            st.dataframe(
+                pd.DataFrame([{'Phase': phase, 'Seconds': seconds} for phase, seconds in summary['phases'].items()]),
+                hide_index=True,
+                width='stretch'
+            )
+    with col2:
+        if summary['requests']:
+            st.dataframe(
+                pd.DataFrame([
+                    {
+                        'Request': f"{r['method']} {r['endpoint']}", 'Status': r['status'], 'Count': r['count'],
+                        'Mean (s)': r['mean_s'], 'p95 (s)': r['p95_s'], 'p99 (s)': r['p99_s']
+                    }
+                    for r in summary['requests']
+                ]),
+                hide_index=True,
+                width='stretch'
+            )
+
+@st.fragment(run_every=JOB_REFRESH_INTERVAL)
+def jobs_panel():
+    """Job list, refreshed every JOB_REFRESH_INTERVAL seconds without rerunning the whole page"""
+    runner = get_job_runner()
+    jobs = runner.list()
+    if not jobs:
+        st.info("No jobs yet. Tick \"Run in Background\" when starting a backup, restore, sync or deletion.")
+        return
+    
+    active = [job for job in jobs if job['status'] in ('queued', 'running')]
+    st.caption(f"{len(active)} active, {len(jobs)} total - up to {JOB_CONCURRENCY} jobs run at the same time")
+    
+    for job in jobs:
+        done = job['succeeded'] + job['failed']
+        counts = f"{done}/{job['total']}" if job['total'] else f"{done}"
+        with st.expander(
+            f"{JOB_STATUS_ICONS.get(job['status'], '❔')} {job['title']} - {job['status']} ({counts})",
+            expanded=job['status'] == 'running'
+        ):
+            st.caption(
+                f"Job {job['id']} · created {job['created']}"
+                + (f" · started {job['started']}" if job['started'] else "")
+                + (f" · finished {job['finished']}" if job['finished'] else "")
+            )
+            if job['total']:
+                st.progress(min(done / job['total'], 1.0))
+            if job['status'] == 'running' and job.get('progress'):
+                st.dataframe(
+                    pd.DataFrame([
+                        {'Database': p['database'], 'State': p['state'], 'Documents Written': p['docs_written'],
+                         'Changes Pending': p['changes_pending']}
+                        for p in job['progress'].values()
+                    ]),
+                    hide_index=True,
+                    width='stretch'
+                )
+            if job['results']:
+                st.dataframe(
+                    pd.DataFrame([
+                        {'Database': r['database'], 'Result': '✅' if r['success'] else '❌', 'Message': r['message']}
+                        for r in job['results']
+                    ]),
+                    hide_index=True,
+                    width='stretch'
+                )
+            if job.get('metrics'):
+                show_job_metrics(job['metrics'])
+            if job['status'] == 'interrupted' and job['kind'] in ('backup', 'restore'):
+                st.warning("The manager stopped while this job was running - resume it from its checkpoints")
+            st.code(runner.read_log(job['id']) or "(no output yet)", language=None)
+            
+            if job['status'] in ('queued', 'running'):
+                if st.button("⏹️ Cancel", key=f"cancel_job_{job['id']}"):
+                    runner.cancel(job['id'])
+                    st.rerun(scope="fragment")
+            elif st.button("🗑️ Remove", key=f"remove_job_{job['id']}"):
+                runner.remove(job['id'])
+                st.rerun(scope="fragment")
+
+with tab6:
+    st.header("⏳ Background Jobs")
+    st.markdown("Backups, restores, syncs and deletions started with **Run in Background** run here, "
+                "independently of this page: they keep going when you reload it or close the browser.")
+    jobs_panel()
+
+# Tab 7: Cluster Performance
+NODE_CHARTS = [
+    ('requests_per_s', "Requests/s"), ('latency_p95_ms', "p95 request time (ms)"),
+    ('writes_per_s', "Document writes/s"), ('reads_per_s', "Document reads/s"),
+    ('memory_mb', "Memory (MB)"), ('run_queue', "Run queue")
+]
+
+def time_series_chart(rows: List[Dict], value: str, series: str):
+    """Line chart of one value over time, one line per series (node, task, replication)"""
+    df = pd.DataFrame(rows)
+    df['time'] = pd.to_datetime(df['time'], unit='s')
+    st.line_chart(df.pivot_table(index='time', columns=series, values=value))
+
+@st.fragment(run_every=MONITOR_INTERVAL)
+def cluster_panel(url: str):
+    """Live cluster figures, polled every MONITOR_INTERVAL seconds without rerunning the whole page"""
+    monitor = monitor_for(url)
+    sample = monitor.poll()
+    rows = monitor.latest_rows()
+    
+    ready, reasons = assess_cluster(sample, rows)
+    if ready:
+        st.success("✅ The cluster has room for heavy jobs: every node answers quickly, nothing is compacting or indexing")
+    else:
+        st.warning("⚠️ Busy - heavy jobs will compete with: " + "; ".join(reasons))
+    slowest = slowest_node(rows)
+    if slowest and len(rows) > 1:
+        st.caption(f"🐢 Slowest node: **{slowest['node']}** - p95 request time {slowest['latency_p95_ms']:.0f} ms, "
+                   f"run queue {slowest['run_queue']}")
+    st.caption(f"{len(rows)} node(s) polled in {sample['duration_s']:.2f}s · "
+               f"{len(monitor.samples)}/{MONITOR_HISTORY} samples, one every {MONITOR_INTERVAL:g}s")
+    
+    st.dataframe(
+        pd.DataFrame([
+            {
+                'Node': row['node'], 'Requests/s': row.get('requests_per_s'), 'Reads/s': row.get('reads_per_s'),
+                'Writes/s': row.get('writes_per_s'), '5xx/s': row.get('errors_per_s'),
+                'p50 (ms)': row.get('latency_p50_ms'), 'p95 (ms)': row.get('latency_p95_ms'),
+                'p99 (ms)': row.get('latency_p99_ms'), 'Memory (MB)': row.get('memory_mb'),
+                'Run queue': row.get('run_queue'), 'Error': row.get('error')
+            }
+            for row in rows
+        ]),
+        hide_index=True,
+        width='stretch'
+    )
+    
+    series = monitor.series()
+    node_series = [row for row in series['nodes'] if 'error' not in row]
+    if node_series:
+        for pair in (NODE_CHARTS[i:i + 2] for i in range(0, len(NODE_CHARTS), 2)):
+            for column, (value, title) in zip(st.columns(2), pair):
+                with column:
+                    st.markdown(f"**{title}**")
+                    time_series_chart(node_series, value, 'node')
+    
+    st.subheader("🧱 Compaction and Indexing")
+    if sample['tasks']:
+        st.dataframe(
+            pd.DataFrame([
+                {
+                    'Task': task['type'], 'Database': task['database'], 'Design Document': task['design_document'],
+                    'Node': task['node'], 'Shards': task['shards'], 'Progress': task['progress']
+                }
+                for task in sample['tasks']
+            ]),
+            column_config={'Progress': st.column_config.ProgressColumn(min_value=0, max_value=100, format="%d%%")},
+            hide_index=True,
+            width='stretch'
+        )
+        time_series_chart(
+            [{**task, 'task': f"{task['type']} {task['database']} {task['design_document'] or ''} @{task['node']}"}
+             for task in series['tasks']],
+            'progress', 'task'
+        )
+    else:
+        st.info("No compaction or index build running")
+    
+    st.subheader("🔁 Replications")
+    if sample['replications']:
+        st.dataframe(
+            pd.DataFrame([
+                {
+                    'Replication': r['doc_id'], 'Node': r['node'], 'State': r['state'], 'Crashes': r['crashes'],
+                    'Changes Pending': r['changes_pending'], 'Docs Written': r['docs_written'],
+                    'Source': r['source'], 'Target': r['target']
+                }
+                for r in sample['replications']
+            ]),
+            hide_index=True,
+            width='stretch'
+        )
+        lag = [r for r in series['replications'] if r['changes_pending'] is not None]
+        if lag:
+            st.markdown("**Replication lag (changes pending)**")
+            time_series_chart(lag, 'changes_pending', 'doc_id')
+    else:
+        st.info("No replication jobs")
+
+with tab7:
+    st.header("📈 Cluster Performance")
+    st.markdown("Live request rates, latencies, memory and run queue of every node (`_node/{node}/_stats` and "
+                "`_system`), compactions and index builds (`_active_tasks`) and replication lag (`_scheduler/jobs`). "
+                f"A node is busy above {MONITOR_LATENCY_WARN_MS:g} ms p95 request time or "
+                f"{MONITOR_RUN_QUEUE_WARN} processes in its run queue.")
+    
+    monitor_server = st.radio(
+        "Monitor:",
+        ["Source Database", "Target Database"],
+        key="monitor_server",
+        horizontal=True
+    )
+    monitor_url = source_url if monitor_server == "Source Database" else target_url
+    monitor_connected = st.session_state.source_connected if monitor_server == "Source Database" else st.session_state.target_connected
+    
+    if monitor_url and monitor_connected:
+        if st.toggle("▶️ Live monitoring", key="monitor_live",
+                     help=f"Poll the cluster every {MONITOR_INTERVAL:g}s while this page is open"):
+            cluster_panel(monitor_url)
+        else:
+            st.info("Turn on live monitoring to poll the cluster")
+    else:
+        st.warning(f"Please configure {monitor_server.lower()} in the sidebar")
+
+
 st.divider()
 st.caption("CouchDB Manager v1.0 - Manage your CouchDB instances with ease")
\ No newline at end of file
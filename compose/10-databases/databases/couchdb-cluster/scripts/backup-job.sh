@@ -1,27 +1,91 @@
 #!/bin/bash
 
 # CouchDB Backup Job for Ofelia
-# Simplified backup script for job execution
+# Runs the Python engine (python3 -m couchdb_engine) when available - as in the
+# couchdb-manager container - and falls back to the bash+curl+jq script otherwise
 
 set -e
 
 # Configuration
 TIMESTAMP=$(date +%Y%m%d_%H%M%S)
-BACKUP_DIR="/opt/backups/ofelia_backup_${TIMESTAMP}"
-LOG_FILE="/opt/backups/backup_${TIMESTAMP}.log"
+BACKUP_ROOT="${BACKUP_ROOT:-/opt/backups}"
+BACKUP_DIR="${BACKUP_ROOT}/ofelia_backup_${TIMESTAMP}"
+LOG_FILE="${BACKUP_ROOT}/backup_${TIMESTAMP}.log"
 BACKUP_SCRIPT="/opt/manage/backup_restore_couchdb.sh"
+# Directory containing the couchdb_engine package
+ENGINE_DIR="${ENGINE_DIR:-/app}"
+# full: dump every database | incremental: only changes since the last backup (_changes feed)
+BACKUP_MODE="${BACKUP_MODE:-full}"
+# Verify each new backup against its manifest (true/false); sampled revisions are also
+# compared with the live databases when VERIFY_SAMPLE_SIZE > 0
+BACKUP_VERIFY="${BACKUP_VERIFY:-true}"
 
 # Function to log with timestamp
 log() {
     echo "[$(date '+%Y-%m-%d %H:%M:%S')] $1" | tee -a "${LOG_FILE}"
 }
 
+# Remove backups older than the retention period (keep last N days)
+cleanup_old_backups() {
+    RETENTION_DAYS=${BACKUP_RETENTION_DAYS:-7}
+    log "Cleaning up backups older than ${RETENTION_DAYS} days..."
+
+    find "${BACKUP_ROOT}" -name "ofelia_backup_*" -type d -mtime +${RETENTION_DAYS} -exec rm -rf {} \; 2>/dev/null || true
+    find "${BACKUP_ROOT}" -name "backup_*.log" -mtime +${RETENTION_DAYS} -delete 2>/dev/null || true
+
+    log "Cleanup completed"
+}
+
 # Create backup directory
 mkdir -p "${BACKUP_DIR}"
 
 log "=== CouchDB Backup Job Started ==="
 log "Backup directory: ${BACKUP_DIR}"
+log "Backup mode: ${BACKUP_MODE}"
+
+# CouchDB connection details (connect to cluster node 0)
+COUCHDB_HOST="${COUCHDB_HOST:-couchdb-0}"
+COUCHDB_PORT="${COUCHDB_PORT:-5984}"
+COUCHDB_USER="${COUCHDB_USER:-admin}"
+COUCHDB_PASS="${COUCHDB_PASSWORD:-admin}"
+
+log "Connecting to CouchDB at ${COUCHDB_HOST}:${COUCHDB_PORT}"
+
+# Preferred path: the Python engine (streamed, paged and parallel backups, no jq needed)
+if command -v python3 >/dev/null 2>&1 && PYTHONPATH="${ENGINE_DIR}" python3 -c "import couchdb_engine" 2>/dev/null; then
+    log "Using Python engine from ${ENGINE_DIR}"
+    engine_args=(backup --url "http://${COUCHDB_USER}:${COUCHDB_PASS}@${COUCHDB_HOST}:${COUCHDB_PORT}" --all
+                 --backup-dir "${BACKUP_ROOT}" --name "ofelia_backup_${TIMESTAMP}")
+    if [ "${BACKUP_MODE}" = "incremental" ]; then
+        engine_args+=(--incremental)
+    fi
 
+    PYTHONPATH="${ENGINE_DIR}" python3 -m couchdb_engine "${engine_args[@]}" 2>&1 | tee -a "${LOG_FILE}"
+    if [ "${PIPESTATUS[0]}" -ne 0 ]; then
+        log "✗ Some databases failed to back up"
+    fi
+
+    # Incremental runs write deltas next to their base, which then carries the manifest
+    if [ "${BACKUP_VERIFY}" = "true" ] && [ -f "${BACKUP_DIR}/manifest.json" ]; then
+        log "Verifying backup..."
+        PYTHONPATH="${ENGINE_DIR}" python3 -m couchdb_engine verify --backup "${BACKUP_DIR}" \
+            --url "http://${COUCHDB_USER}:${COUCHDB_PASS}@${COUCHDB_HOST}:${COUCHDB_PORT}" 2>&1 | tee -a "${LOG_FILE}"
+        if [ "${PIPESTATUS[0]}" -ne 0 ]; then
+            log "✗ Backup verification failed"
+        fi
+    fi
+    # Incremental runs leave the run directory empty when every database had a base
+    if rmdir "${BACKUP_DIR}" 2>/dev/null; then
+        log "Deltas written next to their base backups"
+    else
+        log "Backup location: ${BACKUP_DIR}"
+    fi
+    cleanup_old_backups
+    log "=== CouchDB Backup Job Finished ==="
+    exit 0
+fi
+
+# Fallback: bash script with curl and jq
 # Check if backup script exists
 if [ ! -f "${BACKUP_SCRIPT}" ]; then
     log "✗ Backup script not found at ${BACKUP_SCRIPT}"
@@ -33,20 +97,50 @@ cp "${BACKUP_SCRIPT}" "/tmp/backup_restore_couchdb.sh"
 chmod +x "/tmp/backup_restore_couchdb.sh"
 BACKUP_SCRIPT="/tmp/backup_restore_couchdb.sh"
 
-# CouchDB connection details (connect to cluster node 0)
-COUCHDB_HOST="couchdb-0"
-COUCHDB_PORT="5984"
-COUCHDB_USER="${COUCHDB_USER:-admin}"
-COUCHDB_PASS="${COUCHDB_PASSWORD:-admin}"
-
-log "Connecting to CouchDB at ${COUCHDB_HOST}:${COUCHDB_PORT}"
-
 # Install required tools if not available
 if ! command -v jq >/dev/null 2>&1; then
     log "Installing required tools..."
     apt-get update && apt-get install -y jq curl >/dev/null 2>&1
 fi
 
+COUCHDB_BASE_URL="http://${COUCHDB_HOST}:${COUCHDB_PORT}"
+
+# Current update_seq of a database
+get_update_seq() {
+    curl -s -u "${COUCHDB_USER}:${COUCHDB_PASS}" "${COUCHDB_BASE_URL}/$1" | jq -r '.update_seq // empty'
+}
+
+# Most recently updated update_seq checkpoint of a database (empty if none)
+latest_seq_file() {
+    find "${BACKUP_ROOT}" -type f -name "$1.seq" -printf '%T@ %p\n' 2>/dev/null | sort -n | tail -1 | cut -d' ' -f2-
+}
+
+# Write the changes since the checkpoint as a delta file next to the base backup
+backup_incremental() {
+    local db_name="$1"
+    local seq_file="$2"
+    local since delta_file changes_file
+
+    since=$(cat "${seq_file}")
+    delta_file="$(dirname "${seq_file}")/${db_name}.$(date +%Y%m%d-%H%M%S).delta"
+    changes_file="${delta_file}.changes"
+
+    curl -sf -u "${COUCHDB_USER}:${COUCHDB_PASS}" -G "${COUCHDB_BASE_URL}/${db_name}/_changes" \
+        --data-urlencode "since=${since}" -d include_docs=true -d attachments=true \
+        -o "${changes_file}" || { rm -f "${changes_file}"; return 1; }
+
+    if [ "$(jq '.results | length' "${changes_file}")" -gt 0 ]; then
+        jq -c '{new_edits: false, docs: [.results[] | select(.doc) | .doc]}' "${changes_file}" > "${delta_file}" \
+            || { rm -f "${changes_file}" "${delta_file}"; return 1; }
+        log "  Delta written: ${delta_file}"
+    else
+        log "  No changes since last backup"
+    fi
+
+    jq -r '.last_seq' "${changes_file}" > "${seq_file}"
+    rm -f "${changes_file}"
+}
+
 # Get list of all databases (excluding system databases)
 log "Getting database list..."
 databases=$(curl -s -u "${COUCHDB_USER}:${COUCHDB_PASS}" \
@@ -55,6 +149,7 @@ databases=$(curl -s -u "${COUCHDB_USER}:${COUCHDB_PASS}" \
 
 if [ -z "$databases" ]; then
     log "No user databases found"
+    rmdir "${BACKUP_DIR}" 2>/dev/null || true
     exit 0
 fi
 
@@ -66,19 +161,46 @@ total_count=0
 # Backup each database using the existing script
 for db_name in $databases; do
     total_count=$((total_count + 1))
+
+    base_seq_file=""
+    if [ "${BACKUP_MODE}" = "incremental" ]; then
+        base_seq_file=$(latest_seq_file "${db_name}")
+    fi
+
+    if [ -n "${base_seq_file}" ]; then
+        log "Incremental backup of database: ${db_name} (base: $(dirname "${base_seq_file}"))"
+        if backup_incremental "${db_name}" "${base_seq_file}"; then
+            log "✓ Successfully backed up: ${db_name}"
+            success_count=$((success_count + 1))
+        else
+            log "✗ Failed to backup: ${db_name}"
+        fi
+        continue
+    fi
+
     log "Backing up database: ${db_name}"
-    
+    # Capture update_seq before the dump so the backup can serve as an incremental base
+    update_seq=$(get_update_seq "${db_name}")
+
     if bash "${BACKUP_SCRIPT}" -b -H "${COUCHDB_HOST}" -P "${COUCHDB_PORT}" \
         -u "${COUCHDB_USER}" -p "${COUCHDB_PASS}" -d "${db_name}" -o "${BACKUP_DIR}" -q 2>/dev/null; then
         log "✓ Successfully backed up: ${db_name}"
         success_count=$((success_count + 1))
+        backup_file=$(find "${BACKUP_DIR}" -type f -name "${db_name}.json" 2>/dev/null | head -1)
+        if [ -n "${update_seq}" ] && [ -n "${backup_file}" ]; then
+            echo "${update_seq}" > "$(dirname "${backup_file}")/${db_name}.seq"
+        fi
     else
         log "✗ Failed to backup: ${db_name}"
     fi
 done
 
 log "Backup completed: ${success_count}/${total_count} databases backed up successfully"
-log "Backup location: ${BACKUP_DIR}"
+if rmdir "${BACKUP_DIR}" 2>/dev/null; then
+    log "Deltas written next to their base backups"
+else
+    log "Backup location: ${BACKUP_DIR}"
+fi
 
 # Show backup directory size
 if [ -d "${BACKUP_DIR}" ]; then
@@ -87,14 +209,7 @@ if [ -d "${BACKUP_DIR}" ]; then
     log "Backup size: ${backup_size} (${file_count} files)"
 fi
 
-# Cleanup old backups (keep last N days)
-RETENTION_DAYS=${BACKUP_RETENTION_DAYS:-7}
-log "Cleaning up backups older than ${RETENTION_DAYS} days..."
-
-find /opt/backups -name "ofelia_backup_*" -type d -mtime +${RETENTION_DAYS} -exec rm -rf {} \; 2>/dev/null || true
-find /opt/backups -name "backup_*.log" -mtime +${RETENTION_DAYS} -delete 2>/dev/null || true
-
-log "Cleanup completed"
+cleanup_old_backups
 log "=== CouchDB Backup Job Finished ==="
 
 # Exit with success